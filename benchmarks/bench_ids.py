@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark inserting messages keyed by random text UUIDs versus compact UUIDv7 ids
+
+Usage:
+    python benchmarks/bench_ids.py [--conversations 200] [--messages 100]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.ids import uuid7
+
+SCHEMA = """
+CREATE TABLE messages (id {type} NOT NULL PRIMARY KEY, conversation_id {type} NOT NULL,
+                       seq INTEGER NOT NULL, content TEXT NOT NULL);
+CREATE UNIQUE INDEX ix_messages_conversation_seq ON messages (conversation_id, seq);
+"""
+
+
+def run(path, key_type, make_id, conversations, messages):
+    """Insert messages in turns spread over many conversations, one commit per turn"""
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA.format(type=key_type))
+    conversation_ids = [make_id() for _ in range(conversations)]
+    started = time.perf_counter()
+    for seq in range(1, messages + 1):
+        for conversation_id in conversation_ids:
+            connection.execute('INSERT INTO messages VALUES (?, ?, ?, ?)',
+                               (make_id(), conversation_id, seq, 'An advisor reply of typical length. ' * 8))
+            connection.commit()
+    elapsed = time.perf_counter() - started
+    pages = dict(connection.execute(
+        "SELECT name, SUM(pgsize) FROM dbstat WHERE name NOT IN ('messages', 'sqlite_schema') GROUP BY name"
+    ).fetchall()) if _has_dbstat(connection) else {}
+    connection.close()
+    return elapsed, os.path.getsize(path), pages
+
+
+def _has_dbstat(connection):
+    try:
+        connection.execute('SELECT 1 FROM dbstat LIMIT 1')
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--conversations', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=100)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        rows = args.conversations * args.messages
+        print(f"{rows} messages in {args.conversations} conversations, one commit per insert")
+        variants = [
+            ('uuid4 VARCHAR(36)', 'VARCHAR(36)', lambda: str(uuid.uuid4())),
+            ('uuid7 BLOB(16)', 'BLOB', lambda: uuid7().bytes),
+        ]
+        for name, key_type, make_id in variants:
+            elapsed, size, indexes = run(os.path.join(root, f'{key_type}.db'), key_type, make_id,
+                                         args.conversations, args.messages)
+            detail = ', '.join(f'{index} {pages / 1024:.0f} KiB' for index, pages in sorted(indexes.items()))
+            print(f"{name:18s} {rows / elapsed:8.0f} inserts/s  file {size / 1024 / 1024:6.2f} MiB"
+                  f"{'  ' + detail if detail else ''}")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark streaming ingestion of full-market end-of-day CSV dumps
+
+Usage:
+    python benchmarks/bench_ingest.py [--symbols 10000] [--days 5] [--workers 4]
+"""
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.fundamentals_index import FundamentalsIndex
+from src.services.market_data_ingest import MarketDataIngestor
+from src.services.price_history import PriceHistoryStore
+
+
+def write_dump(path, day, symbols, rng):
+    """Write one day of bars for every symbol"""
+    closes = rng.uniform(5, 500, len(symbols))
+    with open(path, 'w') as handle:
+        handle.write('date,symbol,open,high,low,close,volume,pe_ratio\n')
+        for symbol, close in zip(symbols, closes):
+            handle.write(f'{day},{symbol},{close:.2f},{close * 1.02:.2f},{close * 0.98:.2f},{close:.2f},'
+                         f'{rng.integers(1_000, 10_000_000)},{rng.uniform(5, 40):.2f}\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--symbols', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        rng = np.random.default_rng(42)
+        symbols = [f'SYM{number}' for number in range(args.symbols)]
+        days = [str(np.datetime64('2024-01-01', 'D') + day) for day in range(args.days)]
+        paths = []
+        for day in days:
+            paths.append(os.path.join(root, f'{day}.csv'))
+            write_dump(paths[-1], day, symbols, rng)
+        size_mib = sum(os.path.getsize(path) for path in paths) / 1024 / 1024
+
+        ingestor = MarketDataIngestor(PriceHistoryStore(os.path.join(root, 'prices')), FundamentalsIndex(),
+                                      os.path.join(root, 'checkpoints'))
+        print(f"Dumps: {args.days} days x {args.symbols} symbols, {size_mib:.1f} MiB of CSV")
+
+        # Days of the same symbols go in date order, one file after another
+        timings = []
+        for path in paths:
+            started = time.perf_counter()
+            ingestor.ingest_file(path)
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f"  first day          {timings[0]:8.1f} ms")
+        print(f"  later days (mean)  {np.mean(timings[1:]) if len(timings) > 1 else timings[0]:8.1f} ms")
+
+        # Independent files, e.g. one per exchange, go in parallel
+        parts = []
+        for part in range(args.workers):
+            parts.append(os.path.join(root, f'part{part}.csv'))
+            write_dump(parts[-1], days[0], [f'P{part}X{number}' for number in range(args.symbols // args.workers)], rng)
+        started = time.perf_counter()
+        ingestor.ingest(parts, workers=args.workers)
+        print(f"  {args.workers} files in parallel {(time.perf_counter() - started) * 1000:8.1f} ms")
+
+        peak_mib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"  peak RSS           {peak_mib:8.1f} MiB")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark reading a long message history through the ORM, the Core read path and its transcript snapshot
+
+Usage:
+    python benchmarks/bench_message_history.py [--messages 10000] [--repeat 5]
+"""
+import argparse
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+from src.extensions import db, db_writer
+from src.ids import new_id
+from src.json_provider import FastJSONProvider
+from src.models import Conversation, Message
+from src.services.message_history import message_history
+from src.services.transcripts import transcript_store
+
+ADVISORS = ['warren_buffett', 'john_keynes', 'benjamin_graham', 'albert_einstein']
+
+
+def create_app(path):
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    db_writer.init_app(app)
+    return app
+
+
+def populate(count):
+    """Store one conversation with ``count`` messages, returning its id"""
+    conversation_id = new_id()
+    db.session.add(Conversation(id=conversation_id, user_id='bench', title='Bench', last_seq=count))
+    db.session.flush()
+    start = datetime(2025, 1, 1)
+    db.session.execute(Message.__table__.insert(), [{
+        'id': new_id(),
+        'conversation_id': conversation_id,
+        'seq': i + 1,
+        'role': 'user' if i % 5 == 0 else 'advisor',
+        'advisor_id': None if i % 5 == 0 else ADVISORS[i % 4],
+        'content': "As an advisor, I'd look at the company's fundamentals, competitive advantages, "
+                   "and whether it's trading at a discount to intrinsic value.",
+        'timestamp': start + timedelta(seconds=i),
+        'metadata': {'cancelled': True} if i % 97 == 0 else None,
+    } for i in range(count)])
+    db.session.commit()
+    return conversation_id
+
+
+def measure(fn, repeat):
+    """Return the fastest time in milliseconds and the peak traced memory in MiB of ``fn``"""
+    timings = []
+    for _ in range(repeat):
+        db.session.remove()
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    db.session.remove()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(timings), peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        app = create_app(os.path.join(root, 'bench.db'))
+        with app.test_request_context():
+            db.create_all()
+            conversation_id = populate(args.messages)
+
+            def orm_list():
+                messages = Message.query.filter_by(conversation_id=conversation_id).order_by(Message.seq).all()
+                return jsonify([message.to_dict() for message in messages]).get_data()
+
+            def core_list():
+                return b''.join(message_history.json_chunks(message_history.records(conversation_id)))
+
+            def core_stream():
+                for _ in message_history.json_chunks(message_history.records(conversation_id)):
+                    pass
+
+            def snapshot_list():
+                return transcript_store.body(conversation_id)[0]
+
+            def snapshot_gzip():
+                return transcript_store.body(conversation_id, gzip_ok=True)[0]
+
+            def orm_prompt():
+                messages = Message.query.filter_by(conversation_id=conversation_id).order_by(Message.seq).all()
+                return [message.to_dict() for message in messages if not (message.meta or {}).get('cancelled')]
+
+            def core_prompt():
+                return message_history.recent(conversation_id, 20)
+
+            assert orm_list() == core_list()
+            transcript_store.rebuild(conversation_id)
+            assert orm_list() == snapshot_list() == gzip.decompress(snapshot_gzip())
+            assert orm_prompt()[-20:] == core_prompt()
+
+            print(f"{args.messages} messages in one conversation")
+            for name, fn in [('GET messages, ORM', orm_list), ('GET messages, Core', core_list),
+                             ('GET messages, Core streamed', core_stream),
+                             ('GET messages, snapshot', snapshot_list), ('GET messages, snapshot gzip', snapshot_gzip),
+                             ('Prompt history, ORM', orm_prompt), ('Prompt history, Core', core_prompt)]:
+                elapsed, peak = measure(fn, args.repeat)
+                print(f"{name:28s} {elapsed:9.2f} ms  peak {peak:7.2f} MiB")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
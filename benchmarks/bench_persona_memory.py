@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark persona memory embedding and top-k retrieval at conversation scale
+
+Usage:
+    python benchmarks/bench_persona_memory.py [--turns 10000] [--dim 256] [--k 3] [--repeat 50]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.persona_memory import HashingVectorizer, MemoryIndex
+
+TOPICS = ['interest rates', 'inflation', 'Costco', 'Apple earnings', 'bond yields', 'dividends',
+          'buybacks', 'recession risk', 'bank stocks', 'oil prices', 'market sentiment', 'valuation']
+
+
+def build_turns(count):
+    """Build synthetic exchanges shaped like PersonaMemory snippets"""
+    rng = random.Random(42)
+    return [f"User: What do you think about {rng.choice(TOPICS)} and {rng.choice(TOPICS)} this quarter?\n"
+            f"Advisor: I would look at {rng.choice(TOPICS)} before drawing conclusions (turn {i})."
+            for i in range(count)]
+
+
+def percentile(timings, fraction):
+    return sorted(timings)[min(int(len(timings) * fraction), len(timings) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--turns', type=int, default=10000)
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    vectorizer = HashingVectorizer(args.dim)
+    turns = build_turns(args.turns)
+
+    started = time.perf_counter()
+    vectors = np.stack([vectorizer.transform(turn) for turn in turns])
+    embed_ms = (time.perf_counter() - started) * 1000
+
+    # Round trip through the float16 storage format, as loading from the database does
+    stored = vectors.astype(np.float16).tobytes()
+    started = time.perf_counter()
+    index = MemoryIndex(args.dim)
+    index.extend(np.frombuffer(stored, dtype=np.float16).reshape(args.turns, args.dim), turns)
+    load_ms = (time.perf_counter() - started) * 1000
+
+    query = 'Should I worry about bond yields and inflation?'
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        index.search(vectorizer.transform(query), args.k)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    print(f"Index: {args.turns} turns x {args.dim} dims, {len(stored) / 1024:.1f} KiB stored (float16)")
+    print(f"  embed all turns    {embed_ms:8.1f} ms  ({embed_ms * 1000 / args.turns:.1f} us per turn)")
+    print(f"  load index         {load_ms:8.2f} ms")
+    print(f"\nQuery (embed + top-{args.k}, {args.repeat} runs):")
+    print(f"  p50                {percentile(timings, 0.5):8.3f} ms")
+    print(f"  p95                {percentile(timings, 0.95):8.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark indicator computation over many memory-mapped price series
+
+Usage:
+    python benchmarks/bench_price_history.py [--symbols 5000] [--days 1260] [--repeat 5]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.price_history import BAR_DTYPE, PriceHistoryStore, compute_indicators
+
+
+def build_bars(rng, days):
+    """Build a random-walk daily series"""
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, days)))
+    bars = np.zeros(days, dtype=BAR_DTYPE)
+    bars['date'] = np.datetime64('2020-01-01', 'D') + np.arange(days)
+    bars['open'] = closes
+    bars['high'] = closes * 1.01
+    bars['low'] = closes * 0.99
+    bars['close'] = closes
+    bars['volume'] = rng.integers(1_000, 1_000_000, days)
+    return bars
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--symbols', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=1260)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        store = PriceHistoryStore(root)
+        rng = np.random.default_rng(42)
+        started = time.perf_counter()
+        for number in range(args.symbols):
+            store.append(f'SYM{number}', build_bars(rng, args.days))
+        write_ms = (time.perf_counter() - started) * 1000
+        symbols = store.symbols()
+
+        timings = []
+        for _ in range(args.repeat):
+            store = PriceHistoryStore(root)  # cold maps, warm page cache
+            started = time.perf_counter()
+            compute_indicators([store.series(symbol) for symbol in symbols])
+            timings.append((time.perf_counter() - started) * 1000)
+
+        size_mib = args.symbols * args.days * BAR_DTYPE.itemsize / 1024 / 1024
+        print(f"Store: {args.symbols} symbols x {args.days} days, {size_mib:.1f} MiB")
+        print(f"  write all series   {write_ms:8.1f} ms")
+        print(f"\nIndicators for every symbol ({args.repeat} runs, map + compute):")
+        print(f"  best               {min(timings):8.1f} ms")
+        print(f"  median             {sorted(timings)[len(timings) // 2]:8.1f} ms")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
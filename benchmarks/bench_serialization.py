@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark JSON serialization and response compression on message-history payloads
+
+Usage:
+    python benchmarks/bench_serialization.py [--messages 5000] [--repeat 20]
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from src.json_provider import FastJSONProvider
+from src.compression import brotli
+
+ADVISORS = ['warren_buffett', 'john_keynes', 'benjamin_graham', 'albert_einstein']
+
+
+def build_history(count):
+    """Build a message history shaped like GET /api/conversations/<id>/messages"""
+    conversation_id = str(uuid.uuid4())
+    start = datetime(2025, 1, 1)
+    messages = []
+    for i in range(count):
+        is_user = i % 5 == 0
+        advisor_id = None if is_user else ADVISORS[i % 4]
+        messages.append({
+            'id': str(uuid.uuid4()),
+            'conversation_id': conversation_id,
+            'role': 'user' if is_user else 'advisor',
+            'advisor_id': advisor_id,
+            'content': ("What do you think about the current valuation of large cap tech?" if is_user else
+                        f"As {advisor_id}, I would analyze this from a value investing perspective. "
+                        "I'd look at the company's fundamentals, competitive advantages, and whether "
+                        "it's trading at a discount to intrinsic value."),
+            'timestamp': (start + timedelta(seconds=i)).isoformat()
+        })
+    return messages
+
+
+def best_of(fn, repeat):
+    """Return the fastest wall-clock time of ``repeat`` runs in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    payload = build_history(args.messages)
+    provider = FastJSONProvider(Flask(__name__))
+
+    stdlib_ms = best_of(lambda: json.dumps(payload, separators=(',', ':'), sort_keys=True), args.repeat)
+    provider_ms = best_of(lambda: provider.dumps_bytes(payload, separators=(',', ':')), args.repeat)
+    body = provider.dumps_bytes(payload, separators=(',', ':'))
+
+    print(f"Payload: {args.messages} messages, {len(body) / 1024:.1f} KiB uncompressed")
+    print(f"\nSerialization (best of {args.repeat}):")
+    print(f"  json (stdlib)      {stdlib_ms:8.2f} ms")
+    print(f"  {provider.backend:<18} {provider_ms:8.2f} ms  ({stdlib_ms / provider_ms:.1f}x)")
+
+    print("\nCompressed size:")
+    for level in (1, 6):
+        size = len(gzip.compress(body, compresslevel=level))
+        ms = best_of(lambda: gzip.compress(body, compresslevel=level), max(1, args.repeat // 4))
+        print(f"  gzip level {level}       {size / 1024:8.1f} KiB  ({len(body) / size:.1f}x smaller, {ms:.2f} ms)")
+    if brotli is not None:
+        for quality in (4, 11):
+            size = len(brotli.compress(body, quality=quality))
+            ms = best_of(lambda: brotli.compress(body, quality=quality), max(1, args.repeat // 4))
+            print(f"  brotli quality {quality:<3} {size / 1024:8.1f} KiB  ({len(body) / size:.1f}x smaller, {ms:.2f} ms)")
+    else:
+        print("  brotli             not installed")
+
+
+if __name__ == '__main__':
+    main()
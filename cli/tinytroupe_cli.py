@@ -5,6 +5,8 @@ TinyTroupe CLI - Command-line interface for TinyTroupe Financial Advisors
 import os
 import sys
 import json
+import time
+import uuid
 import click
 import requests
 from tabulate import tabulate
@@ -16,6 +18,9 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # Default server URL
 DEFAULT_SERVER = "http://localhost:5000"
 
+# Attempts at sending a message when the connection fails
+SEND_ATTEMPTS = 3
+
 class TinyTroupeCLI:
     """CLI client for TinyTroupe service"""
     
@@ -158,30 +163,75 @@ class TinyTroupeCLI:
             click.echo(f"Error: Could not retrieve messages. {str(e)}")
             return []
     
+    def _stream_events(self, response):
+        """Yield (event, data) pairs from a Server-Sent Events response"""
+        event, data = 'message', []
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                if data:
+                    yield event, json.loads('\n'.join(data))
+                event, data = 'message', []
+            elif line.startswith(':'):
+                continue
+            elif line.startswith('event:'):
+                event = line[len('event:'):].strip()
+            elif line.startswith('data:'):
+                data.append(line[len('data:'):].strip())
+    
     def send_message(self, conversation_id, content):
-        """Send a message in a conversation"""
-        try:
-            response = requests.post(
-                f"{self.config['server_url']}/api/conversations/{conversation_id}/messages",
-                json={"content": content}
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            # Display user message
-            user_message = result['user_message']
-            click.echo(f"\nYou: {user_message['content']}")
-            
-            # Display advisor responses
-            for resp in result['advisor_responses']:
-                advisor_name = resp['advisor_name']
-                click.echo(f"\n{advisor_name}:\n{resp['content']}")
-            
-            return result
-            
-        except requests.RequestException as e:
-            click.echo(f"Error: Could not send message. {str(e)}")
-            return None
+        """Send a message in a conversation, printing advisor responses as they arrive
+        
+        Every message gets its own Idempotency-Key, so when the connection
+        drops the message is sent again without the server generating a
+        second turn. Pressing Ctrl+C while advisors are answering closes the
+        connection, which makes the server cancel the answers still pending.
+        """
+        key = str(uuid.uuid4())
+        shown = set()
+        for attempt in range(SEND_ATTEMPTS):
+            response = None
+            try:
+                response = requests.post(
+                    f"{self.config['server_url']}/api/conversations/{conversation_id}/messages/stream",
+                    json={"content": content},
+                    headers={"Idempotency-Key": key},
+                    stream=True
+                )
+                response.raise_for_status()
+                
+                result = None
+                for event, data in self._stream_events(response):
+                    if event == 'user_message' and 'user' not in shown:
+                        shown.add('user')
+                        click.echo(f"\nYou: {data['content']}")
+                    elif event == 'advisor_response' and data['advisor_id'] not in shown:
+                        shown.add(data['advisor_id'])
+                        # A retry after a dropped connection replays answers cancelled by the disconnect
+                        answer = "(cancelled)" if (data.get('metadata') or {}).get('cancelled') else data['content']
+                        click.echo(f"\n{data['advisor_name']}:\n{answer}")
+                    elif event == 'done':
+                        result = data
+                        break
+                    elif event == 'error':
+                        click.echo(f"Error: {data['error']}")
+                        break
+                
+                return result
+                
+            except KeyboardInterrupt:
+                click.echo("\nCancelled; advisors still answering were stopped.")
+                return None
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                if attempt + 1 == SEND_ATTEMPTS:
+                    click.echo(f"Error: Could not send message. {str(e)}")
+                    return None
+                time.sleep(2 ** attempt)
+            except requests.RequestException as e:
+                click.echo(f"Error: Could not send message. {str(e)}")
+                return None
+            finally:
+                if response is not None:
+                    response.close()
     
     def analyze_stock(self, symbol):
         """Analyze a stock"""
@@ -190,6 +240,9 @@ class TinyTroupeCLI:
             response = requests.get(
                 f"{self.config['server_url']}/api/financial-data/{symbol}/analysis"
             )
+            if response.status_code in (400, 404):
+                click.echo(f"Error: {response.json().get('error')}. Try: tinytroupe symbols {symbol[:2]}")
+                return None
             response.raise_for_status()
             analysis = response.json()
             
@@ -226,6 +279,213 @@ class TinyTroupeCLI:
             click.echo(f"Error: Could not analyze stock. {str(e)}")
             return None
     
+    def stream_quotes(self, symbol, count=None):
+        """Print a symbol's live quotes as they change until Ctrl+C, or until ``count`` quotes arrived"""
+        response = None
+        quotes = []
+        try:
+            response = requests.get(
+                f"{self.config['server_url']}/api/financial-data/{symbol}/stream",
+                stream=True
+            )
+            if response.status_code in (400, 404, 503):
+                click.echo(f"Error: {response.json().get('error')}")
+                return quotes
+            response.raise_for_status()
+            
+            click.echo(f"Streaming quotes for {symbol}, press Ctrl+C to stop.")
+            for event, data in self._stream_events(response):
+                if event == 'quote':
+                    quotes.append(data)
+                    click.echo(f"{datetime.now().strftime('%H:%M:%S')}  {data['symbol']}  "
+                               f"{data['price']:.2f}  {data['change_percent']:+.2f}%")
+                    if count is not None and len(quotes) >= count:
+                        break
+                elif event == 'error':
+                    click.echo(f"Warning: {data['error']}")
+            
+        except KeyboardInterrupt:
+            pass
+        except requests.RequestException as e:
+            click.echo(f"Error: Could not stream quotes. {str(e)}")
+        finally:
+            if response is not None:
+                response.close()
+        return quotes
+    
+    def watch(self, add=(), remove=()):
+        """Add symbols to or remove them from the watchlist, then show it"""
+        try:
+            if add:
+                response = requests.post(
+                    f"{self.config['server_url']}/api/watchlist",
+                    json={"user_id": self.config["user_id"], "symbols": list(add)}
+                )
+                if response.status_code in (400, 404):
+                    click.echo(f"Error: {response.json().get('error')}")
+                    return None
+                response.raise_for_status()
+            for symbol in remove:
+                response = requests.delete(
+                    f"{self.config['server_url']}/api/watchlist/{symbol}",
+                    params={"user_id": self.config["user_id"]}
+                )
+                if response.status_code == 404:
+                    click.echo(f"{symbol.upper()} is not on your watchlist.")
+                    continue
+                response.raise_for_status()
+            
+            response = requests.get(
+                f"{self.config['server_url']}/api/watchlist",
+                params={"user_id": self.config["user_id"]}
+            )
+            response.raise_for_status()
+            watchlist = response.json()
+            
+            if not watchlist:
+                click.echo("Your watchlist is empty. Add symbols with: tinytroupe watch AAPL MSFT")
+                return watchlist
+            
+            table_data = []
+            for item in watchlist:
+                quote = item.get('quote')
+                table_data.append([
+                    item['symbol'],
+                    f"{quote['price']:.2f}" if quote else '-',
+                    f"{quote['change_percent']:.2f}%" if quote else '-',
+                    item['created_at'][:10]
+                ])
+            click.echo(tabulate(
+                table_data,
+                headers=["Symbol", "Price", "Change", "Watched Since"],
+                tablefmt="pretty"
+            ))
+            
+            return watchlist
+            
+        except requests.RequestException as e:
+            click.echo(f"Error: Could not update watchlist. {str(e)}")
+            return None
+    
+    def search_symbols(self, prefix, limit=10):
+        """Look up symbols by ticker or company name prefix"""
+        try:
+            response = requests.get(
+                f"{self.config['server_url']}/api/financial-data/symbols",
+                params={"prefix": prefix, "limit": limit}
+            )
+            response.raise_for_status()
+            result = response.json()
+            
+            if not result['results']:
+                click.echo(f"No symbols match '{prefix}'.")
+                return result
+            
+            table_data = [[row['symbol'], row['name'], row['exchange']] for row in result['results']]
+            click.echo(tabulate(
+                table_data,
+                headers=["Symbol", "Name", "Exchange"],
+                tablefmt="pretty"
+            ))
+            
+            return result
+            
+        except requests.RequestException as e:
+            click.echo(f"Error: Could not look up symbols. {str(e)}")
+            return None
+    
+    def screen(self, filters, sort=None, limit=20, page=1):
+        """Screen stocks by fundamentals"""
+        try:
+            params = dict(filters)
+            params.update({"limit": limit, "offset": (page - 1) * limit})
+            if sort:
+                params["sort"] = sort
+            response = requests.get(
+                f"{self.config['server_url']}/api/financial-data/screen",
+                params=params
+            )
+            response.raise_for_status()
+            result = response.json()
+            
+            if not result['results']:
+                click.echo("No stocks match the screen.")
+                return result
+            
+            def number(value, fmt):
+                return format(value, fmt) if value is not None else '-'
+            
+            table_data = [[
+                row['symbol'],
+                number(row['price'], '.2f'),
+                number(row['pe_ratio'], '.2f'),
+                number(row['dividend_yield'], '.2f'),
+                number(row['market_cap'], ',.0f'),
+                f"{number(row['52_week_low'], '.2f')} - {number(row['52_week_high'], '.2f')}"
+            ] for row in result['results']]
+            click.echo(tabulate(
+                table_data,
+                headers=["Symbol", "Price", "P/E", "Yield %", "Market Cap", "52-Week Range"],
+                tablefmt="pretty"
+            ))
+            
+            first = result['offset'] + 1
+            last = result['offset'] + len(result['results'])
+            click.echo(f"Showing {first}-{last} of {result['total']} matches (universe of {result['universe']}).")
+            
+            return result
+            
+        except requests.RequestException as e:
+            click.echo(f"Error: Could not screen stocks. {str(e)}")
+            return None
+    
+    def ingest(self, paths, workers=None, restart=False, token_header=None):
+        """Ingest market data files from the server's ingest directory
+        
+        The admin token is sent in ``token_header``, defaulting to the
+        ADMIN_TOKEN_HEADER the server reads.
+        """
+        try:
+            payload = {"paths": list(paths), "restart": restart}
+            if workers:
+                payload["workers"] = workers
+            token_header = token_header or os.getenv('ADMIN_TOKEN_HEADER', 'X-Admin-Token')
+            response = requests.post(
+                f"{self.config['server_url']}/api/admin/ingest",
+                json=payload,
+                headers={token_header: os.getenv('TINYTROUPE_ADMIN_TOKEN', self.config.get('admin_token', ''))}
+            )
+            response.raise_for_status()
+            result = response.json()
+            
+            table_data = [[
+                os.path.basename(item['path']),
+                item['status'] + (" (resumed)" if item.get('resumed') else ""),
+                item.get('rows', 0),
+                item.get('written', 0),
+                item.get('rejected', 0),
+                item.get('duplicates', 0),
+                item.get('stale', 0),
+                f"{item['seconds']:.1f}s"
+            ] for item in result['files']]
+            click.echo(tabulate(
+                table_data,
+                headers=["File", "Status", "Rows", "Written", "Rejected", "Duplicates", "Stale", "Time"],
+                tablefmt="pretty"
+            ))
+            for item in result['files']:
+                if item.get('error'):
+                    click.echo(f"{os.path.basename(item['path'])}: {item['error']}")
+            
+            totals = result['totals']
+            click.echo(f"Wrote {totals['written']} bars from {totals['rows']} rows in {totals['seconds']:.1f}s.")
+            
+            return result
+            
+        except requests.RequestException as e:
+            click.echo(f"Error: Could not ingest market data. {str(e)}")
+            return None
+    
     def configure(self, server_url=None, user_id=None):
         """Configure the CLI client"""
         if server_url:
@@ -303,6 +563,61 @@ def analyze_stock(cli_client, symbol):
     cli_client.analyze_stock(symbol.upper())
 
 
+@cli.command('quote')
+@click.argument('symbol')
+@click.option('--count', '-n', type=int, help='Stop after this many quotes')
+@click.pass_obj
+def stream_quotes(cli_client, symbol, count):
+    """Follow a stock's live quote"""
+    cli_client.stream_quotes(symbol.upper(), count=count)
+
+
+@cli.command('watch')
+@click.argument('symbols', nargs=-1)
+@click.option('--remove', '-r', multiple=True, help='Symbol to stop watching (repeatable)')
+@click.pass_obj
+def watch_symbols(cli_client, symbols, remove):
+    """Show the watchlist, adding SYMBOLS to it first, e.g. watch AAPL MSFT"""
+    cli_client.watch(add=[symbol.upper() for symbol in symbols], remove=remove)
+
+
+@cli.command('symbols')
+@click.argument('prefix')
+@click.option('--limit', '-n', default=10, help='Most symbols to show')
+@click.pass_obj
+def search_symbols(cli_client, prefix, limit):
+    """Look up symbols by ticker or company name, e.g. symbols app"""
+    cli_client.search_symbols(prefix, limit=limit)
+
+
+@cli.command('screen')
+@click.argument('filters', nargs=-1)
+@click.option('--sort', '-s', help='Field to sort by, prefix with - for descending (e.g. -dividend_yield)')
+@click.option('--limit', '-n', default=20, help='Results per page')
+@click.option('--page', '-p', default=1, help='Page number')
+@click.pass_obj
+def screen_stocks(cli_client, filters, sort, limit, page):
+    """Screen stocks, e.g. screen pe_lt=15 dividend_yield_gt=3 --sort -dividend_yield"""
+    parsed = {}
+    for item in filters:
+        name, separator, value = item.partition('=')
+        if not separator:
+            raise click.BadParameter(f"Expected FIELD_OP=VALUE, got {item}", param_hint='FILTERS')
+        parsed[name] = value
+    cli_client.screen(parsed, sort=sort, limit=limit, page=page)
+
+
+@cli.command('ingest')
+@click.argument('paths', nargs=-1, required=True)
+@click.option('--workers', '-w', type=int, help='Files ingested at once')
+@click.option('--restart', is_flag=True, help='Ignore checkpoints and read the files from the start')
+@click.option('--token-header', help='Header carrying the admin token (default: $ADMIN_TOKEN_HEADER or X-Admin-Token)')
+@click.pass_obj
+def ingest_market_data(cli_client, paths, workers, restart, token_header):
+    """Ingest CSV/Parquet market data files from the server's ingest directory"""
+    cli_client.ingest(paths, workers=workers, restart=restart, token_header=token_header)
+
+
 @cli.command('config')
 @click.option('--server', help='TinyTroupe server URL')
 @click.option('--user', help='User ID')
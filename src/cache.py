@@ -0,0 +1,457 @@
+"""
+Shared cache backends for TinyTroupe Service
+"""
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class BaseCache:
+    """Interface implemented by every cache backend
+
+    Values must be JSON serializable so that they can be shared between
+    worker processes. TTLs are in seconds; a TTL of None or 0 means the entry
+    does not expire.
+    """
+
+    def lookup(self, key: str) -> Tuple[bool, Any]:
+        """Return ``(found, value)`` for a key"""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value"""
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Store a value only if the key is absent, returning True if stored"""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """Remove a key"""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """Remove every key"""
+        raise NotImplementedError
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached value or ``default``"""
+        found, value = self.lookup(key)
+        return value if found else default
+
+    @staticmethod
+    def _dumps(value: Any) -> bytes:
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def _loads(data: bytes) -> Any:
+        return json.loads(data)
+
+
+def _copy(value: Any) -> Any:
+    """Copy the dicts and lists of a JSON-like value, sharing its immutable leaves"""
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_copy(item) for item in value]
+    return value
+
+
+class LRUCache(BaseCache):
+    """In-process least recently used cache
+
+    Values are copied when stored and when returned, so, as with the shared
+    backends, a caller changing a value it got does not change the cached one.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[Optional[float], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+        return True, _copy(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + ttl if ttl else None
+        value = _copy(value)
+        with self._lock:
+            self._store(key, expires_at, value)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        value = _copy(value)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                return False
+            self._store(key, time.monotonic() + ttl if ttl else None, value)
+            return True
+
+    def _store(self, key: str, expires_at: Optional[float], value: Any) -> None:
+        """Insert an entry as the most recently used, evicting beyond ``max_entries``; caller holds the lock"""
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCache(BaseCache):
+    """Cache stored in a memory-mapped SQLite file shared by all workers on a host
+
+    Each thread keeps its own connection. The file uses WAL so readers in one
+    process never wait for a writer in another.
+    """
+
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str, mmap_size: int = 64 * 1024 * 1024, compress_over: int = 4096):
+        self.path = path
+        self.mmap_size = mmap_size
+        self.compress_over = compress_over
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL) WITHOUT ROWID'
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+            self._local.connection = connection
+        return connection
+
+    def _encode(self, value: Any) -> bytes:
+        data = self._dumps(value)
+        if len(data) > self.compress_over:
+            return b'z' + zlib.compress(data, 1)
+        return b'j' + data
+
+    def _decode(self, blob: bytes) -> Any:
+        blob = bytes(blob)
+        if blob[:1] == b'z':
+            return self._loads(zlib.decompress(blob[1:]))
+        return self._loads(blob[1:])
+
+    def lookup(self, key: str) -> Tuple[bool, Any]:
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return False, None
+        return True, self._decode(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, self._encode(value), time.time() + ttl if ttl else None)
+        )
+        self._maybe_purge()
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM cache WHERE key = ? AND expires_at <= ?', (key, now))
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, self._encode(value), now + ttl if ttl else None)
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return cursor.rowcount == 1
+
+    def delete(self, key: str) -> None:
+        self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self) -> None:
+        self._connection().execute('DELETE FROM cache')
+
+    def _maybe_purge(self) -> None:
+        with self._writes_lock:
+            self._writes += 1
+            purge = self._writes % self.PURGE_EVERY == 0
+        if purge:
+            self._connection().execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),))
+
+
+class RedisError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+
+class RedisCache(BaseCache):
+    """Cache backed by any server speaking the Redis protocol (RESP)
+
+    Only GET, SET (with PX/NX), DEL and SCAN are used, so Redis, Valkey,
+    KeyDB or a local stand-in all work. Each thread keeps its own socket.
+    """
+
+    def __init__(self, url: str = 'redis://localhost:6379/0', prefix: str = 'tinytroupe:', timeout: float = 2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.database = int(parsed.path.lstrip('/') or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._local.sock = sock
+        self._local.reader = sock.makefile('rb')
+        if self.password:
+            self._send('AUTH', self.password)
+        if self.database:
+            self._send('SELECT', self.database)
+
+    def _close(self) -> None:
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            try:
+                sock.close()
+            finally:
+                self._local.sock = None
+
+    def _read_reply(self):
+        line = self._local.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by cache server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise RedisError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length == -1:
+                return None
+            data = self._local.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            count = int(payload)
+            if count == -1:
+                return None
+            return [self._read_reply() for _ in range(count)]
+        raise RedisError(f"Unexpected reply type {kind!r}")
+
+    def _send(self, *args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        self._local.sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    def _command(self, *args):
+        """Send a command, reconnecting once if the socket went away"""
+        for attempt in range(2):
+            try:
+                if getattr(self._local, 'sock', None) is None:
+                    self._connect()
+                return self._send(*args)
+            except (ConnectionError, OSError):
+                self._close()
+                if attempt:
+                    raise
+
+    def lookup(self, key: str) -> Tuple[bool, Any]:
+        data = self._command('GET', self.prefix + key)
+        if data is None:
+            return False, None
+        return True, self._loads(data)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        args = ['SET', self.prefix + key, self._dumps(value)]
+        if ttl:
+            args += ['PX', max(int(ttl * 1000), 1)]
+        self._command(*args)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        args = ['SET', self.prefix + key, self._dumps(value), 'NX']
+        if ttl:
+            args += ['PX', max(int(ttl * 1000), 1)]
+        return self._command(*args) == 'OK'
+
+    def delete(self, key: str) -> None:
+        self._command('DEL', self.prefix + key)
+
+    def clear(self) -> None:
+        cursor = b'0'
+        while True:
+            cursor, keys = self._command('SCAN', cursor, 'MATCH', self.prefix + '*', 'COUNT', 500)
+            if keys:
+                self._command('DEL', *keys)
+            if cursor in (b'0', '0'):
+                break
+
+
+class CacheNamespace:
+    """View over a cache that prefixes keys and applies a namespace TTL"""
+
+    def __init__(self, cache: 'Cache', name: str, ttl: Optional[float] = None):
+        self.cache = cache
+        self.name = name
+        self._ttl = ttl
+
+    @property
+    def ttl(self) -> Optional[float]:
+        """Explicit TTL, else the configured TTL for this namespace"""
+        if self._ttl is not None:
+            return self._ttl
+        return self.cache.ttls.get(self.name, self.cache.default_ttl)
+
+    def key(self, key: str) -> str:
+        return f'{self.name}:{key}'
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.cache.backend.get(self.key(key), default)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.cache.backend.set(self.key(key), value, ttl if ttl is not None else self.ttl)
+
+    def delete(self, key: str) -> None:
+        self.cache.backend.delete(self.key(key))
+
+    def get_or_set(self, key: str, creator: Callable[[], Any], ttl: Optional[float] = None,
+                   cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        return self.cache.get_or_set(self.key(key), creator, ttl if ttl is not None else self.ttl, cacheable)
+
+
+class Cache:
+    """Flask extension selecting a cache backend from configuration
+
+    ``CACHE_BACKEND`` is one of ``lru`` (default, per process), ``sqlite``
+    (shared file at ``CACHE_PATH``) or ``redis`` (server at ``CACHE_URL``).
+    Until ``init_app`` runs an in-process LRU is used, so services can create
+    namespaces at import time.
+    """
+
+    LOCK_STRIPES = 64
+
+    def __init__(self, app=None):
+        self.backend: BaseCache = LRUCache()
+        self.default_ttl: Optional[float] = 300
+        self.ttls: Dict[str, float] = {}
+        self.lock_timeout = 10.0
+        self._stripes = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        """Create the configured backend"""
+        backend = app.config.get('CACHE_BACKEND', 'lru')
+        self.default_ttl = app.config.get('CACHE_DEFAULT_TTL', self.default_ttl)
+        self.ttls = dict(app.config.get('CACHE_TTLS', {}))
+        self.lock_timeout = app.config.get('CACHE_LOCK_TIMEOUT', self.lock_timeout)
+
+        if backend == 'sqlite':
+            path = app.config.get('CACHE_PATH') or os.path.join(app.instance_path, 'cache.sqlite3')
+            self.backend = SQLiteCache(path)
+        elif backend == 'redis':
+            self.backend = RedisCache(app.config.get('CACHE_URL', 'redis://localhost:6379/0'))
+        elif backend == 'lru':
+            self.backend = LRUCache(app.config.get('CACHE_MAX_ENTRIES', 10000))
+        else:
+            raise ValueError(f"Unknown cache backend: {backend}")
+
+        logger.info(f"Using {backend} cache backend")
+
+    def namespace(self, name: str, ttl: Optional[float] = None) -> CacheNamespace:
+        """Return a view of the cache whose keys are prefixed with ``name``"""
+        return CacheNamespace(self, name, ttl)
+
+    def clear(self) -> None:
+        """Remove every cached entry"""
+        self.backend.clear()
+
+    def get_or_set(self, key: str, creator: Callable[[], Any], ttl: Optional[float] = None,
+                   cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Return a cached value, computing it at most once across workers
+
+        The first caller to miss takes a short-lived lock entry in the backend
+        and computes the value; other callers, in this process or another,
+        poll for the value to appear. A lock stripe is held only while a
+        caller checks for the value and tries to take the lock, never while
+        it waits or computes, so misses on other keys of the same stripe are
+        not held up. Waiters compute the value themselves if the lock holder
+        does not finish within ``CACHE_LOCK_TIMEOUT``, and take over the lock
+        if the holder releases it without storing a value. Stored TTLs are
+        jittered slightly so entries written together do not all expire at
+        once.
+
+        Args:
+            key: Cache key
+            creator: Function computing the value on a miss
+            ttl: Time to live in seconds
+            cacheable: Tells whether a computed value may be stored; values it
+                rejects are returned to this caller only
+
+        Returns:
+            The cached or freshly computed value
+        """
+        found, value = self.backend.lookup(key)
+        if found:
+            return value
+
+        stripe = self._stripes[hash(key) % self.LOCK_STRIPES]
+        lock_key = f'lock:{key}'
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            with stripe:
+                found, value = self.backend.lookup(key)
+                if found:
+                    return value
+                locked = self.backend.add(lock_key, os.getpid(), self.lock_timeout)
+            if locked or time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+
+        try:
+            value = creator()
+            if cacheable is None or cacheable(value):
+                self.backend.set(key, value, ttl * random.uniform(0.9, 1.0) if ttl else ttl)
+            return value
+        finally:
+            if locked:
+                self.backend.delete(lock_key)
@@ -0,0 +1,44 @@
+"""
+Cooperative cancellation for request-scoped work in TinyTroupe Service
+"""
+import threading
+from typing import Optional
+
+
+class OperationCancelled(Exception):
+    """Raised when work is abandoned because its caller went away"""
+
+
+class CancellationToken:
+    """A flag shared between a request and the work it started
+
+    The request side calls ``cancel`` (for example when the client
+    disconnects from a streaming response) and the workers check
+    ``cancelled`` between steps, so calls that have not started yet are
+    never made.
+    """
+
+    __slots__ = ('_event', 'reason')
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = 'cancelled') -> None:
+        """Request cancellation; only the first reason is kept"""
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def raise_if_cancelled(self) -> None:
+        """Raise OperationCancelled if cancellation was requested"""
+        if self._event.is_set():
+            raise OperationCancelled(self.reason)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until cancelled or the timeout elapses; returns whether cancelled"""
+        return self._event.wait(timeout)
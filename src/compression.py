@@ -0,0 +1,132 @@
+"""
+HTTP response compression for TinyTroupe Service
+"""
+import gzip
+import logging
+import zlib
+from typing import Iterable, Iterator, Optional
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIMETYPES = (
+    'application/json',
+    'text/html',
+    'text/css',
+    'text/plain',
+    'application/javascript',
+    'text/javascript',
+)
+
+
+class Compress:
+    """Flask extension compressing responses based on ``Accept-Encoding``
+
+    Brotli is preferred when the ``brotli`` package is installed and the client
+    accepts it, otherwise gzip is used. Streamed responses are compressed
+    chunk by chunk as they are sent. Responses smaller than
+    ``COMPRESS_MIN_SIZE`` bytes and responses that already carry a
+    ``Content-Encoding`` are left untouched.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.min_size = 500
+        self.gzip_level = 6
+        self.brotli_level = 4
+        self.mimetypes = set(DEFAULT_MIMETYPES)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        """Read settings from the app config and register the response hook"""
+        self.enabled = app.config.get('COMPRESS_ENABLED', self.enabled)
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.gzip_level = app.config.get('COMPRESS_LEVEL', self.gzip_level)
+        self.brotli_level = app.config.get('COMPRESS_BR_LEVEL', self.brotli_level)
+        self.mimetypes = set(app.config.get('COMPRESS_MIMETYPES', self.mimetypes))
+        app.after_request(self.after_request)
+
+    @property
+    def encodings(self):
+        """Encodings this server can produce, in order of preference"""
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def negotiate(self, accept_encodings) -> Optional[str]:
+        """Pick the best encoding allowed by the request's ``Accept-Encoding``
+
+        Args:
+            accept_encodings: Parsed ``Accept-Encoding`` header from werkzeug
+
+        Returns:
+            The chosen encoding, or None to send the body as is
+        """
+        best, best_quality = None, 0
+        for encoding in self.encodings:
+            quality = accept_encodings.quality(encoding)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compress(self, data: bytes, encoding: str) -> bytes:
+        """Compress a body with the given content encoding"""
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_level)
+        return gzip.compress(data, compresslevel=self.gzip_level)
+
+    def compress_stream(self, chunks: Iterable, encoding: str) -> Iterator[bytes]:
+        """Compress a streamed body without collecting it first"""
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_level)
+            process, finish = compressor.process, compressor.finish
+        else:
+            compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            process, finish = compressor.compress, compressor.flush
+        try:
+            for chunk in chunks:
+                data = process(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+                if data:
+                    yield data
+            yield finish()
+        finally:
+            # Lets the wrapped generator clean up, e.g. pop its request context
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    def after_request(self, response):
+        """Compress eligible responses"""
+        from flask import request
+
+        if not self.enabled:
+            return response
+
+        response.vary.add('Accept-Encoding')
+
+        if (response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in self.mimetypes
+                or not 200 <= response.status_code < 300):
+            return response
+
+        if not response.is_streamed and (response.content_length or 0) < self.min_size:
+            return response
+
+        encoding = self.negotiate(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self.compress_stream(response.response, encoding)
+            response.headers['Content-Encoding'] = encoding
+            response.headers.pop('Content-Length', None)
+            return response
+
+        body = self.compress(response.get_data(), encoding)
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        response.headers['Content-Length'] = str(len(body))
+        return response
@@ -19,9 +19,105 @@ class Config:
     AZURE_OPENAI_ENDPOINT = os.getenv('AZURE_OPENAI_ENDPOINT')
     AZURE_OPENAI_API_VERSION = os.getenv('AZURE_OPENAI_API_VERSION', '2023-05-15')
     
+    # LLM model selection and pricing (USD per million prompt / completion tokens)
+    LLM_MODEL = os.getenv('LLM_MODEL', 'gpt-4o')
+    LLM_DOWNGRADE_MODEL = os.getenv('LLM_DOWNGRADE_MODEL', 'gpt-4o-mini')
+    LLM_PRICING = {
+        'gpt-4o': (2.50, 10.00),
+        'gpt-4o-mini': (0.15, 0.60),
+    }
+    
+    # Daily token budgets (0 disables). Past a soft budget turns use LLM_DOWNGRADE_MODEL,
+    # past a hard budget they are rejected.
+    USAGE_USER_SOFT_DAILY_TOKENS = int(os.getenv('USAGE_USER_SOFT_DAILY_TOKENS', '0'))
+    USAGE_USER_HARD_DAILY_TOKENS = int(os.getenv('USAGE_USER_HARD_DAILY_TOKENS', '0'))
+    USAGE_ADVISOR_SOFT_DAILY_TOKENS = int(os.getenv('USAGE_ADVISOR_SOFT_DAILY_TOKENS', '0'))
+    USAGE_ADVISOR_HARD_DAILY_TOKENS = int(os.getenv('USAGE_ADVISOR_HARD_DAILY_TOKENS', '0'))
+    
     # Database configuration
     DATABASE_URI = os.getenv('DATABASE_URI', 'sqlite:///tinytroupe.db')
     
+    # SQLite production mode: WAL journal, busy timeout, pooling and a single writer thread. On by default with
+    # FLASK_ENV=production; set here rather than on ProductionConfig so services reading Config see the same value
+    SQLITE_PRODUCTION_MODE = os.getenv(
+        'SQLITE_PRODUCTION_MODE', str(os.getenv('FLASK_ENV') == 'production')) == 'True'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', '65536'))
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+    SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', '10'))
+    SQLITE_POOL_OVERFLOW = int(os.getenv('SQLITE_POOL_OVERFLOW', '10'))
+    SQLITE_WRITE_BATCH_SIZE = int(os.getenv('SQLITE_WRITE_BATCH_SIZE', '64'))
+    SQLITE_WRITE_BATCH_WINDOW_MS = float(os.getenv('SQLITE_WRITE_BATCH_WINDOW_MS', '2'))
+    
+    # Cache configuration: 'lru' (per process), 'sqlite' (shared file) or 'redis'
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'lru')
+    CACHE_PATH = os.getenv('CACHE_PATH')  # defaults to instance/cache.sqlite3
+    CACHE_URL = os.getenv('CACHE_URL', 'redis://localhost:6379/0')
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '10000'))
+    CACHE_DEFAULT_TTL = int(os.getenv('CACHE_DEFAULT_TTL', '300'))
+    CACHE_LOCK_TIMEOUT = float(os.getenv('CACHE_LOCK_TIMEOUT', '10'))
+    CACHE_TTLS = {
+        'quotes': int(os.getenv('CACHE_TTL_QUOTES', '60')),
+        'analysis': int(os.getenv('CACHE_TTL_ANALYSIS', '900')),
+        'indicators': int(os.getenv('CACHE_TTL_INDICATORS', '86400')),
+        'charts': int(os.getenv('CACHE_TTL_CHARTS', '86400')),
+    }
+    
+    # Local daily price history: one memory-mapped OHLCV file per symbol
+    PRICE_HISTORY_PATH = os.getenv('PRICE_HISTORY_PATH', str(Path(__file__).parent.parent / 'instance' / 'prices'))
+    PRICE_HISTORY_MAX_BARS = int(os.getenv('PRICE_HISTORY_MAX_BARS', '5000'))  # per history response
+    
+    # Symbol master: CSV of symbol,name[,exchange]; when present, unknown symbols are rejected
+    # before any provider call
+    SYMBOL_MASTER_PATH = os.getenv('SYMBOL_MASTER_PATH', str(Path(__file__).parent.parent / 'instance' / 'symbols.csv'))
+    SYMBOL_SEARCH_MAX_LIMIT = int(os.getenv('SYMBOL_SEARCH_MAX_LIMIT', '50'))
+    
+    # Chart series are downsampled to at most CHART_MAX_WIDTH points; periods are calendar days
+    # back from the latest bar (None for all history)
+    CHART_MAX_WIDTH = int(os.getenv('CHART_MAX_WIDTH', '4000'))
+    CHART_PERIODS = {'1m': 31, '3m': 92, '6m': 183, '1y': 366, '2y': 731, '5y': 1827, 'max': None}
+    
+    # Portfolio analysis: risk is measured over the last PORTFOLIO_LOOKBACK_DAYS common trading days,
+    # with betas against PORTFOLIO_BENCHMARK when its history is stored
+    PORTFOLIO_LOOKBACK_DAYS = int(os.getenv('PORTFOLIO_LOOKBACK_DAYS', '252'))
+    PORTFOLIO_BENCHMARK = os.getenv('PORTFOLIO_BENCHMARK', 'SPY')
+    PORTFOLIO_MAX_HOLDINGS = int(os.getenv('PORTFOLIO_MAX_HOLDINGS', '500'))
+    
+    # Stock screener: quotes are indexed as they are fetched, and prices and 52-week ranges are
+    # synced from the price history at most every SCREENER_REFRESH_SECONDS
+    SCREENER_REFRESH_SECONDS = float(os.getenv('SCREENER_REFRESH_SECONDS', '60'))
+    SCREENER_MAX_LIMIT = int(os.getenv('SCREENER_MAX_LIMIT', '500'))
+    
+    # Watchlists and off-peak pre-warming: once a day inside PREWARM_WINDOW_UTC, watched symbols' quotes and
+    # analyses are refreshed by PREWARM_WORKERS threads, paced to the provider and LLM rate limits (0 disables
+    # one). Analyses are cached for PREWARM_TTL_SECONDS, quotes for the usual quotes TTL. The scheduler runs
+    # in every process that enables it, so enable it in one worker only
+    WATCHLIST_MAX_SYMBOLS = int(os.getenv('WATCHLIST_MAX_SYMBOLS', '200'))
+    PREWARM_ENABLED = os.getenv('PREWARM_ENABLED', 'False') == 'True'
+    PREWARM_WINDOW_UTC = os.getenv('PREWARM_WINDOW_UTC', '08:00-11:00')
+    PREWARM_WORKERS = int(os.getenv('PREWARM_WORKERS', '4'))
+    PREWARM_QUOTES_PER_MINUTE = float(os.getenv('PREWARM_QUOTES_PER_MINUTE', '30'))
+    PREWARM_LLM_CALLS_PER_MINUTE = float(os.getenv('PREWARM_LLM_CALLS_PER_MINUTE', '60'))
+    PREWARM_TTL_SECONDS = int(os.getenv('PREWARM_TTL_SECONDS', '93600'))  # analyses, until after the next day's run
+    PREWARM_CHECK_SECONDS = float(os.getenv('PREWARM_CHECK_SECONDS', '60'))
+    
+    # Live quotes: each symbol with stream subscribers is polled once every QUOTE_POLL_SECONDS, however
+    # many clients watch it, and polling stops when the last one disconnects
+    QUOTE_POLL_SECONDS = float(os.getenv('QUOTE_POLL_SECONDS', '15'))
+    QUOTE_STREAM_MAX_SUBSCRIBERS = int(os.getenv('QUOTE_STREAM_MAX_SUBSCRIBERS', '1000'))
+    
+    # Bulk market-data ingestion: files under INGEST_PATH are streamed INGEST_CHUNK_ROWS rows at a time,
+    # INGEST_WORKERS files at once, checkpointing progress under INGEST_CHECKPOINT_PATH
+    INGEST_PATH = os.getenv('INGEST_PATH', str(Path(__file__).parent.parent / 'instance' / 'ingest'))
+    INGEST_CHECKPOINT_PATH = os.getenv('INGEST_CHECKPOINT_PATH', str(Path(__file__).parent.parent / 'instance' / 'ingest_checkpoints'))
+    INGEST_CHUNK_ROWS = int(os.getenv('INGEST_CHUNK_ROWS', '50000'))
+    INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '4'))
+    
+    # Admin endpoints are disabled unless ADMIN_TOKEN is set; clients send it in ADMIN_TOKEN_HEADER
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+    ADMIN_TOKEN_HEADER = os.getenv('ADMIN_TOKEN_HEADER', 'X-Admin-Token')
+    
     # Financial API configuration
     YAHOO_FINANCE_API_KEY = os.getenv('YAHOO_FINANCE_API_KEY')
     ALPHA_VANTAGE_API_KEY = os.getenv('ALPHA_VANTAGE_API_KEY')
@@ -30,6 +126,86 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev_secret_key')
     DEBUG = os.getenv('FLASK_DEBUG', 'False') == 'True'
     
+    # Response compression configuration
+    COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', 'True') == 'True'
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '500'))
+    COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', '6'))
+    COMPRESS_BR_LEVEL = int(os.getenv('COMPRESS_BR_LEVEL', '4'))
+    
+    # Advisor routing: 'all' advisors answer every message, or only the 'top_k' most relevant,
+    # or those scoring at least 'threshold'. Conversations can override these in their settings.
+    ADVISOR_ROUTING_MODE = os.getenv('ADVISOR_ROUTING_MODE', 'all')
+    ADVISOR_ROUTING_TOP_K = int(os.getenv('ADVISOR_ROUTING_TOP_K', '2'))
+    ADVISOR_ROUTING_THRESHOLD = float(os.getenv('ADVISOR_ROUTING_THRESHOLD', '0.3'))
+    
+    # Request deadlines: clients may send a shorter budget in the X-Request-Deadline-Ms header.
+    # Model calls still running DEADLINE_RESERVE_MS before the deadline get a degraded template answer.
+    REQUEST_DEADLINE_DEFAULT_MS = int(os.getenv('REQUEST_DEADLINE_DEFAULT_MS', '30000'))
+    REQUEST_DEADLINE_MAX_MS = int(os.getenv('REQUEST_DEADLINE_MAX_MS', '120000'))
+    REQUEST_DEADLINE_HEADER = os.getenv('REQUEST_DEADLINE_HEADER', 'X-Request-Deadline-Ms')
+    DEADLINE_RESERVE_MS = int(os.getenv('DEADLINE_RESERVE_MS', '250'))
+    
+    # Hedged model calls: a duplicate request is sent once a call outlives the p95 latency of recent calls
+    LLM_MAX_WORKERS = int(os.getenv('LLM_MAX_WORKERS', '16'))
+    LLM_HEDGING_ENABLED = os.getenv('LLM_HEDGING_ENABLED', 'True') == 'True'
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))
+    LLM_HEDGE_MIN_DELAY_MS = int(os.getenv('LLM_HEDGE_MIN_DELAY_MS', '50'))
+    
+    # Streamed turns send a comment line this often so a disconnected client is noticed
+    # (and its pending advisor calls cancelled) even while every model call is still running
+    STREAM_HEARTBEAT_SECONDS = float(os.getenv('STREAM_HEARTBEAT_SECONDS', '5'))
+    
+    # Idempotency keys: POSTs sent with this header are processed once and retries get the stored
+    # result for IDEMPOTENCY_TTL_SECONDS. A retry arriving while the original is still running waits
+    # up to IDEMPOTENCY_WAIT_SECONDS; an original that has not finished after IDEMPOTENCY_LOCK_SECONDS
+    # (e.g. its worker died) is taken over by the next retry.
+    IDEMPOTENCY_HEADER = os.getenv('IDEMPOTENCY_HEADER', 'Idempotency-Key')
+    IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+    IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', '300'))
+    IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', '60'))
+    IDEMPOTENCY_POLL_MS = int(os.getenv('IDEMPOTENCY_POLL_MS', '100'))
+    
+    # Generation mode: 'per_advisor' calls the model once per advisor, 'board' asks every selected
+    # advisor in a single structured call. Conversations can override this in their settings.
+    GENERATION_MODE = os.getenv('GENERATION_MODE', 'per_advisor')
+    
+    # Concurrent turns: persona states and conversations carry a version, and a write that lost the race
+    # to another worker is retried up to OCC_MAX_RETRIES times. With TURN_ORDERING 'serialized' (or the
+    # conversation setting), turns on one conversation queue for a lease instead, waiting up to
+    # TURN_WAIT_SECONDS; a lease not released within TURN_LEASE_SECONDS is taken over
+    OCC_MAX_RETRIES = int(os.getenv('OCC_MAX_RETRIES', '5'))
+    OCC_BACKOFF_MS = float(os.getenv('OCC_BACKOFF_MS', '10'))
+    TURN_ORDERING = os.getenv('TURN_ORDERING', 'optimistic')
+    TURN_WAIT_SECONDS = float(os.getenv('TURN_WAIT_SECONDS', '60'))
+    TURN_LEASE_SECONDS = int(os.getenv('TURN_LEASE_SECONDS', '300'))
+    TURN_POLL_MS = int(os.getenv('TURN_POLL_MS', '100'))
+    
+    # Most messages returned by one page of GET /api/conversations/<id>/messages?after=<seq>&limit=<n>
+    MESSAGES_MAX_LIMIT = int(os.getenv('MESSAGES_MAX_LIMIT', '500'))
+    
+    # Transcript snapshots: each conversation's messages kept serialized and gzip compressed, appended to
+    # on every turn, so a full GET .../messages reads one row. A snapshot is rebuilt when it is read with
+    # more than TRANSCRIPT_MAX_TAIL newer messages missing from it, or after TRANSCRIPT_MAX_MEMBERS appends
+    TRANSCRIPT_SNAPSHOTS_ENABLED = os.getenv('TRANSCRIPT_SNAPSHOTS_ENABLED', 'True') == 'True'
+    TRANSCRIPT_MAX_TAIL = int(os.getenv('TRANSCRIPT_MAX_TAIL', '50'))
+    TRANSCRIPT_MAX_MEMBERS = int(os.getenv('TRANSCRIPT_MAX_MEMBERS', '200'))
+    
+    # Persona semantic memory: earlier exchanges are embedded with a hashing vectorizer and the
+    # most similar ones are added to prompts once they fall out of the recent message window
+    PERSONA_MEMORY_ENABLED = os.getenv('PERSONA_MEMORY_ENABLED', 'True') == 'True'
+    PERSONA_MEMORY_DIM = int(os.getenv('PERSONA_MEMORY_DIM', '256'))
+    PERSONA_MEMORY_TOP_K = int(os.getenv('PERSONA_MEMORY_TOP_K', '3'))
+    PERSONA_MEMORY_MIN_SCORE = float(os.getenv('PERSONA_MEMORY_MIN_SCORE', '0.1'))
+    PERSONA_MEMORY_CACHED_INDEXES = int(os.getenv('PERSONA_MEMORY_CACHED_INDEXES', '256'))
+    
+    # Near-duplicate response reuse: a recent answer to a near-identical, self-contained question
+    # is returned instead of calling the model (can also be turned off per advisor)
+    RESPONSE_REUSE_ENABLED = os.getenv('RESPONSE_REUSE_ENABLED', 'True') == 'True'
+    RESPONSE_REUSE_SIMILARITY = float(os.getenv('RESPONSE_REUSE_SIMILARITY', '0.85'))
+    RESPONSE_REUSE_MAX_AGE = int(os.getenv('RESPONSE_REUSE_MAX_AGE', '3600'))  # seconds
+    RESPONSE_REUSE_MAX_ENTRIES = int(os.getenv('RESPONSE_REUSE_MAX_ENTRIES', '1000'))  # per advisor
+    RESPONSE_REUSE_MAX_LENGTH = int(os.getenv('RESPONSE_REUSE_MAX_LENGTH', '200'))  # characters
+    
     # Advisor configuration
     DEFAULT_ADVISORS = [
         {
@@ -0,0 +1,268 @@
+"""
+Database tuning and serialized writes for TinyTroupe Service
+"""
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm.exc import StaleDataError
+
+logger = logging.getLogger(__name__)
+
+
+def is_sqlite_file(uri: str) -> bool:
+    """Return True when the URI points at an on-disk SQLite database"""
+    return uri.startswith('sqlite') and ':memory:' not in uri and uri not in ('sqlite://', 'sqlite:///')
+
+
+def sqlite_engine_options(config) -> Dict[str, Any]:
+    """Build SQLAlchemy engine options for the configured database
+
+    In SQLite production mode file databases get a pooled engine whose
+    connections may be shared between threads, with the busy timeout applied
+    at connect time. Other databases keep SQLAlchemy's defaults.
+
+    Args:
+        config: Configuration class
+
+    Returns:
+        Options for ``SQLALCHEMY_ENGINE_OPTIONS``
+    """
+    if not (config.SQLITE_PRODUCTION_MODE and is_sqlite_file(config.DATABASE_URI)):
+        return {}
+
+    return {
+        'pool_size': config.SQLITE_POOL_SIZE,
+        'max_overflow': config.SQLITE_POOL_OVERFLOW,
+        'pool_timeout': config.SQLITE_BUSY_TIMEOUT_MS / 1000,
+        'connect_args': {
+            'timeout': config.SQLITE_BUSY_TIMEOUT_MS / 1000,
+            'check_same_thread': False,
+        },
+    }
+
+
+def enable_sqlite_pragmas(engine, config) -> None:
+    """Apply WAL journaling and tuned pragmas to every new SQLite connection
+
+    Args:
+        engine: SQLAlchemy engine to configure
+        config: Configuration class
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = [
+        'PRAGMA journal_mode=WAL',
+        f'PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}',
+        f'PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT_MS)}',
+        # Negative values are KiB rather than pages
+        f'PRAGMA cache_size=-{int(config.SQLITE_CACHE_SIZE_KB)}',
+        f'PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}',
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    logger.info("SQLite production mode enabled (WAL, synchronous=%s)", config.SQLITE_SYNCHRONOUS)
+
+
+class ConcurrentUpdateError(Exception):
+    """Raised when a versioned row kept changing underneath a write, or no longer has the expected version"""
+
+
+class _WriteJob:
+    """A unit of write work waiting for the writer thread"""
+
+    __slots__ = ('fn', 'done', 'result', 'error')
+
+    def __init__(self, fn: Callable):
+        self.fn = fn
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def resolve(self, result=None, error=None) -> None:
+        self.result = result
+        self.error = error
+        self.done.set()
+
+
+class WriteQueue:
+    """Serializes database writes, group-committing them from a single thread
+
+    Write work is expressed as a function taking a session. When the queue is
+    disabled the function runs on the caller's ``db.session`` and is committed
+    immediately. When enabled, functions are handed to one writer thread which
+    drains whatever is queued (up to ``SQLITE_WRITE_BATCH_SIZE`` jobs, waiting
+    at most ``SQLITE_WRITE_BATCH_WINDOW_MS`` for more to arrive) and commits
+    them in a single transaction. If that transaction fails, the jobs are
+    retried one by one so a bad write only fails its own caller.
+
+    Because a job may be executed more than once and runs on another thread's
+    session, it must only perform database work and should return plain data
+    rather than ORM instances.
+    """
+
+    _STOP = object()
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.batch_size = 64
+        self.batch_window = 0.002
+        self.batches_committed = 0
+        self.conflict_retries = 5
+        self.conflict_backoff = 0.01
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        """Read settings from the app config"""
+        self.app = app
+        self.enabled = app.config.get('SQLITE_WRITE_QUEUE', False)
+        self.batch_size = app.config.get('SQLITE_WRITE_BATCH_SIZE', self.batch_size)
+        self.batch_window = app.config.get('SQLITE_WRITE_BATCH_WINDOW_MS', self.batch_window * 1000) / 1000
+        self.conflict_retries = app.config.get('OCC_MAX_RETRIES', self.conflict_retries)
+        self.conflict_backoff = app.config.get('OCC_BACKOFF_MS', self.conflict_backoff * 1000) / 1000
+
+    def run(self, fn: Callable, timeout: Optional[float] = None) -> Any:
+        """Execute a write function and commit it
+
+        Args:
+            fn: Function receiving a SQLAlchemy session and returning a result
+            timeout: Seconds to wait for the writer thread, None to wait forever
+
+        Returns:
+            Whatever ``fn`` returned
+        """
+        if not self.enabled:
+            from src.extensions import db
+            try:
+                result = fn(db.session)
+                db.session.commit()
+                return result
+            except Exception:
+                db.session.rollback()
+                raise
+
+        job = _WriteJob(fn)
+        self._ensure_started()
+        self._queue.put(job)
+        if not job.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for the database writer")
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def run_versioned(self, fn: Callable, retries: Optional[int] = None) -> Any:
+        """Execute a write that updates versioned rows, retrying it if another writer got there first
+
+        Rows mapped with a ``version_id_col`` are only updated while they
+        still have the version they were read with. When another worker or
+        thread committed in between, the write is rolled back and ``fn`` runs
+        again after a short randomized backoff, so it must read the rows it
+        changes from its session (with ``populate_existing``) rather than
+        reuse values read before.
+
+        Args:
+            fn: Function receiving a SQLAlchemy session and returning a result
+            retries: Attempts after the first, OCC_MAX_RETRIES by default
+
+        Returns:
+            Whatever ``fn`` returned
+
+        Raises:
+            ConcurrentUpdateError: If every attempt lost the race
+        """
+        retries = self.conflict_retries if retries is None else retries
+        for attempt in range(retries + 1):
+            try:
+                return self.run(fn)
+            except StaleDataError as e:
+                if attempt == retries:
+                    raise ConcurrentUpdateError(
+                        f"Gave up after {retries + 1} attempts: the data kept changing concurrently") from e
+                logger.info("Write conflict on attempt %d, retrying: %s", attempt + 1, e)
+                time.sleep(random.uniform(0, self.conflict_backoff * 2 ** attempt))
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Stop the writer thread after draining queued jobs"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(self._STOP)
+            thread.join(timeout)
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name='db-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.shutdown)
+
+    def _next_batch(self, first) -> List:
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is self._STOP:
+                self._queue.put(job)
+                break
+            batch.append(job)
+        return batch
+
+    def _worker(self) -> None:
+        from src.extensions import db
+
+        with self.app.app_context():
+            while True:
+                first = self._queue.get()
+                if first is self._STOP:
+                    break
+                batch = self._next_batch(first)
+                try:
+                    self._commit_batch(db.session, batch)
+                finally:
+                    # Start every batch with an empty identity map
+                    db.session.remove()
+
+    def _commit_batch(self, session, batch: List[_WriteJob]) -> None:
+        try:
+            results = [job.fn(session) for job in batch]
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            if len(batch) == 1:
+                batch[0].resolve(error=e)
+                return
+            logger.warning("Group commit of %d writes failed (%s), retrying individually", len(batch), e)
+            for job in batch:
+                self._commit_batch(session, [job])
+            return
+
+        self.batches_committed += 1
+        for job, result in zip(batch, results):
+            job.resolve(result)
@@ -0,0 +1,96 @@
+"""
+Request-scoped deadlines for TinyTroupe Service
+"""
+import logging
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when work cannot finish before the request deadline"""
+
+
+class Deadline:
+    """An absolute point in time by which a request must be answered
+
+    Deadlines are created from a relative budget and measured with the
+    monotonic clock, so they are passed down the call chain as-is rather than
+    re-derived from timeouts at every layer.
+    """
+
+    __slots__ = ('expires_at',)
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def after_ms(cls, milliseconds: float) -> 'Deadline':
+        """Create a deadline ``milliseconds`` from now"""
+        return cls(milliseconds / 1000)
+
+    def remaining(self) -> float:
+        """Seconds left, never negative"""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self, reserve: float = 0.0) -> bool:
+        """Whether less than ``reserve`` seconds are left"""
+        return self.remaining() <= reserve
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """Remaining time as a timeout for a blocking call, optionally capped"""
+        remaining = self.remaining()
+        return min(remaining, cap) if cap is not None else remaining
+
+    def check(self, what: str = 'request') -> None:
+        """Raise DeadlineExceeded if the deadline has passed"""
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline exceeded before {what} completed")
+
+    def __repr__(self):
+        return f'<Deadline {self.remaining() * 1000:.0f}ms left>'
+
+
+class Deadlines:
+    """Flask extension attaching a deadline to every request
+
+    Clients may shorten (never extend past ``REQUEST_DEADLINE_MAX_MS``) the
+    server default ``REQUEST_DEADLINE_DEFAULT_MS`` by sending a budget in
+    milliseconds in the ``REQUEST_DEADLINE_HEADER`` header.
+    """
+
+    def __init__(self, app=None):
+        self.default_ms = 30000
+        self.max_ms = 120000
+        self.header = 'X-Request-Deadline-Ms'
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        """Read settings from the app config and register the request hook"""
+        self.default_ms = app.config.get('REQUEST_DEADLINE_DEFAULT_MS', self.default_ms)
+        self.max_ms = app.config.get('REQUEST_DEADLINE_MAX_MS', self.max_ms)
+        self.header = app.config.get('REQUEST_DEADLINE_HEADER', self.header)
+        app.before_request(self.before_request)
+
+    def before_request(self):
+        """Start the deadline clock for the current request"""
+        from flask import g, jsonify, request
+
+        budget_ms = self.default_ms
+        requested = request.headers.get(self.header)
+        if requested is not None:
+            try:
+                budget_ms = float(requested)
+            except ValueError:
+                return jsonify({'error': f'{self.header} must be a number of milliseconds'}), 400
+            if budget_ms <= 0:
+                return jsonify({'error': f'{self.header} must be positive'}), 400
+        g.deadline = Deadline.after_ms(min(budget_ms, self.max_ms))
+
+
+def current_deadline() -> Optional[Deadline]:
+    """The deadline of the request being handled, if any"""
+    from flask import g, has_request_context
+    return g.get('deadline') if has_request_context() else None
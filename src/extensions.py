@@ -3,9 +3,17 @@ Shared Flask extensions for TinyTroupe Service
 """
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from src.cache import Cache
+from src.compression import Compress
+from src.database import WriteQueue
+from src.deadline import Deadlines
 
 # Initialize extensions
 db = SQLAlchemy()
 cors = CORS()
+compress = Compress()
+db_writer = WriteQueue()
+cache = Cache()
+deadlines = Deadlines()
 
 # These will be properly initialized with init_app later
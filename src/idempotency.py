@@ -0,0 +1,242 @@
+"""
+Idempotency-Key handling for TinyTroupe Service
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from src.config import Config
+from src.deadline import current_deadline
+from src.extensions import db_writer
+from src.models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+# Longest key accepted, matching the column size
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    """Raised when a key is reused for a different request"""
+
+
+class IdempotencyInProgress(Exception):
+    """Raised when the original request is still running after the wait timeout"""
+
+
+def request_fingerprint(method: str, path: str, body: Any) -> str:
+    """Hash the parts of a request that must match for a retry to reuse its result"""
+    canonical = json.dumps([method, path, body], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class IdempotencyStore:
+    """Records request outcomes by idempotency key in the ``idempotency_keys`` table
+
+    The first request with a key claims it by inserting a row without a
+    status code; retries then either get the stored outcome or wait until
+    the original completes. Waiters in the same process are woken as soon
+    as the outcome is stored, others poll the table.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._events: Dict[Tuple[str, str], threading.Event] = {}
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+    def _event(self, scope: str, key: str) -> threading.Event:
+        with self._lock:
+            return self._events.setdefault((scope, key), threading.Event())
+
+    def _wake(self, scope: str, key: str) -> None:
+        with self._lock:
+            event = self._events.pop((scope, key), None)
+        if event is not None:
+            event.set()
+
+    def _claim(self, scope: str, key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        purge = time.monotonic() - self._last_purge > Config.IDEMPOTENCY_LOCK_SECONDS
+        if purge:
+            self._last_purge = time.monotonic()
+
+        def claim(session):
+            if purge:
+                session.query(IdempotencyKey).filter(IdempotencyKey.expires_at < now).delete()
+            record = session.get(IdempotencyKey, (scope, key))
+            if record is not None and record.expires_at > now:
+                return {
+                    'fingerprint': record.fingerprint,
+                    'status_code': record.status_code,
+                    'response': record.response
+                }
+            lease = now + timedelta(seconds=Config.IDEMPOTENCY_LOCK_SECONDS)
+            if record is None:
+                session.add(IdempotencyKey(scope=scope, key=key, fingerprint=fingerprint,
+                                           created_at=now, expires_at=lease))
+            else:
+                # Expired result or abandoned lease: start over
+                record.fingerprint = fingerprint
+                record.status_code = None
+                record.response = None
+                record.created_at = now
+                record.expires_at = lease
+            return None
+
+        try:
+            return db_writer.run(claim)
+        except IntegrityError:
+            # Another request inserted the key first; read what it stored
+            return db_writer.run(claim)
+
+    def begin(self, scope: str, key: str, fingerprint: str,
+              timeout: Optional[float] = None) -> Optional[Tuple[int, Any]]:
+        """Claim a key, or get the outcome already stored for it
+
+        Args:
+            scope: Endpoint the key is used on
+            key: Client supplied idempotency key
+            fingerprint: ``request_fingerprint`` of the request
+            timeout: Seconds to wait for an original still in progress
+
+        Returns:
+            None if the caller now owns the key and must ``complete`` or
+            ``release`` it, else the stored (status code, body)
+
+        Raises:
+            IdempotencyConflict: If the key was used with a different request
+            IdempotencyInProgress: If the original did not finish within the timeout
+        """
+        timeout = Config.IDEMPOTENCY_WAIT_SECONDS if timeout is None else timeout
+        give_up_at = time.monotonic() + timeout
+        while True:
+            event = self._event(scope, key)
+            state = self._claim(scope, key, fingerprint)
+            if state is None:
+                return None
+            if state['fingerprint'] != fingerprint:
+                raise IdempotencyConflict(f"{Config.IDEMPOTENCY_HEADER} {key} was already used for a different request")
+            if state['status_code'] is not None:
+                return state['status_code'], state['response']
+
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                raise IdempotencyInProgress(f"A request with {Config.IDEMPOTENCY_HEADER} {key} is still in progress")
+            event.wait(min(remaining, Config.IDEMPOTENCY_POLL_MS / 1000))
+
+    def complete(self, scope: str, key: str, status_code: int, body: Any) -> None:
+        """Store the outcome of a claimed key for later retries"""
+        def store(session):
+            record = session.get(IdempotencyKey, (scope, key))
+            if record is not None:
+                record.status_code = status_code
+                record.response = body
+                record.expires_at = datetime.utcnow() + timedelta(seconds=Config.IDEMPOTENCY_TTL_SECONDS)
+
+        try:
+            db_writer.run(store)
+        finally:
+            self._wake(scope, key)
+
+    def release(self, scope: str, key: str) -> None:
+        """Give up a claimed key so a retry runs the request again"""
+        def forget(session):
+            session.query(IdempotencyKey).filter_by(scope=scope, key=key, status_code=None).delete()
+
+        try:
+            db_writer.run(forget)
+        except Exception as e:
+            # The lease expiring has the same effect, only later
+            self.logger.warning(f"Could not release idempotency key {key}: {str(e)}")
+        finally:
+            self._wake(scope, key)
+
+
+# Shared by every route
+idempotency_store = IdempotencyStore()
+
+
+def idempotency_key() -> Optional[str]:
+    """The idempotency key of the current request, if any
+
+    Raises:
+        ValueError: If the key is empty or too long
+    """
+    from flask import request
+
+    key = request.headers.get(Config.IDEMPOTENCY_HEADER)
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"{Config.IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters")
+    return key
+
+
+def current_fingerprint() -> str:
+    """``request_fingerprint`` of the current request"""
+    from flask import request
+
+    return request_fingerprint(request.method, request.path, request.get_json(silent=True))
+
+
+def wait_timeout() -> float:
+    """How long the current request may wait for an original still in progress"""
+    deadline = current_deadline()
+    if deadline is None:
+        return Config.IDEMPOTENCY_WAIT_SECONDS
+    return deadline.timeout(Config.IDEMPOTENCY_WAIT_SECONDS)
+
+
+def idempotent(view: Callable) -> Callable:
+    """Make a JSON view honour the Idempotency-Key header
+
+    Requests without the header are handled as usual. Outcomes below 500 are
+    stored and returned to retries with ``Idempotent-Replayed: true``; server
+    errors release the key so the retry runs again.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from flask import current_app, jsonify, request
+
+        try:
+            key = idempotency_key()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if key is None:
+            return view(*args, **kwargs)
+
+        scope = request.endpoint
+        try:
+            stored = idempotency_store.begin(scope, key, current_fingerprint(), wait_timeout())
+        except IdempotencyConflict as e:
+            return jsonify({'error': str(e)}), 422
+        except IdempotencyInProgress as e:
+            return jsonify({'error': str(e)}), 409
+        if stored is not None:
+            status_code, body = stored
+            response = jsonify(body)
+            response.status_code = status_code
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except BaseException:
+            idempotency_store.release(scope, key)
+            raise
+        if response.status_code >= 500 or not response.is_json:
+            idempotency_store.release(scope, key)
+        else:
+            idempotency_store.complete(scope, key, response.status_code, response.get_json())
+        return response
+
+    return wrapper
@@ -0,0 +1,95 @@
+"""
+JSON serialization provider for TinyTroupe Service
+"""
+import logging
+import typing as t
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider that uses orjson when it is installed
+
+    Falls back to Flask's standard library based provider when orjson is not
+    available, or when a payload uses options orjson does not understand.
+    Datetimes are passed through to ``default`` so they are formatted as the
+    standard provider formats them. The output decodes to the same data, but
+    it is not byte for byte the same: orjson writes non-ASCII characters as
+    UTF-8 rather than ``\\u`` escapes whatever ``ensure_ascii`` says, is
+    always compact unless indenting (by 2) whatever the ``separators``, and
+    formats some floats differently (``1e16`` rather than ``1e+16``).
+    """
+
+    # Keyword arguments orjson accepts (ignoring ensure_ascii and separators); anything else goes to the stdlib
+    _ORJSON_KWARGS = {'default', 'indent', 'separators', 'sort_keys', 'ensure_ascii'}
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.fast = orjson is not None
+        if not self.fast:
+            logger.info("orjson not installed, using standard library JSON serializer")
+
+    @property
+    def backend(self) -> str:
+        """Name of the serializer in use"""
+        return 'orjson' if self.fast else 'json'
+
+    def _orjson_options(self, kwargs: t.Dict[str, t.Any]) -> int:
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps_bytes(self, obj: t.Any, **kwargs: t.Any) -> bytes:
+        """Serialize data as UTF-8 encoded JSON bytes
+
+        Args:
+            obj: The data to serialize
+            **kwargs: Options understood by :func:`json.dumps`
+
+        Returns:
+            Encoded JSON document
+        """
+        if self.fast and set(kwargs) <= self._ORJSON_KWARGS:
+            try:
+                return orjson.dumps(obj, default=kwargs.get('default', self.default),
+                                    option=self._orjson_options(kwargs))
+            except (orjson.JSONEncodeError, TypeError):
+                # e.g. integers wider than 64 bits; let the stdlib decide
+                pass
+        return super().dumps(obj, **kwargs).encode('utf-8')
+
+    def dumps(self, obj: t.Any, **kwargs: t.Any) -> str:
+        """Serialize data as a JSON string"""
+        if self.fast and set(kwargs) <= self._ORJSON_KWARGS:
+            return self.dumps_bytes(obj, **kwargs).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s: t.Union[str, bytes], **kwargs: t.Any) -> t.Any:
+        """Deserialize JSON from a string or bytes"""
+        if self.fast and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args: t.Any, **kwargs: t.Any):
+        """Serialize the arguments into a JSON response without a str round trip"""
+        obj = self._prepare_response_obj(args, kwargs)
+        dump_args: t.Dict[str, t.Any] = {}
+
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            dump_args['indent'] = 2
+        else:
+            dump_args['separators'] = (',', ':')
+
+        return self._app.response_class(
+            self.dumps_bytes(obj, **dump_args) + b'\n', mimetype=self.mimetype
+        )
@@ -6,30 +6,83 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))  # Required for Flask deployment
 
 from flask import Flask, render_template, request, jsonify, session
-from src.extensions import db, cors
-from src.config import Config
+from src.extensions import db, cors, compress, db_writer, cache, deadlines
+from src.config import get_config
+from src.database import is_sqlite_file, sqlite_engine_options, enable_sqlite_pragmas
+from src.ids import IdConverter
+from src.migrations import upgrade as upgrade_schema
+from src.json_provider import FastJSONProvider
+
+config = get_config()
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+app.url_map.converters['id'] = IdConverter
 
 # Configure database and other settings
-app.config['SQLALCHEMY_DATABASE_URI'] = Config.DATABASE_URI
+app.config['SQLALCHEMY_DATABASE_URI'] = config.DATABASE_URI
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = Config.SECRET_KEY
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options(config)
+app.config['SECRET_KEY'] = config.SECRET_KEY
+app.config['COMPRESS_ENABLED'] = config.COMPRESS_ENABLED
+app.config['COMPRESS_MIN_SIZE'] = config.COMPRESS_MIN_SIZE
+app.config['COMPRESS_LEVEL'] = config.COMPRESS_LEVEL
+app.config['COMPRESS_BR_LEVEL'] = config.COMPRESS_BR_LEVEL
+app.config['SQLITE_WRITE_QUEUE'] = config.SQLITE_PRODUCTION_MODE and is_sqlite_file(config.DATABASE_URI)
+app.config['SQLITE_WRITE_BATCH_SIZE'] = config.SQLITE_WRITE_BATCH_SIZE
+app.config['SQLITE_WRITE_BATCH_WINDOW_MS'] = config.SQLITE_WRITE_BATCH_WINDOW_MS
+app.config['OCC_MAX_RETRIES'] = config.OCC_MAX_RETRIES
+app.config['OCC_BACKOFF_MS'] = config.OCC_BACKOFF_MS
+app.config['CACHE_BACKEND'] = config.CACHE_BACKEND
+app.config['CACHE_PATH'] = config.CACHE_PATH
+app.config['CACHE_URL'] = config.CACHE_URL
+app.config['CACHE_MAX_ENTRIES'] = config.CACHE_MAX_ENTRIES
+app.config['CACHE_DEFAULT_TTL'] = config.CACHE_DEFAULT_TTL
+app.config['CACHE_LOCK_TIMEOUT'] = config.CACHE_LOCK_TIMEOUT
+app.config['CACHE_TTLS'] = config.CACHE_TTLS
+app.config['REQUEST_DEADLINE_DEFAULT_MS'] = config.REQUEST_DEADLINE_DEFAULT_MS
+app.config['REQUEST_DEADLINE_MAX_MS'] = config.REQUEST_DEADLINE_MAX_MS
+app.config['REQUEST_DEADLINE_HEADER'] = config.REQUEST_DEADLINE_HEADER
+app.config['PREWARM_ENABLED'] = config.PREWARM_ENABLED
 
 # Initialize extensions with the app
 db.init_app(app)
 cors.init_app(app)
+compress.init_app(app)
+db_writer.init_app(app)
+cache.init_app(app)
+deadlines.init_app(app)
+
+if config.SQLITE_PRODUCTION_MODE:
+    with app.app_context():
+        enable_sqlite_pragmas(db.engine, config)
 
 # Import routes after app initialization to avoid circular imports
 from src.routes.conversation import conversation_bp
 from src.routes.advisor import advisor_bp
 from src.routes.financial import financial_bp
+from src.routes.usage import usage_bp
+from src.routes.portfolio import portfolio_bp
+from src.routes.admin import admin_bp
+from src.routes.watchlist import watchlist_bp
+from src.services.prewarm import prewarm_scheduler
+from src.services.quote_stream import quote_hub
 
 # Register blueprints
 app.register_blueprint(conversation_bp, url_prefix='/api/conversations')
 app.register_blueprint(advisor_bp, url_prefix='/api/advisors')
 app.register_blueprint(financial_bp, url_prefix='/api/financial-data')
+app.register_blueprint(usage_bp, url_prefix='/api/usage')
+app.register_blueprint(portfolio_bp, url_prefix='/api/portfolio')
+app.register_blueprint(admin_bp, url_prefix='/api/admin')
+app.register_blueprint(watchlist_bp, url_prefix='/api/watchlist')
+
+# Pre-warm watched symbols off-peak
+prewarm_scheduler.init_app(app)
+
+# Poll live quotes once per subscribed symbol
+quote_hub.init_app(app)
 
 @app.route('/')
 def index():
@@ -57,9 +110,10 @@ def server_error(error):
     return jsonify({'error': 'Server error'}), 500
 
 if __name__ == '__main__':
-    # Create database tables if they don't exist
+    # Create database tables if they don't exist, and upgrade ones created by older versions
     with app.app_context():
         db.create_all()
+        upgrade_schema(db.engine)
     
     # Run the application
     app.run(host='0.0.0.0', port=int(os.getenv('PORT', 5000)), debug=os.getenv('FLASK_DEBUG', 'False') == 'True')
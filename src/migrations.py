@@ -0,0 +1,179 @@
+"""
+Schema upgrades for databases created by older versions of TinyTroupe Service
+
+Run once after upgrading, with the service stopped::
+
+    python -m src.migrations
+"""
+import logging
+from typing import Dict, List
+
+from sqlalchemy import Column, Table, text
+from sqlalchemy.schema import CreateColumn
+
+from src.ids import CompactId
+
+logger = logging.getLogger(__name__)
+
+# Rows copied per batch while rebuilding a table
+BATCH_ROWS = 5000
+
+
+def _columns(connection, name: str) -> Dict[str, str]:
+    """Declared column types of an existing SQLite table"""
+    return {row[1]: (row[2] or '').upper() for row in connection.exec_driver_sql(f'PRAGMA table_info("{name}")')}
+
+
+def _addable(column: Column) -> bool:
+    """Whether ALTER TABLE can add a column to a table that already has rows"""
+    return column.nullable or column.server_default is not None
+
+
+def outdated_tables(connection, metadata) -> List[Table]:
+    """Tables that have to be rebuilt to match the current schema
+
+    A table is outdated when one of its compact id columns is still declared
+    as text, typically ``VARCHAR(36)``, or when it lacks a required column
+    without a server default, which ALTER TABLE cannot add.
+    """
+    outdated = []
+    for table in metadata.sorted_tables:
+        existing = _columns(connection, table.name)
+        if not existing:
+            continue
+        compact = [column.name for column in table.columns if isinstance(column.type, CompactId)]
+        if any('CHAR' in existing[name] or 'TEXT' in existing[name] for name in compact if name in existing) or \
+                any(column.name not in existing and not _addable(column) for column in table.columns):
+            outdated.append(table)
+    return outdated
+
+
+def missing_columns(connection, metadata, skip: List[Table] = ()) -> Dict[Table, List[Column]]:
+    """Columns of the models that existing tables lack, other than in the tables to ``skip``"""
+    missing = {}
+    for table in metadata.sorted_tables:
+        if table in skip:
+            continue
+        existing = _columns(connection, table.name)
+        columns = [column for column in table.columns if existing and column.name not in existing]
+        if columns:
+            missing[table] = columns
+    return missing
+
+
+def add_column(connection, table: Table, column: Column) -> None:
+    """Add a column in place, existing rows taking its server default"""
+    ddl = CreateColumn(column).compile(dialect=connection.dialect)
+    connection.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN {ddl}')
+
+
+def _rows(connection, table: Table, source: str, existing: Dict[str, str]):
+    """Yield an old table's rows as dicts, giving messages their seq if they predate it"""
+    names = [name for name in table.columns.keys() if name in existing]
+    order = ' ORDER BY conversation_id, timestamp, id' if table.name == 'messages' and 'seq' not in existing else ''
+    # Read with the new column types: CompactId accepts ids stored as text and rejects anything not a UUID
+    query = text(f'SELECT {", ".join(names)} FROM "{source}"{order}').columns(
+        **{name: table.columns[name].type for name in names})
+    result = connection.execute(query)
+    seqs: Dict[str, int] = {}
+    while True:
+        batch = result.mappings().fetchmany(BATCH_ROWS)
+        if not batch:
+            break
+        rows = []
+        for row in map(dict, batch):
+            if order:
+                seqs[row['conversation_id']] = row['seq'] = seqs.get(row['conversation_id'], 0) + 1
+            rows.append(row)
+        yield rows
+
+
+def rebuild_table(connection, table: Table) -> int:
+    """Recreate an SQLite table with the current schema and copy its rows over
+
+    SQLite cannot change a column's type, so the old table is renamed, the
+    new one created with its indexes, and the rows converted on the way:
+    text ids become 16-byte ids, and columns the old table lacks get their
+    defaults.
+
+    Returns:
+        Number of rows copied
+    """
+    source = f'_old_{table.name}'
+    existing = _columns(connection, table.name)
+    connection.exec_driver_sql(f'ALTER TABLE "{table.name}" RENAME TO "{source}"')
+    indexes = connection.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (source,)
+    ).fetchall()
+    for (index,) in indexes:
+        connection.exec_driver_sql(f'DROP INDEX "{index}"')
+    table.create(connection)
+
+    copied = 0
+    for rows in _rows(connection, table, source, existing):
+        connection.execute(table.insert(), rows)
+        copied += len(rows)
+    connection.exec_driver_sql(f'DROP TABLE "{source}"')
+    return copied
+
+
+def upgrade(engine, metadata=None) -> Dict[str, int]:
+    """Bring tables created by older versions up to the current schema
+
+    Everything runs in one transaction, so a failure leaves the database as
+    it was. Only SQLite is supported; other databases should be dumped and
+    loaded into a fresh schema.
+
+    Args:
+        engine: Engine of the database to upgrade
+        metadata: Tables to upgrade, all models by default
+
+    Tables whose ids are still stored as text are rebuilt; columns added
+    since a table was created are added in place.
+
+    Returns:
+        Rows copied per rebuilt table, and 0 for each table that only had
+        columns added; empty if the schema was current
+    """
+    if metadata is None:
+        from src.extensions import db
+        import src.models  # noqa: F401 - registers the tables
+        metadata = db.metadata
+
+    with engine.begin() as connection:
+        if engine.dialect.name != 'sqlite':
+            raise RuntimeError(f"Schema upgrades are only supported on SQLite, not {engine.dialect.name}")
+        tables = outdated_tables(connection, metadata)
+        copied = {}
+        for table, columns in missing_columns(connection, metadata, tables).items():
+            for column in columns:
+                add_column(connection, table, column)
+            copied[table.name] = 0
+            logger.info("Added %s to %s", ', '.join(column.name for column in columns), table.name)
+        if not tables:
+            return copied
+
+        # Keep references to a renamed table pointing at the name, which the rebuilt table takes over
+        connection.exec_driver_sql('PRAGMA legacy_alter_table = ON')
+        for table in tables:
+            copied[table.name] = rebuild_table(connection, table)
+            logger.info("Rebuilt %s with compact ids (%d rows)", table.name, copied[table.name])
+        if 'conversations' in metadata.tables and 'messages' in metadata.tables:
+            connection.exec_driver_sql(
+                'UPDATE conversations SET last_seq = (SELECT COALESCE(MAX(seq), 0) FROM messages '
+                'WHERE messages.conversation_id = conversations.id)'
+            )
+        connection.exec_driver_sql('PRAGMA legacy_alter_table = OFF')
+    return copied
+
+
+if __name__ == '__main__':
+    from src.main import app
+    from src.extensions import db
+
+    logging.basicConfig(level=logging.INFO)
+    with app.app_context():
+        db.create_all()
+        result = upgrade(db.engine)
+    print(f"Upgraded {', '.join(f'{name} ({rows} rows)' for name, rows in result.items())}"
+          if result else "Schema is up to date")
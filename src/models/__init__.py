@@ -5,5 +5,11 @@ from src.models.conversation import Conversation
 from src.models.message import Message
 from src.models.persona import Persona
 from src.models.persona_state import PersonaState
+from src.models.persona_memory import PersonaMemory
+from src.models.idempotency_key import IdempotencyKey
+from src.models.usage_record import UsageRecord
+from src.models.watchlist_item import WatchlistItem
+from src.models.transcript_snapshot import TranscriptSnapshot
 
-__all__ = ['Conversation', 'Message', 'Persona', 'PersonaState']
+__all__ = ['Conversation', 'Message', 'Persona', 'PersonaState', 'PersonaMemory', 'IdempotencyKey', 'UsageRecord',
+           'WatchlistItem', 'TranscriptSnapshot']
@@ -2,22 +2,33 @@
 Database models for conversations
 """
 from datetime import datetime
-import uuid
 from src.extensions import db
+from src.ids import CompactId, new_id
 
 class Conversation(db.Model):
     """Conversation model for storing chat sessions"""
     __tablename__ = 'conversations'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(CompactId, primary_key=True, default=new_id)
     user_id = db.Column(db.String(36), nullable=False)
     title = db.Column(db.String(255), nullable=False)
+    settings = db.Column(db.JSON, nullable=False, default=dict)  # per-conversation options, e.g. advisor routing
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bumped by every ORM update, which only applies if the row still has the version it was read with
+    version = db.Column(db.Integer, nullable=False, default=1)
+    # Lease on the conversation's next turn when turns are serialized, see TurnQueue
+    turn_owner = db.Column(db.String(36), nullable=True)
+    turn_expires_at = db.Column(db.DateTime, nullable=True)
+    last_seq = db.Column(db.Integer, nullable=False, default=0)  # seq of the newest message
+    
+    __mapper_args__ = {'version_id_col': version}
     
     # Relationships
-    messages = db.relationship('Message', backref='conversation', lazy=True, cascade='all, delete-orphan')
+    messages = db.relationship('Message', backref='conversation', lazy=True, cascade='all, delete-orphan',
+                               order_by='Message.seq')
     persona_states = db.relationship('PersonaState', backref='conversation', lazy=True, cascade='all, delete-orphan')
+    transcript = db.relationship('TranscriptSnapshot', lazy=True, uselist=False, cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Conversation {self.id}: {self.title}>'
@@ -28,7 +39,9 @@ class Conversation(db.Model):
             'id': self.id,
             'user_id': self.user_id,
             'title': self.title,
+            'settings': self.settings or {},
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
-            'message_count': len(self.messages)
+            'version': self.version,
+            'message_count': self.last_seq  # messages are only ever deleted with their conversation
         }
@@ -0,0 +1,37 @@
+"""
+Database models for idempotent request handling
+"""
+from datetime import datetime
+from src.extensions import db
+
+class IdempotencyKey(db.Model):
+    """IdempotencyKey model storing the outcome of a request sent with an Idempotency-Key header
+    
+    A row without a status code is a request still being processed; its
+    ``expires_at`` is then the end of the processing lease rather than of the
+    stored result.
+    """
+    __tablename__ = 'idempotency_keys'
+    
+    scope = db.Column(db.String(64), primary_key=True)  # endpoint the key was used on
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)  # hash of method, path and body
+    status_code = db.Column(db.Integer, nullable=True)
+    response = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<IdempotencyKey {self.scope}:{self.key}>'
+    
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'scope': self.scope,
+            'key': self.key,
+            'fingerprint': self.fingerprint,
+            'status_code': self.status_code,
+            'response': self.response,
+            'created_at': self.created_at.isoformat(),
+            'expires_at': self.expires_at.isoformat()
+        }
@@ -2,19 +2,27 @@
 Database models for messages
 """
 from datetime import datetime
-import uuid
+from sqlalchemy import event, select
 from src.extensions import db
+from src.ids import CompactId, new_id
+from src.models.conversation import Conversation
 
 class Message(db.Model):
     """Message model for storing conversation messages"""
     __tablename__ = 'messages'
+    __table_args__ = (
+        # Messages are read in seq order straight off this index
+        db.Index('ix_messages_conversation_seq', 'conversation_id', 'seq', unique=True),
+    )
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    conversation_id = db.Column(db.String(36), db.ForeignKey('conversations.id'), nullable=False)
+    id = db.Column(CompactId, primary_key=True, default=new_id)
+    conversation_id = db.Column(CompactId, db.ForeignKey('conversations.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)  # 1-based position in the conversation, see _assign_seq
     role = db.Column(db.String(20), nullable=False)  # 'user' or 'advisor'
     advisor_id = db.Column(db.String(36), nullable=True)  # NULL for user messages
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    meta = db.Column('metadata', db.JSON, nullable=True)  # e.g. {'reused': True} for reused answers
     
     def __repr__(self):
         return f'<Message {self.id}: {self.role}>'
@@ -24,8 +32,25 @@ class Message(db.Model):
         return {
             'id': self.id,
             'conversation_id': self.conversation_id,
+            'seq': self.seq,
             'role': self.role,
             'advisor_id': self.advisor_id,
             'content': self.content,
-            'timestamp': self.timestamp.isoformat()
+            'timestamp': self.timestamp.isoformat(),
+            'metadata': self.meta or {}
         }
+
+@event.listens_for(Message, 'before_insert')
+def _assign_seq(mapper, connection, message):
+    """Number a new message after the last one in its conversation
+    
+    The conversation's counter is incremented in the inserting transaction,
+    which keeps the row locked until commit, so concurrent writers get
+    distinct numbers and a rolled back insert leaves no gap.
+    """
+    if message.seq is not None:
+        return
+    conversations = Conversation.__table__
+    row = conversations.c.id == message.conversation_id
+    connection.execute(conversations.update().where(row).values(last_seq=conversations.c.last_seq + 1))
+    message.seq = connection.execute(select(conversations.c.last_seq).where(row)).scalar_one()
@@ -13,6 +13,8 @@ class Persona(db.Model):
     description = db.Column(db.Text, nullable=False)
     personality = db.Column(db.JSON, nullable=False)
     expertise = db.Column(db.JSON, nullable=False)
+    # Admin switch for near-duplicate reuse
+    response_reuse = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     
     # Relationships
@@ -29,5 +31,6 @@ class Persona(db.Model):
             'description': self.description,
             'personality': self.personality,
             'expertise': self.expertise,
+            'response_reuse': self.response_reuse,
             'created_at': self.created_at.isoformat()
         }
@@ -0,0 +1,33 @@
+"""
+Database models for persona semantic memory
+"""
+from datetime import datetime
+from src.extensions import db
+from src.ids import CompactId
+
+class PersonaMemory(db.Model):
+    """PersonaMemory model storing one embedded exchange of a persona in a conversation"""
+    __tablename__ = 'persona_memories'
+    __table_args__ = (
+        db.UniqueConstraint('persona_state_id', 'position', name='uq_persona_memories_position'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    persona_state_id = db.Column(CompactId, db.ForeignKey('persona_states.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)  # 0-based exchange number within the persona state
+    content = db.Column(db.Text, nullable=False)
+    vector = db.Column(db.LargeBinary, nullable=False)  # float16 embedding, see services.persona_memory
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<PersonaMemory {self.persona_state_id}#{self.position}>'
+    
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': self.id,
+            'persona_state_id': self.persona_state_id,
+            'position': self.position,
+            'content': self.content,
+            'created_at': self.created_at.isoformat()
+        }
@@ -1,19 +1,24 @@
 """
 Database models for persona states
 """
-import uuid
 from datetime import datetime
 from src.extensions import db
+from src.ids import CompactId, new_id
 
 class PersonaState(db.Model):
     """PersonaState model for storing persona memory states in conversations"""
     __tablename__ = 'persona_states'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(CompactId, primary_key=True, default=new_id)
     persona_id = db.Column(db.String(36), db.ForeignKey('personas.id'), nullable=False)
-    conversation_id = db.Column(db.String(36), db.ForeignKey('conversations.id'), nullable=False)
+    conversation_id = db.Column(CompactId, db.ForeignKey('conversations.id'), nullable=False)
     memory_state = db.Column(db.JSON, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Compared and incremented on every update, so concurrent turns cannot overwrite each other's memory_state
+    version = db.Column(db.Integer, nullable=False, default=1)
+    memories = db.relationship('PersonaMemory', backref='persona_state', lazy='dynamic', cascade='all, delete-orphan')
+    
+    __mapper_args__ = {'version_id_col': version}
     
     def __repr__(self):
         return f'<PersonaState {self.id}: {self.persona_id} in {self.conversation_id}>'
@@ -25,5 +30,6 @@ class PersonaState(db.Model):
             'persona_id': self.persona_id,
             'conversation_id': self.conversation_id,
             'memory_state': self.memory_state,
+            'version': self.version,
             'updated_at': self.updated_at.isoformat()
         }
@@ -0,0 +1,21 @@
+"""
+Database models for conversation transcript snapshots
+"""
+from datetime import datetime
+from src.extensions import db
+from src.ids import CompactId
+
+class TranscriptSnapshot(db.Model):
+    """TranscriptSnapshot model storing a conversation's messages pre-serialized and gzip compressed"""
+    __tablename__ = 'transcript_snapshots'
+    
+    conversation_id = db.Column(CompactId, db.ForeignKey('conversations.id'), primary_key=True)
+    seq = db.Column(db.Integer, nullable=False)  # seq of the last message in the snapshot, it holds 1..seq
+    size = db.Column(db.Integer, nullable=False)  # uncompressed bytes, where the next message is appended
+    members = db.Column(db.Integer, nullable=False)  # gzip members, one per append since the last rebuild
+    format = db.Column(db.Integer, nullable=False)  # services.transcripts.FORMAT it was written with
+    data = db.Column(db.LargeBinary, nullable=False)  # comma separated message JSON, no brackets
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<TranscriptSnapshot {self.conversation_id}@{self.seq}>'
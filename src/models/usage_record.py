@@ -0,0 +1,49 @@
+"""
+Database models for LLM usage accounting
+"""
+from datetime import datetime
+from src.extensions import db
+
+class UsageRecord(db.Model):
+    """UsageRecord model storing one row per LLM call in a compact ledger"""
+    __tablename__ = 'usage_ledger'
+    __table_args__ = (
+        db.Index('ix_usage_ledger_user_day', 'user_id', 'day'),
+        db.Index('ix_usage_ledger_advisor_day', 'advisor_id', 'day'),
+        db.Index('ix_usage_ledger_conversation', 'conversation_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    user_id = db.Column(db.String(36), nullable=True)
+    conversation_id = db.Column(db.String(36), nullable=True)
+    advisor_id = db.Column(db.String(36), nullable=False)
+    operation = db.Column(db.String(16), nullable=False)  # 'response' or 'analysis'
+    model = db.Column(db.String(64), nullable=False)
+    prompt_tokens = db.Column(db.Integer, nullable=False, default=0)
+    completion_tokens = db.Column(db.Integer, nullable=False, default=0)
+    latency_ms = db.Column(db.Integer, nullable=False, default=0)
+    cost_micros = db.Column(db.Integer, nullable=False, default=0)  # millionths of a US dollar
+    downgraded = db.Column(db.Boolean, nullable=False, default=False)
+    
+    def __repr__(self):
+        return f'<UsageRecord {self.id}: {self.advisor_id} {self.prompt_tokens}+{self.completion_tokens}>'
+    
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': self.id,
+            'day': self.day.isoformat(),
+            'created_at': self.created_at.isoformat(),
+            'user_id': self.user_id,
+            'conversation_id': self.conversation_id,
+            'advisor_id': self.advisor_id,
+            'operation': self.operation,
+            'model': self.model,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'latency_ms': self.latency_ms,
+            'cost_usd': self.cost_micros / 1_000_000,
+            'downgraded': self.downgraded
+        }
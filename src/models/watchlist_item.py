@@ -0,0 +1,24 @@
+"""
+Database models for user watchlists
+"""
+from datetime import datetime
+from src.extensions import db
+
+class WatchlistItem(db.Model):
+    """WatchlistItem model storing one watched symbol of a user"""
+    __tablename__ = 'watchlist_items'
+    
+    user_id = db.Column(db.String(36), primary_key=True)
+    symbol = db.Column(db.String(15), primary_key=True, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<WatchlistItem {self.user_id}: {self.symbol}>'
+    
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'user_id': self.user_id,
+            'symbol': self.symbol,
+            'created_at': self.created_at.isoformat()
+        }
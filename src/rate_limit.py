@@ -0,0 +1,51 @@
+"""
+Rate limiting for calls to upstream providers in TinyTroupe Service
+"""
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Allows ``rate`` calls per minute on average, with bursts up to ``burst``
+
+    Callers ``acquire`` one token per call (or several for a call that
+    counts more, such as one analysis fanning out to every advisor) and
+    wait until the bucket has refilled enough.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate / 60.0
+        self.capacity = burst if burst is not None else max(rate / 60.0, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        """Take tokens, returning how long to wait before they are available"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1.0, stop: Optional[threading.Event] = None) -> bool:
+        """Wait until ``tokens`` may be spent
+
+        Args:
+            tokens: Number of calls about to be made
+            stop: Event that aborts the wait when set
+
+        Returns:
+            True once the tokens are granted, False if ``stop`` was set first
+        """
+        if self.rate <= 0:
+            return True
+        wait = self._reserve(tokens)
+        if wait <= 0:
+            return True
+        if stop is None:
+            time.sleep(wait)
+            return True
+        return not stop.wait(wait)
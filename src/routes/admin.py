@@ -0,0 +1,61 @@
+"""
+Admin routes for TinyTroupe Service
+"""
+import hmac
+
+from flask import Blueprint, jsonify, request
+from src.config import Config
+from src.idempotency import idempotent
+from src.services.market_data_ingest import market_data_ingestor, resolve_input
+from src.services.prewarm import PrewarmInProgress, prewarm_scheduler
+from src.services.quote_stream import quote_hub
+
+admin_bp = Blueprint('admin', __name__)
+
+@admin_bp.before_request
+def require_admin_token():
+    """Reject requests without the admin token"""
+    if not Config.ADMIN_TOKEN:
+        return jsonify({'error': 'Admin endpoints are disabled; set ADMIN_TOKEN to enable them'}), 403
+    token = request.headers.get(Config.ADMIN_TOKEN_HEADER, '')
+    if not hmac.compare_digest(token.encode('utf-8'), Config.ADMIN_TOKEN.encode('utf-8')):
+        return jsonify({'error': 'Invalid admin token'}), 401
+
+@admin_bp.route('/ingest', methods=['POST'])
+@idempotent
+def ingest_market_data():
+    """Ingest CSV or Parquet market data files from the ingest directory"""
+    data = request.json or {}
+    paths = data.get('paths')
+    workers = data.get('workers')
+    
+    try:
+        if not isinstance(paths, list) or not paths or not all(isinstance(path, str) for path in paths):
+            raise ValueError("paths must be a non-empty list of file names")
+        if workers is not None and (not isinstance(workers, int) or isinstance(workers, bool) or workers < 1):
+            raise ValueError("workers must be a positive integer")
+        files = [resolve_input(path) for path in paths]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    result = market_data_ingestor.ingest(files, workers=workers, restart=bool(data.get('restart')))
+    return jsonify(result)
+
+@admin_bp.route('/prewarm', methods=['GET'])
+def get_prewarm_status():
+    """Get the pre-warm schedule and the outcome of its last run"""
+    return jsonify(prewarm_scheduler.status())
+
+@admin_bp.route('/prewarm', methods=['POST'])
+def run_prewarm():
+    """Pre-warm every watched symbol now"""
+    try:
+        result = prewarm_scheduler.run()
+    except PrewarmInProgress as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify(result)
+
+@admin_bp.route('/streams', methods=['GET'])
+def get_quote_streams():
+    """Get the symbols whose quotes are being streamed, with their subscribers"""
+    return jsonify(quote_hub.status())
@@ -5,6 +5,7 @@ from flask import Blueprint, jsonify, request
 from src.config import get_config
 from src.models import Persona
 from src.extensions import db
+from src.routes.admin import require_admin_token
 
 advisor_bp = Blueprint('advisor', __name__)
 
@@ -39,3 +40,21 @@ def get_advisor(advisor_id):
     """Get a specific advisor"""
     advisor = Persona.query.get_or_404(advisor_id)
     return jsonify(advisor.to_dict())
+
+@advisor_bp.route('/<advisor_id>', methods=['PATCH'])
+def update_advisor(advisor_id):
+    """Update an advisor's operational switches (admin token required)"""
+    denied = require_admin_token()
+    if denied is not None:
+        return denied
+    
+    advisor = Persona.query.get_or_404(advisor_id)
+    data = request.json or {}
+    
+    if 'response_reuse' in data:
+        if not isinstance(data['response_reuse'], bool):
+            return jsonify({'error': 'response_reuse must be a boolean'}), 400
+        advisor.response_reuse = data['response_reuse']
+    
+    db.session.commit()
+    return jsonify(advisor.to_dict())
@@ -1,10 +1,24 @@
 """
 Conversation routes for TinyTroupe Service
 """
-from flask import Blueprint, request, jsonify, current_app
+import queue
+import threading
+
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from src.cancellation import CancellationToken
+from src.config import Config
+from src.database import ConcurrentUpdateError
 from src.extensions import db
-from src.models import Conversation, Message
+from src.models import Conversation
+from src.deadline import current_deadline
+from src.idempotency import (IdempotencyConflict, IdempotencyInProgress, current_fingerprint, idempotency_key,
+                             idempotency_store, idempotent, wait_timeout)
 from src.services.conversation_service import ConversationService
+from src.services.message_history import message_history
+from src.services.transcripts import transcript_store
+from src.services.turn_queue import TurnInProgress
+from src.services.usage_service import BudgetExceededError
+from src.sse import KEEP_ALIVE, event_stream, sse_frame
 
 conversation_bp = Blueprint('conversation', __name__)
 conversation_service = ConversationService()
@@ -18,34 +32,85 @@ def get_conversations():
     return jsonify([conversation.to_dict() for conversation in conversations])
 
 @conversation_bp.route('', methods=['POST'])
+@idempotent
 def create_conversation():
     """Create a new conversation"""
     data = request.json
     user_id = data.get('user_id', 'default_user')
     title = data.get('title', 'New Conversation')
     
-    conversation = Conversation(user_id=user_id, title=title)
-    db.session.add(conversation)
-    db.session.commit()
-    
-    # Initialize advisor personas for this conversation
-    conversation_service.initialize_personas(conversation.id)
+    # Create the conversation and its advisor personas in one write
+    try:
+        conversation = conversation_service.create_conversation(user_id, title, data.get('settings'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify(conversation.to_dict()), 201
+    return jsonify(conversation), 201
 
-@conversation_bp.route('/<conversation_id>', methods=['GET'])
+@conversation_bp.route('/<id:conversation_id>', methods=['GET'])
 def get_conversation(conversation_id):
     """Get a specific conversation"""
     conversation = Conversation.query.get_or_404(conversation_id)
     return jsonify(conversation.to_dict())
 
-@conversation_bp.route('/<conversation_id>/messages', methods=['GET'])
+@conversation_bp.route('/<id:conversation_id>', methods=['PATCH'])
+def update_conversation(conversation_id):
+    """Update a conversation's title or settings
+    
+    Sending the ``version`` last read makes the update fail with 409 if
+    someone else changed the conversation in the meantime.
+    """
+    data = request.json or {}
+    Conversation.query.get_or_404(conversation_id)
+    
+    version = data.get('version')
+    if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+        return jsonify({'error': 'version must be an integer'}), 400
+    
+    try:
+        conversation = conversation_service.update_conversation(
+            conversation_id, title=data.get('title'), settings=data.get('settings'), version=version
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except ConcurrentUpdateError as e:
+        return jsonify({'error': str(e)}), 409
+    
+    return jsonify(conversation)
+
+@conversation_bp.route('/<id:conversation_id>/messages', methods=['GET'])
 def get_messages(conversation_id):
-    """Get all messages in a conversation"""
-    messages = Message.query.filter_by(conversation_id=conversation_id).order_by(Message.timestamp).all()
-    return jsonify([message.to_dict() for message in messages])
+    """Get the messages in a conversation, in order
+    
+    ``?after=<seq>`` returns only the messages after that one and ``?limit=``
+    caps how many are returned, so clients can page through a long
+    conversation or fetch just what is new. The whole conversation is read
+    from its transcript snapshot; otherwise, without a limit, the messages
+    are streamed as they are read, so a long history is never held in memory.
+    """
+    after = request.args.get('after', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    if after < 0:
+        return jsonify({'error': 'after must be a message seq'}), 400
+    if limit is not None and not 1 <= limit <= Config.MESSAGES_MAX_LIMIT:
+        return jsonify({'error': f'limit must be between 1 and {Config.MESSAGES_MAX_LIMIT}'}), 400
+    
+    if 'after' not in request.args and limit is None and Config.TRANSCRIPT_SNAPSHOTS_ENABLED:
+        gzip_ok = current_app.config.get('COMPRESS_ENABLED', True) and request.accept_encodings.quality('gzip') > 0
+        body, encoding = transcript_store.body(conversation_id, gzip_ok)
+        response = Response(body, mimetype='application/json')
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        return response
+    
+    chunks = message_history.json_chunks(message_history.records(conversation_id, after, limit))
+    if limit is None:
+        return Response(stream_with_context(chunks), mimetype='application/json')
+    # A page is small enough to send in one piece, which lets it be compressed
+    return Response(b''.join(chunks), mimetype='application/json')
 
-@conversation_bp.route('/<conversation_id>/messages', methods=['POST'])
+@conversation_bp.route('/<id:conversation_id>/messages', methods=['POST'])
+@idempotent
 def add_message(conversation_id):
     """Add a message to a conversation"""
     data = request.json
@@ -54,30 +119,184 @@ def add_message(conversation_id):
     if not content:
         return jsonify({'error': 'Content is required'}), 400
     
-    # Get the conversation
+    # Make sure the conversation exists
     conversation = Conversation.query.get_or_404(conversation_id)
     
-    # Add user message
-    user_message = Message(
-        conversation_id=conversation_id,
-        role='user',
-        content=content
-    )
-    db.session.add(user_message)
+    # Refuse the turn before storing anything if the user is out of budget
+    try:
+        conversation_service.check_budget(conversation.user_id)
+    except BudgetExceededError as e:
+        return jsonify({'error': str(e), 'budget': e.to_dict()}), 429
     
-    # Update conversation timestamp
-    conversation.updated_at = db.func.now()
-    db.session.commit()
+    # Conversations with serialized turns wait here for the turns before this one
+    try:
+        lease = conversation_service.begin_turn(conversation)
+    except TurnInProgress as e:
+        return jsonify({'error': str(e)}), 409
     
-    # Generate advisor responses
-    advisor_responses = conversation_service.generate_responses(conversation_id, content)
+    try:
+        # Add user message and update conversation timestamp
+        user_message = conversation_service.add_user_message(conversation_id, content)
+        
+        # Generate advisor responses
+        try:
+            turn = conversation_service.generate_responses(conversation_id, content, current_deadline())
+        except BudgetExceededError as e:
+            return jsonify({'error': str(e), 'budget': e.to_dict(), 'user_message': user_message}), 429
+        except ConcurrentUpdateError as e:
+            return jsonify({'error': str(e), 'user_message': user_message}), 409
+    finally:
+        conversation_service.end_turn(conversation_id, lease)
     
     return jsonify({
-        'user_message': user_message.to_dict(),
-        'advisor_responses': advisor_responses
+        'user_message': user_message,
+        **turn
     }), 201
 
-@conversation_bp.route('/<conversation_id>', methods=['DELETE'])
+@conversation_bp.route('/<id:conversation_id>/messages/stream', methods=['POST'])
+def stream_message(conversation_id):
+    """Add a message and stream advisor responses as Server-Sent Events
+    
+    Each advisor answer is sent as an ``advisor_response`` event as soon as it
+    is ready, followed by a ``done`` event with the full turn. If the client
+    disconnects first, advisor calls still pending are cancelled and stored as
+    cancelled messages.
+    
+    With an Idempotency-Key header, a retry replays the stored turn as the
+    same events instead of generating it again. Once the user message is
+    stored the key is bound to the turn, even if the client left and some
+    answers were cancelled, so a retry never stores the message twice.
+    """
+    data = request.json or {}
+    content = data.get('content')
+    
+    if not content:
+        return jsonify({'error': 'Content is required'}), 400
+    
+    conversation = Conversation.query.get_or_404(conversation_id)
+    
+    try:
+        key = idempotency_key()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    scope = request.endpoint
+    if key is not None:
+        try:
+            stored = idempotency_store.begin(scope, key, current_fingerprint(), wait_timeout())
+        except IdempotencyConflict as e:
+            return jsonify({'error': str(e)}), 422
+        except IdempotencyInProgress as e:
+            return jsonify({'error': str(e)}), 409
+        if stored is not None:
+            return _replay_turn(*stored)
+    
+    try:
+        conversation_service.check_budget(conversation.user_id)
+    except BudgetExceededError as e:
+        if key is not None:
+            idempotency_store.release(scope, key)
+        return jsonify({'error': str(e), 'budget': e.to_dict()}), 429
+    
+    try:
+        lease = conversation_service.begin_turn(conversation)
+    except TurnInProgress as e:
+        if key is not None:
+            idempotency_store.release(scope, key)
+        return jsonify({'error': str(e)}), 409
+    
+    app = current_app._get_current_object()
+    deadline = current_deadline()
+    token = CancellationToken()
+    events = queue.Queue()
+    
+    def generate_turn():
+        with app.app_context():
+            try:
+                user_message = conversation_service.add_user_message(conversation_id, content)
+            except Exception as e:
+                current_app.logger.exception("Could not store the streamed message")
+                conversation_service.end_turn(conversation_id, lease)
+                if key is not None:
+                    idempotency_store.release(scope, key)
+                events.put(('error', {'error': str(e)}))
+                return
+            events.put(('user_message', user_message))
+            
+            try:
+                turn = conversation_service.generate_responses(
+                    conversation_id, content, deadline, cancel=token,
+                    on_answer=lambda response: events.put(('advisor_response', response))
+                )
+                result = {'user_message': user_message, **turn}
+                if key is not None:
+                    # Stored by the worker so a retry after a disconnect replays the turn, cancelled
+                    # answers included, instead of storing the user message a second time
+                    idempotency_store.complete(scope, key, 201, result)
+                events.put(('done', result))
+            except BudgetExceededError as e:
+                error = {'error': str(e), 'budget': e.to_dict(), 'user_message': user_message}
+                if key is not None:
+                    idempotency_store.complete(scope, key, 429, error)
+                events.put(('error', error))
+            except Exception as e:
+                current_app.logger.exception("Streamed turn failed")
+                error = {'error': str(e), 'user_message': user_message}
+                if key is not None:
+                    idempotency_store.complete(scope, key, 500, error)
+                events.put(('error', error))
+            finally:
+                conversation_service.end_turn(conversation_id, lease)
+    
+    started = []
+    
+    def stream():
+        started.append(True)
+        threading.Thread(target=generate_turn, name=f'turn-{conversation_id}', daemon=True).start()
+        try:
+            while True:
+                try:
+                    event, payload = events.get(timeout=Config.STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield KEEP_ALIVE
+                    continue
+                yield sse_frame(event, payload)
+                if event in ('done', 'error'):
+                    break
+        finally:
+            # Runs when the client goes away mid-stream as well as on completion
+            token.cancel('client disconnected')
+    
+    def abandon():
+        # A client gone before the stream started has nothing stored, so the turn and the
+        # idempotency key are let go
+        if started:
+            return
+        if lease is not None:
+            conversation_service.end_turn(conversation_id, lease)
+        if key is not None:
+            idempotency_store.release(scope, key)
+    
+    response = event_stream(stream())
+    response.call_on_close(abandon)
+    return response
+
+def _replay_turn(status_code, body):
+    """Send a stored turn as the events a streamed turn produces"""
+    if status_code != 201:
+        response = jsonify(body)
+        response.status_code = status_code
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
+    
+    def frames():
+        yield sse_frame('user_message', body['user_message'])
+        for advisor_response in body['advisor_responses']:
+            yield sse_frame('advisor_response', advisor_response)
+        yield sse_frame('done', body)
+    
+    return event_stream(frames(), {'Idempotent-Replayed': 'true'})
+
+@conversation_bp.route('/<id:conversation_id>', methods=['DELETE'])
 def delete_conversation(conversation_id):
     """Delete a conversation"""
     conversation = Conversation.query.get_or_404(conversation_id)
@@ -2,25 +2,129 @@
 Financial data routes for TinyTroupe Service
 """
 from flask import Blueprint, jsonify, request
+from src.config import Config
+from src.deadline import DeadlineExceeded, current_deadline
 from src.services.financial_service import FinancialService
+from src.services.quote_stream import SubscriberLimitExceeded, quote_hub
+from src.services.symbol_master import UnknownSymbolError
+from src.sse import KEEP_ALIVE, event_stream, sse_frame
 
 financial_bp = Blueprint('financial', __name__)
 financial_service = FinancialService()
 
+@financial_bp.route('/screen', methods=['GET'])
+def screen_stocks():
+    """Screen stocks by fundamentals, e.g. ?pe_lt=15&dividend_yield_gt=3&sort=-dividend_yield"""
+    filters = {name: value for name, value in request.args.items() if name not in ('sort', 'limit', 'offset')}
+    try:
+        results = financial_service.screen(
+            filters,
+            sort=request.args.get('sort'),
+            limit=request.args.get('limit', 50, type=int),
+            offset=request.args.get('offset', 0, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(results)
+
+@financial_bp.route('/symbols', methods=['GET'])
+def search_symbols():
+    """Autocomplete symbols by ticker or company name, e.g. ?prefix=app"""
+    try:
+        results = financial_service.search_symbols(
+            request.args.get('prefix', ''),
+            limit=request.args.get('limit', 10, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(results)
+
 @financial_bp.route('/<symbol>', methods=['GET'])
 def get_financial_data(symbol):
     """Get financial data for a specific symbol"""
     try:
-        data = financial_service.get_stock_data(symbol)
+        data = financial_service.get_stock_data(symbol, current_deadline())
         return jsonify(data)
+    except UnknownSymbolError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except DeadlineExceeded as e:
+        return jsonify({'error': str(e)}), 504
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@financial_bp.route('/<symbol>/stream', methods=['GET'])
+def stream_quotes(symbol):
+    """Stream live quotes for a symbol as Server-Sent Events
+    
+    Sends a ``quote`` event whenever the quote changes, or an ``error`` event
+    if polling the provider fails. All clients streaming a symbol share one
+    upstream poll; a client that reads slowly skips to the newest quote.
+    """
+    try:
+        subscription = quote_hub.subscribe(financial_service.symbols.validate(symbol))
+    except UnknownSymbolError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except SubscriberLimitExceeded as e:
+        return jsonify({'error': str(e)}), 503
+    
+    def stream():
+        while not subscription.closed:
+            update = subscription.get(Config.STREAM_HEARTBEAT_SECONDS)
+            yield sse_frame(*update) if update is not None else KEEP_ALIVE
+    
+    response = event_stream(stream())
+    # Also runs when the client disconnects before the first frame is sent
+    response.call_on_close(subscription.close)
+    return response
+
+@financial_bp.route('/<symbol>/history', methods=['GET'])
+def get_price_history(symbol):
+    """Get daily price history and technical indicators for a specific symbol"""
+    try:
+        limit = request.args.get('limit', type=int)
+        history = financial_service.get_price_history(
+            symbol, request.args.get('start'), request.args.get('end'), limit
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if history is None:
+        return jsonify({'error': f'No price history for {symbol}'}), 404
+    return jsonify(history)
+
+@financial_bp.route('/<symbol>/chart', methods=['GET'])
+def get_chart_series(symbol):
+    """Get a price series downsampled for a chart, e.g. ?range=5y&width=600&method=minmax&encoding=base64"""
+    try:
+        chart = financial_service.get_chart_series(
+            symbol,
+            period=request.args.get('range', '1y'),
+            width=request.args.get('width', 800, type=int),
+            method=request.args.get('method', 'lttb'),
+            encoding=request.args.get('encoding', 'json')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if chart is None:
+        return jsonify({'error': f'No price history for {symbol}'}), 404
+    return jsonify(chart)
+
 @financial_bp.route('/<symbol>/analysis', methods=['GET'])
 def get_stock_analysis(symbol):
     """Get advisor analysis for a specific stock symbol"""
     try:
-        analysis = financial_service.get_stock_analysis(symbol)
+        analysis = financial_service.get_stock_analysis(symbol, current_deadline())
         return jsonify(analysis)
+    except UnknownSymbolError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except DeadlineExceeded as e:
+        return jsonify({'error': str(e)}), 504
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -0,0 +1,30 @@
+"""
+Portfolio routes for TinyTroupe Service
+"""
+from flask import Blueprint, jsonify, request
+from src.deadline import DeadlineExceeded, current_deadline
+from src.idempotency import idempotent
+from src.services.portfolio_service import PortfolioService
+
+portfolio_bp = Blueprint('portfolio', __name__)
+portfolio_service = PortfolioService()
+
+@portfolio_bp.route('/analysis', methods=['POST'])
+@idempotent
+def analyze_portfolio():
+    """Measure a portfolio's risk and get advisor analysis of it as a whole"""
+    data = request.json or {}
+    
+    try:
+        analysis = portfolio_service.analyze(
+            data.get('holdings'),
+            benchmark=data.get('benchmark'),
+            lookback=data.get('lookback_days'),
+            deadline=current_deadline()
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except DeadlineExceeded as e:
+        return jsonify({'error': str(e)}), 504
+    
+    return jsonify(analysis)
@@ -0,0 +1,52 @@
+"""
+Usage ledger routes for TinyTroupe Service
+"""
+from datetime import date, datetime
+from flask import Blueprint, jsonify, request
+from src.config import Config
+from src.services.usage_service import UsageService, BudgetExceededError
+
+usage_bp = Blueprint('usage', __name__)
+usage_service = UsageService()
+
+def _parse_day(value):
+    """Parse an optional YYYY-MM-DD query parameter"""
+    return date.fromisoformat(value) if value else None
+
+@usage_bp.route('', methods=['GET'])
+def get_usage():
+    """Aggregate token usage by user, conversation, advisor, day or model"""
+    try:
+        rows = usage_service.summarize(
+            request.args.get('group_by', 'day'),
+            since=_parse_day(request.args.get('since')),
+            until=_parse_day(request.args.get('until')),
+            user_id=request.args.get('user_id'),
+            conversation_id=request.args.get('conversation_id'),
+            advisor_id=request.args.get('advisor_id')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(rows)
+
+@usage_bp.route('/budget', methods=['GET'])
+def get_budget():
+    """Report today's token usage against the configured budgets"""
+    user_id = request.args.get('user_id', 'default_user')
+    used = usage_service.tokens_used_today(user_id=user_id)
+    
+    try:
+        downgraded = usage_service.check_user_budget(user_id)
+        status = 'downgraded' if downgraded else 'ok'
+    except BudgetExceededError:
+        status = 'rejected'
+    
+    return jsonify({
+        'user_id': user_id,
+        'day': datetime.utcnow().date().isoformat(),
+        'tokens_used': used,
+        'soft_limit': Config.USAGE_USER_SOFT_DAILY_TOKENS or None,
+        'hard_limit': Config.USAGE_USER_HARD_DAILY_TOKENS or None,
+        'status': status
+    })
@@ -0,0 +1,39 @@
+"""
+Watchlist routes for TinyTroupe Service
+"""
+from flask import Blueprint, jsonify, request
+from src.services.symbol_master import UnknownSymbolError
+from src.services.watchlist_service import WatchlistService
+
+watchlist_bp = Blueprint('watchlist', __name__)
+watchlist_service = WatchlistService()
+
+@watchlist_bp.route('', methods=['GET'])
+def get_watchlist():
+    """Get a user's watched symbols"""
+    # In a real app, use the authenticated user
+    user_id = request.args.get('user_id', 'default_user')
+    return jsonify(watchlist_service.list(user_id))
+
+@watchlist_bp.route('', methods=['POST'])
+def watch_symbols():
+    """Add symbols to a user's watchlist"""
+    data = request.json or {}
+    user_id = data.get('user_id', 'default_user')
+    
+    try:
+        watchlist = watchlist_service.add(user_id, data.get('symbols'))
+    except UnknownSymbolError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(watchlist)
+
+@watchlist_bp.route('/<symbol>', methods=['DELETE'])
+def unwatch_symbol(symbol):
+    """Remove a symbol from a user's watchlist"""
+    user_id = request.args.get('user_id', 'default_user')
+    if not watchlist_service.remove(user_id, symbol):
+        return jsonify({'error': f'{symbol.upper()} is not on the watchlist'}), 404
+    return jsonify(watchlist_service.list(user_id))
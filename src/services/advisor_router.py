@@ -0,0 +1,219 @@
+"""
+Relevance-based routing of user messages to advisors
+"""
+import logging
+import math
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.config import Config
+
+logger = logging.getLogger(__name__)
+
+ROUTING_MODES = ('all', 'top_k', 'threshold')
+
+# Words that signal each expertise area, beyond the words of the area's own name
+EXPERTISE_KEYWORDS = {
+    'value investing': ['value', 'undervalued', 'overvalued', 'intrinsic', 'moat', 'buy', 'hold', 'stock',
+                        'stocks', 'valuation', 'cheap', 'expensive', 'bargain'],
+    'business analysis': ['business', 'company', 'management', 'competitive', 'competitor', 'brand',
+                          'moat', 'industry', 'margins', 'profitability'],
+    'capital allocation': ['buyback', 'buybacks', 'dividend', 'dividends', 'acquisition', 'acquisitions',
+                           'reinvest', 'capital', 'allocation', 'debt'],
+    'macroeconomics': ['fed', 'federal', 'reserve', 'rate', 'rates', 'hike', 'hikes', 'inflation', 'cpi',
+                       'gdp', 'recession', 'unemployment', 'monetary', 'fiscal', 'central', 'bank', 'yield',
+                       'yields', 'bond', 'bonds', 'treasury', 'economy', 'economic', 'currency', 'dollar'],
+    'contrarian investing': ['contrarian', 'unpopular', 'crowded', 'consensus', 'against', 'unloved'],
+    'market psychology': ['sentiment', 'panic', 'fear', 'greed', 'bubble', 'euphoria', 'crowd', 'mania',
+                          'crash', 'speculation', 'hype', 'animal spirits'],
+    'margin of safety': ['safety', 'downside', 'discount', 'undervalued', 'risk', 'protection'],
+    'fundamental analysis': ['earnings', 'pe', 'p/e', 'book', 'balance sheet', 'cash flow', 'revenue', 'ratio',
+                             'eps', 'fundamentals', 'fundamental', 'financials', 'statements', 'debt'],
+    'pattern recognition': ['pattern', 'patterns', 'trend', 'trends', 'cycle', 'cycles', 'correlation',
+                            'signal', 'signals', 'anomaly', 'chart'],
+    'systems thinking': ['system', 'systems', 'feedback', 'interconnected', 'network', 'complex',
+                         'second order', 'ecosystem'],
+    'thought experiments': ['imagine', 'hypothetical', 'hypothetically', 'suppose', 'scenario', 'what if'],
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9/']+")
+_MENTION_RE = re.compile(r'@([\w.-]+)')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens plus adjacent-word bigrams"""
+    words = _TOKEN_RE.findall(text.lower())
+    return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+
+class RoutingDecision:
+    """Which advisors answer a turn, and why the others were skipped"""
+
+    __slots__ = ('mode', 'selected', 'skipped', 'scores')
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.selected: List[str] = []
+        self.skipped: List[Dict[str, Any]] = []
+        self.scores: Dict[str, float] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to dictionary"""
+        return {
+            'mode': self.mode,
+            'selected': self.selected,
+            'skipped': self.skipped,
+            'scores': self.scores
+        }
+
+
+class AdvisorRouter:
+    """Chooses the advisors relevant to a message
+
+    An inverted index maps keywords to the advisors whose expertise they
+    signal, weighted by inverse document frequency so that words shared by
+    every advisor count for little. Scores are squashed into [0, 1).
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._indexes: Dict[Tuple, Dict[str, Dict[str, float]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def settings_for(conversation_settings: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Merge a conversation's routing settings over the configured defaults"""
+        settings = {
+            'mode': Config.ADVISOR_ROUTING_MODE,
+            'k': Config.ADVISOR_ROUTING_TOP_K,
+            'threshold': Config.ADVISOR_ROUTING_THRESHOLD,
+        }
+        settings.update((conversation_settings or {}).get('routing') or {})
+        return settings
+
+    def _index(self, advisors: Iterable) -> Dict[str, Dict[str, float]]:
+        key = tuple(sorted((advisor.id, advisor.version) for advisor in advisors))
+        index = self._indexes.get(key)
+        if index is not None:
+            return index
+
+        postings: Dict[str, set] = {}
+        for advisor in advisors:
+            for area in advisor.expertise:
+                terms = set(tokenize(area)) | set(EXPERTISE_KEYWORDS.get(area, []))
+                for term in terms:
+                    postings.setdefault(term, set()).add(advisor.id)
+
+        count = max(len(key), 1)
+        index = {
+            term: {advisor_id: math.log(1 + count / len(ids)) for advisor_id in ids}
+            for term, ids in postings.items()
+        }
+        with self._lock:
+            self._indexes[key] = index
+        return index
+
+    def score(self, message: str, advisors: List) -> Dict[str, float]:
+        """Score each advisor's relevance to a message in [0, 1)"""
+        index = self._index(advisors)
+        raw = {advisor.id: 0.0 for advisor in advisors}
+        for term in set(tokenize(message)):
+            for advisor_id, weight in index.get(term, {}).items():
+                raw[advisor_id] += weight
+        return {advisor_id: round(1 - math.exp(-value), 3) for advisor_id, value in raw.items()}
+
+    @staticmethod
+    def mentions(message: str, advisors: List) -> List[str]:
+        """Advisors @-mentioned by id, full name or any part of their name"""
+        handles = {handle.lower().strip('.') for handle in _MENTION_RE.findall(message)}
+        if not handles:
+            return []
+        mentioned = []
+        for advisor in advisors:
+            names = {advisor.id.lower(), advisor.name.lower().replace(' ', '_')}
+            names.update(part.lower() for part in advisor.name.split())
+            if handles & names:
+                mentioned.append(advisor.id)
+        return mentioned
+
+    def route(self, message: str, advisors: List, conversation_settings: Optional[Dict[str, Any]] = None) -> RoutingDecision:
+        """Decide which advisors should answer a message
+
+        Args:
+            message: User message
+            advisors: Compiled personas taking part in the conversation
+            conversation_settings: The conversation's settings dictionary
+
+        Returns:
+            The routing decision
+        """
+        settings = self.settings_for(conversation_settings)
+        decision = RoutingDecision(settings['mode'])
+        mentioned = set(self.mentions(message, advisors))
+
+        if settings['mode'] == 'all':
+            decision.selected = [advisor.id for advisor in advisors]
+            return decision
+
+        scores = self.score(message, advisors)
+        decision.scores = scores
+        ranked = sorted(advisors, key=lambda advisor: scores[advisor.id], reverse=True)
+
+        if not any(scores.values()):
+            # Nothing to rank on: a general question goes to everyone unless someone was mentioned
+            for advisor in ranked:
+                if not mentioned or advisor.id in mentioned:
+                    decision.selected.append(advisor.id)
+                else:
+                    decision.skipped.append(self._skip(advisor, 0.0, 'not mentioned'))
+            return decision
+
+        for position, advisor in enumerate(ranked):
+            advisor_score = scores[advisor.id]
+            if advisor.id in mentioned:
+                decision.selected.append(advisor.id)
+            elif settings['mode'] == 'top_k' and position >= settings['k']:
+                decision.skipped.append(self._skip(advisor, advisor_score, f"not in top {settings['k']}"))
+            elif settings['mode'] == 'threshold' and advisor_score < settings['threshold']:
+                decision.skipped.append(self._skip(
+                    advisor, advisor_score, f"relevance below threshold {settings['threshold']}"))
+            else:
+                decision.selected.append(advisor.id)
+
+        self.logger.info(f"Routed message to {len(decision.selected)} of {len(advisors)} advisors ({decision.mode})")
+        return decision
+
+    @staticmethod
+    def _skip(advisor, score: float, reason: str) -> Dict[str, Any]:
+        return {'advisor_id': advisor.id, 'advisor_name': advisor.name, 'score': score, 'reason': reason}
+
+
+def validate_routing_settings(routing: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate routing settings supplied by a client
+
+    Args:
+        routing: Dictionary with 'mode' and optional 'k' / 'threshold'
+
+    Returns:
+        The cleaned settings
+
+    Raises:
+        ValueError: If a setting is invalid
+    """
+    if not isinstance(routing, dict):
+        raise ValueError("routing must be an object")
+    cleaned = {}
+    mode = routing.get('mode', Config.ADVISOR_ROUTING_MODE)
+    if mode not in ROUTING_MODES:
+        raise ValueError(f"routing mode must be one of {', '.join(ROUTING_MODES)}")
+    cleaned['mode'] = mode
+    if 'k' in routing:
+        if not isinstance(routing['k'], int) or isinstance(routing['k'], bool) or routing['k'] < 1:
+            raise ValueError("routing k must be a positive integer")
+        cleaned['k'] = routing['k']
+    if 'threshold' in routing:
+        if not isinstance(routing['threshold'], (int, float)) or not 0 <= routing['threshold'] <= 1:
+            raise ValueError("routing threshold must be between 0 and 1")
+        cleaned['threshold'] = float(routing['threshold'])
+    return cleaned
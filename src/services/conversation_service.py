@@ -2,10 +2,27 @@
 Conversation management service
 """
 import logging
-from typing import List, Dict, Any
-from src.extensions import db
+from typing import List, Dict, Any, Callable, Optional
+from src.database import ConcurrentUpdateError
+from src.extensions import db, db_writer
 from src.models import Conversation, Message, Persona, PersonaState
+from src.config import Config
+from src.cancellation import CancellationToken, OperationCancelled
+from src.deadline import Deadline
 from src.services.tinytroupe_service import TinyTroupeService
+from src.services.usage_service import BudgetExceededError
+from src.services.advisor_router import AdvisorRouter, validate_routing_settings
+from src.services.message_history import message_history
+from src.services.persona_memory import memory_store
+from src.services.prompt_compiler import MAX_HISTORY
+from src.services.transcripts import transcript_store
+from src.services.turn_queue import turn_queue
+
+# 'per_advisor' asks each advisor separately, 'board' asks all selected advisors in one call
+GENERATION_MODES = ('per_advisor', 'board')
+
+# 'optimistic' runs concurrent turns at once and retries conflicting writes, 'serialized' queues them
+TURN_ORDERINGS = ('optimistic', 'serialized')
 
 class ConversationService:
     """Service for managing conversations with TinyTroupe advisors"""
@@ -14,7 +31,145 @@ class ConversationService:
         """Initialize the conversation service"""
         self.logger = logging.getLogger(__name__)
         self.tinytroupe_service = TinyTroupeService()
+        self.usage = self.tinytroupe_service.usage
+        self.router = AdvisorRouter()
+        self.memory = memory_store
+        self.history = message_history
+        self.transcripts = transcript_store
+        self.turns = turn_queue
+        
+    def _load_advisors(self) -> List[Persona]:
+        """Load all advisors and make sure the TinyTroupe service knows about them"""
+        advisors = Persona.query.all()
+        if advisors:
+            self.tinytroupe_service.initialize_advisors([advisor.to_dict() for advisor in advisors])
+        return advisors
+    
+    @staticmethod
+    def _add_persona_states(session, conversation_id: str, advisor_ids: List[str]) -> None:
+        """Add an empty persona state for each advisor to a session"""
+        for advisor_id in advisor_ids:
+            session.add(PersonaState(
+                persona_id=advisor_id,
+                conversation_id=conversation_id,
+                memory_state={"context": [], "recent_messages": []}
+            ))
+    
+    @staticmethod
+    def _remember(memory_state: Dict[str, Any], user_message: str, response_content: str) -> Dict[str, Any]:
+        """Return a copy of a persona memory state with a new exchange appended"""
+        memory_state = dict(memory_state or {})
+        memory_state['memory_size'] = memory_state.get('memory_size', 0) + 1
+        recent_messages = list(memory_state.get('recent_messages', []))
+        recent_messages.append({'role': 'user', 'content': user_message})
+        recent_messages.append({'role': 'advisor', 'content': response_content})
+        
+        # Keep only the last 20 messages in memory
+        memory_state['recent_messages'] = recent_messages[-20:]
+        return memory_state
+    
+    @staticmethod
+    def generation_mode_for(settings: Dict[str, Any]) -> str:
+        """Generation mode of a conversation, falling back to the configured default"""
+        return (settings or {}).get('generation_mode') or Config.GENERATION_MODE
+    
+    @staticmethod
+    def turn_ordering_for(settings: Dict[str, Any]) -> str:
+        """Turn ordering of a conversation, falling back to the configured default"""
+        return (settings or {}).get('turn_ordering') or Config.TURN_ORDERING
+    
+    @staticmethod
+    def validate_settings(settings: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate conversation settings supplied by a client
         
+        Args:
+            settings: Settings dictionary
+            
+        Returns:
+            The cleaned settings
+            
+        Raises:
+            ValueError: If a setting is unknown or invalid
+        """
+        if not isinstance(settings, dict):
+            raise ValueError("settings must be an object")
+        cleaned = {}
+        for key, value in settings.items():
+            if key == 'routing':
+                cleaned['routing'] = validate_routing_settings(value)
+            elif key == 'generation_mode':
+                if value not in GENERATION_MODES:
+                    raise ValueError(f"generation_mode must be one of {', '.join(GENERATION_MODES)}")
+                cleaned['generation_mode'] = value
+            elif key == 'turn_ordering':
+                if value not in TURN_ORDERINGS:
+                    raise ValueError(f"turn_ordering must be one of {', '.join(TURN_ORDERINGS)}")
+                cleaned['turn_ordering'] = value
+            else:
+                raise ValueError(f"Unknown conversation setting: {key}")
+        return cleaned
+    
+    def create_conversation(self, user_id: str, title: str, settings: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Create a conversation together with its advisor persona states
+        
+        Args:
+            user_id: ID of the user owning the conversation
+            title: Conversation title
+            settings: Optional conversation settings, see validate_settings
+            
+        Returns:
+            The new conversation as a dictionary
+        """
+        settings = self.validate_settings(settings or {})
+        advisors = self._load_advisors()
+        if not advisors:
+            self.logger.warning("No advisors found in database")
+        advisor_ids = [advisor.id for advisor in advisors]
+        
+        def write(session):
+            conversation = Conversation(user_id=user_id, title=title, settings=settings)
+            session.add(conversation)
+            session.flush()
+            self._add_persona_states(session, conversation.id, advisor_ids)
+            return conversation.to_dict()
+        
+        conversation = db_writer.run(write)
+        self.logger.info(f"Initialized {len(advisors)} personas for conversation: {conversation['id']}")
+        return conversation
+    
+    def update_conversation(self, conversation_id: str, title: str = None,
+                            settings: Dict[str, Any] = None, version: Optional[int] = None) -> Dict[str, Any]:
+        """Update a conversation's title and merge new settings into its existing ones
+        
+        Args:
+            conversation_id: ID of the conversation
+            title: New title, or None to keep the current one
+            settings: Settings to merge, see validate_settings
+            version: Version the client last read; the update is refused if the
+                conversation changed since. Without it, concurrent updates are merged.
+            
+        Returns:
+            The updated conversation as a dictionary
+            
+        Raises:
+            ConcurrentUpdateError: If the conversation no longer has ``version``
+        """
+        settings = self.validate_settings(settings or {})
+        
+        def write(session):
+            conversation = session.get(Conversation, conversation_id, populate_existing=True)
+            if version is not None and conversation.version != version:
+                raise ConcurrentUpdateError(
+                    f"Conversation {conversation_id} is at version {conversation.version}, not {version}")
+            if title:
+                conversation.title = title
+            if settings:
+                conversation.settings = {**(conversation.settings or {}), **settings}
+            session.flush()
+            return conversation.to_dict()
+        
+        return db_writer.run_versioned(write, retries=0 if version is not None else None)
+    
     def initialize_personas(self, conversation_id: str) -> None:
         """Initialize advisor personas for a conversation
         
@@ -23,107 +178,272 @@ class ConversationService:
         """
         self.logger.info(f"Initializing personas for conversation: {conversation_id}")
         
-        # Get all advisors
-        advisors = Persona.query.all()
+        advisors = self._load_advisors()
         
         # If no advisors exist, we can't initialize personas
         if not advisors:
             self.logger.warning("No advisors found in database")
             return
         
-        # Initialize the TinyTroupe service with advisor configurations
-        advisor_configs = [advisor.to_dict() for advisor in advisors]
-        self.tinytroupe_service.initialize_advisors(advisor_configs)
+        advisor_ids = [advisor.id for advisor in advisors]
+        db_writer.run(lambda session: self._add_persona_states(session, conversation_id, advisor_ids))
+        self.logger.info(f"Initialized {len(advisors)} personas for conversation: {conversation_id}")
+    
+    def add_user_message(self, conversation_id: str, content: str) -> Dict[str, Any]:
+        """Store a user message and touch the conversation
         
-        # Create initial persona states for each advisor
-        for advisor in advisors:
-            persona_state = PersonaState(
-                persona_id=advisor.id,
-                conversation_id=conversation_id,
-                memory_state={"context": [], "recent_messages": []}
+        Args:
+            conversation_id: ID of the conversation
+            content: Message content
+            
+        Returns:
+            The stored message as a dictionary
+        """
+        def write(session):
+            message = Message(conversation_id=conversation_id, role='user', content=content)
+            session.add(message)
+            session.query(Conversation).filter_by(id=conversation_id).update(
+                {Conversation.updated_at: db.func.now()}, synchronize_session=False
             )
-            db.session.add(persona_state)
+            session.flush()
+            stored = message.to_dict()
+            self.transcripts.append(session, conversation_id, [stored])
+            return stored
         
-        db.session.commit()
-        self.logger.info(f"Initialized {len(advisors)} personas for conversation: {conversation_id}")
+        return db_writer.run(write)
+    
+    def check_budget(self, user_id: str) -> None:
+        """Reject a turn up front if the user's hard daily budget is used up
+        
+        Args:
+            user_id: ID of the user starting the turn
+            
+        Raises:
+            BudgetExceededError: If the user's hard budget is exceeded
+        """
+        self.usage.check_user_budget(user_id)
+    
+    def begin_turn(self, conversation: Conversation) -> Optional[str]:
+        """Wait for the conversation's earlier turns if its turns are serialized
+        
+        Call before storing the user message, and pass the result to end_turn
+        once the turn is written.
+        
+        Args:
+            conversation: The conversation the turn is on
+            
+        Returns:
+            Lease token if the turn now holds the conversation, else None
+            
+        Raises:
+            TurnInProgress: If the earlier turns did not finish within TURN_WAIT_SECONDS
+        """
+        if self.turn_ordering_for(conversation.settings) != 'serialized':
+            return None
+        return self.turns.acquire(conversation.id)
     
-    def generate_responses(self, conversation_id: str, user_message: str) -> List[Dict[str, Any]]:
-        """Generate responses from all advisors for a user message
+    def end_turn(self, conversation_id: str, token: Optional[str]) -> None:
+        """Let the conversation's next turn run"""
+        if token is not None:
+            self.turns.release(conversation_id, token)
+    
+    def generate_responses(self, conversation_id: str, user_message: str,
+                           deadline: Optional[Deadline] = None, cancel: Optional[CancellationToken] = None,
+                           on_answer: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Generate responses from the relevant advisors for a user message
         
         Args:
             conversation_id: ID of the conversation
             user_message: User message to respond to
+            deadline: Request deadline; advisors that cannot answer in time give
+                their template response, marked as degraded
+            cancel: Token cancelled when nobody is waiting for the turn any more;
+                advisors not yet answered are stored as cancelled
+            on_answer: Called with each advisor response as soon as it is ready,
+                before the turn is written
             
         Returns:
-            List of advisor responses with metadata
+            Dictionary with the advisor responses and the advisors skipped for this turn
         """
         self.logger.info(f"Generating responses for conversation: {conversation_id}")
         
-        # Get conversation history
-        messages = Message.query.filter_by(conversation_id=conversation_id).order_by(Message.timestamp).all()
-        conversation_history = [message.to_dict() for message in messages]
+        conversation = db.session.get(Conversation, conversation_id)
+        user_id = conversation.user_id if conversation else None
+        settings = conversation.settings if conversation else {}
+        routing_mode = self.router.settings_for(settings)['mode']
+        
+        # Prompts only show the most recent messages, so only those are read
+        conversation_history = self.history.recent(conversation_id, MAX_HISTORY)
         
         # Get all advisors for this conversation
         persona_states = PersonaState.query.filter_by(conversation_id=conversation_id).all()
         if not persona_states:
             self.logger.warning(f"No persona states found for conversation: {conversation_id}")
-            return []
+            return {'advisor_responses': [], 'skipped_advisors': [], 'routing_mode': routing_mode,
+                    'generation_mode': self.generation_mode_for(settings)}
+        
+        # Compiled prompts are cached per persona version, so this only recompiles edited advisors
+        advisors = Persona.query.filter(Persona.id.in_([state.persona_id for state in persona_states])).all()
+        self.tinytroupe_service.initialize_advisors([advisor.to_dict() for advisor in advisors])
+        advisor_names = {advisor.id: advisor.name for advisor in advisors}
+        reuse_allowed = {advisor.id: advisor.response_reuse for advisor in advisors}
         
-        advisor_responses = []
+        # Only ask the advisors relevant to this message
+        compiled = [self.tinytroupe_service.advisors[state.persona_id] for state in persona_states
+                    if state.persona_id in self.tinytroupe_service.advisors]
+        decision = self.router.route(user_message, compiled, settings)
+        selected = set(decision.selected)
+        skipped_advisors = list(decision.skipped)
+        
+        # Users past their soft budget get the cheaper model for the whole turn
+        downgrade_user = self.usage.check_user_budget(user_id) if user_id else False
+        
+        # Work out the model and retrieved memories for every advisor that will answer
+        candidates = []
         for persona_state in persona_states:
             advisor_id = persona_state.persona_id
+            if advisor_id not in selected:
+                continue
             
             try:
-                # Get response from TinyTroupe service
-                response_content = self.tinytroupe_service.get_response(
-                    advisor_id, 
-                    user_message, 
-                    conversation_history
-                )
-                
+                downgrade = self.usage.check_advisor_budget(advisor_id) or downgrade_user
+            except BudgetExceededError as e:
+                self.logger.warning(f"Skipping advisor {advisor_id}: {str(e)}")
+                skipped_advisors.append({
+                    'advisor_id': advisor_id,
+                    'advisor_name': advisor_names.get(advisor_id, 'Unknown'),
+                    'score': decision.scores.get(advisor_id),
+                    'reason': 'daily token budget exceeded'
+                })
+                continue
+            
+            # Earlier exchanges relevant to this message, beyond the persona's recent window
+            memories = None
+            if Config.PERSONA_MEMORY_ENABLED:
+                recent = len((persona_state.memory_state or {}).get('recent_messages', [])) // 2
+                memories = self.memory.search(persona_state.id, user_message, exclude_recent=recent)
+            candidates.append((persona_state, downgrade, memories))
+        
+        def answered(advisor_id, answer):
+            if on_answer is not None and not isinstance(answer, Exception):
+                on_answer({
+                    'advisor_id': advisor_id,
+                    'advisor_name': advisor_names.get(advisor_id, 'Unknown'),
+                    'content': answer[0],
+                    'metadata': answer[1]
+                })
+        
+        # Generate every reply before opening the write transaction, collecting this turn's usage
+        with self.usage.collect() as usage_batch:
+            answers = {}
+            generation_mode = self.generation_mode_for(settings)
+            if generation_mode == 'board' and len(candidates) > 1:
+                try:
+                    answers = self.tinytroupe_service.board_respond(
+                        [persona_state.persona_id for persona_state, _, _ in candidates],
+                        user_message,
+                        conversation_history,
+                        allow_reuse=reuse_allowed,
+                        model=Config.LLM_DOWNGRADE_MODEL if any(d for _, d, _ in candidates) else Config.LLM_MODEL,
+                        user_id=user_id,
+                        conversation_id=conversation_id,
+                        memories={persona_state.persona_id: memories for persona_state, _, memories in candidates},
+                        deadline=deadline,
+                        cancel=cancel
+                    )
+                    for advisor_id, answer in answers.items():
+                        answered(advisor_id, answer)
+                except Exception as e:
+                    self.logger.warning(f"Board generation failed, falling back to per-advisor calls: {str(e)}")
+            
+            # Remaining advisors are asked concurrently, bounded by the request deadline
+            calls = [(persona_state.persona_id, reuse_allowed.get(persona_state.persona_id, True), {
+                'model': Config.LLM_DOWNGRADE_MODEL if downgrade else Config.LLM_MODEL,
+                'user_id': user_id,
+                'conversation_id': conversation_id,
+                'memories': memories
+            }) for persona_state, downgrade, memories in candidates if persona_state.persona_id not in answers]
+            if calls:
+                answers.update(self.tinytroupe_service.respond_many(
+                    calls, user_message, conversation_history, deadline, cancel, answered))
+            
+            # Ledger entries are committed together with the turn
+            usage_entries = usage_batch.drain()
+        
+        replies = []
+        for persona_state, _, _ in candidates:
+            advisor_id = persona_state.persona_id
+            answer = answers.get(advisor_id)
+            if isinstance(answer, OperationCancelled):
+                # Keep a record of the abandoned reply, outside the persona's memory
+                replies.append((persona_state.id, advisor_id, '', {'cancelled': True}, None, None))
+                continue
+            if isinstance(answer, Exception):
+                self.logger.error(f"Error generating response from advisor {advisor_id}: {str(answer)}")
+                continue
+            response_content, metadata = answer
+            snippet = self.memory.snippet(user_message, response_content)
+            replies.append((persona_state.id, advisor_id, response_content, metadata,
+                            snippet, self.memory.encode(snippet)))
+        
+        def write(session):
+            self.usage.add_records(session, usage_entries)
+            
+            stored = []
+            for persona_state_id, advisor_id, response_content, metadata, snippet, vector in replies:
                 # Create message in database
                 advisor_message = Message(
                     conversation_id=conversation_id,
                     role='advisor',
                     advisor_id=advisor_id,
-                    content=response_content
+                    content=response_content,
+                    meta=metadata or None
                 )
-                db.session.add(advisor_message)
-                
-                # Update persona state with new message
-                memory_state = persona_state.memory_state
-                if 'recent_messages' not in memory_state:
-                    memory_state['recent_messages'] = []
-                
-                memory_state['recent_messages'].append({
-                    'role': 'user',
-                    'content': user_message
-                })
-                memory_state['recent_messages'].append({
-                    'role': 'advisor',
-                    'content': response_content
-                })
-                
-                # Keep only the last 10 messages in memory
-                if len(memory_state['recent_messages']) > 20:
-                    memory_state['recent_messages'] = memory_state['recent_messages'][-20:]
-                
-                persona_state.memory_state = memory_state
-                
-                # Add response to result list
-                advisor = Persona.query.get(advisor_id)
-                advisor_responses.append({
-                    'id': advisor_message.id,
-                    'advisor_id': advisor_id,
-                    'advisor_name': advisor.name if advisor else 'Unknown',
-                    'content': response_content,
-                    'timestamp': advisor_message.timestamp.isoformat()
-                })
+                session.add(advisor_message)
+                stored.append(advisor_message)
+                if vector is None:
+                    continue
                 
+                # Update persona state with new message, re-read in case another turn just changed it
+                persona_state = session.get(PersonaState, persona_state_id, populate_existing=True)
+                position = persona_state.memory_state.get('memory_size', 0)
+                session.add(self.memory.entry(persona_state_id, position, snippet, vector))
+                persona_state.memory_state = self._remember(persona_state.memory_state, user_message, response_content)
+            
+            session.flush()
+            self.transcripts.append(session, conversation_id, [advisor_message.to_dict() for advisor_message in stored])
+            return [{
+                'id': advisor_message.id,
+                'seq': advisor_message.seq,
+                'advisor_id': advisor_message.advisor_id,
+                'advisor_name': advisor_names.get(advisor_message.advisor_id, 'Unknown'),
+                'content': advisor_message.content,
+                'timestamp': advisor_message.timestamp.isoformat(),
+                'metadata': advisor_message.meta or {}
+            } for advisor_message in stored]
+        
+        # A concurrent turn that updated the same persona states first makes this write start over
+        try:
+            advisor_responses = db_writer.run_versioned(write) if replies or usage_entries else []
+        except Exception:
+            # The calls were made all the same, so they are charged even if the turn is not stored
+            try:
+                self.usage.write(usage_entries)
             except Exception as e:
-                self.logger.error(f"Error generating response from advisor {advisor_id}: {str(e)}")
+                self.logger.error(f"Could not record usage for conversation {conversation_id}: {str(e)}")
+            raise
         
-        db.session.commit()
+        # Hedged duplicates that finished after their turn's write are charged separately
+        try:
+            self.usage.flush()
+        except Exception as e:
+            self.logger.warning(f"Could not record late usage: {str(e)}")
         self.logger.info(f"Generated {len(advisor_responses)} responses for conversation: {conversation_id}")
         
-        return advisor_responses
+        return {
+            'advisor_responses': advisor_responses,
+            'skipped_advisors': skipped_advisors,
+            'routing_mode': decision.mode,
+            'generation_mode': generation_mode,
+            'cancelled': cancel is not None and cancel.cancelled
+        }
@@ -3,9 +3,18 @@ Financial data service
 """
 import logging
 import os
-from typing import Dict, Any
+import time
+from typing import Dict, Any, List, Optional
+import numpy as np
 import requests
 import json
+from src.config import Config
+from src.extensions import cache
+from src.deadline import Deadline
+from src.services.downsampling import ENCODINGS, METHODS, downsample, encode_series
+from src.services.fundamentals_index import fundamentals_index, parse_filters
+from src.services.price_history import compute_indicators, normalize_symbol, price_history, series_to_dict
+from src.services.symbol_master import symbol_master
 
 class FinancialService:
     """Service for retrieving and analyzing financial data"""
@@ -24,16 +33,57 @@ class FinancialService:
         from src.services.tinytroupe_service import TinyTroupeService
         self.tinytroupe_service = TinyTroupeService()
         
-    def get_stock_data(self, symbol: str) -> Dict[str, Any]:
+        # Known symbols, checked before anything is asked of the provider
+        self.symbols = symbol_master
+        
+        # Quotes and advisor snapshots are shared between workers through the cache
+        self.quotes = cache.namespace('quotes')
+        self.analyses = cache.namespace('analysis')
+        
+        # Indicators are keyed by the series version, so they are recomputed once per new bar
+        self.prices = price_history
+        self.indicators = cache.namespace('indicators')
+        self.charts = cache.namespace('charts')
+        
+        # Columnar fundamentals for screening, kept current as quotes are fetched
+        self.fundamentals = fundamentals_index
+        self._synced_versions: Dict[str, str] = {}
+        self._synced_at = 0.0
+        
+    def get_stock_data(self, symbol: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """Get financial data for a stock symbol
         
         Args:
             symbol: Stock symbol to get data for
+            deadline: Request deadline bounding the upstream call on a cache miss
             
         Returns:
             Dictionary containing financial data
+            
+        Raises:
+            ValueError: If the symbol is malformed
+            UnknownSymbolError: If the symbol is not in the symbol master
+            DeadlineExceeded: If the data is not cached and the deadline has passed
         """
+        symbol = self.symbols.validate(symbol)
+        return self.quotes.get_or_set(symbol, lambda: self._index(self._fetch_stock_data(symbol, deadline)))
+    
+    @staticmethod
+    def _complete(analysis: Dict[str, Any]) -> bool:
+        """Whether no advisor's analysis is a degraded fallback, so it may be cached"""
+        return not any(advisor_analysis.get('degraded') for advisor_analysis in analysis.values())
+    
+    def _index(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Add freshly fetched stock data to the screening index"""
+        self.fundamentals.upsert([data])
+        return data
+    
+    def _fetch_stock_data(self, symbol: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Fetch financial data for a stock symbol from the upstream provider"""
         self.logger.info(f"Getting stock data for: {symbol}")
+        if deadline is not None:
+            deadline.check(f"fetching {symbol}")
+        timeout = deadline.timeout(cap=10) if deadline is not None else 10
         
         # In a real implementation, you would call the Yahoo Finance or Alpha Vantage API
         # For now, we'll return placeholder data
@@ -44,7 +94,8 @@ class FinancialService:
             #     response = requests.get(
             #         f"https://yfapi.net/v6/finance/quote",
             #         params={"symbols": symbol},
-            #         headers={"X-API-KEY": self.yahoo_finance_api_key}
+            #         headers={"X-API-KEY": self.yahoo_finance_api_key},
+            #         timeout=timeout
             #     )
             #     return response.json()
             
@@ -66,32 +117,312 @@ class FinancialService:
             self.logger.error(f"Error getting stock data for {symbol}: {str(e)}")
             raise
     
-    def get_stock_analysis(self, symbol: str) -> Dict[str, Any]:
+    def get_stock_analysis(self, symbol: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """Get advisor analysis for a stock symbol
         
         Args:
             symbol: Stock symbol to analyze
+            deadline: Request deadline; advisors that cannot answer in time give
+                their template analysis, marked as degraded
             
         Returns:
             Dictionary containing analysis from each advisor
+            
+        Raises:
+            ValueError: If the symbol is malformed
+            UnknownSymbolError: If the symbol is not in the symbol master
         """
+        symbol = self.symbols.validate(symbol)
         self.logger.info(f"Getting stock analysis for: {symbol}")
         
         try:
             # Get stock data first
-            stock_data = self.get_stock_data(symbol)
+            stock_data = self.get_stock_data(symbol, deadline)
             
-            # Get analysis from TinyTroupe service
-            analysis = self.tinytroupe_service.analyze_stock(symbol)
+            # Get analysis from TinyTroupe service, reusing a recent snapshot if there is one
+            # Degraded snapshots are served once but never shared
+            usage = self.tinytroupe_service.usage
+            with usage.collect() as batch:
+                analysis = self.analyses.get_or_set(symbol,
+                                                    lambda: self.tinytroupe_service.analyze_stock(symbol, deadline),
+                                                    cacheable=self._complete)
+                usage.flush(batch)
             
             # Combine data and analysis
             result = {
                 "stock_data": stock_data,
                 "advisor_analysis": analysis
             }
+            try:
+                indicators = self.get_indicators([symbol])[0]
+            except ValueError:
+                indicators = None
+            if indicators is not None:
+                result["indicators"] = indicators
             
             return result
             
         except Exception as e:
             self.logger.error(f"Error getting stock analysis for {symbol}: {str(e)}")
             raise
+    
+    def refresh_quote(self, symbol: str, ttl: Optional[float] = None) -> Dict[str, Any]:
+        """Fetch a quote from the provider and cache it, replacing any cached one
+        
+        Args:
+            symbol: Stock symbol
+            ttl: Seconds to keep the quote, the quotes TTL by default
+            
+        Returns:
+            The fresh quote
+        """
+        symbol = self.symbols.validate(symbol)
+        data = self._index(self._fetch_stock_data(symbol))
+        self.quotes.set(symbol, data, ttl)
+        return data
+    
+    def refresh_analysis(self, symbol: str, ttl: Optional[float] = None) -> Dict[str, Any]:
+        """Run every advisor's analysis of a stock and cache it, replacing any cached one
+        
+        Degraded analyses are returned but not cached.
+        
+        Args:
+            symbol: Stock symbol
+            ttl: Seconds to keep the analysis, the analysis TTL by default
+            
+        Returns:
+            Analysis from each advisor
+        """
+        symbol = self.symbols.validate(symbol)
+        usage = self.tinytroupe_service.usage
+        with usage.collect() as batch:
+            analysis = self.tinytroupe_service.analyze_stock(symbol)
+            usage.flush(batch)
+        if self._complete(analysis):
+            self.analyses.set(symbol, analysis, ttl)
+        return analysis
+    
+    def search_symbols(self, prefix: str, limit: int = 10) -> Dict[str, Any]:
+        """Look up symbols by ticker or company name prefix, for autocompletion
+        
+        Args:
+            prefix: Start of a ticker or of a word of the company name
+            limit: Most results to return, capped at SYMBOL_SEARCH_MAX_LIMIT
+            
+        Returns:
+            Matching symbols with their names and exchanges
+            
+        Raises:
+            ValueError: If the limit is not positive
+        """
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        limit = min(limit, Config.SYMBOL_SEARCH_MAX_LIMIT)
+        return {
+            "prefix": prefix,
+            "results": self.symbols.search(prefix, limit),
+            "universe": self.symbols.size
+        }
+    
+    def get_indicators(self, symbols: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Get technical indicators for symbols from the local price history
+        
+        Cached values are used where the series has not changed; the rest are
+        computed together in one vectorized pass.
+        
+        Args:
+            symbols: Stock symbols
+            
+        Returns:
+            Indicators per symbol, in order; None for symbols without history
+        """
+        versions = [self.prices.version(symbol) for symbol in symbols]
+        keys = [f"{normalize_symbol(symbol)}:{version}" for symbol, version in zip(symbols, versions)]
+        results = [self.indicators.get(key) if version is not None else None
+                   for key, version in zip(keys, versions)]
+        missing = [position for position, result in enumerate(results)
+                   if result is None and versions[position] is not None]
+        if missing:
+            computed = compute_indicators([self.prices.series(symbols[position]) for position in missing])
+            for position, indicators in zip(missing, computed):
+                results[position] = indicators
+                if indicators is not None:
+                    self.indicators.set(keys[position], indicators)
+        return results
+    
+    def get_price_history(self, symbol: str, start: Optional[str] = None, end: Optional[str] = None,
+                          limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Get daily bars and indicators for a stock symbol
+        
+        Args:
+            symbol: Stock symbol
+            start: First date to include (YYYY-MM-DD)
+            end: Last date to include (YYYY-MM-DD)
+            limit: Most recent number of bars to return, capped at PRICE_HISTORY_MAX_BARS
+            
+        Returns:
+            Columnar series and latest indicators, or None if the symbol has no history
+            
+        Raises:
+            ValueError: If the symbol or a date is invalid
+        """
+        symbol = normalize_symbol(symbol)
+        if limit is not None and limit <= 0:
+            raise ValueError("limit must be a positive number of bars")
+        bars = self.prices.series(symbol)
+        if bars is None or len(bars) == 0:
+            return None
+        
+        dates = bars['date']
+        first = np.searchsorted(dates, np.datetime64(start, 'D')) if start else 0
+        last = np.searchsorted(dates, np.datetime64(end, 'D'), side='right') if end else len(bars)
+        count = min(limit or Config.PRICE_HISTORY_MAX_BARS, Config.PRICE_HISTORY_MAX_BARS)
+        selected = bars[max(first, last - count):last]
+        
+        return {
+            "symbol": symbol,
+            "bars": len(selected),
+            "series": series_to_dict(selected),
+            "indicators": self.get_indicators([symbol])[0]
+        }
+    
+    def get_chart_series(self, symbol: str, period: str = '1y', width: int = 800, method: str = 'lttb',
+                         encoding: str = 'json') -> Optional[Dict[str, Any]]:
+        """Get a symbol's price series downsampled to a chart's pixel width
+        
+        Results are cached per symbol, period, width, method and encoding
+        until the series changes.
+        
+        Args:
+            symbol: Stock symbol
+            period: Span ending at the latest bar, one of CHART_PERIODS or ``ytd``
+            width: Chart width in pixels, i.e. the most points to return, capped at CHART_MAX_WIDTH
+            method: ``lttb`` (Largest-Triangle-Three-Buckets) or ``minmax`` (each bucket's low and high)
+            encoding: ``json`` arrays or ``base64`` float32/int32 arrays, see ``encode_series``
+            
+        Returns:
+            Downsampled columnar series, or None if the symbol has no history
+            
+        Raises:
+            ValueError: If the symbol or a parameter is invalid
+        """
+        symbol = normalize_symbol(symbol)
+        period = (period or '1y').lower()
+        if period not in Config.CHART_PERIODS and period != 'ytd':
+            raise ValueError(f"range must be one of: {', '.join(list(Config.CHART_PERIODS) + ['ytd'])}")
+        if width < 3:
+            raise ValueError("width must be at least 3 pixels")
+        if method not in METHODS:
+            raise ValueError(f"method must be one of: {', '.join(METHODS)}")
+        if encoding not in ENCODINGS:
+            raise ValueError(f"encoding must be one of: {', '.join(ENCODINGS)}")
+        width = min(width, Config.CHART_MAX_WIDTH)
+        
+        version = self.prices.version(symbol)
+        if version is None:
+            return None
+        key = f"{symbol}:{period}:{width}:{method}:{encoding}:{version}"
+        cached = self.charts.get(key)
+        if cached is not None:
+            return cached
+        
+        bars = self.prices.series(symbol)
+        if bars is None or len(bars) == 0:
+            return None
+        last = bars['date'][-1]
+        if period == 'ytd':
+            first = last.astype('datetime64[Y]').astype('datetime64[D]')
+        elif Config.CHART_PERIODS[period] is None:
+            first = bars['date'][0]
+        else:
+            first = last - np.timedelta64(Config.CHART_PERIODS[period], 'D')
+        selected = bars[np.searchsorted(bars['date'], first):]
+        points = downsample(selected, width, method)
+        
+        chart = {
+            "symbol": symbol,
+            "range": period,
+            "width": width,
+            "method": method,
+            "encoding": encoding,
+            "bars": len(selected),
+            "points": len(points),
+            "series": encode_series(points, encoding)
+        }
+        self.charts.set(key, chart)
+        return chart
+    
+    def sync_fundamentals(self, force: bool = False) -> int:
+        """Update screening prices and 52-week ranges from the local price history
+        
+        Only symbols whose series changed since the last sync are recomputed,
+        in one vectorized pass.
+        
+        Args:
+            force: Sync even if the last sync was less than SCREENER_REFRESH_SECONDS ago
+            
+        Returns:
+            Number of symbols updated
+        """
+        if not force and time.monotonic() - self._synced_at < Config.SCREENER_REFRESH_SECONDS:
+            return 0
+        self._synced_at = time.monotonic()
+        
+        changed = []
+        for symbol in self.prices.symbols():
+            version = self.prices.version(symbol)
+            if version is not None and self._synced_versions.get(symbol) != version:
+                changed.append((symbol, version))
+        if not changed:
+            return 0
+        
+        series = [self.prices.series(symbol) for symbol, _ in changed]
+        records = []
+        for (symbol, version), bars, indicators in zip(changed, series, compute_indicators(series)):
+            self._synced_versions[symbol] = version
+            if indicators is None:
+                continue
+            record = {
+                "symbol": symbol,
+                "price": indicators['close'],
+                "52_week_high": indicators['high_52w'],
+                "52_week_low": indicators['low_52w']
+            }
+            if len(bars) > 1:
+                previous = float(bars['close'][-2])
+                record["change"] = indicators['close'] - previous
+                record["change_percent"] = 100 * (indicators['close'] - previous) / previous if previous else None
+            records.append(record)
+        self.logger.info(f"Synced {len(records)} symbols into the screening index")
+        return self.fundamentals.upsert(records)
+    
+    def screen(self, filters: Dict[str, str], sort: Optional[str] = None, limit: int = 50,
+               offset: int = 0) -> Dict[str, Any]:
+        """Screen the indexed universe of stocks
+        
+        Args:
+            filters: Query parameters such as ``{"pe_lt": "15", "dividend_yield_gt": "3"}``
+            sort: Field to order by, ``-field`` for descending
+            limit: Page size, capped at SCREENER_MAX_LIMIT
+            offset: Number of matches to skip
+            
+        Returns:
+            Total matches and one page of results
+            
+        Raises:
+            ValueError: If a filter, the sort field or the paging is invalid
+        """
+        parsed = parse_filters(filters)
+        if limit <= 0 or offset < 0:
+            raise ValueError("limit must be positive and offset must not be negative")
+        limit = min(limit, Config.SCREENER_MAX_LIMIT)
+        
+        self.sync_fundamentals()
+        total, results = self.fundamentals.screen(parsed, sort, limit, offset)
+        return {
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "universe": self.fundamentals.size,
+            "results": results
+        }
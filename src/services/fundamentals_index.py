@@ -0,0 +1,193 @@
+"""
+In-memory columnar index of stock fundamentals for screening
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Numeric fields of ``FinancialService.get_stock_data`` plus derived columns
+FIELDS = ('price', 'change', 'change_percent', 'market_cap', 'pe_ratio', 'dividend_yield',
+          '52_week_high', '52_week_low', 'range_position')
+
+OPERATORS = {
+    'lt': np.less,
+    'lte': np.less_equal,
+    'gt': np.greater,
+    'gte': np.greater_equal,
+}
+
+MARKET_CAP_SUFFIXES = {'K': 1e3, 'M': 1e6, 'B': 1e9, 'T': 1e12}
+
+
+def parse_number(value: Any) -> float:
+    """Read a number from a quote field, accepting market caps like ``"123.45B"``; NaN if absent"""
+    if value is None or isinstance(value, bool):
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().replace(',', '').upper()
+    multiplier = MARKET_CAP_SUFFIXES.get(text[-1:], 1.0)
+    if multiplier != 1.0:
+        text = text[:-1]
+    try:
+        return float(text) * multiplier
+    except ValueError:
+        return np.nan
+
+
+def parse_filters(args: Dict[str, str]) -> List[Tuple[str, str, float]]:
+    """Turn ``pe_ratio_lt=15``-style parameters into (field, operator, value) filters
+
+    ``pe`` is accepted as a shorthand for ``pe_ratio``.
+
+    Raises:
+        ValueError: If a parameter names an unknown field or operator, or its value is not a number
+    """
+    filters = []
+    for name, raw in args.items():
+        field, _, operator = name.rpartition('_')
+        field = 'pe_ratio' if field == 'pe' else field
+        if field not in FIELDS or operator not in OPERATORS:
+            raise ValueError(f"Unknown screen filter: {name}")
+        value = parse_number(raw)
+        if np.isnan(value):
+            raise ValueError(f"Screen filter {name} must be a number")
+        filters.append((field, operator, value))
+    return filters
+
+
+class FundamentalsIndex:
+    """Columnar snapshot of the latest fundamentals for a universe of symbols
+
+    Each field is a float64 array with one slot per symbol (NaN when
+    unknown), so a screen is a handful of vectorized comparisons. Quotes are
+    upserted one symbol at a time as they are fetched, or in bulk; arrays
+    grow geometrically and are never rebuilt.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.symbols: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.columns = {field: np.full(capacity, np.nan) for field in FIELDS}
+        self.updated = np.zeros(capacity)
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return len(self.symbols)
+
+    def _row(self, symbol: str) -> int:
+        row = self.rows.get(symbol)
+        if row is not None:
+            return row
+        row = len(self.symbols)
+        if row == len(self.updated):
+            capacity = 2 * row
+            for field, column in self.columns.items():
+                grown = np.full(capacity, np.nan)
+                grown[:row] = column
+                self.columns[field] = grown
+            updated = np.zeros(capacity)
+            updated[:row] = self.updated
+            self.updated = updated
+        self.symbols.append(symbol)
+        self.rows[symbol] = row
+        return row
+
+    def upsert(self, records: Iterable[Dict[str, Any]], updated_at: Optional[float] = None) -> int:
+        """Add or replace the fundamentals of symbols
+
+        Args:
+            records: Quote dictionaries with a ``symbol`` key; missing fields keep their previous value
+            updated_at: Time the records were fetched, defaults to now
+
+        Returns:
+            Number of records indexed
+        """
+        updated_at = time.time() if updated_at is None else updated_at
+        count = 0
+        with self._lock:
+            for record in records:
+                row = self._row(str(record['symbol']).upper())
+                for field in FIELDS:
+                    if field in record:
+                        self.columns[field][row] = parse_number(record[field])
+                low, high = self.columns['52_week_low'][row], self.columns['52_week_high'][row]
+                self.columns['range_position'][row] = (
+                    (self.columns['price'][row] - low) / (high - low) if high > low else np.nan
+                )
+                self.updated[row] = updated_at
+                count += 1
+        return count
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """Fundamentals of one row as a dictionary"""
+        values = {'symbol': self.symbols[row]}
+        for field in FIELDS:
+            value = self.columns[field][row]
+            values[field] = None if np.isnan(value) else round(float(value), 4)
+        return values
+
+    def screen(self, filters: List[Tuple[str, str, float]], sort: Optional[str] = None,
+               limit: int = 50, offset: int = 0) -> Tuple[int, List[Dict[str, Any]]]:
+        """Find the symbols matching every filter
+
+        Args:
+            filters: (field, operator, value) triples, see ``parse_filters``;
+                symbols with an unknown value for a filtered field never match
+            sort: Field to order by, prefixed with ``-`` for descending; symbols
+                with an unknown value come last. Unsorted results are in symbol order
+            limit: Page size
+            offset: Number of matches to skip
+
+        Returns:
+            Total number of matches and the requested page
+
+        Raises:
+            ValueError: If the sort field is unknown
+        """
+        descending = bool(sort) and sort.startswith('-')
+        sort_field = sort.lstrip('-') if sort else None
+        if sort_field is not None and sort_field not in FIELDS:
+            raise ValueError(f"Unknown sort field: {sort_field}")
+
+        with self._lock:
+            size = self.size
+            mask = np.ones(size, dtype=bool)
+            for field, operator, value in filters:
+                mask &= OPERATORS[operator](self.columns[field][:size], value)
+            matches = np.flatnonzero(mask)
+
+            if sort_field is None:
+                names = np.array(self.symbols, dtype=object)[matches]
+                order = matches[np.argsort(names, kind='stable')]
+            else:
+                keys = self.columns[sort_field][matches]
+                keys = np.where(np.isnan(keys), np.inf, -keys if descending else keys)
+                wanted = offset + limit
+                if wanted < len(matches):
+                    # Only the first page(s) need ordering
+                    top = np.argpartition(keys, wanted)[:wanted]
+                    order = matches[top[np.argsort(keys[top], kind='stable')]]
+                else:
+                    order = matches[np.argsort(keys, kind='stable')]
+            page = [self.record(row) for row in order[offset:offset + limit]]
+        return len(matches), page
+
+    def clear(self) -> None:
+        """Forget every symbol"""
+        with self._lock:
+            self.symbols = []
+            self.rows = {}
+            self.updated[:] = 0
+            for column in self.columns.values():
+                column[:] = np.nan
+
+
+# Shared by every FinancialService instance
+fundamentals_index = FundamentalsIndex()
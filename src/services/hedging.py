@@ -0,0 +1,243 @@
+"""
+Hedged, deadline-bounded execution of model calls
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+from src.cancellation import CancellationToken, OperationCancelled
+from src.config import Config
+from src.deadline import Deadline, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# How often gather checks a cancellation token while calls are running, in seconds
+CANCEL_POLL_INTERVAL = 0.05
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies per key"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: str, seconds: float) -> None:
+        """Record the duration of a successful call"""
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, key: str, percent: float = 95, min_samples: int = 1) -> Optional[float]:
+        """Latency below which ``percent`` of recent calls finished, or None with too few samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(int(len(samples) * percent / 100), len(samples) - 1)]
+
+    def clear(self) -> None:
+        """Forget every sample"""
+        with self._lock:
+            self._samples.clear()
+
+
+class HedgedCall:
+    """One logical call that may run as a primary and a hedged duplicate
+
+    After ``gather`` returns, exactly one of ``result`` (with ``metadata``)
+    or ``error`` is set. Every start runs in a copy of the context the call
+    was submitted from, so context variables such as the usage batch follow
+    it onto the pool.
+    """
+
+    __slots__ = ('key', 'fn', 'fallback', 'context', 'futures', 'starts', 'hedge_at', 'done',
+                 'result', 'metadata', 'error')
+
+    def __init__(self, key: str, fn: Callable[[], Any], fallback: Optional[Callable[[], Any]]):
+        self.key = key
+        self.fn = fn
+        self.fallback = fallback
+        self.context = contextvars.copy_context()
+        self.futures: List[Future] = []
+        self.starts: List[float] = []
+        self.hedge_at: Optional[float] = None
+        self.done = False
+        self.result = None
+        self.metadata: Dict[str, Any] = {}
+        self.error: Optional[BaseException] = None
+
+    def resolve(self, result=None, metadata: Optional[Dict[str, Any]] = None, error=None) -> None:
+        self.done = True
+        self.result = result
+        self.metadata = metadata or {}
+        self.error = error
+        for future in self.futures:
+            future.cancel()
+
+
+class HedgedExecutor:
+    """Runs model calls on a shared pool, hedging slow ones and bounding them by a deadline
+
+    When a call has taken longer than the recent p95 latency for its key, an
+    identical duplicate is started and whichever finishes first wins. Calls
+    still running when the deadline is about to expire are abandoned and
+    answered by their fallback, marked as degraded.
+
+    Abandoning a call, or the losing half of a hedged pair, only cancels
+    starts still queued: a thread cannot be interrupted, so a call already
+    running finishes in the background and is billed by the provider all
+    the same. Its usage is recorded when it finishes, after its turn's own
+    entries (see ``UsageService.collect``), so the ledger matches the bill.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers
+        self.latencies = LatencyTracker()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers or Config.LLM_MAX_WORKERS,
+                                                    thread_name_prefix='llm-call')
+        return self._pool
+
+    def _hedge_delay(self, key: str) -> Optional[float]:
+        if not Config.LLM_HEDGING_ENABLED:
+            return None
+        p95 = self.latencies.percentile(key, 95, Config.LLM_HEDGE_MIN_SAMPLES)
+        if p95 is None:
+            return None
+        return max(p95, Config.LLM_HEDGE_MIN_DELAY_MS / 1000)
+
+    def _start(self, call: HedgedCall) -> None:
+        call.starts.append(time.monotonic())
+        call.futures.append(self.pool.submit(call.context.copy().run, call.fn))
+
+    def submit(self, key: str, fn: Callable[[], Any], fallback: Optional[Callable[[], Any]] = None,
+               cancel: Optional[CancellationToken] = None) -> HedgedCall:
+        """Start a call immediately
+
+        Args:
+            key: Latency bucket, e.g. the advisor id
+            fn: The call to make; it must be safe to run twice
+            fallback: Produces the degraded answer if the deadline expires
+            cancel: Token that, once cancelled, stops the call from being started
+
+        Returns:
+            Handle to pass to ``gather``
+        """
+        call = HedgedCall(key, fn, fallback)
+        if cancel is not None and cancel.cancelled:
+            call.resolve(error=OperationCancelled(cancel.reason))
+            return call
+        self._start(call)
+        delay = self._hedge_delay(key)
+        if delay is not None:
+            call.hedge_at = call.starts[0] + delay
+        return call
+
+    def _poll(self, call: HedgedCall) -> None:
+        failures = 0
+        for position, future in enumerate(call.futures):
+            if not future.done():
+                continue
+            error = future.exception()
+            if error is None:
+                self.latencies.observe(call.key, time.monotonic() - call.starts[position])
+                call.resolve(future.result(), {'hedged': True} if position > 0 else None)
+                return
+            failures += 1
+        if failures and failures == len(call.futures):
+            call.resolve(error=call.futures[0].exception())
+
+    def _abandon(self, call: HedgedCall) -> None:
+        if call.fallback is None:
+            call.resolve(error=DeadlineExceeded(f"Deadline exceeded waiting for {call.key}"))
+            return
+        logger.warning(f"Deadline reached, answering {call.key} with its fallback")
+        call.resolve(call.fallback(), {'degraded': True, 'reason': 'deadline'})
+
+    def gather(self, calls: List[HedgedCall], deadline: Optional[Deadline] = None,
+               cancel: Optional[CancellationToken] = None,
+               on_done: Optional[Callable[[HedgedCall], None]] = None) -> List[HedgedCall]:
+        """Wait for calls to finish, hedging slow ones, until the deadline's reserve is reached
+
+        Args:
+            calls: Handles returned by ``submit``
+            deadline: Request deadline, None to wait as long as it takes
+            cancel: Token that, once cancelled, abandons the calls still pending;
+                queued calls that have not started are never run
+            on_done: Called with each handle as soon as it resolves
+
+        Returns:
+            The same handles, all resolved
+        """
+        reserve = Config.DEADLINE_RESERVE_MS / 1000
+        pending = []
+        for call in calls:
+            if call.done:
+                if on_done is not None:
+                    on_done(call)
+            else:
+                pending.append(call)
+        while pending:
+            for call in pending:
+                self._poll(call)
+                if call.done and on_done is not None:
+                    on_done(call)
+            pending = [call for call in pending if not call.done]
+            if not pending:
+                break
+
+            if cancel is not None and cancel.cancelled:
+                for call in pending:
+                    call.resolve(error=OperationCancelled(cancel.reason))
+                    if on_done is not None:
+                        on_done(call)
+                break
+
+            if deadline is not None and deadline.expired(reserve):
+                for call in pending:
+                    self._abandon(call)
+                    if on_done is not None:
+                        on_done(call)
+                break
+
+            now = time.monotonic()
+            for call in pending:
+                if call.hedge_at is not None and len(call.futures) == 1 and now >= call.hedge_at:
+                    logger.info(f"Hedging slow call to {call.key}")
+                    self._start(call)
+
+            wakeups = [call.hedge_at - now for call in pending
+                       if call.hedge_at is not None and len(call.futures) == 1]
+            if deadline is not None:
+                wakeups.append(deadline.remaining() - reserve)
+            if cancel is not None:
+                wakeups.append(CANCEL_POLL_INTERVAL)
+            timeout = max(min(wakeups), 0) if wakeups else None
+            wait([future for call in pending for future in call.futures], timeout=timeout,
+                 return_when=FIRST_COMPLETED)
+        return calls
+
+    def call(self, key: str, fn: Callable[[], Any], deadline: Optional[Deadline] = None,
+             fallback: Optional[Callable[[], Any]] = None,
+             cancel: Optional[CancellationToken] = None) -> HedgedCall:
+        """Submit a single call and wait for it"""
+        return self.gather([self.submit(key, fn, fallback, cancel)], deadline, cancel)[0]
+
+
+# Shared by every TinyTroupeService instance
+hedged_executor = HedgedExecutor()
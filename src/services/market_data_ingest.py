@@ -0,0 +1,339 @@
+"""
+Streaming bulk ingestion of end-of-day market data files
+"""
+import csv
+import hashlib
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.config import Config
+from src.services.fundamentals_index import FundamentalsIndex, fundamentals_index
+from src.services.price_history import BAR_DTYPE, PRICE_FIELDS, SYMBOL_PATTERN, PriceHistoryStore, price_history
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the environment
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Accepted column names, lower-cased, for each bar field
+COLUMN_ALIASES = {
+    'symbol': ('symbol', 'ticker'),
+    'date': ('date', 'trade_date'),
+    'open': ('open',),
+    'high': ('high',),
+    'low': ('low',),
+    'close': ('close',),
+    'volume': ('volume',),
+}
+# Optional columns copied into the screener index
+FUNDAMENTAL_FIELDS = ('market_cap', 'pe_ratio', 'dividend_yield')
+
+PARQUET_SUFFIXES = ('.parquet', '.pq')
+
+
+def resolve_input(path: str, root: Optional[str] = None) -> str:
+    """Resolve a file name relative to ``INGEST_PATH``, refusing anything outside it
+
+    Raises:
+        ValueError: If the path escapes the ingest directory or is not a file
+    """
+    root = os.path.realpath(root or Config.INGEST_PATH)
+    full = os.path.realpath(os.path.join(root, path))
+    if not full.startswith(root + os.sep):
+        raise ValueError(f"{path} is outside the ingest directory")
+    if not os.path.isfile(full):
+        raise ValueError(f"No such file: {path}")
+    return full
+
+
+def _column_map(names: List[str]) -> Dict[str, int]:
+    """Position of each known field among a file's columns
+
+    Raises:
+        ValueError: If a bar field is missing
+    """
+    positions = {name.strip().lower(): position for position, name in enumerate(names)}
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        found = next((positions[alias] for alias in aliases if alias in positions), None)
+        if found is None:
+            raise ValueError(f"Missing column: {field}")
+        columns[field] = found
+    for field in FUNDAMENTAL_FIELDS:
+        if field in positions:
+            columns[field] = positions[field]
+    return columns
+
+
+def _floats(values: List[Any]) -> np.ndarray:
+    """Numbers of a column, NaN where a value is blank or malformed"""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        parsed = np.full(len(values), np.nan)
+        for row, value in enumerate(values):
+            try:
+                parsed[row] = float(value)
+            except (TypeError, ValueError):
+                pass
+        return parsed
+
+
+def _dates(values: List[Any]) -> np.ndarray:
+    """Days of a column of ISO dates or timestamps, NaT where malformed"""
+    values = [value[:10] if isinstance(value, str) else value for value in values]
+    try:
+        return np.array(values, dtype='datetime64[D]')
+    except (TypeError, ValueError):
+        parsed = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[D]')
+        for row, value in enumerate(values):
+            try:
+                parsed[row] = np.datetime64(value, 'D')
+            except (TypeError, ValueError):
+                pass
+        return parsed
+
+
+def _symbols(values: List[Any]) -> np.ndarray:
+    """Normalized symbols of a column, empty where invalid"""
+    normalized = [str(value or '').strip().upper() for value in values]
+    return np.array([symbol if SYMBOL_PATTERN.match(symbol) else '' for symbol in normalized], dtype='U15')
+
+
+def to_columns(values: Dict[str, List[Any]]) -> Dict[str, np.ndarray]:
+    """Convert raw column values to typed arrays"""
+    columns = {'symbol': _symbols(values['symbol']), 'date': _dates(values['date'])}
+    for field in PRICE_FIELDS + FUNDAMENTAL_FIELDS:
+        if field in values:
+            columns[field] = _floats(values[field])
+    return columns
+
+
+def valid_rows(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """Mask of rows with a symbol, a date and a consistent positive OHLC bar"""
+    open_, high, low, close, volume = (columns[field] for field in PRICE_FIELDS)
+    with np.errstate(invalid='ignore'):
+        return (
+            (columns['symbol'] != '') & ~np.isnat(columns['date'])
+            & (low > 0) & (high >= low) & (volume >= 0)
+            & (open_ >= low) & (open_ <= high) & (close >= low) & (close <= high)
+        )
+
+
+def latest_rows(symbols: np.ndarray, dates: np.ndarray) -> np.ndarray:
+    """Indices of the last row of every (symbol, date) pair, sorted by symbol then date"""
+    order = np.lexsort((np.arange(len(symbols)), dates, symbols))
+    symbols, dates = symbols[order], dates[order]
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = (symbols[1:] != symbols[:-1]) | (dates[1:] != dates[:-1])
+    return order[last]
+
+
+def read_csv(path: str, position: int = 0, chunk_rows: int = 50000) -> Iterator[Tuple[int, int, Dict[str, np.ndarray]]]:
+    """Stream a CSV file in chunks
+
+    Args:
+        path: File to read; the first line names the columns
+        position: Byte offset to resume from, 0 for the start
+        chunk_rows: Rows per chunk
+
+    Yields:
+        Byte offset after the chunk, number of lines read, and the typed columns of well-formed lines
+    """
+    with open(path, 'rb') as handle:
+        header = next(csv.reader([handle.readline().decode('utf-8-sig')]), [])
+        columns = _column_map(header)
+        width = len(header)
+        if position:
+            handle.seek(position)
+        while True:
+            lines = list(itertools.islice(handle, chunk_rows))
+            if not lines:
+                return
+            rows = [row for row in csv.reader(line.decode('utf-8', 'replace') for line in lines) if len(row) == width]
+            values = {field: [row[column] for row in rows] for field, column in columns.items()}
+            yield handle.tell(), len(lines), to_columns(values)
+
+
+def read_parquet(path: str, position: int = 0, chunk_rows: int = 50000) -> Iterator[Tuple[int, int, Dict[str, np.ndarray]]]:
+    """Stream a Parquet file in record batches, like ``read_csv``; positions count rows
+
+    Raises:
+        ValueError: If pyarrow is not installed
+    """
+    if pq is None:
+        raise ValueError("Reading Parquet files requires the pyarrow package")
+    parquet = pq.ParquetFile(path)
+    columns = _column_map(parquet.schema_arrow.names)
+    names = {field: parquet.schema_arrow.names[column] for field, column in columns.items()}
+    done = 0
+    for batch in parquet.iter_batches(batch_size=chunk_rows, columns=list(names.values())):
+        if done + batch.num_rows <= position:
+            done += batch.num_rows
+            continue
+        if done < position:
+            batch = batch.slice(position - done)
+            done = position
+        raw = batch.to_pydict()
+        done += batch.num_rows
+        yield done, batch.num_rows, to_columns({field: raw[name] for field, name in names.items()})
+
+
+class MarketDataIngestor:
+    """Loads vendor end-of-day dumps into the price history and screener index
+
+    Files are read a chunk at a time, so memory stays bounded whatever their
+    size. Rows are validated and deduplicated (the last row for a symbol and
+    day wins), then merged into each symbol's series, so files of different
+    days can be loaded in any order and at once. Bars already stored
+    unchanged are counted as ``stale`` and skipped, which makes re-ingesting
+    a file harmless. After every chunk the file's position is checkpointed,
+    so an interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, store: Optional[PriceHistoryStore] = None, index: Optional[FundamentalsIndex] = None,
+                 checkpoint_path: Optional[str] = None):
+        self.logger = logging.getLogger(__name__)
+        self.store = store or price_history
+        self.index = index or fundamentals_index
+        self._checkpoint_path = checkpoint_path
+
+    @property
+    def checkpoint_path(self) -> str:
+        return self._checkpoint_path or Config.INGEST_CHECKPOINT_PATH
+
+    def _checkpoint_file(self, path: str) -> str:
+        name = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:20]
+        return os.path.join(self.checkpoint_path, name + '.json')
+
+    def load_checkpoint(self, path: str) -> Optional[Dict[str, Any]]:
+        """Saved progress through a file, or None if there is none or the file changed since"""
+        try:
+            with open(self._checkpoint_file(path), 'r') as handle:
+                checkpoint = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        stat = os.stat(path)
+        if checkpoint.get('size') != stat.st_size or checkpoint.get('mtime_ns') != stat.st_mtime_ns:
+            return None
+        return checkpoint
+
+    def _save_checkpoint(self, path: str, checkpoint: Dict[str, Any]) -> None:
+        os.makedirs(self.checkpoint_path, exist_ok=True)
+        target = self._checkpoint_file(path)
+        temporary = f'{target}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as handle:
+            json.dump(checkpoint, handle)
+        os.replace(temporary, target)
+
+    def _write(self, columns: Dict[str, np.ndarray], totals: Dict[str, int]) -> None:
+        """Validate, deduplicate and append one chunk"""
+        valid = valid_rows(columns)
+        totals['rejected'] += int((~valid).sum())
+        columns = {field: values[valid] for field, values in columns.items()}
+        keep = latest_rows(columns['symbol'], columns['date'])
+        totals['duplicates'] += len(columns['symbol']) - len(keep)
+        columns = {field: values[keep] for field, values in columns.items()}
+
+        symbols = columns['symbol']
+        starts = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]])
+        ends = np.r_[starts[1:], len(symbols)]
+        fundamentals = [field for field in FUNDAMENTAL_FIELDS if field in columns]
+        records = []
+        for start, end in zip(starts, ends):
+            symbol = str(symbols[start])
+            bars = np.empty(end - start, dtype=BAR_DTYPE)
+            for field in BAR_DTYPE.names:
+                bars[field] = columns[field][start:end]
+            # Checked and written under the store's lock, as other files may hold other days of the symbol
+            written = self.store.merge(symbol, bars)
+            totals['written'] += written
+            totals['stale'] += len(bars) - written
+            if fundamentals:
+                latest = end - 1
+                record = {field: float(columns[field][latest]) for field in fundamentals
+                          if not np.isnan(columns[field][latest])}
+                if record:
+                    records.append({'symbol': symbol, **record})
+        if records:
+            self.index.upsert(records)
+
+    def ingest_file(self, path: str, restart: bool = False, chunk_rows: Optional[int] = None) -> Dict[str, Any]:
+        """Ingest one CSV or Parquet file, resuming from its checkpoint
+
+        Args:
+            path: File to read; ``.parquet``/``.pq`` files are read as Parquet, anything else as CSV
+            restart: Ignore any checkpoint and read the file from the start
+            chunk_rows: Rows per chunk, INGEST_CHUNK_ROWS by default
+
+        Returns:
+            Counts of rows read, bars written, and rows rejected, duplicated or already stored
+        """
+        started = time.perf_counter()
+        chunk_rows = chunk_rows or Config.INGEST_CHUNK_ROWS
+        result = {'path': path, 'status': 'ingested', 'resumed': False}
+        try:
+            stat = os.stat(path)
+            checkpoint = None if restart else self.load_checkpoint(path)
+            if checkpoint is not None and checkpoint['done']:
+                result.update(checkpoint['totals'], status='complete', seconds=0.0)
+                return result
+
+            totals = dict.fromkeys(('rows', 'written', 'rejected', 'duplicates', 'stale'), 0)
+            position = 0
+            if checkpoint is not None:
+                totals.update(checkpoint['totals'])
+                position = checkpoint['position']
+                result['resumed'] = position > 0
+
+            reader = read_parquet if path.lower().endswith(PARQUET_SUFFIXES) else read_csv
+            for position, count, columns in reader(path, position, chunk_rows):
+                totals['rows'] += count
+                self._write(columns, totals)
+                self._save_checkpoint(path, {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                             'position': position, 'totals': totals, 'done': False})
+            self._save_checkpoint(path, {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                         'position': position, 'totals': totals, 'done': True})
+            result.update(totals)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Error ingesting {path}: {str(e)}")
+            result.update(status='failed', error=str(e))
+        result['seconds'] = round(time.perf_counter() - started, 3)
+        return result
+
+    def ingest(self, paths: List[str], workers: Optional[int] = None, restart: bool = False,
+               chunk_rows: Optional[int] = None) -> Dict[str, Any]:
+        """Ingest several files concurrently, in any order
+
+        Args:
+            paths: Files to read
+            workers: Files ingested at once, INGEST_WORKERS by default
+            restart: Ignore checkpoints
+            chunk_rows: Rows per chunk, INGEST_CHUNK_ROWS by default
+
+        Returns:
+            Per-file results and overall totals
+        """
+        started = time.perf_counter()
+        workers = max(1, min(workers or Config.INGEST_WORKERS, len(paths) or 1))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            files = list(executor.map(lambda path: self.ingest_file(path, restart, chunk_rows), paths))
+
+        totals = {field: sum(result.get(field, 0) for result in files)
+                  for field in ('rows', 'written', 'rejected', 'duplicates', 'stale')}
+        totals['failed'] = sum(result['status'] == 'failed' for result in files)
+        totals['seconds'] = round(time.perf_counter() - started, 3)
+        return {'files': files, 'totals': totals}
+
+
+# Shared by the admin routes
+market_data_ingestor = MarketDataIngestor()
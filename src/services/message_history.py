@@ -0,0 +1,134 @@
+"""
+Read-only message history for TinyTroupe Service
+"""
+import logging
+from typing import Any, Dict, Iterator, List, Optional
+
+from flask import current_app
+from sqlalchemy import select
+
+from src.extensions import db
+from src.models import Message
+
+# Rows fetched from the database at a time while streaming a history
+BATCH_ROWS = 1000
+
+_messages = Message.__table__
+_COLUMNS = (_messages.c.id, _messages.c.conversation_id, _messages.c.seq, _messages.c.role,
+            _messages.c.advisor_id, _messages.c.content, _messages.c.timestamp, _messages.c.metadata)
+
+
+class MessageRecord:
+    """A message as read for display or prompting, without ORM state"""
+
+    __slots__ = ('id', 'conversation_id', 'seq', 'role', 'advisor_id', 'content', 'timestamp', 'meta')
+
+    def __init__(self, id, conversation_id, seq, role, advisor_id, content, timestamp, meta):
+        self.id = id
+        self.conversation_id = conversation_id
+        self.seq = seq
+        self.role = role
+        self.advisor_id = advisor_id
+        self.content = content
+        self.timestamp = timestamp
+        self.meta = meta
+
+    @property
+    def cancelled(self) -> bool:
+        return bool((self.meta or {}).get('cancelled'))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Same dictionary as ``Message.to_dict``"""
+        return {
+            'id': self.id,
+            'conversation_id': self.conversation_id,
+            'seq': self.seq,
+            'role': self.role,
+            'advisor_id': self.advisor_id,
+            'content': self.content,
+            'timestamp': self.timestamp.isoformat(),
+            'metadata': self.meta or {}
+        }
+
+
+class MessageHistory:
+    """Reads conversation messages with Core selects instead of the ORM
+
+    Rows become ``MessageRecord`` objects rather than mapped ``Message``
+    instances, so reading a history does not fill the session's identity
+    map or track changes nobody will make, and long histories are fetched
+    ``BATCH_ROWS`` at a time instead of all at once.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+    def records(self, conversation_id: str, after: int = 0, limit: Optional[int] = None) -> Iterator[MessageRecord]:
+        """Iterate over a conversation's messages in seq order
+
+        Args:
+            conversation_id: ID of the conversation
+            after: Only messages with a greater seq
+            limit: Most messages to return, all by default
+        """
+        query = select(*_COLUMNS).where(
+            _messages.c.conversation_id == conversation_id, _messages.c.seq > after
+        ).order_by(_messages.c.seq).execution_options(yield_per=BATCH_ROWS)
+        if limit is not None:
+            query = query.limit(limit)
+        result = db.session.execute(query)
+        try:
+            for row in result:
+                yield MessageRecord(*row)
+        finally:
+            result.close()
+
+    def recent(self, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+        """The last messages of a conversation that were not cancelled, oldest first
+
+        Only these rows are read, walking the seq index backwards, so the
+        cost does not grow with the length of the conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+            limit: Number of messages wanted
+        """
+        if limit <= 0:
+            return []
+        query = select(*_COLUMNS).where(
+            _messages.c.conversation_id == conversation_id
+        ).order_by(_messages.c.seq.desc()).execution_options(yield_per=limit + 1)
+        recent = []
+        result = db.session.execute(query)
+        try:
+            for row in result:
+                record = MessageRecord(*row)
+                if not record.cancelled:
+                    recent.append(record.to_dict())
+                    if len(recent) == limit:
+                        break
+        finally:
+            result.close()
+        recent.reverse()
+        return recent
+
+    def json_chunks(self, records: Iterator[MessageRecord]) -> Iterator[bytes]:
+        """Encode records as a JSON array, ``BATCH_ROWS`` messages per chunk
+
+        The output is the same as ``jsonify`` of the messages' dictionaries.
+        """
+        dumps = current_app.json.dumps_bytes
+        chunk, separator = [b'['], b''
+        for record in records:
+            chunk.append(separator)
+            chunk.append(dumps(record.to_dict(), separators=(',', ':')))
+            separator = b','
+            if len(chunk) >= 2 * BATCH_ROWS:
+                yield b''.join(chunk)
+                chunk = []
+        chunk.append(b']\n')
+        yield b''.join(chunk)
+
+
+# Stateless, shared by the routes and the conversation service
+message_history = MessageHistory()
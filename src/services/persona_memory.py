@@ -0,0 +1,197 @@
+"""
+Retrieval-augmented semantic memory for advisor personas
+"""
+import logging
+import math
+import re
+import threading
+import zlib
+from collections import Counter, OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from src.config import Config
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9'.-]*")
+
+# Words too common to say anything about what an exchange was about
+STOP_WORDS = frozenset("""
+a about after again all also am an and any are as at be because been before being between both but by can
+could did do does doing down during each few for from further had has have having he her here hers him his
+how i if in into is it its itself just me more most my no nor not now of off on once only or other our out
+over own same she should so some such than that the their them then there these they this those through to
+too under until up very was we were what when where which while who whom why will with would you your
+""".split())
+
+
+class HashingVectorizer:
+    """Stateless text embedding using the hashing trick
+
+    Words and adjacent-word bigrams are hashed into ``dim`` signed buckets
+    with CRC32 (stable across processes, unlike ``hash``), weighted by
+    sublinear term frequency and L2-normalized, so the dot product of two
+    vectors is their cosine similarity. No model or vocabulary is needed.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def terms(self, text: str) -> List[str]:
+        """Content words of a text plus their bigrams"""
+        words = [word.strip('.-') for word in _TOKEN_RE.findall(text.lower())]
+        words = [word for word in words if word and word not in STOP_WORDS]
+        return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+    def transform(self, text: str) -> np.ndarray:
+        """Embed a text as a unit-length float32 vector"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for term, count in Counter(self.terms(text)).items():
+            bucket = zlib.crc32(term.encode('utf-8'))
+            sign = 1.0 if (bucket >> 31) & 1 else -1.0
+            vector[bucket % self.dim] += sign * (1.0 + math.log(count))
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+
+class MemoryIndex:
+    """Append-only matrix of embeddings with their snippets
+
+    Rows are kept in a float32 array that doubles when full, so appending is
+    amortized O(1) and a search is one matrix-vector product over the used
+    rows followed by a partial sort.
+    """
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.dim = dim
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.contents: List[str] = []
+
+    @property
+    def size(self) -> int:
+        return len(self.contents)
+
+    def extend(self, vectors: np.ndarray, contents: List[str]) -> None:
+        """Append embeddings and their snippets"""
+        needed = self.size + len(contents)
+        if needed > len(self.vectors):
+            grown = np.zeros((max(needed, 2 * len(self.vectors)), self.dim), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+        self.vectors[self.size:needed] = vectors
+        self.contents.extend(contents)
+
+    def search(self, query: np.ndarray, k: int, limit: Optional[int] = None,
+               min_score: float = 0.0) -> List[Tuple[int, float, str]]:
+        """Find the rows most similar to a query vector
+
+        Args:
+            query: Unit-length query embedding
+            k: Maximum number of results
+            limit: Only consider the first ``limit`` rows
+            min_score: Minimum cosine similarity
+
+        Returns:
+            (position, score, content) tuples, most similar first
+        """
+        count = self.size if limit is None else max(min(limit, self.size), 0)
+        if count == 0 or k <= 0:
+            return []
+        scores = self.vectors[:count] @ query
+        if k < count:
+            candidates = np.argpartition(scores, count - k)[count - k:]
+        else:
+            candidates = np.arange(count)
+        ranked = candidates[np.argsort(scores[candidates])[::-1]]
+        return [(int(position), float(scores[position]), self.contents[position])
+                for position in ranked if scores[position] >= min_score]
+
+
+class PersonaMemoryStore:
+    """Per persona-state memory indexes, persisted as PersonaMemory rows
+
+    Each advisor exchange is embedded when the turn is written and stored
+    next to its ``PersonaState``. Indexes are loaded lazily into a bounded
+    in-process LRU and caught up incrementally from the database, so workers
+    sharing a database stay consistent without rebuilding.
+    """
+
+    def __init__(self, dim: Optional[int] = None, max_indexes: Optional[int] = None):
+        self.vectorizer = HashingVectorizer(dim or Config.PERSONA_MEMORY_DIM)
+        self.max_indexes = max_indexes or Config.PERSONA_MEMORY_CACHED_INDEXES
+        self._indexes: "OrderedDict[str, MemoryIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def snippet(user_message: str, response_content: str) -> str:
+        """Text stored for one exchange"""
+        return f"User: {user_message}\nAdvisor: {response_content}"
+
+    def encode(self, text: str) -> bytes:
+        """Embed a text and pack it for storage as float16"""
+        return self.vectorizer.transform(text).astype(np.float16).tobytes()
+
+    def entry(self, persona_state_id: str, position: int, content: str, vector: bytes):
+        """Build the PersonaMemory row for an exchange"""
+        from src.models import PersonaMemory
+        return PersonaMemory(persona_state_id=persona_state_id, position=position,
+                             content=content, vector=vector)
+
+    def index_for(self, persona_state_id: str) -> MemoryIndex:
+        """Return the index of a persona state, loading rows not seen yet"""
+        from src.extensions import db
+        from src.models import PersonaMemory
+
+        with self._lock:
+            index = self._indexes.get(persona_state_id)
+            if index is None:
+                index = MemoryIndex(self.vectorizer.dim)
+                self._indexes[persona_state_id] = index
+                while len(self._indexes) > self.max_indexes:
+                    self._indexes.popitem(last=False)
+            else:
+                self._indexes.move_to_end(persona_state_id)
+
+            rows = db.session.query(PersonaMemory.position, PersonaMemory.content, PersonaMemory.vector).filter(
+                PersonaMemory.persona_state_id == persona_state_id,
+                PersonaMemory.position >= index.size
+            ).order_by(PersonaMemory.position).all()
+            if rows:
+                vectors = np.frombuffer(b''.join(row.vector for row in rows), dtype=np.float16)
+                index.extend(vectors.reshape(len(rows), self.vectorizer.dim), [row.content for row in rows])
+        return index
+
+    def search(self, persona_state_id: str, query: str, k: Optional[int] = None,
+               exclude_recent: int = 0) -> List[str]:
+        """Retrieve the earlier exchanges most relevant to a query
+
+        Args:
+            persona_state_id: Persona state whose memory to search
+            query: Text to match, usually the new user message
+            k: Number of snippets, defaults to Config.PERSONA_MEMORY_TOP_K
+            exclude_recent: Number of latest exchanges to skip because the
+                prompt already contains them
+
+        Returns:
+            Snippets, most relevant first
+        """
+        index = self.index_for(persona_state_id)
+        limit = index.size - exclude_recent
+        if limit <= 0:
+            return []
+        hits = index.search(self.vectorizer.transform(query), k or Config.PERSONA_MEMORY_TOP_K,
+                            limit=limit, min_score=Config.PERSONA_MEMORY_MIN_SCORE)
+        return [content for _, _, content in hits]
+
+    def clear(self) -> None:
+        """Drop every loaded index"""
+        with self._lock:
+            self._indexes.clear()
+
+
+# Shared by every ConversationService instance
+memory_store = PersonaMemoryStore()
@@ -0,0 +1,227 @@
+"""
+Portfolio risk analysis service
+"""
+import logging
+from functools import reduce
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.config import Config
+from src.deadline import Deadline
+from src.models import Persona
+from src.services.price_history import TRADING_DAYS, normalize_symbol, price_history
+from src.services.tinytroupe_service import TinyTroupeService
+
+
+def parse_holdings(holdings: Any) -> Tuple[List[str], np.ndarray]:
+    """Validate holdings and normalize their weights to sum to one
+
+    Args:
+        holdings: ``{"AAPL": 0.6, ...}`` or ``[{"symbol": "AAPL", "weight": 0.6}, ...]``
+
+    Returns:
+        Symbols and their normalized weights, in input order
+
+    Raises:
+        ValueError: If the holdings are empty, repeated, too many or not positively weighted
+    """
+    if isinstance(holdings, dict):
+        pairs = list(holdings.items())
+    elif isinstance(holdings, list) and all(isinstance(holding, dict) for holding in holdings):
+        pairs = [(holding.get('symbol'), holding.get('weight')) for holding in holdings]
+    else:
+        raise ValueError("holdings must be an object of symbol weights or a list of {symbol, weight}")
+    if not pairs:
+        raise ValueError("holdings must not be empty")
+    if len(pairs) > Config.PORTFOLIO_MAX_HOLDINGS:
+        raise ValueError(f"At most {Config.PORTFOLIO_MAX_HOLDINGS} holdings can be analyzed")
+
+    symbols = [normalize_symbol(symbol) for symbol, _ in pairs]
+    if len(set(symbols)) != len(symbols):
+        raise ValueError("Each symbol may only be held once")
+    try:
+        weights = np.array([weight for _, weight in pairs], dtype=float)
+    except (TypeError, ValueError):
+        raise ValueError("Weights must be numbers")
+    if not np.isfinite(weights).all() or (weights <= 0).any():
+        raise ValueError("Weights must be positive numbers")
+    return symbols, weights / weights.sum()
+
+
+def aligned_closes(series: List[np.ndarray], lookback: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Closing prices on the most recent ``lookback + 1`` days all series have in common
+
+    Returns:
+        Dates and a matrix of closes with one row per series
+
+    Raises:
+        ValueError: If the series share fewer than two days
+    """
+    recent = [bars['date'][-(2 * lookback + 1):] for bars in series]
+    dates = reduce(lambda left, right: np.intersect1d(left, right, assume_unique=True), recent)[-(lookback + 1):]
+    if len(dates) < 2:
+        raise ValueError("Not enough overlapping price history to measure risk")
+    closes = np.empty((len(series), len(dates)))
+    for row, bars in enumerate(series):
+        closes[row] = bars['close'][np.searchsorted(bars['date'], dates)]
+    return dates, closes
+
+
+def _matrix(values: np.ndarray) -> List[List[Optional[float]]]:
+    """Round a matrix for JSON, with None where it is undefined"""
+    return np.where(np.isnan(values), None, np.round(values, 6)).tolist()
+
+
+def _number(value: float, digits: int = 6) -> Optional[float]:
+    return None if value is None or not np.isfinite(value) else round(float(value), digits)
+
+
+def portfolio_metrics(symbols: List[str], weights: np.ndarray, series: List[np.ndarray],
+                      benchmark: Optional[np.ndarray] = None, lookback: int = TRADING_DAYS) -> Dict[str, Any]:
+    """Compute return, risk, correlation, beta and concentration for weighted holdings
+
+    All statistics use simple daily returns over the common lookback window
+    and are annualized with 252 trading days.
+
+    Args:
+        symbols: Held symbols
+        weights: Normalized weights, aligned with ``symbols``
+        series: Price history of each holding
+        benchmark: Price history of the market benchmark, for betas
+        lookback: Trading days to measure over
+
+    Returns:
+        Per-holding and portfolio metrics plus covariance and correlation matrices
+    """
+    dates, closes = aligned_closes(series + ([benchmark] if benchmark is not None else []), lookback)
+    returns = closes[:, 1:] / closes[:, :-1] - 1
+    market = returns[-1] if benchmark is not None else None
+    returns = returns[:len(symbols)]
+    days = returns.shape[1]
+
+    covariance = np.atleast_2d(np.cov(returns)) if days > 1 else np.full((len(symbols), len(symbols)), np.nan)
+    volatility = np.sqrt(np.diag(covariance))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlation = covariance / np.outer(volatility, volatility)
+
+    daily = weights @ returns
+    variance = weights @ covariance @ weights
+    with np.errstate(invalid='ignore', divide='ignore'):
+        risk_contribution = weights * (covariance @ weights) / variance
+    growth = np.cumprod(1 + daily)
+    drawdown = growth / np.maximum.accumulate(growth) - 1
+
+    betas = np.full(len(symbols), np.nan)
+    portfolio_beta = np.nan
+    if market is not None and days > 1:
+        centered = market - market.mean()
+        market_variance = centered @ centered / (days - 1)
+        if market_variance > 0:
+            betas = (returns - returns.mean(axis=1, keepdims=True)) @ centered / (days - 1) / market_variance
+            portfolio_beta = weights @ betas
+
+    order = np.argsort(weights)[::-1]
+    concentration = float(weights @ weights)
+    holdings = [
+        {
+            'symbol': symbol,
+            'weight': _number(weights[row]),
+            'annual_return': _number(returns[row].mean() * TRADING_DAYS),
+            'volatility': _number(volatility[row] * np.sqrt(TRADING_DAYS)),
+            'beta': _number(betas[row]),
+            'risk_contribution': _number(risk_contribution[row])
+        }
+        for row, symbol in enumerate(symbols)
+    ]
+
+    return {
+        'period': {
+            'start': str(dates[0]),
+            'end': str(dates[-1]),
+            'days': days
+        },
+        'holdings': holdings,
+        'portfolio': {
+            'total_return': _number(growth[-1] - 1),
+            'annual_return': _number(daily.mean() * TRADING_DAYS),
+            'volatility': _number(np.sqrt(variance * TRADING_DAYS)),
+            'beta': _number(portfolio_beta),
+            'max_drawdown': _number(drawdown.min()),
+            'concentration': {
+                'hhi': _number(concentration),
+                'effective_holdings': _number(1 / concentration, 2),
+                'largest_weight': _number(weights[order[0]]),
+                'top5_weight': _number(weights[order[:5]].sum())
+            }
+        },
+        'covariance': {
+            'symbols': symbols,
+            'annualized': _matrix(covariance * TRADING_DAYS)
+        },
+        'correlation': {
+            'symbols': symbols,
+            'matrix': _matrix(correlation)
+        }
+    }
+
+
+class PortfolioService:
+    """Service measuring portfolio risk from the local price history"""
+
+    def __init__(self):
+        """Initialize the portfolio service"""
+        self.logger = logging.getLogger(__name__)
+        self.prices = price_history
+        self.tinytroupe_service = TinyTroupeService()
+
+    def analyze(self, holdings: Any, benchmark: Optional[str] = None, lookback: Optional[int] = None,
+                deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Measure a portfolio's risk and get each advisor's view of it as a whole
+
+        Args:
+            holdings: Symbols and weights, see ``parse_holdings``
+            benchmark: Symbol betas are measured against, PORTFOLIO_BENCHMARK by default
+            lookback: Trading days to measure over, PORTFOLIO_LOOKBACK_DAYS by default
+            deadline: Request deadline for the advisor analysis
+
+        Returns:
+            Risk metrics and advisor analysis
+
+        Raises:
+            ValueError: If the holdings are invalid or lack price history
+        """
+        symbols, weights = parse_holdings(holdings)
+        lookback = Config.PORTFOLIO_LOOKBACK_DAYS if lookback is None else lookback
+        if not isinstance(lookback, int) or isinstance(lookback, bool) or lookback < 2:
+            raise ValueError("lookback must be at least 2 trading days")
+
+        series = [self.prices.series(symbol) for symbol in symbols]
+        missing = [symbol for symbol, bars in zip(symbols, series) if bars is None or len(bars) < 2]
+        if missing:
+            raise ValueError(f"No price history for: {', '.join(missing)}")
+
+        benchmark = normalize_symbol(benchmark or Config.PORTFOLIO_BENCHMARK)
+        benchmark_series = self.prices.series(benchmark)
+        if benchmark_series is not None and len(benchmark_series) < 2:
+            benchmark_series = None
+
+        result = portfolio_metrics(symbols, weights, series, benchmark_series, lookback)
+        result['benchmark'] = benchmark if benchmark_series is not None else None
+
+        # One analysis per advisor over the aggregate, instead of one per holding
+        advisors = Persona.query.all()
+        if advisors:
+            self.tinytroupe_service.initialize_advisors([advisor.to_dict() for advisor in advisors])
+        largest = max(result['holdings'], key=lambda holding: holding['weight'])
+        summary = {
+            'holdings': len(symbols),
+            'largest': largest['symbol'],
+            'top_holdings': sorted(result['holdings'], key=lambda holding: -holding['weight'])[:5],
+            **result['portfolio']
+        }
+        usage = self.tinytroupe_service.usage
+        with usage.collect() as batch:
+            result['advisor_analysis'] = self.tinytroupe_service.analyze_portfolio(summary, deadline)
+            usage.flush(batch)
+        return result
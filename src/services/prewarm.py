@@ -0,0 +1,185 @@
+"""
+Off-peak pre-warming of watched symbols
+"""
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from src.config import Config
+from src.rate_limit import TokenBucket
+
+
+class PrewarmInProgress(Exception):
+    """Raised when a pre-warm run is requested while another is running"""
+
+
+def parse_window(window: str) -> Tuple[int, int]:
+    """Read an ``HH:MM-HH:MM`` UTC window as minutes after midnight; the end may be past midnight
+
+    Raises:
+        ValueError: If the window is malformed
+    """
+    try:
+        start, end = (datetime.strptime(part.strip(), '%H:%M') for part in window.split('-'))
+    except ValueError:
+        raise ValueError(f"Pre-warm window must look like 02:00-05:00, got {window!r}")
+    return start.hour * 60 + start.minute, end.hour * 60 + end.minute
+
+
+def in_window(now: datetime, window: str) -> bool:
+    """Whether a UTC time falls inside a ``parse_window`` window"""
+    start, end = parse_window(window)
+    minute = now.hour * 60 + now.minute
+    return start <= minute < end if start <= end else minute >= start or minute < end
+
+
+class PrewarmScheduler:
+    """Refreshes the quotes and advisor analyses of watched symbols off-peak
+
+    Once a day, inside ``PREWARM_WINDOW_UTC``, every watched symbol's quote
+    is fetched and its analysis computed by a pool of ``PREWARM_WORKERS``
+    threads. Analyses are cached for ``PREWARM_TTL_SECONDS`` so the day's
+    interactive views are cache hits; quotes keep the usual quotes TTL, so
+    prices are never served stale. Provider and LLM calls are paced by
+    token buckets. The scheduler thread only runs when ``PREWARM_ENABLED``
+    is set, which should be in a single process, as every process enabling
+    it runs its own; ``run`` can also be called directly.
+    """
+
+    def __init__(self, app=None):
+        self.logger = logging.getLogger(__name__)
+        self.app = None
+        self.last_run: Optional[datetime] = None
+        self.last_result: Optional[Dict[str, Any]] = None
+        self._financial_service = None
+        self._watchlist_service = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._running = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        """Remember the app and start the scheduler thread if enabled"""
+        self.app = app
+        if app.config.get('PREWARM_ENABLED', False):
+            self.start()
+
+    @property
+    def financial_service(self):
+        if self._financial_service is None:
+            from src.services.financial_service import FinancialService
+            self._financial_service = FinancialService()
+        return self._financial_service
+
+    @property
+    def watchlist_service(self):
+        if self._watchlist_service is None:
+            from src.services.watchlist_service import WatchlistService
+            self._watchlist_service = WatchlistService()
+        return self._watchlist_service
+
+    def start(self) -> None:
+        """Start the scheduler thread"""
+        if self._thread is not None:
+            return
+        parse_window(Config.PREWARM_WINDOW_UTC)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._worker, name='prewarm', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Stop the scheduler thread, abandoning symbols not yet warmed"""
+        thread, self._thread = self._thread, None
+        self._stop.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def due(self, now: Optional[datetime] = None) -> bool:
+        """Whether it is off-peak and today's run has not happened yet"""
+        now = now or datetime.utcnow()
+        if self.last_run is not None and self.last_run.date() == now.date():
+            return False
+        return in_window(now, Config.PREWARM_WINDOW_UTC)
+
+    def _worker(self) -> None:
+        while not self._stop.is_set():
+            if self.due():
+                try:
+                    self.run()
+                except PrewarmInProgress:
+                    pass
+                except Exception as e:
+                    self.logger.error(f"Pre-warm run failed: {str(e)}")
+            self._stop.wait(Config.PREWARM_CHECK_SECONDS)
+
+    def _warm(self, symbol: str, quotes: TokenBucket, llm_calls: TokenBucket, advisors: int) -> Optional[str]:
+        """Refresh one symbol, returning an error message if it failed"""
+        try:
+            with self.app.app_context():
+                if not quotes.acquire(1, self._stop):
+                    return 'stopped'
+                self.financial_service.refresh_quote(symbol)
+                if not llm_calls.acquire(advisors, self._stop):
+                    return 'stopped'
+                self.financial_service.refresh_analysis(symbol, Config.PREWARM_TTL_SECONDS)
+            return None
+        except Exception as e:
+            self.logger.warning(f"Could not pre-warm {symbol}: {str(e)}")
+            return str(e)
+
+    def run(self) -> Dict[str, Any]:
+        """Warm every watched symbol now
+
+        Returns:
+            Number of symbols warmed and the errors of those that failed
+
+        Raises:
+            PrewarmInProgress: If a run is already in progress
+        """
+        if not self._running.acquire(blocking=False):
+            raise PrewarmInProgress("A pre-warm run is already in progress")
+        try:
+            started = time.perf_counter()
+            with self.app.app_context():
+                symbols = [item['symbol'] for item in self.watchlist_service.watched_symbols()]
+            quotes = TokenBucket(Config.PREWARM_QUOTES_PER_MINUTE)
+            llm_calls = TokenBucket(Config.PREWARM_LLM_CALLS_PER_MINUTE)
+            advisors = max(1, len(self.financial_service.tinytroupe_service.advisors))
+
+            errors = {}
+            if symbols:
+                with ThreadPoolExecutor(max_workers=max(1, Config.PREWARM_WORKERS)) as executor:
+                    outcomes = executor.map(lambda symbol: self._warm(symbol, quotes, llm_calls, advisors), symbols)
+                    errors = {symbol: error for symbol, error in zip(symbols, outcomes) if error is not None}
+
+            self.last_run = datetime.utcnow()
+            self.last_result = {
+                'started_at': self.last_run.isoformat(),
+                'symbols': len(symbols),
+                'warmed': len(symbols) - len(errors),
+                'errors': errors,
+                'seconds': round(time.perf_counter() - started, 3)
+            }
+            self.logger.info(f"Pre-warmed {self.last_result['warmed']} of {len(symbols)} watched symbols")
+            return self.last_result
+        finally:
+            self._running.release()
+
+    def status(self) -> Dict[str, Any]:
+        """Schedule and outcome of the last run"""
+        return {
+            'enabled': self._thread is not None,
+            'window_utc': Config.PREWARM_WINDOW_UTC,
+            'running': self._running.locked(),
+            'last_run': self.last_result
+        }
+
+
+# Started from the app module
+prewarm_scheduler = PrewarmScheduler()
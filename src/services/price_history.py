@@ -0,0 +1,297 @@
+"""
+Local price history store and technical indicators
+"""
+import logging
+import os
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.config import Config
+
+logger = logging.getLogger(__name__)
+
+# One fixed-size record per trading day; files are plain arrays of these
+BAR_DTYPE = np.dtype([
+    ('date', '<M8[D]'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+PRICE_FIELDS = BAR_DTYPE.names[1:]
+
+SYMBOL_PATTERN = re.compile(r'^[A-Z0-9][A-Z0-9.\-]{0,14}$')
+FILE_SUFFIX = '.ohlcv'
+
+TRADING_DAYS = 252
+SMA_WINDOWS = (20, 50, 200)
+EMA_SPANS = (12, 26)
+RSI_PERIOD = 14
+VOLATILITY_WINDOW = 20
+
+
+def normalize_symbol(symbol: str) -> str:
+    """Upper-case a ticker symbol and check it is safe to use as a file name
+
+    Raises:
+        ValueError: If the symbol is not 1-15 letters, digits, dots or dashes
+    """
+    normalized = (symbol or '').strip().upper()
+    if not SYMBOL_PATTERN.match(normalized):
+        raise ValueError(f"Invalid symbol: {symbol!r}")
+    return normalized
+
+
+def to_bars(rows: Iterable[Any]) -> np.ndarray:
+    """Convert bars given as dicts or (date, open, high, low, close, volume) tuples to a record array"""
+    if isinstance(rows, np.ndarray) and rows.dtype == BAR_DTYPE:
+        return rows
+    records = [
+        (row['date'], *(row[field] for field in PRICE_FIELDS)) if isinstance(row, dict) else tuple(row)
+        for row in rows
+    ]
+    return np.array(records, dtype=BAR_DTYPE)
+
+
+class PriceHistoryStore:
+    """Per-symbol daily OHLCV series kept in memory-mapped files
+
+    Each symbol is a file of ``BAR_DTYPE`` records in date order under
+    ``PRICE_HISTORY_PATH``. New days are appended to the end of the file;
+    only the latest day can be rewritten (e.g. a provisional close). Readers
+    map the files read-only, so series are shared with the page cache
+    instead of being copied into every worker.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self._root = root
+        self._maps: Dict[str, Tuple[int, np.ndarray]] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def root(self) -> str:
+        return self._root or Config.PRICE_HISTORY_PATH
+
+    def path(self, symbol: str) -> str:
+        return os.path.join(self.root, normalize_symbol(symbol) + FILE_SUFFIX)
+
+    def symbols(self) -> List[str]:
+        """Symbols with a stored series, sorted"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name[:-len(FILE_SUFFIX)] for name in os.listdir(self.root) if name.endswith(FILE_SUFFIX))
+
+    def series(self, symbol: str) -> Optional[np.ndarray]:
+        """Read-only view of a symbol's bars, or None if it has no history"""
+        path = self.path(symbol)
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
+            return None
+
+        cached = self._maps.get(path)
+        if cached is not None and cached[0] == size:
+            return cached[1]
+        count = size // BAR_DTYPE.itemsize
+        if count == 0:
+            return np.empty(0, dtype=BAR_DTYPE)
+        bars = np.memmap(path, dtype=BAR_DTYPE, mode='r', shape=(count,))
+        with self._lock:
+            self._maps[path] = (size, bars)
+        return bars
+
+    def version(self, symbol: str) -> Optional[str]:
+        """Token that changes whenever a symbol's series is written"""
+        try:
+            stat = os.stat(self.path(symbol))
+        except FileNotFoundError:
+            return None
+        return f'{stat.st_size}-{stat.st_mtime_ns}'
+
+    def append(self, symbol: str, rows: Iterable[Any]) -> int:
+        """Add daily bars to the end of a symbol's series
+
+        Args:
+            symbol: Ticker symbol
+            rows: Bars in any order; a bar for the latest stored day replaces it
+
+        Returns:
+            Number of bars written
+
+        Raises:
+            ValueError: If a bar predates the latest stored day or a day is repeated
+        """
+        bars = np.sort(to_bars(rows), order='date')
+        if len(bars) == 0:
+            return 0
+        if (np.diff(bars['date'].astype(np.int64)) == 0).any():
+            raise ValueError(f"Duplicate dates in bars for {symbol}")
+
+        path = self.path(symbol)
+        revised = 0
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            existing = self.series(symbol)
+            if existing is not None and len(existing):
+                last = existing['date'][-1]
+                if bars['date'][0] < last:
+                    raise ValueError(f"Bars for {symbol} must not predate {last}")
+                if bars['date'][0] == last:
+                    # Revise the latest day in place
+                    offset = (len(existing) - 1) * BAR_DTYPE.itemsize
+                    latest = np.memmap(path, dtype=BAR_DTYPE, mode='r+', offset=offset, shape=(1,))
+                    latest[0] = bars[0]
+                    latest.flush()
+                    del latest
+                    os.utime(path)
+                    bars = bars[1:]
+                    revised = 1
+            with open(path, 'ab') as handle:
+                handle.write(bars.tobytes())
+            self._maps.pop(path, None)
+        return revised + len(bars)
+
+    def merge(self, symbol: str, rows: Iterable[Any]) -> int:
+        """Add daily bars for any days, keeping the series in date order
+
+        Bars identical to stored ones are left alone. Changed or new bars
+        after the latest stored day are appended; earlier ones are inserted
+        or replace the bar of their day, which rewrites the file. The whole
+        comparison and write happens under the store's lock, so concurrent
+        merges of the same symbol cannot drop each other's bars.
+
+        Args:
+            symbol: Ticker symbol
+            rows: Bars in any order
+
+        Returns:
+            Number of bars that were new or differed from the stored ones
+
+        Raises:
+            ValueError: If a day is repeated
+        """
+        bars = np.sort(to_bars(rows), order='date')
+        if len(bars) == 0:
+            return 0
+        if (np.diff(bars['date'].astype(np.int64)) == 0).any():
+            raise ValueError(f"Duplicate dates in bars for {symbol}")
+
+        path = self.path(symbol)
+        with self._lock:
+            existing = self.series(symbol)
+            if existing is None or not len(existing):
+                return self.append(symbol, bars)
+            positions = np.minimum(np.searchsorted(existing['date'], bars['date']), len(existing) - 1)
+            changed = bars[existing[positions] != bars]
+            if not len(changed):
+                return 0
+            if changed['date'][0] >= existing['date'][-1]:
+                return self.append(symbol, changed)
+
+            kept = existing[~np.isin(existing['date'], changed['date'])]
+            merged = np.sort(np.concatenate([kept, changed]), order='date')
+            temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temporary, 'wb') as handle:
+                handle.write(merged.tobytes())
+            os.replace(temporary, path)
+            self._maps.pop(path, None)
+        return len(changed)
+
+    def delete(self, symbol: str) -> None:
+        """Remove a symbol's series"""
+        path = self.path(symbol)
+        with self._lock:
+            self._maps.pop(path, None)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def window_matrix(series: List[Optional[np.ndarray]], field: str, length: int = TRADING_DAYS) -> np.ndarray:
+    """Stack the last ``length`` values of a field, one row per series, left-padded with NaN"""
+    matrix = np.full((len(series), length), np.nan)
+    for row, bars in enumerate(series):
+        if bars is None or len(bars) == 0:
+            continue
+        values = bars[field][-length:]
+        matrix[row, length - len(values):] = values
+    return matrix
+
+
+def _ewm(matrix: np.ndarray, alpha: float) -> np.ndarray:
+    """Exponentially weighted mean of each row at its last column, ignoring NaN"""
+    weights = (1 - alpha) ** np.arange(matrix.shape[1])[::-1]
+    valid = ~np.isnan(matrix)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (np.where(valid, matrix, 0.0) @ weights) / (valid @ weights)
+
+
+def indicator_columns(close: np.ndarray, high: np.ndarray, low: np.ndarray) -> Dict[str, np.ndarray]:
+    """Compute indicators for many symbols at once
+
+    Args:
+        close: ``window_matrix`` of closing prices
+        high: ``window_matrix`` of daily highs
+        low: ``window_matrix`` of daily lows
+
+    Returns:
+        One array per indicator with a value per row; NaN where a row has
+        too little history
+    """
+    columns = {'close': close[:, -1]}
+    for window in SMA_WINDOWS:
+        columns[f'sma_{window}'] = close[:, -window:].mean(axis=1)
+    for span in EMA_SPANS:
+        columns[f'ema_{span}'] = _ewm(close, 2 / (span + 1))
+
+    change = np.diff(close, axis=1)
+    gains, losses = np.maximum(change, 0), np.maximum(-change, 0)
+    enough = (~np.isnan(change)).sum(axis=1) >= RSI_PERIOD
+    average_gain, average_loss = _ewm(gains, 1 / RSI_PERIOD), _ewm(losses, 1 / RSI_PERIOD)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rsi = np.where(average_loss == 0, 100.0, 100 - 100 / (1 + average_gain / average_loss))
+    columns[f'rsi_{RSI_PERIOD}'] = np.where(enough, rsi, np.nan)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = np.diff(np.log(close[:, -(VOLATILITY_WINDOW + 1):]), axis=1)
+    columns[f'volatility_{VOLATILITY_WINDOW}'] = returns.std(axis=1, ddof=1) * np.sqrt(TRADING_DAYS)
+
+    peaks = np.fmax.accumulate(close, axis=1)
+    drawdowns = close / peaks - 1
+    columns['drawdown'] = drawdowns[:, -1]
+    columns['max_drawdown'] = np.fmin.reduce(drawdowns, axis=1)
+    columns['high_52w'] = np.fmax.reduce(high, axis=1)
+    columns['low_52w'] = np.fmin.reduce(low, axis=1)
+    return columns
+
+
+def compute_indicators(series: List[Optional[np.ndarray]]) -> List[Optional[Dict[str, Any]]]:
+    """Latest indicator values for each series, or None for series without history"""
+    close, high, low = (window_matrix(series, field) for field in ('close', 'high', 'low'))
+    columns = indicator_columns(close, high, low)
+    results = []
+    for row, bars in enumerate(series):
+        if bars is None or len(bars) == 0:
+            results.append(None)
+            continue
+        values = {'as_of': str(bars['date'][-1]), 'bars': len(bars)}
+        for name, column in columns.items():
+            value = column[row]
+            values[name] = None if np.isnan(value) else round(float(value), 4)
+        results.append(values)
+    return results
+
+
+def series_to_dict(bars: np.ndarray) -> Dict[str, List[Any]]:
+    """Columnar JSON representation of bars"""
+    columns = {'date': np.datetime_as_string(bars['date'], unit='D').tolist()}
+    for field in PRICE_FIELDS:
+        columns[field] = bars[field].tolist()
+    return columns
+
+
+# Shared by every FinancialService instance
+price_history = PriceHistoryStore()
@@ -0,0 +1,321 @@
+"""
+Persona prompt compilation for TinyTroupe advisors
+"""
+import hashlib
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Most recent conversation messages included in a prompt
+MAX_HISTORY = 20
+
+
+class ExpertiseStrategy:
+    """How an advisor with a given expertise frames answers and analyses
+
+    Templates use ``{name}`` for the advisor name, which is bound once at
+    compile time, and ``{symbol}`` for the stock symbol, bound per call.
+    Portfolio templates get ``{holdings}``, ``{volatility}`` and ``{largest}``
+    (the largest position's symbol).
+    """
+
+    __slots__ = ('key', 'style_rules', 'response_template', 'summary_template', 'recommendation',
+                 'portfolio_template')
+
+    def __init__(self, key: str, style_rules: List[str], response_template: str,
+                 summary_template: str, recommendation: str, portfolio_template: str):
+        self.key = key
+        self.style_rules = style_rules
+        self.response_template = response_template
+        self.summary_template = summary_template
+        self.recommendation = recommendation
+        self.portfolio_template = portfolio_template
+
+
+# Strategy dispatch table, in priority order: when an advisor lists several
+# expertise areas, the first entry here that matches wins.
+STRATEGIES: Dict[str, ExpertiseStrategy] = {
+    'value investing': ExpertiseStrategy(
+        key='value investing',
+        style_rules=[
+            "Anchor every answer in business fundamentals and intrinsic value.",
+            "Discuss competitive advantages and margin of safety before price.",
+        ],
+        response_template="As {name}, I would analyze this from a value investing perspective. "
+                          "I'd look at the company's fundamentals, competitive advantages, and whether "
+                          "it's trading at a discount to intrinsic value.",
+        summary_template="From a value investing perspective, {symbol} requires careful fundamental analysis.",
+        recommendation="Need to examine P/E ratio, book value, and cash flow before making a determination.",
+        portfolio_template="Across {holdings} holdings, the {volatility} annual volatility matters less than whether "
+                           "each business, starting with {largest}, is worth owning at its price."
+    ),
+    'macroeconomics': ExpertiseStrategy(
+        key='macroeconomics',
+        style_rules=[
+            "Relate the question to interest rates, inflation and the economic cycle.",
+            "Consider how market psychology may diverge from fundamentals.",
+        ],
+        response_template="From my perspective as {name}, I would consider the macroeconomic "
+                          "factors at play here. How do interest rates, inflation trends, and broader "
+                          "economic cycles affect this situation?",
+        summary_template="The macroeconomic environment significantly impacts {symbol}'s prospects.",
+        recommendation="Consider how interest rates and sector trends affect this company's outlook.",
+        portfolio_template="With {holdings} holdings and {volatility} annual volatility, this portfolio's "
+                           "exposure to rate and cycle shifts deserves attention, particularly through {largest}."
+    ),
+    'pattern recognition': ExpertiseStrategy(
+        key='pattern recognition',
+        style_rules=[
+            "Look for non-obvious patterns and interconnections.",
+            "Use thought experiments to test assumptions.",
+        ],
+        response_template="As {name}, I notice interesting patterns here. Let's apply some "
+                          "systematic thinking and consider how these elements interconnect in "
+                          "non-obvious ways.",
+        summary_template="Interesting patterns emerge when examining {symbol}'s performance metrics.",
+        recommendation="Look for non-linear relationships between various business factors.",
+        portfolio_template="The correlations among these {holdings} holdings, not just their {volatility} combined "
+                           "volatility, show how much diversification is real; {largest} dominates the picture."
+    ),
+}
+
+DEFAULT_STRATEGY = ExpertiseStrategy(
+    key='general',
+    style_rules=["Focus on long-term implications and fundamental principles."],
+    response_template="As {name}, I would approach this by considering the long-term "
+                      "implications and focusing on the fundamental principles at work.",
+    summary_template="A fundamental analysis of {symbol} reveals important considerations.",
+    recommendation="Focus on long-term business quality rather than short-term price movements.",
+    portfolio_template="This {holdings}-holding portfolio, led by {largest}, runs at {volatility} annual volatility; "
+                       "judge it by the long-term quality of what it owns."
+)
+
+_STRATEGY_ORDER = list(STRATEGIES.values())
+_STRATEGY_RANK = {strategy.key: rank for rank, strategy in enumerate(_STRATEGY_ORDER)}
+
+
+def route_expertise(expertise: List[str]) -> ExpertiseStrategy:
+    """Pick the strategy for a list of expertise areas
+
+    Args:
+        expertise: Expertise areas of an advisor
+
+    Returns:
+        The highest priority matching strategy, or the default strategy
+    """
+    ranked = [_STRATEGY_RANK[area] for area in expertise if area in _STRATEGY_RANK]
+    if not ranked:
+        return DEFAULT_STRATEGY
+    return _STRATEGY_ORDER[min(ranked)]
+
+
+def persona_version(config: Dict[str, Any]) -> str:
+    """Fingerprint the parts of a persona that affect its prompts"""
+    relevant = {
+        'name': config.get('name'),
+        'description': config.get('description'),
+        'personality': config.get('personality'),
+        'expertise': config.get('expertise'),
+    }
+    canonical = json.dumps(relevant, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:12]
+
+
+def _history_lines(conversation_history: List[Dict[str, Any]], max_history: int) -> List[str]:
+    lines = []
+    for previous in conversation_history[-max_history:]:
+        speaker = 'User' if previous.get('role') == 'user' else (previous.get('advisor_id') or 'Advisor')
+        lines.append(f"{speaker}: {previous.get('content', '')}")
+    return lines
+
+
+class CompiledPersona:
+    """An advisor's prompts, rendered once per persona version"""
+
+    __slots__ = ('id', 'name', 'description', 'expertise', 'version', 'strategy',
+                 'system_prompt', 'response', 'recommendation', '_summary_template', '_portfolio_template')
+
+    def __init__(self, config: Dict[str, Any], version: str):
+        personality = config.get('personality') or {}
+        self.id = config['id']
+        self.name = config['name']
+        self.description = config.get('description', '')
+        self.expertise = list(config.get('expertise') or [])
+        self.version = version
+        self.strategy = route_expertise(self.expertise)
+
+        lines = [f"You are {self.name}. {self.description}".strip()]
+        if self.expertise:
+            lines.append(f"Your areas of expertise: {', '.join(self.expertise)}.")
+        if personality.get('traits'):
+            lines.append(f"Personality traits: {', '.join(personality['traits'])}.")
+        if personality.get('communication_style'):
+            lines.append(f"Communication style: {personality['communication_style']}.")
+        lines.extend(f"- {rule}" for rule in self.strategy.style_rules)
+        self.system_prompt = '\n'.join(lines)
+
+        # Bind the advisor name now so per-call work is a lookup or one format
+        self.response = self.strategy.response_template.format(name=self.name)
+        self._summary_template = self.strategy.summary_template
+        self._portfolio_template = self.strategy.portfolio_template
+        self.recommendation = self.strategy.recommendation
+
+    def build_prompt(self, message: str, conversation_history: List[Dict[str, Any]],
+                     max_history: int = MAX_HISTORY, memories: Optional[List[str]] = None) -> str:
+        """Assemble the full prompt for a user message
+
+        Args:
+            message: User message to respond to
+            conversation_history: Previous messages in the conversation
+            max_history: Number of most recent messages to include
+            memories: Earlier exchanges retrieved as relevant to the message
+
+        Returns:
+            Prompt text
+        """
+        parts = [self.system_prompt]
+        if memories:
+            parts.append("Relevant earlier discussion:")
+            parts.extend(f"- {memory}" for memory in memories)
+        parts.extend(_history_lines(conversation_history, max_history))
+        parts.append(f"User: {message}")
+        parts.append(f"{self.name}:")
+        return '\n'.join(parts)
+
+    def analyze(self, symbol: str) -> Dict[str, str]:
+        """Render this advisor's analysis of a stock symbol"""
+        return {
+            'name': self.name,
+            'summary': self._summary_template.format(symbol=symbol),
+            'recommendation': self.recommendation
+        }
+
+    def analyze_portfolio(self, portfolio: Dict[str, Any]) -> Dict[str, str]:
+        """Render this advisor's analysis of a whole portfolio
+
+        Args:
+            portfolio: Summary with ``holdings`` count, annualized ``volatility``
+                and the ``largest`` position's symbol
+        """
+        return {
+            'name': self.name,
+            'summary': self._portfolio_template.format(
+                holdings=portfolio['holdings'],
+                volatility=f"{portfolio['volatility']:.1%}" if portfolio.get('volatility') is not None else 'unknown',
+                largest=portfolio['largest']
+            ),
+            'recommendation': self.recommendation
+        }
+
+
+def build_board_prompt(advisors: List[CompiledPersona], message: str, conversation_history: List[Dict[str, Any]],
+                       max_history: int = MAX_HISTORY, memories: Optional[Dict[str, List[str]]] = None) -> str:
+    """Assemble one prompt asking several advisors to answer in a single structured reply
+
+    The conversation prefix appears once instead of once per advisor.
+
+    Args:
+        advisors: Compiled personas that should answer
+        message: User message to respond to
+        conversation_history: Previous messages in the conversation
+        max_history: Number of most recent messages to include
+        memories: Retrieved earlier exchanges per advisor id
+
+    Returns:
+        Prompt text
+    """
+    parts = ["You are moderating an advisory board. Answer the user's message once as each advisor below, "
+             "staying in character and keeping each answer independent of the others."]
+    for advisor in advisors:
+        parts.append(f"\n## Advisor `{advisor.id}`\n{advisor.system_prompt}")
+        advisor_memories = (memories or {}).get(advisor.id)
+        if advisor_memories:
+            parts.append("Relevant earlier discussion:")
+            parts.extend(f"- {memory}" for memory in advisor_memories)
+    parts.append("\n## Conversation")
+    parts.extend(_history_lines(conversation_history, max_history))
+    parts.append(f"User: {message}")
+    parts.append('\nRespond with JSON only, in the form '
+                 '{"replies": [{"advisor_id": "<id>", "content": "<answer>"}]}, with one reply for each of: '
+                 f"{', '.join(advisor.id for advisor in advisors)}.")
+    return '\n'.join(parts)
+
+
+def parse_board_reply(raw: str, advisor_ids: List[str]) -> Dict[str, str]:
+    """Split a structured advisory board reply into per-advisor answers
+
+    Args:
+        raw: Model output, optionally wrapped in a Markdown code fence
+        advisor_ids: Advisors that were asked
+
+    Returns:
+        Answer per advisor id; advisors missing from the reply are left out
+
+    Raises:
+        ValueError: If the reply is not a JSON list of replies
+    """
+    text = raw.strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+        text = text.rsplit('```', 1)[0]
+    try:
+        document = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Board reply is not valid JSON: {e}") from e
+
+    replies = document.get('replies') if isinstance(document, dict) else None
+    if not isinstance(replies, list):
+        raise ValueError("Board reply has no list of replies")
+
+    wanted = set(advisor_ids)
+    answers = {}
+    for reply in replies:
+        if not isinstance(reply, dict):
+            continue
+        advisor_id, content = reply.get('advisor_id'), reply.get('content')
+        if advisor_id in wanted and isinstance(content, str) and content.strip():
+            answers.setdefault(advisor_id, content.strip())
+    return answers
+
+
+class PromptRegistry:
+    """Process-wide cache of compiled personas keyed by advisor and version"""
+
+    def __init__(self):
+        self._compiled: Dict[str, CompiledPersona] = {}
+        self._lock = threading.Lock()
+        self.compilations = 0
+
+    def register(self, config: Dict[str, Any]) -> CompiledPersona:
+        """Return the compiled persona for a config, compiling only on a new version
+
+        Args:
+            config: Advisor configuration dictionary
+
+        Returns:
+            The compiled persona
+        """
+        version = persona_version(config)
+        compiled = self._compiled.get(config['id'])
+        if compiled is not None and compiled.version == version:
+            return compiled
+
+        with self._lock:
+            compiled = self._compiled.get(config['id'])
+            if compiled is None or compiled.version != version:
+                compiled = CompiledPersona(config, version)
+                self._compiled[config['id']] = compiled
+                self.compilations += 1
+                logger.info(f"Compiled prompts for {compiled.name} (version {version})")
+        return compiled
+
+    def get(self, advisor_id: str) -> Optional[CompiledPersona]:
+        """Return the compiled persona for an advisor, if registered"""
+        return self._compiled.get(advisor_id)
+
+
+# Shared by every TinyTroupeService instance
+registry = PromptRegistry()
@@ -0,0 +1,176 @@
+"""
+Live quote fan-out for TinyTroupe Service
+"""
+import logging
+import threading
+from typing import Any, Dict, Optional, Set, Tuple
+
+from src.config import Config
+
+Update = Tuple[str, Dict[str, Any]]
+
+
+class SubscriberLimitExceeded(Exception):
+    """Raised when the server already streams quotes to QUOTE_STREAM_MAX_SUBSCRIBERS clients"""
+
+
+class QuoteSubscription:
+    """One client's stream of a symbol's quotes
+
+    The poller never waits for a client: each subscription holds only the
+    newest update not yet sent, so a client that reads slower than quotes
+    arrive skips straight to the latest quote instead of building a queue.
+    """
+
+    def __init__(self, hub: 'QuoteHub', symbol: str):
+        self.hub = hub
+        self.symbol = symbol
+        self.skipped = 0
+        self.closed = False
+        self._pending: Optional[Update] = None
+        self._ready = threading.Condition()
+
+    def offer(self, event: str, payload: Dict[str, Any]) -> None:
+        """Hand the subscriber an update, replacing one it has not read yet"""
+        with self._ready:
+            if self.closed:
+                return
+            if self._pending is not None:
+                self.skipped += 1
+            self._pending = (event, payload)
+            self._ready.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Update]:
+        """Wait for the next update
+
+        Returns:
+            The ``(event, payload)`` pair, or None on timeout or once closed
+        """
+        with self._ready:
+            self._ready.wait_for(lambda: self._pending is not None or self.closed, timeout)
+            update, self._pending = self._pending, None
+            return update
+
+    def close(self) -> None:
+        """Unsubscribe; safe to call more than once"""
+        self.hub.unsubscribe(self)
+
+    def _closed(self) -> None:
+        with self._ready:
+            self.closed = True
+            self._ready.notify_all()
+
+
+class _Topic:
+    """Subscribers of one symbol and the thread polling its quotes"""
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.subscribers: Set[QuoteSubscription] = set()
+        self.last: Optional[Update] = None
+        self.polls = 0
+        self.stop = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+
+class QuoteHub:
+    """Polls each subscribed symbol once and fans its quotes out to every subscriber
+
+    The first subscription to a symbol starts a thread fetching its quote
+    from the provider every ``QUOTE_POLL_SECONDS``; the thread stops when the
+    last subscriber leaves. Unchanged quotes are not sent again. A new
+    subscriber gets the latest quote at once instead of waiting for the
+    next poll.
+    """
+
+    def __init__(self, app=None):
+        self.logger = logging.getLogger(__name__)
+        self.app = None
+        self._topics: Dict[str, _Topic] = {}
+        self._lock = threading.Lock()
+        self._financial_service = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        """Remember the app the poll threads run in"""
+        self.app = app
+
+    @property
+    def financial_service(self):
+        if self._financial_service is None:
+            from src.services.financial_service import FinancialService
+            self._financial_service = FinancialService()
+        return self._financial_service
+
+    def subscribe(self, symbol: str) -> QuoteSubscription:
+        """Subscribe to a symbol's quotes, starting its poller if nobody else is subscribed
+
+        Args:
+            symbol: A validated stock symbol
+
+        Raises:
+            SubscriberLimitExceeded: If QUOTE_STREAM_MAX_SUBSCRIBERS clients are already subscribed
+        """
+        subscription = QuoteSubscription(self, symbol)
+        with self._lock:
+            if sum(len(topic.subscribers) for topic in self._topics.values()) >= Config.QUOTE_STREAM_MAX_SUBSCRIBERS:
+                raise SubscriberLimitExceeded("Too many live quote streams, try again later")
+            topic = self._topics.get(symbol)
+            if topic is None:
+                topic = self._topics[symbol] = _Topic(symbol)
+                topic.thread = threading.Thread(target=self._poll, args=(topic,), name=f'quotes-{symbol}',
+                                                daemon=True)
+                topic.thread.start()
+            topic.subscribers.add(subscription)
+            if topic.last is not None:
+                subscription.offer(*topic.last)
+        return subscription
+
+    def unsubscribe(self, subscription: QuoteSubscription) -> None:
+        """Remove a subscriber, stopping the symbol's poller if it was the last one"""
+        with self._lock:
+            topic = self._topics.get(subscription.symbol)
+            if topic is not None and subscription in topic.subscribers:
+                topic.subscribers.discard(subscription)
+                if not topic.subscribers:
+                    del self._topics[subscription.symbol]
+                    topic.stop.set()
+        subscription._closed()
+
+    def _publish(self, topic: _Topic, event: str, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            if topic.last == (event, payload):
+                return
+            topic.last = (event, payload)
+            subscribers = list(topic.subscribers)
+        for subscription in subscribers:
+            subscription.offer(event, payload)
+
+    def _poll(self, topic: _Topic) -> None:
+        with self.app.app_context():
+            while not topic.stop.is_set():
+                try:
+                    self._publish(topic, 'quote', self.financial_service.refresh_quote(topic.symbol))
+                except Exception as e:
+                    self.logger.warning(f"Could not poll the quote for {topic.symbol}: {str(e)}")
+                    self._publish(topic, 'error', {'symbol': topic.symbol, 'error': str(e)})
+                topic.polls += 1
+                topic.stop.wait(Config.QUOTE_POLL_SECONDS)
+        self.logger.info(f"Stopped polling {topic.symbol} after {topic.polls} polls")
+
+    def status(self) -> Dict[str, Any]:
+        """Symbols being polled, with their subscriber counts and updates skipped by slow subscribers"""
+        with self._lock:
+            return {
+                symbol: {
+                    'subscribers': len(topic.subscribers),
+                    'polls': topic.polls,
+                    'skipped': sum(subscription.skipped for subscription in topic.subscribers)
+                }
+                for symbol, topic in sorted(self._topics.items())
+            }
+
+
+# Initialized from the app module
+quote_hub = QuoteHub()
@@ -0,0 +1,211 @@
+"""
+Near-duplicate question detection for reusing recent advisor answers
+"""
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.config import Config
+from src.services.persona_memory import HashingVectorizer
+
+logger = logging.getLogger(__name__)
+
+# Paraphrases mapped onto one canonical wording before embedding, longest first
+CANONICAL_PHRASES = [
+    ('too expensive', 'overvalued'), ('too pricey', 'overvalued'), ('overpriced', 'overvalued'),
+    ('expensive', 'overvalued'), ('pricey', 'overvalued'), ('in a bubble', 'overvalued'),
+    ('too cheap', 'undervalued'), ('underpriced', 'undervalued'), ('cheap', 'undervalued'),
+    ('a bargain', 'undervalued'), ('worth buying', 'buy'), ('good buy', 'buy'), ('purchase', 'buy'),
+    ('get rid of', 'sell'), ('dump', 'sell'), ('shares', 'stock'), ('stocks', 'stock'), ('equities', 'stock'),
+]
+_PHRASE_RE = re.compile(r'\b(' + '|'.join(re.escape(phrase) for phrase, _ in CANONICAL_PHRASES) + r')\b')
+_CANONICAL = dict(CANONICAL_PHRASES)
+
+# Words that point back at earlier turns, making an answer depend on the conversation
+CONTEXT_WORDS = frozenset("""
+it its it's that this these those they them their he she him her his hers above earlier previous previously
+before again else also instead then you said your last same other another one ones follow following
+""".split())
+
+# Words that flip a question's meaning; the vectorizer drops them as stop words, so a negated question would
+# embed like its opposite
+NEGATION_WORDS = frozenset("""
+no nor not never neither none nothing nobody cannot without
+""".split())
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def canonicalize(message: str) -> str:
+    """Lowercase a question and map common paraphrases onto one wording"""
+    return _PHRASE_RE.sub(lambda match: _CANONICAL[match.group(1)], message.lower())
+
+
+class _Answer:
+    """A stored answer and the question it was given for"""
+
+    __slots__ = ('key', 'vector', 'bands', 'response', 'created')
+
+    def __init__(self, key: int, vector: np.ndarray, bands: List[int], response: str, created: float):
+        self.key = key
+        self.vector = vector
+        self.bands = bands
+        self.response = response
+        self.created = created
+
+
+class NearDuplicateIndex:
+    """SimHash signatures over question embeddings with banded LSH lookup
+
+    Each question vector is projected onto ``bits`` random hyperplanes; the
+    sign bits form its signature, split into ``bands`` buckets. Questions
+    sharing any bucket are candidates, confirmed with the exact cosine
+    similarity. Entries are kept oldest first and bounded in number.
+    """
+
+    def __init__(self, dim: int, bits: int = 64, bands: int = 8, max_entries: int = 1000, seed: int = 0):
+        self.bands = bands
+        self.rows = bits // bands
+        self.max_entries = max_entries
+        self.planes = np.random.default_rng(seed).standard_normal((bits, dim)).astype(np.float32)
+        self._weights = np.left_shift(np.uint64(1), np.arange(self.rows, dtype=np.uint64))
+        self._buckets: List[Dict[int, set]] = [{} for _ in range(bands)]
+        self._answers: "OrderedDict[int, _Answer]" = OrderedDict()
+        self._next_key = 0
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    def band_keys(self, vector: np.ndarray) -> List[int]:
+        """SimHash signature of a vector split into per-band bucket keys"""
+        bits = ((self.planes @ vector) > 0).reshape(self.bands, self.rows).astype(np.uint64)
+        return [int(key) for key in bits @ self._weights]
+
+    def add(self, vector: np.ndarray, response: str, now: float) -> None:
+        """Store an answer, evicting the oldest beyond ``max_entries``"""
+        answer = _Answer(self._next_key, vector, self.band_keys(vector), response, now)
+        self._next_key += 1
+        self._answers[answer.key] = answer
+        for buckets, band_key in zip(self._buckets, answer.bands):
+            buckets.setdefault(band_key, set()).add(answer.key)
+        while len(self._answers) > self.max_entries:
+            self._remove(next(iter(self._answers.values())))
+
+    def find(self, vector: np.ndarray, min_similarity: float, max_age: float,
+             now: float) -> Optional[Tuple[_Answer, float]]:
+        """Return the most similar fresh answer above ``min_similarity``, if any"""
+        self.expire(now - max_age)
+        candidates = set()
+        for buckets, band_key in zip(self._buckets, self.band_keys(vector)):
+            candidates.update(buckets.get(band_key, ()))
+
+        best, best_similarity = None, min_similarity
+        for key in candidates:
+            answer = self._answers[key]
+            similarity = float(answer.vector @ vector)
+            if similarity >= best_similarity:
+                best, best_similarity = answer, similarity
+        return (best, best_similarity) if best is not None else None
+
+    def expire(self, cutoff: float) -> None:
+        """Drop answers created before ``cutoff``"""
+        while self._answers:
+            oldest = next(iter(self._answers.values()))
+            if oldest.created >= cutoff:
+                break
+            self._remove(oldest)
+
+    def _remove(self, answer: _Answer) -> None:
+        del self._answers[answer.key]
+        for buckets, band_key in zip(self._buckets, answer.bands):
+            keys = buckets.get(band_key)
+            if keys is not None:
+                keys.discard(answer.key)
+                if not keys:
+                    del buckets[band_key]
+
+
+class ResponseReuse:
+    """Reuses an advisor's recent answer to a near-identical, context-free question
+
+    One index is kept per advisor, persona version and model, so edits to a
+    persona or a model downgrade never serve a stale style of answer. Only
+    questions that stand on their own (no references to earlier turns, no
+    negations and at least two content words) are looked up or stored.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.vectorizer = HashingVectorizer(Config.PERSONA_MEMORY_DIM)
+        self._indexes: Dict[Tuple[str, str, str], NearDuplicateIndex] = {}
+        self._lock = threading.Lock()
+
+    def is_context_free(self, message: str) -> bool:
+        """Whether a question can be answered without the conversation so far"""
+        if len(message) > Config.RESPONSE_REUSE_MAX_LENGTH or '@' in message:
+            return False
+        words = set(_WORD_RE.findall(message.lower()))
+        if words & CONTEXT_WORDS:
+            return False
+        if words & NEGATION_WORDS or any(word.endswith("n't") for word in words):
+            return False
+        return len(self.vectorizer.terms(message)) >= 2
+
+    def _index(self, advisor, model: str) -> NearDuplicateIndex:
+        key = (advisor.id, advisor.version, model)
+        index = self._indexes.get(key)
+        if index is None:
+            index = self._indexes.setdefault(key, NearDuplicateIndex(
+                self.vectorizer.dim, max_entries=Config.RESPONSE_REUSE_MAX_ENTRIES))
+        return index
+
+    def lookup(self, advisor, model: str, message: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Find a reusable answer for a question
+
+        Args:
+            advisor: Compiled persona being asked
+            model: Model that would answer
+            message: User question
+
+        Returns:
+            The answer and its response metadata, or None
+        """
+        if not Config.RESPONSE_REUSE_ENABLED or not self.is_context_free(message):
+            return None
+        vector = self.vectorizer.transform(canonicalize(message))
+        now = time.time()
+        with self._lock:
+            match = self._index(advisor, model).find(
+                vector, Config.RESPONSE_REUSE_SIMILARITY, Config.RESPONSE_REUSE_MAX_AGE, now)
+        if match is None:
+            return None
+
+        answer, similarity = match
+        self.logger.info(f"Reusing {advisor.name}'s answer (similarity {similarity:.2f})")
+        return answer.response, {
+            'reused': True,
+            'similarity': round(similarity, 3),
+            'age_seconds': int(now - answer.created)
+        }
+
+    def remember(self, advisor, model: str, message: str, response: str) -> None:
+        """Store a fresh answer so near-identical questions can reuse it"""
+        if not Config.RESPONSE_REUSE_ENABLED or not self.is_context_free(message):
+            return
+        vector = self.vectorizer.transform(canonicalize(message))
+        with self._lock:
+            self._index(advisor, model).add(vector, response, time.time())
+
+    def clear(self) -> None:
+        """Forget every stored answer"""
+        with self._lock:
+            self._indexes.clear()
+
+
+# Shared by every TinyTroupeService instance
+response_reuse = ResponseReuse()
@@ -0,0 +1,162 @@
+"""
+Symbol master list with prefix lookup
+"""
+import csv
+import logging
+import os
+import re
+import threading
+from bisect import bisect_left
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.config import Config
+from src.services.price_history import SYMBOL_PATTERN, normalize_symbol
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+class UnknownSymbolError(ValueError):
+    """Raised when a well-formed symbol is not in the symbol master"""
+
+
+def _prefix_range(keys: List[str], prefix: str) -> Iterable[int]:
+    """Positions of the sorted keys starting with a prefix"""
+    position = bisect_left(keys, prefix)
+    while position < len(keys) and keys[position].startswith(prefix):
+        yield position
+        position += 1
+
+
+class SymbolMaster:
+    """Known tickers and company names, searchable by prefix
+
+    The list is read from a CSV file at ``SYMBOL_MASTER_PATH`` with
+    ``symbol`` (or ``ticker``), ``name`` and optional ``exchange`` columns,
+    and reloaded when the file changes. Lookups are binary searches over
+    sorted tickers and sorted name words. Without a file every well-formed
+    symbol is accepted, as before.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.logger = logging.getLogger(__name__)
+        self._path = path
+        self._file_version: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+        self.load([])
+
+    @property
+    def path(self) -> str:
+        return self._path or Config.SYMBOL_MASTER_PATH
+
+    @property
+    def size(self) -> int:
+        self._refresh()
+        return len(self._index[0])
+
+    def load(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """Replace the list with ``{"symbol", "name", "exchange"}`` records
+
+        Returns:
+            Number of symbols loaded; malformed symbols are skipped
+        """
+        records = {}
+        for row in rows:
+            symbol = str(row.get('symbol') or '').strip().upper()
+            if SYMBOL_PATTERN.match(symbol):
+                records[symbol] = (str(row.get('name') or '').strip(), str(row.get('exchange') or '').strip())
+        tickers = sorted(records)
+        terms = []
+        for position, symbol in enumerate(tickers):
+            name = records[symbol][0].lower()
+            words = set(WORD_PATTERN.findall(name))
+            words.add(name)
+            terms.extend((word, position) for word in words if word)
+        terms.sort()
+
+        # Swapped in as one tuple so concurrent searches see one consistent list
+        self._index = (
+            tickers,
+            [records[symbol] for symbol in tickers],
+            [term for term, _ in terms],
+            [position for _, position in terms],
+        )
+        return len(tickers)
+
+    def _refresh(self) -> None:
+        """Reload the list if its file appeared, changed or disappeared"""
+        try:
+            stat = os.stat(self.path)
+            version = (stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            version = None
+        if version == self._file_version:
+            return
+        with self._lock:
+            if version == self._file_version:
+                return
+            if version is None:
+                count = self.load([])
+            else:
+                with open(self.path, newline='', encoding='utf-8-sig') as handle:
+                    reader = csv.DictReader(handle)
+                    rows = ({key.strip().lower(): value for key, value in row.items() if key} for row in reader)
+                    count = self.load({**row, 'symbol': row.get('symbol') or row.get('ticker')} for row in rows)
+            self._file_version = version
+            self.logger.info(f"Loaded {count} symbols from {self.path}")
+
+    @staticmethod
+    def _record(tickers: List[str], records: List[Tuple[str, str]], position: int) -> Dict[str, str]:
+        name, exchange = records[position]
+        return {'symbol': tickers[position], 'name': name, 'exchange': exchange}
+
+    def get(self, symbol: str) -> Optional[Dict[str, str]]:
+        """Record of a symbol, or None if it is unknown"""
+        self._refresh()
+        tickers, records, _, _ = self._index
+        symbol = (symbol or '').strip().upper()
+        position = bisect_left(tickers, symbol)
+        if position < len(tickers) and tickers[position] == symbol:
+            return self._record(tickers, records, position)
+        return None
+
+    def search(self, prefix: str, limit: int = 10) -> List[Dict[str, str]]:
+        """Symbols whose ticker or a word of whose name starts with a prefix
+
+        Ticker matches come first, then name matches, each in alphabetical
+        order, so an exact ticker match always leads.
+        """
+        self._refresh()
+        prefix = (prefix or '').strip()
+        if not prefix or limit <= 0:
+            return []
+        tickers, records, terms, term_rows = self._index
+        ticker_matches = list(islice(_prefix_range(tickers, prefix.upper()), limit))
+        seen = set(ticker_matches)
+        name_matches = []
+        for position in _prefix_range(terms, prefix.lower()):
+            if len(ticker_matches) + len(name_matches) >= limit:
+                break
+            row = term_rows[position]
+            if row not in seen:
+                seen.add(row)
+                name_matches.append(row)
+        return [self._record(tickers, records, position) for position in ticker_matches + name_matches]
+
+    def validate(self, symbol: str) -> str:
+        """Normalize a symbol and check it is listed, before anything is asked of a provider
+
+        Raises:
+            ValueError: If the symbol is malformed
+            UnknownSymbolError: If a symbol master is loaded and does not list it
+        """
+        normalized = normalize_symbol(symbol)
+        if self.size and self.get(normalized) is None:
+            raise UnknownSymbolError(f"Unknown symbol: {normalized}")
+        return normalized
+
+
+# Shared by every FinancialService instance
+symbol_master = SymbolMaster()
@@ -3,9 +3,20 @@ TinyTroupe integration service
 """
 import os
 import json
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Callable, Optional, Tuple
 import logging
+from functools import partial
 from ..config import Config
+from ..cancellation import CancellationToken
+from ..deadline import Deadline
+from .prompt_compiler import registry, build_board_prompt, parse_board_reply
+from .usage_service import UsageService
+from .response_reuse import response_reuse
+from .hedging import hedged_executor
+
+# Latency bucket for single-call advisory board generations
+BOARD_ADVISOR_ID = 'advisory_board'
 
 # This is a placeholder for the actual TinyTroupe import
 # In a real implementation, you would import the TinyTroupe library
@@ -28,20 +39,27 @@ class TinyTroupeService:
         # self.world = TinyWorld(name="Financial Advisory Board")
         self.advisors = {}
         
+        # Token, latency and cost ledger for every model call
+        self.usage = UsageService()
+        
+        # Recent answers reused for near-identical questions
+        self.reuse = response_reuse
+        
+        # Model calls run concurrently, hedged and bounded by the request deadline
+        self.executor = hedged_executor
+        
     def initialize_advisors(self, advisor_configs: List[Dict[str, Any]]) -> None:
         """Initialize advisor personas from configuration
         
+        Prompts are compiled once per persona version and shared through the
+        prompt registry, so re-initializing unchanged advisors is cheap.
+        
         Args:
             advisor_configs: List of advisor configuration dictionaries
         """
         self.logger.info(f"Initializing {len(advisor_configs)} advisors")
         
         for config in advisor_configs:
-            advisor_id = config['id']
-            name = config['name']
-            description = config['description']
-            expertise = config['expertise']
-            
             # In a real implementation, you would create TinyPerson objects
             # self.advisors[advisor_id] = TinyPerson(
             #     name=name,
@@ -49,23 +67,22 @@ class TinyTroupeService:
             #     expertise=expertise
             # )
             
-            # For now, we'll just store the configuration
-            self.advisors[advisor_id] = {
-                'id': advisor_id,
-                'name': name,
-                'description': description,
-                'expertise': expertise
-            }
-            
-            self.logger.info(f"Initialized advisor: {name}")
+            # For now, we'll keep the compiled persona
+            self.advisors[config['id']] = registry.register(config)
     
-    def get_response(self, advisor_id: str, message: str, conversation_history: List[Dict[str, Any]]) -> str:
+    def get_response(self, advisor_id: str, message: str, conversation_history: List[Dict[str, Any]],
+                     model: Optional[str] = None, user_id: Optional[str] = None,
+                     conversation_id: Optional[str] = None, memories: Optional[List[str]] = None) -> str:
         """Get a response from an advisor
         
         Args:
             advisor_id: ID of the advisor to get a response from
             message: User message to respond to
             conversation_history: List of previous messages in the conversation
+            model: Model to use, defaults to Config.LLM_MODEL
+            user_id: User the response is for, recorded in the usage ledger
+            conversation_id: Conversation the response is for, recorded in the usage ledger
+            memories: Earlier exchanges of this advisor relevant to the message
             
         Returns:
             Response from the advisor
@@ -74,77 +91,279 @@ class TinyTroupeService:
         if not advisor:
             raise ValueError(f"Advisor {advisor_id} not found")
         
-        self.logger.info(f"Getting response from {advisor['name']} for message: {message[:50]}...")
+        self.logger.info(f"Getting response from {advisor.name} for message: {message[:50]}...")
+        model = model or Config.LLM_MODEL
+        started = time.perf_counter()
+        prompt = advisor.build_prompt(message, conversation_history, memories=memories)
         
         # In a real implementation, you would use TinyTroupe to generate a response
-        # response = self.advisors[advisor_id].respond(message, conversation_history)
-        
-        # For now, we'll return a placeholder response
-        advisor_name = advisor['name']
-        expertise = advisor['expertise']
-        
-        # Simple template-based response for demonstration
-        if 'value investing' in expertise:
-            response = f"As {advisor_name}, I would analyze this from a value investing perspective. " \
-                      f"I'd look at the company's fundamentals, competitive advantages, and whether " \
-                      f"it's trading at a discount to intrinsic value."
-        elif 'macroeconomics' in expertise:
-            response = f"From my perspective as {advisor_name}, I would consider the macroeconomic " \
-                      f"factors at play here. How do interest rates, inflation trends, and broader " \
-                      f"economic cycles affect this situation?"
-        elif 'pattern recognition' in expertise:
-            response = f"As {advisor_name}, I notice interesting patterns here. Let's apply some " \
-                      f"systematic thinking and consider how these elements interconnect in " \
-                      f"non-obvious ways."
-        else:
-            response = f"As {advisor_name}, I would approach this by considering the long-term " \
-                      f"implications and focusing on the fundamental principles at work."
+        # response = self.advisors[advisor_id].respond(prompt, model=model)
+        
+        # For now, we'll return the advisor's precompiled template response
+        response = advisor.response
         
+        self.usage.record(advisor_id, 'response', model, prompt, response,
+                          (time.perf_counter() - started) * 1000, user_id, conversation_id)
         return response
     
-    def analyze_stock(self, symbol: str) -> Dict[str, Any]:
+    def respond(self, advisor_id: str, message: str, conversation_history: List[Dict[str, Any]],
+                allow_reuse: bool = True, deadline: Optional[Deadline] = None, **kwargs) -> Tuple[str, Dict[str, Any]]:
+        """Get a response from an advisor, reusing a recent answer to a near-identical question
+        
+        Args:
+            advisor_id: ID of the advisor to get a response from
+            message: User message to respond to
+            conversation_history: List of previous messages in the conversation
+            allow_reuse: False to always call the model, e.g. when reuse is disabled for the advisor
+            deadline: Request deadline; past it the template response is returned as degraded
+            **kwargs: Passed on to get_response
+            
+        Returns:
+            Tuple of the response and its metadata
+        """
+        result = self.respond_many([(advisor_id, allow_reuse, kwargs)], message, conversation_history,
+                                   deadline)[advisor_id]
+        if isinstance(result, Exception):
+            raise result
+        return result
+    
+    def respond_many(self, calls: List[Tuple[str, bool, Dict[str, Any]]], message: str,
+                     conversation_history: List[Dict[str, Any]], deadline: Optional[Deadline] = None,
+                     cancel: Optional[CancellationToken] = None,
+                     on_answer: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Any]:
+        """Get responses from several advisors concurrently
+        
+        Each model call runs on the shared hedged executor: a duplicate is
+        started when a call outlives the advisor's recent p95 latency, and
+        calls still running when the deadline is about to expire are answered
+        with the advisor's template response, marked as degraded.
+        
+        Args:
+            calls: (advisor_id, allow_reuse, get_response keyword arguments) per advisor
+            message: User message to respond to
+            conversation_history: List of previous messages in the conversation
+            deadline: Request deadline, None to wait for every call
+            cancel: Token that abandons the calls still pending once cancelled;
+                advisors left unanswered map to OperationCancelled
+            on_answer: Called with (advisor_id, result) as soon as each advisor
+                is answered, with the same values as the returned dictionary
+            
+        Returns:
+            Dictionary mapping advisor id to a (response, metadata) tuple, or to
+            the exception raised for that advisor
+        """
+        advisors = {}
+        for advisor_id, _, _ in calls:
+            advisor = self.advisors.get(advisor_id)
+            if not advisor:
+                raise ValueError(f"Advisor {advisor_id} not found")
+            advisors[advisor_id] = advisor
+        
+        results = {}
+        pending = {}
+        for advisor_id, allow_reuse, kwargs in calls:
+            advisor = advisors[advisor_id]
+            model = kwargs.get('model') or Config.LLM_MODEL
+            if allow_reuse:
+                reused = self.reuse.lookup(advisor, model, message)
+                if reused is not None:
+                    results[advisor_id] = reused
+                    if on_answer is not None:
+                        on_answer(advisor_id, reused)
+                    continue
+            
+            call = self.executor.submit(
+                advisor_id,
+                partial(self.get_response, advisor_id, message, conversation_history, **kwargs),
+                fallback=lambda advisor=advisor: advisor.response,
+                cancel=cancel
+            )
+            pending[call] = (advisor, allow_reuse, model)
+        
+        def finished(call):
+            advisor, allow_reuse, model = pending[call]
+            if call.error is not None:
+                results[advisor.id] = call.error
+            else:
+                if allow_reuse and not call.metadata.get('degraded'):
+                    self.reuse.remember(advisor, model, message, call.result)
+                results[advisor.id] = (call.result, call.metadata)
+            if on_answer is not None:
+                on_answer(advisor.id, results[advisor.id])
+        
+        self.executor.gather(list(pending), deadline, cancel, finished)
+        return results
+    
+    def board_respond(self, advisor_ids: List[str], message: str, conversation_history: List[Dict[str, Any]],
+                      allow_reuse: Optional[Dict[str, bool]] = None, model: Optional[str] = None,
+                      user_id: Optional[str] = None, conversation_id: Optional[str] = None,
+                      memories: Optional[Dict[str, List[str]]] = None, deadline: Optional[Deadline] = None,
+                      cancel: Optional[CancellationToken] = None) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+        """Get responses from several advisors with a single structured model call
+        
+        Advisors with a reusable answer are served from the reuse index and the
+        rest are asked together. Advisors the reply leaves out are missing from
+        the result, so callers can fall back to per-advisor calls for them.
+        
+        Args:
+            advisor_ids: IDs of the advisors to get responses from
+            message: User message to respond to
+            conversation_history: List of previous messages in the conversation
+            allow_reuse: Whether near-duplicate reuse is allowed, per advisor id
+            model: Model to use, defaults to Config.LLM_MODEL
+            user_id: User the responses are for, recorded in the usage ledger
+            conversation_id: Conversation the responses are for, recorded in the usage ledger
+            memories: Earlier exchanges relevant to the message, per advisor id
+            deadline: Request deadline, None to wait for the call
+            cancel: Token that abandons the call once cancelled
+        
+        Returns:
+            Dictionary mapping advisor id to a tuple of response and metadata
+        
+        Raises:
+            ValueError: If an advisor is unknown or the model reply cannot be parsed
+            DeadlineExceeded: If the call did not finish before the deadline
+            OperationCancelled: If the call was cancelled
+        """
+        advisors = []
+        for advisor_id in advisor_ids:
+            advisor = self.advisors.get(advisor_id)
+            if not advisor:
+                raise ValueError(f"Advisor {advisor_id} not found")
+            advisors.append(advisor)
+        
+        model = model or Config.LLM_MODEL
+        allow_reuse = allow_reuse or {}
+        answers = {}
+        for advisor in advisors:
+            if allow_reuse.get(advisor.id, True):
+                reused = self.reuse.lookup(advisor, model, message)
+                if reused is not None:
+                    answers[advisor.id] = reused
+        
+        board = [advisor for advisor in advisors if advisor.id not in answers]
+        if not board:
+            return answers
+        
+        self.logger.info(f"Getting board response from {len(board)} advisors for message: {message[:50]}...")
+        prompt = build_board_prompt(board, message, conversation_history, memories=memories)
+        call = self.executor.call(
+            BOARD_ADVISOR_ID,
+            partial(self._board_completion, board, prompt, model, user_id, conversation_id),
+            deadline,
+            cancel=cancel
+        )
+        if call.error is not None:
+            raise call.error
+        raw = call.result
+        
+        parsed = parse_board_reply(raw, [advisor.id for advisor in board])
+        for advisor in board:
+            if advisor.id in parsed:
+                if allow_reuse.get(advisor.id, True):
+                    self.reuse.remember(advisor, model, message, parsed[advisor.id])
+                answers[advisor.id] = (parsed[advisor.id], {'generation': 'board'})
+        return answers
+
+    def _board_completion(self, board: List[Any], prompt: str, model: str,
+                          user_id: Optional[str], conversation_id: Optional[str]) -> str:
+        """Make the single structured model call of an advisory board turn"""
+        started = time.perf_counter()
+        
+        # In a real implementation, you would ask the model for structured output
+        # raw = client.chat.completions.create(model=model, messages=[...],
+        #                                      response_format={"type": "json_object"})
+        
+        # For now, we'll assemble the reply the model is asked for from the precompiled responses
+        raw = json.dumps({'replies': [{'advisor_id': advisor.id, 'content': advisor.response} for advisor in board]})
+        
+        self.usage.record_shared([advisor.id for advisor in board], 'board', model, prompt, raw,
+                                 (time.perf_counter() - started) * 1000, user_id, conversation_id)
+        return raw
+    
+    def analyze_stock(self, symbol: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """Analyze a stock using all advisors
         
         Args:
             symbol: Stock symbol to analyze
+            deadline: Request deadline; advisors still working when it expires
+                contribute their template analysis, marked as degraded
             
         Returns:
             Dictionary containing analysis from each advisor
         """
         self.logger.info(f"Analyzing stock: {symbol}")
         
+        calls = {
+            advisor_id: self.executor.submit(
+                advisor_id,
+                partial(self._analyze_with, advisor, symbol),
+                fallback=lambda advisor=advisor: dict(advisor.analyze(symbol), degraded=True)
+            )
+            for advisor_id, advisor in self.advisors.items()
+        }
+        self.executor.gather(list(calls.values()), deadline)
+        
         analysis = {}
-        for advisor_id, advisor in self.advisors.items():
-            # In a real implementation, you would use TinyTroupe to generate analysis
-            # analysis[advisor_id] = self.advisors[advisor_id].analyze_stock(symbol)
-            
-            # For now, we'll return placeholder analysis
-            advisor_name = advisor['name']
-            expertise = advisor['expertise']
+        for advisor_id, call in calls.items():
+            if call.error is not None:
+                raise call.error
+            analysis[advisor_id] = call.result
+        return analysis
+    
+    def analyze_portfolio(self, portfolio: Dict[str, Any], deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Analyze a whole portfolio once per advisor, rather than once per holding
+        
+        Args:
+            portfolio: Aggregated summary, see ``CompiledPersona.analyze_portfolio``
+            deadline: Request deadline; advisors still working when it expires
+                contribute their template analysis, marked as degraded
             
-            if 'value investing' in expertise:
-                analysis[advisor_id] = {
-                    'name': advisor_name,
-                    'summary': f"From a value investing perspective, {symbol} requires careful fundamental analysis.",
-                    'recommendation': "Need to examine P/E ratio, book value, and cash flow before making a determination."
-                }
-            elif 'macroeconomics' in expertise:
-                analysis[advisor_id] = {
-                    'name': advisor_name,
-                    'summary': f"The macroeconomic environment significantly impacts {symbol}'s prospects.",
-                    'recommendation': "Consider how interest rates and sector trends affect this company's outlook."
-                }
-            elif 'pattern recognition' in expertise:
-                analysis[advisor_id] = {
-                    'name': advisor_name,
-                    'summary': f"Interesting patterns emerge when examining {symbol}'s performance metrics.",
-                    'recommendation': "Look for non-linear relationships between various business factors."
-                }
-            else:
-                analysis[advisor_id] = {
-                    'name': advisor_name,
-                    'summary': f"A fundamental analysis of {symbol} reveals important considerations.",
-                    'recommendation': "Focus on long-term business quality rather than short-term price movements."
-                }
+        Returns:
+            Dictionary containing analysis from each advisor
+        """
+        self.logger.info(f"Analyzing portfolio of {portfolio['holdings']} holdings")
+        
+        calls = {
+            advisor_id: self.executor.submit(
+                advisor_id,
+                partial(self._analyze_portfolio_with, advisor, portfolio),
+                fallback=lambda advisor=advisor: dict(advisor.analyze_portfolio(portfolio), degraded=True)
+            )
+            for advisor_id, advisor in self.advisors.items()
+        }
+        self.executor.gather(list(calls.values()), deadline)
         
+        analysis = {}
+        for advisor_id, call in calls.items():
+            if call.error is not None:
+                raise call.error
+            analysis[advisor_id] = call.result
         return analysis
+    
+    def _analyze_portfolio_with(self, advisor, portfolio: Dict[str, Any]) -> Dict[str, str]:
+        """Make one advisor's portfolio analysis call"""
+        started = time.perf_counter()
+        prompt = f"{advisor.system_prompt}\nAnalyze this portfolio:\n{json.dumps(portfolio, sort_keys=True)}"
+        
+        # For now, we'll return placeholder analysis
+        result = advisor.analyze_portfolio(portfolio)
+        self.usage.record(advisor.id, 'analysis', Config.LLM_MODEL, prompt,
+                          f"{result['summary']} {result['recommendation']}",
+                          (time.perf_counter() - started) * 1000)
+        return result
+    
+    def _analyze_with(self, advisor, symbol: str) -> Dict[str, str]:
+        """Make one advisor's analysis call"""
+        started = time.perf_counter()
+        prompt = f"{advisor.system_prompt}\nAnalyze the stock {symbol}."
+        
+        # In a real implementation, you would use TinyTroupe to generate analysis
+        # result = self.advisors[advisor_id].analyze_stock(symbol)
+        
+        # For now, we'll return placeholder analysis
+        result = advisor.analyze(symbol)
+        self.usage.record(advisor.id, 'analysis', Config.LLM_MODEL, prompt,
+                          f"{result['summary']} {result['recommendation']}",
+                          (time.perf_counter() - started) * 1000)
+        return result
@@ -0,0 +1,162 @@
+"""
+Conversation transcript snapshots for TinyTroupe Service
+"""
+import gzip
+import logging
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import LargeBinary, cast, delete, insert, select, update
+
+from src.config import Config
+from src.extensions import db, db_writer
+from src.models import Conversation, TranscriptSnapshot
+from src.services.message_history import message_history
+
+# Bump when Message.to_dict changes, so snapshots written before are rebuilt
+FORMAT = 1
+
+_snapshots = TranscriptSnapshot.__table__
+_conversations = Conversation.__table__
+
+
+def _encode(message: Dict[str, Any]) -> bytes:
+    return current_app.json.dumps_bytes(message, separators=(',', ':'))
+
+
+class TranscriptStore:
+    """Keeps each conversation's messages serialized, so reading them all is one row read
+
+    A snapshot holds the JSON of messages 1 to ``seq``, comma separated and
+    gzip compressed. Each turn appends its messages as one more gzip member
+    in the transaction that stores them; concatenated members decompress to
+    the concatenated data, so nothing already stored is compressed again.
+    Clients accepting gzip are sent the stored members as they are.
+
+    Messages written without an append, say by a turn whose append found
+    the snapshot behind, are read from the messages table and added after
+    the snapshot. Once that tail grows past ``TRANSCRIPT_MAX_TAIL``, or the
+    snapshot has ``TRANSCRIPT_MAX_MEMBERS`` small members, or it was written
+    in an older ``FORMAT``, the next read rebuilds it in one member.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.rebuilds = 0
+
+    @property
+    def level(self) -> int:
+        return current_app.config.get('COMPRESS_LEVEL', 6)
+
+    def append(self, session, conversation_id: str, messages: List[Dict[str, Any]]) -> bool:
+        """Add messages to the conversation's snapshot in the transaction writing them
+
+        The snapshot is only extended if it ends right before the first of
+        the messages; otherwise it is left for the next read to catch up.
+
+        Args:
+            session: Session of the write transaction
+            conversation_id: ID of the conversation
+            messages: The new messages' dictionaries, in seq order
+
+        Returns:
+            Whether the snapshot now includes the messages
+        """
+        if not Config.TRANSCRIPT_SNAPSHOTS_ENABLED or not messages:
+            return False
+        first = messages[0]['seq']
+        if [message['seq'] for message in messages] != list(range(first, first + len(messages))):
+            return False
+        payload = (b',' if first > 1 else b'') + b','.join(_encode(message) for message in messages)
+        member = gzip.compress(payload, compresslevel=self.level, mtime=0)
+
+        snapshot = _snapshots.c
+        appended = session.execute(update(_snapshots).where(
+            snapshot.conversation_id == conversation_id, snapshot.seq == first - 1, snapshot.format == FORMAT
+        ).values(
+            data=cast(snapshot.data.concat(member), LargeBinary),
+            seq=first + len(messages) - 1,
+            size=snapshot.size + len(payload),
+            members=snapshot.members + 1
+        )).rowcount > 0
+        if appended or first > 1:
+            return appended
+
+        # A conversation's first messages start its snapshot
+        exists = session.execute(select(snapshot.seq).where(snapshot.conversation_id == conversation_id)).first()
+        if exists is not None:
+            return False
+        session.execute(insert(_snapshots).values(conversation_id=conversation_id, seq=len(messages),
+                                                  size=len(payload), members=1, format=FORMAT, data=member))
+        return True
+
+    def rebuild(self, conversation_id: str) -> Tuple[bytes, int]:
+        """Serialize all of a conversation's messages into a new snapshot
+
+        Returns:
+            The compressed data and the seq of the last message in it
+        """
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        parts, seq, size = [], 0, 0
+        for record in message_history.records(conversation_id):
+            chunk = (b',' if seq else b'') + _encode(record.to_dict())
+            parts.append(compressor.compress(chunk))
+            seq, size = record.seq, size + len(chunk)
+        parts.append(compressor.flush())
+        data = b''.join(parts)
+
+        def store(session):
+            session.execute(delete(_snapshots).where(_snapshots.c.conversation_id == conversation_id))
+            session.execute(insert(_snapshots).values(conversation_id=conversation_id, seq=seq, size=size,
+                                                      members=1, format=FORMAT, data=data))
+
+        try:
+            db_writer.run(store)
+            self.rebuilds += 1
+        except Exception as e:
+            # Serve what was read anyway; the next read tries again
+            self.logger.warning(f"Could not store the transcript snapshot of {conversation_id}: {str(e)}")
+        return data, seq
+
+    def _stale(self, row) -> bool:
+        return (row.seq is None
+                or row.format != FORMAT
+                or row.seq > row.last_seq
+                or row.last_seq - row.seq > Config.TRANSCRIPT_MAX_TAIL
+                or row.members > Config.TRANSCRIPT_MAX_MEMBERS)
+
+    def body(self, conversation_id: str, gzip_ok: bool = False) -> Tuple[bytes, Optional[str]]:
+        """All of a conversation's messages as a JSON array, the same as ``jsonify`` would return
+
+        Args:
+            conversation_id: ID of the conversation
+            gzip_ok: Whether the client accepts a gzip encoded body
+
+        Returns:
+            The body and its content encoding, None if it is not encoded
+        """
+        snapshot = _snapshots.c
+        row = db.session.execute(
+            select(_conversations.c.last_seq, snapshot.seq, snapshot.members, snapshot.format, snapshot.data)
+            .select_from(_conversations.outerjoin(_snapshots, snapshot.conversation_id == _conversations.c.id))
+            .where(_conversations.c.id == conversation_id)
+        ).first()
+        if row is None:
+            return b'[]\n', None
+
+        if self._stale(row):
+            data, seq = self.rebuild(conversation_id)
+        else:
+            data, seq = row.data, row.seq
+        tail = b''.join((b',' if seq or position else b'') + _encode(record.to_dict())
+                        for position, record in enumerate(message_history.records(conversation_id, after=seq)))
+
+        if gzip_ok:
+            return (gzip.compress(b'[', compresslevel=self.level, mtime=0) + data
+                    + gzip.compress(tail + b']\n', compresslevel=self.level, mtime=0)), 'gzip'
+        return b'[' + gzip.decompress(data) + tail + b']\n', None
+
+
+# Shared by the routes and the conversation service
+transcript_store = TranscriptStore()
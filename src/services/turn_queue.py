@@ -0,0 +1,132 @@
+"""
+Serialized conversation turns for TinyTroupe Service
+"""
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set
+
+from sqlalchemy import or_
+
+from src.config import Config
+from src.extensions import db_writer
+from src.models import Conversation
+
+
+class TurnInProgress(Exception):
+    """Raised when earlier turns on a conversation are still running after the wait timeout"""
+
+
+class _Line:
+    """Tickets of the turns on one conversation waiting in this process"""
+
+    __slots__ = ('next_ticket', 'serving', 'abandoned')
+
+    def __init__(self):
+        self.next_ticket = 0
+        self.serving = 0
+        self.abandoned: Set[int] = set()
+
+
+class TurnQueue:
+    """Runs the turns on a conversation one at a time, in arrival order
+
+    Across workers, a turn holds a lease stored on the conversation row,
+    claimed with one conditional ``UPDATE`` that only a single claimant can
+    win; the others poll until it is released, or has expired because its
+    worker died. Within a process, turns wait for a ticket first, so they
+    take the lease in the order they arrived without polling.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._lines: Dict[str, _Line] = {}
+        self._ready = threading.Condition()
+
+    def _claim(self, conversation_id: str, token: str) -> bool:
+        now = datetime.utcnow()
+
+        def claim(session):
+            return session.query(Conversation).filter(
+                Conversation.id == conversation_id,
+                or_(Conversation.turn_owner.is_(None), Conversation.turn_expires_at < now)
+            ).update({
+                Conversation.turn_owner: token,
+                Conversation.turn_expires_at: now + timedelta(seconds=Config.TURN_LEASE_SECONDS)
+            }, synchronize_session=False) > 0
+
+        return db_writer.run(claim)
+
+    def _advance(self, conversation_id: str) -> None:
+        """Serve the next ticket still waiting"""
+        with self._ready:
+            line = self._lines[conversation_id]
+            line.serving += 1
+            while line.serving in line.abandoned:
+                line.abandoned.discard(line.serving)
+                line.serving += 1
+            if line.serving == line.next_ticket:
+                del self._lines[conversation_id]
+            self._ready.notify_all()
+
+    def acquire(self, conversation_id: str, timeout: Optional[float] = None) -> str:
+        """Wait for the conversation's earlier turns, then take the lease
+
+        Args:
+            conversation_id: ID of the conversation
+            timeout: Seconds to wait, TURN_WAIT_SECONDS by default
+
+        Returns:
+            Lease token to pass to ``release``
+
+        Raises:
+            TurnInProgress: If the earlier turns did not finish in time
+        """
+        timeout = Config.TURN_WAIT_SECONDS if timeout is None else timeout
+        give_up_at = time.monotonic() + timeout
+        busy = TurnInProgress("An earlier message in this conversation is still being answered, try again later")
+
+        with self._ready:
+            line = self._lines.setdefault(conversation_id, _Line())
+            ticket = line.next_ticket
+            line.next_ticket += 1
+            while line.serving != ticket:
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    line.abandoned.add(ticket)
+                    raise busy
+                self._ready.wait(remaining)
+
+        token = str(uuid.uuid4())
+        try:
+            while not self._claim(conversation_id, token):
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    raise busy
+                time.sleep(min(remaining, Config.TURN_POLL_MS / 1000))
+        except BaseException:
+            self._advance(conversation_id)
+            raise
+        return token
+
+    def release(self, conversation_id: str, token: str) -> None:
+        """Give up the lease and let the next turn run"""
+        def clear(session):
+            session.query(Conversation).filter_by(id=conversation_id, turn_owner=token).update({
+                Conversation.turn_owner: None,
+                Conversation.turn_expires_at: None
+            }, synchronize_session=False)
+
+        try:
+            db_writer.run(clear)
+        except Exception as e:
+            # The lease expiring has the same effect, only later
+            self.logger.warning(f"Could not release the turn lease on {conversation_id}: {str(e)}")
+        finally:
+            self._advance(conversation_id)
+
+
+# Shared by every route, so turns in this process queue in one line
+turn_queue = TurnQueue()
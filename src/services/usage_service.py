@@ -0,0 +1,325 @@
+"""
+LLM usage accounting and budget enforcement
+"""
+import logging
+import math
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import func
+
+from src.config import Config
+from src.extensions import db, db_writer
+from src.models import UsageRecord
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - depends on the environment
+    tiktoken = None
+
+
+class BudgetExceededError(Exception):
+    """Raised when a hard daily token budget has been used up"""
+    
+    def __init__(self, scope: str, subject_id: str, used: int, limit: int):
+        super().__init__(f"Daily token budget exceeded for {scope} {subject_id}: {used} of {limit} tokens used")
+        self.scope = scope
+        self.subject_id = subject_id
+        self.used = used
+        self.limit = limit
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to dictionary"""
+        return {'scope': self.scope, 'id': self.subject_id, 'used': self.used, 'limit': self.limit}
+
+
+class UsageBatch:
+    """Ledger entries recorded for one turn or analysis, for its caller to write"""
+    
+    def __init__(self):
+        self._entries: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._closed = False
+    
+    def add(self, entry: Dict[str, Any]) -> bool:
+        """Add an entry, returning False once the batch is closed"""
+        with self._lock:
+            if self._closed:
+                return False
+            self._entries.append(entry)
+            return True
+    
+    def entries(self) -> List[Dict[str, Any]]:
+        """Entries recorded so far, without removing them"""
+        with self._lock:
+            return list(self._entries)
+    
+    def drain(self) -> List[Dict[str, Any]]:
+        """Remove and return the entries recorded so far"""
+        with self._lock:
+            entries, self._entries = self._entries, []
+        return entries
+    
+    def close(self) -> List[Dict[str, Any]]:
+        """Stop accepting entries and return the ones never drained"""
+        with self._lock:
+            self._closed = True
+            entries, self._entries = self._entries, []
+        return entries
+
+
+# Batch that record() adds to; hedged calls run in a copy of their submitter's context
+_current_batch: ContextVar[Optional[UsageBatch]] = ContextVar('usage_batch', default=None)
+
+
+class UsageService:
+    """Service recording per-call token usage and checking budgets
+    
+    Calls made inside ``collect`` are buffered in that block's batch and
+    written by its caller, normally as part of the write that stores the
+    turn they belong to, so concurrent turns never write each other's
+    entries. Calls recorded outside any batch, or after theirs was closed
+    by a hedged duplicate finishing late, wait in the instance's own buffer
+    for the next ``flush``.
+    """
+    
+    GROUP_COLUMNS = {
+        'user': UsageRecord.user_id,
+        'conversation': UsageRecord.conversation_id,
+        'advisor': UsageRecord.advisor_id,
+        'day': UsageRecord.day,
+        'model': UsageRecord.model,
+    }
+    
+    def __init__(self):
+        """Initialize the usage service"""
+        self.logger = logging.getLogger(__name__)
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.get_encoding('cl100k_base')
+            except Exception:  # pragma: no cover - encoding files unavailable offline
+                self._encoding = None
+    
+    def count_tokens(self, text: str) -> int:
+        """Count tokens with tiktoken when available, else estimate ~4 characters per token"""
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return math.ceil(len(text) / 4)
+    
+    @staticmethod
+    def cost_micros(model: str, prompt_tokens: int, completion_tokens: int) -> int:
+        """Price a call in millionths of a US dollar"""
+        prompt_price, completion_price = Config.LLM_PRICING.get(model, (0.0, 0.0))
+        return round(prompt_tokens * prompt_price + completion_tokens * completion_price)
+    
+    def record(self, advisor_id: str, operation: str, model: str, prompt: str, completion: str,
+               latency_ms: float, user_id: Optional[str] = None, conversation_id: Optional[str] = None) -> None:
+        """Buffer a ledger entry for one LLM call
+        
+        Args:
+            advisor_id: Advisor that answered
+            operation: 'response', 'board' or 'analysis'
+            model: Model used for the call
+            prompt: Prompt text sent to the model
+            completion: Text returned by the model
+            latency_ms: Wall-clock duration of the call
+            user_id: User the call was made for, if any
+            conversation_id: Conversation the call belongs to, if any
+        """
+        self.record_shared([advisor_id], operation, model, prompt, completion, latency_ms, user_id, conversation_id)
+    
+    def record_shared(self, advisor_ids: List[str], operation: str, model: str, prompt: str, completion: str,
+                      latency_ms: float, user_id: Optional[str] = None, conversation_id: Optional[str] = None) -> None:
+        """Buffer ledger entries for one LLM call answered by several advisors, such as an advisory board
+        
+        The call's tokens are split evenly between the advisors, so each
+        one's daily budget is charged its share. Arguments are as for
+        ``record``.
+        """
+        prompt_tokens = self.count_tokens(prompt)
+        completion_tokens = self.count_tokens(completion)
+        now = datetime.utcnow()
+        count = len(advisor_ids)
+        for position, advisor_id in enumerate(advisor_ids):
+            prompt_share = prompt_tokens // count + (position < prompt_tokens % count)
+            completion_share = completion_tokens // count + (position < completion_tokens % count)
+            self._add({
+                'day': now.date(),
+                'created_at': now,
+                'user_id': user_id,
+                'conversation_id': conversation_id,
+                'advisor_id': advisor_id,
+                'operation': operation,
+                'model': model,
+                'prompt_tokens': prompt_share,
+                'completion_tokens': completion_share,
+                'latency_ms': int(latency_ms),
+                'cost_micros': self.cost_micros(model, prompt_share, completion_share),
+                'downgraded': model != Config.LLM_MODEL
+            })
+    
+    def _add(self, entry: Dict[str, Any]) -> None:
+        batch = _current_batch.get()
+        if batch is not None and batch.add(entry):
+            return
+        with self._lock:
+            self._pending.append(entry)
+    
+    @contextmanager
+    def collect(self) -> Iterator[UsageBatch]:
+        """Buffer the calls recorded in this block, and in hedged calls it submits, in a batch of their own
+        
+        Entries the caller has not drained when the block ends move to the
+        instance's buffer rather than being lost.
+        """
+        batch = UsageBatch()
+        token = _current_batch.set(batch)
+        try:
+            yield batch
+        finally:
+            _current_batch.reset(token)
+            leftovers = batch.close()
+            if leftovers:
+                with self._lock:
+                    self._pending.extend(leftovers)
+    
+    def drain(self) -> List[Dict[str, Any]]:
+        """Remove and return the entries recorded outside any batch"""
+        with self._lock:
+            entries = list(self._pending)
+            self._pending.clear()
+        return entries
+    
+    @staticmethod
+    def add_records(session, entries: List[Dict[str, Any]]) -> None:
+        """Add drained ledger entries to a session"""
+        session.add_all([UsageRecord(**entry) for entry in entries])
+    
+    def write(self, entries: List[Dict[str, Any]]) -> None:
+        """Write ledger entries in their own transaction"""
+        if entries:
+            db_writer.run(lambda session: self.add_records(session, entries))
+    
+    def flush(self, batch: Optional[UsageBatch] = None) -> int:
+        """Write a batch's entries, and those recorded outside any batch, in their own transaction
+        
+        Returns:
+            Number of entries written
+        """
+        entries = (batch.drain() if batch is not None else []) + self.drain()
+        self.write(entries)
+        return len(entries)
+    
+    def tokens_used_today(self, user_id: Optional[str] = None, advisor_id: Optional[str] = None) -> int:
+        """Total tokens recorded today for a user or an advisor, including unflushed calls"""
+        today = datetime.utcnow().date()
+        query = db.session.query(
+            func.coalesce(func.sum(UsageRecord.prompt_tokens + UsageRecord.completion_tokens), 0)
+        ).filter(UsageRecord.day == today)
+        if user_id is not None:
+            query = query.filter(UsageRecord.user_id == user_id)
+        if advisor_id is not None:
+            query = query.filter(UsageRecord.advisor_id == advisor_id)
+        used = query.scalar()
+        
+        with self._lock:
+            pending = list(self._pending)
+        batch = _current_batch.get()
+        if batch is not None:
+            pending.extend(batch.entries())
+        used += sum(
+            entry['prompt_tokens'] + entry['completion_tokens'] for entry in pending
+            if entry['day'] == today
+            and (user_id is None or entry['user_id'] == user_id)
+            and (advisor_id is None or entry['advisor_id'] == advisor_id)
+        )
+        return used
+    
+    def _check(self, scope: str, subject_id: str, soft: int, hard: int, **filters) -> bool:
+        if not soft and not hard:
+            return False
+        used = self.tokens_used_today(**filters)
+        if hard and used >= hard:
+            raise BudgetExceededError(scope, subject_id, used, hard)
+        return bool(soft and used >= soft)
+    
+    def check_user_budget(self, user_id: str) -> bool:
+        """Check a user's daily budget
+        
+        Returns:
+            True if the user's turns should be downgraded
+            
+        Raises:
+            BudgetExceededError: If the user's hard budget is used up
+        """
+        return self._check('user', user_id, Config.USAGE_USER_SOFT_DAILY_TOKENS,
+                           Config.USAGE_USER_HARD_DAILY_TOKENS, user_id=user_id)
+    
+    def check_advisor_budget(self, advisor_id: str) -> bool:
+        """Check an advisor's daily budget
+        
+        Returns:
+            True if the advisor's calls should be downgraded
+            
+        Raises:
+            BudgetExceededError: If the advisor's hard budget is used up
+        """
+        return self._check('advisor', advisor_id, Config.USAGE_ADVISOR_SOFT_DAILY_TOKENS,
+                           Config.USAGE_ADVISOR_HARD_DAILY_TOKENS, advisor_id=advisor_id)
+    
+    def summarize(self, group_by: str, since: Optional[date] = None, until: Optional[date] = None,
+                  **filters: Optional[str]) -> List[Dict[str, Any]]:
+        """Aggregate the ledger
+        
+        Args:
+            group_by: One of 'user', 'conversation', 'advisor', 'day' or 'model'
+            since: First day to include
+            until: Last day to include
+            **filters: Optional user_id, conversation_id or advisor_id to restrict to
+            
+        Returns:
+            One row of totals per group, largest token spend first
+        """
+        if group_by not in self.GROUP_COLUMNS:
+            raise ValueError(f"Cannot group usage by {group_by}")
+        
+        column = self.GROUP_COLUMNS[group_by]
+        total_tokens = func.sum(UsageRecord.prompt_tokens + UsageRecord.completion_tokens)
+        query = db.session.query(
+            column,
+            func.count(UsageRecord.id),
+            func.sum(UsageRecord.prompt_tokens),
+            func.sum(UsageRecord.completion_tokens),
+            total_tokens,
+            func.sum(UsageRecord.cost_micros),
+            func.avg(UsageRecord.latency_ms),
+            func.sum(db.case((UsageRecord.downgraded, 1), else_=0))
+        )
+        if since is not None:
+            query = query.filter(UsageRecord.day >= since)
+        if until is not None:
+            query = query.filter(UsageRecord.day <= until)
+        for name, value in filters.items():
+            if value is not None:
+                query = query.filter(getattr(UsageRecord, name) == value)
+        query = query.group_by(column).order_by(total_tokens.desc())
+        
+        return [{
+            group_by: key.isoformat() if isinstance(key, date) else key,
+            'calls': calls,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': tokens,
+            'cost_usd': (cost or 0) / 1_000_000,
+            'avg_latency_ms': round(latency or 0, 1),
+            'downgraded_calls': downgraded
+        } for key, calls, prompt_tokens, completion_tokens, tokens, cost, latency, downgraded in query]
@@ -0,0 +1,90 @@
+"""
+Watchlist service
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, List
+
+from sqlalchemy import func
+
+from src.config import Config
+from src.extensions import cache, db_writer
+from src.models import WatchlistItem
+from src.services.symbol_master import symbol_master
+
+
+class WatchlistService:
+    """Service managing the symbols each user watches"""
+
+    def __init__(self):
+        """Initialize the watchlist service"""
+        self.logger = logging.getLogger(__name__)
+        self.symbols = symbol_master
+        self.quotes = cache.namespace('quotes')
+
+    def list(self, user_id: str) -> List[Dict[str, Any]]:
+        """Get a user's watched symbols with their cached quotes
+
+        Quotes are only read from the cache, never fetched, so an entry
+        without a quote is one the next pre-warm run has not reached yet.
+
+        Args:
+            user_id: ID of the user
+
+        Returns:
+            Watched symbols in alphabetical order
+        """
+        items = WatchlistItem.query.filter_by(user_id=user_id).order_by(WatchlistItem.symbol).all()
+        return [dict(item.to_dict(), quote=self.quotes.get(item.symbol)) for item in items]
+
+    def add(self, user_id: str, symbols: List[str]) -> List[Dict[str, Any]]:
+        """Watch symbols; symbols already watched are left as they are
+
+        Args:
+            user_id: ID of the user
+            symbols: Symbols to watch
+
+        Returns:
+            The user's whole watchlist
+
+        Raises:
+            ValueError: If a symbol is malformed or unknown, or the watchlist would grow
+                beyond WATCHLIST_MAX_SYMBOLS
+        """
+        if not isinstance(symbols, list) or not symbols or not all(isinstance(symbol, str) for symbol in symbols):
+            raise ValueError("symbols must be a non-empty list of ticker symbols")
+        normalized = sorted({self.symbols.validate(symbol) for symbol in symbols})
+
+        def watch(session):
+            watched = {symbol for (symbol,) in session.query(WatchlistItem.symbol).filter_by(user_id=user_id)}
+            added = [symbol for symbol in normalized if symbol not in watched]
+            if len(watched) + len(added) > Config.WATCHLIST_MAX_SYMBOLS:
+                raise ValueError(f"A watchlist can hold at most {Config.WATCHLIST_MAX_SYMBOLS} symbols")
+            now = datetime.utcnow()
+            session.add_all(WatchlistItem(user_id=user_id, symbol=symbol, created_at=now) for symbol in added)
+            return added
+
+        added = db_writer.run(watch)
+        if added:
+            self.logger.info(f"User {user_id} now watches {', '.join(added)}")
+        return self.list(user_id)
+
+    def remove(self, user_id: str, symbol: str) -> bool:
+        """Stop watching a symbol
+
+        Returns:
+            Whether the symbol was being watched
+        """
+        symbol = (symbol or '').strip().upper()
+
+        def unwatch(session):
+            return session.query(WatchlistItem).filter_by(user_id=user_id, symbol=symbol).delete() > 0
+
+        return db_writer.run(unwatch)
+
+    def watched_symbols(self) -> List[Dict[str, Any]]:
+        """Every watched symbol with its number of watchers, most watched first"""
+        watchers = func.count(WatchlistItem.user_id)
+        rows = (WatchlistItem.query.with_entities(WatchlistItem.symbol, watchers)
+                .group_by(WatchlistItem.symbol).order_by(watchers.desc(), WatchlistItem.symbol).all())
+        return [{'symbol': symbol, 'watchers': count} for symbol, count in rows]
@@ -0,0 +1,17 @@
+"""
+Server-Sent Events helpers for TinyTroupe Service
+"""
+from flask import Response, current_app, stream_with_context
+
+KEEP_ALIVE = ': keep-alive\n\n'
+
+
+def sse_frame(event, payload):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {current_app.json.dumps(payload)}\n\n"
+
+
+def event_stream(frames, headers=None):
+    """Wrap an iterator of SSE frames in an unbuffered streaming response"""
+    return Response(stream_with_context(frames), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', **(headers or {})})
@@ -1,4 +1,13 @@
 """
 Test initialization
 """
-# This file intentionally left empty to make the directory a proper Python package
+import atexit
+import os
+import shutil
+import tempfile
+
+# Point the app at a throwaway database file before src.main creates it and its extensions; a file rather
+# than :memory: because the concurrency tests use several connections at once
+_database_dir = tempfile.mkdtemp(prefix='tinytroupe-tests-')
+os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(_database_dir, 'tinytroupe.db')}"
+atexit.register(shutil.rmtree, _database_dir, True)
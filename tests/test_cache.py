@@ -0,0 +1,234 @@
+"""
+Test script for TinyTroupe Service cache backends
+"""
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+import threading
+import socketserver
+import time
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.cache import Cache, LRUCache, SQLiteCache, RedisCache
+
+
+class RedisStandIn(socketserver.ThreadingTCPServer):
+    """Tiny in-memory server speaking enough RESP for RedisCache"""
+    allow_reuse_address = True
+    daemon_threads = True
+    
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RedisStandInHandler)
+        self.data = {}
+        self.lock = threading.Lock()
+
+
+class RedisStandInHandler(socketserver.StreamRequestHandler):
+    """Handle GET, SET (PX/NX), DEL and SCAN"""
+    
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+    
+    def handle(self):
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            self.wfile.write(self.execute(args[0].upper(), args[1:]))
+    
+    def execute(self, command, args):
+        server = self.server
+        with server.lock:
+            now = time.monotonic()
+            for key in [k for k, (_, expires) in server.data.items() if expires and expires <= now]:
+                del server.data[key]
+            if command == b'GET':
+                entry = server.data.get(args[0])
+                return b'$-1\r\n' if entry is None else b'$%d\r\n%s\r\n' % (len(entry[0]), entry[0])
+            if command == b'SET':
+                options = [a.upper() for a in args[2:]]
+                if b'NX' in options and args[0] in server.data:
+                    return b'$-1\r\n'
+                expires = None
+                if b'PX' in options:
+                    expires = now + int(args[2:][options.index(b'PX') + 1]) / 1000
+                server.data[args[0]] = (args[1], expires)
+                return b'+OK\r\n'
+            if command == b'DEL':
+                removed = sum(server.data.pop(key, None) is not None for key in args)
+                return b':%d\r\n' % removed
+            if command == b'SCAN':
+                prefix = args[2].rstrip(b'*')
+                keys = [k for k in server.data if k.startswith(prefix)]
+                return b'*2\r\n$1\r\n0\r\n*%d\r\n' % len(keys) + b''.join(
+                    b'$%d\r\n%s\r\n' % (len(k), k) for k in keys)
+        return b'-ERR unknown command\r\n'
+
+
+class CacheBackendTests(unittest.TestCase):
+    """Behaviour shared by every backend"""
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.server = RedisStandIn()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address
+        self.backends = {
+            'lru': LRUCache(max_entries=100),
+            'sqlite': SQLiteCache(os.path.join(self.test_dir, 'cache.sqlite3')),
+            'redis': RedisCache(f'redis://{host}:{port}/0'),
+        }
+    
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.test_dir)
+    
+    def test_set_get_delete(self):
+        """Test round-tripping values including cached None"""
+        for name, backend in self.backends.items():
+            with self.subTest(backend=name):
+                backend.set('quote', {'symbol': 'AAPL', 'price': 150.0})
+                backend.set('empty', None)
+                self.assertEqual(backend.get('quote'), {'symbol': 'AAPL', 'price': 150.0})
+                self.assertEqual(backend.lookup('empty'), (True, None))
+                self.assertEqual(backend.lookup('missing'), (False, None))
+                backend.delete('quote')
+                self.assertIsNone(backend.get('quote'))
+                backend.clear()
+                self.assertEqual(backend.lookup('empty'), (False, None))
+    
+    def test_values_are_not_shared_with_callers(self):
+        """Test that changing a stored or returned value leaves the cached one alone, on every backend"""
+        for name, backend in self.backends.items():
+            with self.subTest(backend=name):
+                value = {'symbol': 'AAPL', 'history': [1, 2]}
+                backend.set('quote', value)
+                value['history'].append(3)
+                backend.get('quote')['history'].append(4)
+                self.assertEqual(backend.get('quote'), {'symbol': 'AAPL', 'history': [1, 2]})
+    
+    def test_ttl_and_add(self):
+        """Test expiry and add-if-absent semantics"""
+        for name, backend in self.backends.items():
+            with self.subTest(backend=name):
+                self.assertTrue(backend.add('lock', 1, ttl=0.05))
+                self.assertFalse(backend.add('lock', 2, ttl=0.05))
+                time.sleep(0.1)
+                self.assertIsNone(backend.get('lock'))
+                self.assertTrue(backend.add('lock', 3, ttl=1))
+    
+    def test_sqlite_shared_between_instances(self):
+        """Test that two workers opening the same file see each other's writes"""
+        path = os.path.join(self.test_dir, 'cache.sqlite3')
+        worker_a, worker_b = SQLiteCache(path), SQLiteCache(path)
+        worker_a.set('analysis:AAPL', {'summary': 'x' * 10000})
+        self.assertEqual(worker_b.get('analysis:AAPL'), {'summary': 'x' * 10000})
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted first"""
+        backend = LRUCache(max_entries=2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.get('a')
+        backend.set('c', 3)
+        self.assertEqual(backend.get('a'), 1)
+        self.assertIsNone(backend.get('b'))
+        
+        # add() is bounded the same way
+        for i in range(5):
+            self.assertTrue(backend.add(f'added-{i}', i))
+        self.assertEqual(len(backend._data), 2)
+        self.assertEqual(backend.get('added-4'), 4)
+        self.assertIsNone(backend.get('a'))
+
+
+class CacheNamespaceTests(unittest.TestCase):
+    """Test namespaces and stampede protection"""
+    
+    def test_namespace_ttl_from_config(self):
+        """Test that namespaces pick up their configured TTL"""
+        cache = Cache()
+        cache.ttls = {'quotes': 60}
+        self.assertEqual(cache.namespace('quotes').ttl, 60)
+        self.assertEqual(cache.namespace('other').ttl, cache.default_ttl)
+        self.assertEqual(cache.namespace('quotes', ttl=5).ttl, 5)
+        
+        quotes = cache.namespace('quotes')
+        quotes.set('AAPL', 1)
+        self.assertEqual(cache.backend.get('quotes:AAPL'), 1)
+    
+    def test_get_or_set_computes_once(self):
+        """Test that concurrent misses run the creator only once"""
+        cache = Cache()
+        calls = []
+        
+        def creator():
+            calls.append(1)
+            time.sleep(0.1)
+            return {'price': 1.0}
+        
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.namespace('quotes').get_or_set('AAPL', creator)))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'price': 1.0}] * 10)
+    
+    def test_get_or_set_does_not_hold_the_stripe_while_computing(self):
+        """Test that a slow miss does not hold up a miss on another key of the same lock stripe"""
+        cache = Cache()
+        cache.LOCK_STRIPES = 1
+        cache._stripes = [threading.Lock()]
+        computing, release = threading.Event(), threading.Event()
+        
+        def slow():
+            computing.set()
+            release.wait(5)
+            return 'slow'
+        
+        thread = threading.Thread(target=lambda: cache.get_or_set('a', slow))
+        thread.start()
+        try:
+            self.assertTrue(computing.wait(5))
+            started = time.monotonic()
+            self.assertEqual(cache.get_or_set('b', lambda: 'fast'), 'fast')
+            self.assertLess(time.monotonic() - started, 1)
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(cache.get_or_set('a', lambda: 'again'), 'slow')
+    
+    def test_get_or_set_skips_uncacheable_values(self):
+        """Test that values rejected by ``cacheable`` are returned but never stored"""
+        cache = Cache()
+        analyses = cache.namespace('analysis')
+        complete = lambda value: not value.get('degraded')
+        
+        self.assertEqual(analyses.get_or_set('AAPL', lambda: {'degraded': True}, cacheable=complete),
+                         {'degraded': True})
+        self.assertIsNone(analyses.get('AAPL'))
+        self.assertEqual(analyses.get_or_set('AAPL', lambda: {'degraded': False}, cacheable=complete),
+                         {'degraded': False})
+        self.assertEqual(analyses.get('AAPL'), {'degraded': False})
+
+
+if __name__ == '__main__':
+    unittest.main()
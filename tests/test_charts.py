@@ -0,0 +1,118 @@
+"""
+Test script for TinyTroupe chart series downsampling
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import app
+from src.extensions import cache
+from src.services.downsampling import decode_series, downsample, encode_series, lttb, minmax
+from src.services.price_history import BAR_DTYPE, PriceHistoryStore
+
+
+def make_walk(days, seed=7, start='2015-01-01'):
+    """Build a random-walk daily series"""
+    closes = 100 * np.exp(np.cumsum(np.random.default_rng(seed).normal(0, 0.01, days)))
+    bars = np.zeros(days, dtype=BAR_DTYPE)
+    bars['date'] = np.datetime64(start, 'D') + np.arange(days)
+    bars['open'] = bars['close'] = closes
+    bars['high'] = closes * 1.01
+    bars['low'] = closes * 0.99
+    bars['volume'] = 1000
+    return bars
+
+
+class DownsamplingTests(unittest.TestCase):
+    """Test cases for LTTB and min-max downsampling"""
+    
+    def test_lttb(self):
+        """Test that LTTB keeps the end points, one point per bucket and an isolated spike"""
+        y = np.sin(np.linspace(0, 20, 10000))
+        y[4321] = 50
+        indices = lttb(y, 500)
+        self.assertEqual(len(indices), 500)
+        self.assertEqual((indices[0], indices[-1]), (0, 9999))
+        self.assertTrue((np.diff(indices) > 0).all())
+        self.assertIn(4321, indices)
+        np.testing.assert_array_equal(lttb(y[:100], 200), np.arange(100))
+    
+    def test_minmax(self):
+        """Test that min-max bucketing keeps every bucket's extremes"""
+        y = np.random.default_rng(3).normal(size=10001)
+        indices = minmax(y, 100)
+        self.assertLessEqual(len(indices), 202)
+        self.assertIn(int(np.argmax(y)), indices)
+        self.assertIn(int(np.argmin(y)), indices)
+        self.assertEqual((indices[0], indices[-1]), (0, 10000))
+        with self.assertRaises(ValueError):
+            downsample(make_walk(10), 5, 'cubic')
+    
+    def test_base64_round_trip(self):
+        """Test that the compact encoding decodes to float32 columns and days"""
+        bars = make_walk(50)
+        decoded = decode_series(encode_series(bars, 'base64'))
+        np.testing.assert_array_equal(decoded['date'], bars['date'])
+        np.testing.assert_allclose(decoded['close'], bars['close'], rtol=1e-6)
+        self.assertEqual(encode_series(bars[:1])['date'], ['2015-01-01'])
+
+
+class ChartEndpointTests(unittest.TestCase):
+    """Test cases for the chart series endpoint"""
+    
+    def setUp(self):
+        """Set up a store with ten years of one symbol"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.root = tempfile.mkdtemp()
+        self.patcher = patch('src.config.Config.PRICE_HISTORY_PATH', self.root)
+        self.patcher.start()
+        cache.clear()
+        self.store = PriceHistoryStore(self.root)
+        self.store.append('SPY', make_walk(3650))
+    
+    def tearDown(self):
+        """Remove the store files"""
+        self.patcher.stop()
+        shutil.rmtree(self.root)
+    
+    def test_chart_endpoint(self):
+        """Test ranges, widths, encodings and caching until the series changes"""
+        response = self.client.get('/api/financial-data/spy/chart?range=max&width=300')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual((data['bars'], data['points'], data['method']), (3650, 300, 'lttb'))
+        self.assertEqual(data['series']['date'][0], '2015-01-01')
+        
+        data = json.loads(self.client.get('/api/financial-data/SPY/chart?range=1y&width=200&method=minmax'
+                                          '&encoding=base64').data)
+        self.assertEqual(data['bars'], 367)
+        decoded = decode_series(data['series'])
+        self.assertEqual(len(decoded['close']), data['points'])
+        self.assertEqual(str(decoded['date'][-1]), '2024-12-28')
+        
+        with patch('src.services.financial_service.downsample', wraps=downsample) as spy:
+            self.client.get('/api/financial-data/SPY/chart?range=1y&width=200&method=minmax&encoding=base64')
+            self.assertEqual(spy.call_count, 0)
+            self.store.append('SPY', make_walk(1, start='2024-12-29'))
+            data = json.loads(self.client.get('/api/financial-data/SPY/chart?range=1y&width=200&method=minmax'
+                                              '&encoding=base64').data)
+            self.assertEqual(spy.call_count, 1)
+        self.assertEqual(str(decode_series(data['series'])['date'][-1]), '2024-12-29')
+        
+        self.assertEqual(self.client.get('/api/financial-data/IBM/chart').status_code, 404)
+        for query in ('range=10d', 'width=1', 'method=cubic', 'encoding=xml'):
+            self.assertEqual(self.client.get(f'/api/financial-data/SPY/chart?{query}').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,10 +4,11 @@ Test script for TinyTroupe Service CLI interface
 import os
 import sys
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, ANY
 import json
 import tempfile
 import shutil
+import requests
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -144,9 +145,8 @@ class TinyTroupeCLITests(unittest.TestCase):
     @patch('requests.post')
     def test_send_message(self, mock_post):
         """Test sending a message"""
-        # Mock API response
-        mock_response = MagicMock()
-        mock_response.json.return_value = {
+        # Mock streamed API response
+        turn = {
             'user_message': {
                 'id': '12345678-1234-5678-1234-567812345678',
                 'conversation_id': '87654321-8765-4321-8765-432187654321',
@@ -171,6 +171,14 @@ class TinyTroupeCLITests(unittest.TestCase):
                 }
             ]
         }
+        events = [('user_message', turn['user_message'])]
+        events += [('advisor_response', response) for response in turn['advisor_responses']]
+        events.append(('done', turn))
+        lines = [': keep-alive', '']
+        for event, data in events:
+            lines += [f'event: {event}', f'data: {json.dumps(data)}', '']
+        mock_response = MagicMock()
+        mock_response.iter_lines.return_value = iter(lines)
         mock_response.raise_for_status = MagicMock()
         mock_post.return_value = mock_response
         
@@ -179,9 +187,12 @@ class TinyTroupeCLITests(unittest.TestCase):
         
         # Verify API was called correctly
         mock_post.assert_called_once_with(
-            "http://localhost:5000/api/conversations/87654321-8765-4321-8765-432187654321/messages",
-            json={"content": "Test message"}
+            "http://localhost:5000/api/conversations/87654321-8765-4321-8765-432187654321/messages/stream",
+            json={"content": "Test message"},
+            headers={"Idempotency-Key": ANY},
+            stream=True
         )
+        mock_response.close.assert_called_once()
         
         # Verify result
         self.assertEqual(result['user_message']['content'], 'Test message')
@@ -189,6 +200,22 @@ class TinyTroupeCLITests(unittest.TestCase):
         self.assertEqual(result['advisor_responses'][0]['advisor_name'], 'Warren Buffett')
         self.assertEqual(result['advisor_responses'][1]['advisor_name'], 'Albert Einstein')
     
+    @patch('time.sleep')
+    @patch('requests.post')
+    def test_send_message_retries_with_same_key(self, mock_post, mock_sleep):
+        """Test that a message is resent with the same idempotency key after a connection error"""
+        turn = {'user_message': {'content': 'Test message'}, 'advisor_responses': []}
+        mock_response = MagicMock()
+        mock_response.iter_lines.return_value = iter(['event: done', f'data: {json.dumps(turn)}', ''])
+        mock_post.side_effect = [requests.ConnectionError('connection reset'), mock_response]
+        
+        result = self.cli.send_message("87654321-8765-4321-8765-432187654321", "Test message")
+        
+        self.assertEqual(result, turn)
+        self.assertEqual(mock_post.call_count, 2)
+        keys = [call.kwargs['headers']['Idempotency-Key'] for call in mock_post.call_args_list]
+        self.assertEqual(keys[0], keys[1])
+    
     @patch('requests.get')
     def test_analyze_stock(self, mock_get):
         """Test analyzing a stock"""
@@ -241,6 +268,131 @@ class TinyTroupeCLITests(unittest.TestCase):
         self.assertEqual(len(history['analyses']), 1)
         self.assertEqual(history['analyses'][0]['symbol'], 'AAPL')
     
+    @patch('requests.get')
+    def test_stream_quotes(self, mock_get):
+        """Test following live quotes"""
+        mock_response = MagicMock(status_code=200)
+        mock_response.iter_lines.return_value = iter([
+            ': keep-alive',
+            'event: quote',
+            'data: {"symbol": "AAPL", "price": 180.5, "change_percent": 1.2}',
+            '',
+            'event: quote',
+            'data: {"symbol": "AAPL", "price": 180.75, "change_percent": 1.34}',
+            '',
+            'event: quote',
+            'data: {"symbol": "AAPL", "price": 181.0, "change_percent": 1.48}',
+            ''
+        ])
+        mock_get.return_value = mock_response
+        
+        quotes = self.cli.stream_quotes("AAPL", count=2)
+        
+        mock_get.assert_called_once_with(
+            "http://localhost:5000/api/financial-data/AAPL/stream",
+            stream=True
+        )
+        self.assertEqual([quote['price'] for quote in quotes], [180.5, 180.75])
+        mock_response.close.assert_called_once()
+    
+    @patch('requests.get')
+    @patch('requests.post')
+    def test_watch(self, mock_post, mock_get):
+        """Test adding symbols to the watchlist and showing it"""
+        mock_post.return_value = MagicMock(status_code=200)
+        mock_response = MagicMock()
+        mock_response.json.return_value = [
+            {'user_id': 'default_user', 'symbol': 'AAPL', 'created_at': '2024-03-01T08:00:00',
+             'quote': {'symbol': 'AAPL', 'price': 180.5, 'change_percent': 1.2}},
+            {'user_id': 'default_user', 'symbol': 'KO', 'created_at': '2024-03-01T08:00:00', 'quote': None}
+        ]
+        mock_response.raise_for_status = MagicMock()
+        mock_get.return_value = mock_response
+        
+        watchlist = self.cli.watch(add=['AAPL', 'KO'])
+        
+        mock_post.assert_called_once_with(
+            "http://localhost:5000/api/watchlist",
+            json={'user_id': 'default_user', 'symbols': ['AAPL', 'KO']}
+        )
+        mock_get.assert_called_once_with(
+            "http://localhost:5000/api/watchlist",
+            params={'user_id': 'default_user'}
+        )
+        self.assertEqual([item['symbol'] for item in watchlist], ['AAPL', 'KO'])
+    
+    @patch('requests.get')
+    def test_search_symbols(self, mock_get):
+        """Test looking up symbols by prefix"""
+        mock_response = MagicMock()
+        mock_response.json.return_value = {
+            'prefix': 'app', 'universe': 2,
+            'results': [{'symbol': 'AAPL', 'name': 'Apple Inc.', 'exchange': 'NASDAQ'}]
+        }
+        mock_response.raise_for_status = MagicMock()
+        mock_get.return_value = mock_response
+        
+        result = self.cli.search_symbols('app', limit=5)
+        
+        mock_get.assert_called_once_with(
+            "http://localhost:5000/api/financial-data/symbols",
+            params={'prefix': 'app', 'limit': 5}
+        )
+        self.assertEqual(result['results'][0]['symbol'], 'AAPL')
+    
+    @patch('requests.get')
+    def test_screen(self, mock_get):
+        """Test screening stocks with filters, sorting and paging"""
+        mock_response = MagicMock()
+        mock_response.json.return_value = {
+            'total': 3, 'offset': 2, 'limit': 2, 'universe': 500,
+            'results': [{
+                'symbol': 'KO', 'price': 60.0, 'change': 0.1, 'change_percent': 0.2, 'market_cap': 2.6e11,
+                'pe_ratio': 14.0, 'dividend_yield': 3.1, '52_week_high': 64.0, '52_week_low': 55.0,
+                'range_position': 0.56
+            }]
+        }
+        mock_response.raise_for_status = MagicMock()
+        mock_get.return_value = mock_response
+        
+        result = self.cli.screen({'pe_lt': '15'}, sort='-dividend_yield', limit=2, page=2)
+        
+        mock_get.assert_called_once_with(
+            "http://localhost:5000/api/financial-data/screen",
+            params={'pe_lt': '15', 'limit': 2, 'offset': 2, 'sort': '-dividend_yield'}
+        )
+        self.assertEqual(result['results'][0]['symbol'], 'KO')
+    
+    @patch.dict(os.environ, {'TINYTROUPE_ADMIN_TOKEN': 'secret'})
+    @patch('requests.post')
+    def test_ingest(self, mock_post):
+        """Test ingesting market data files through the admin endpoint"""
+        mock_response = MagicMock()
+        mock_response.json.return_value = {
+            'files': [{'path': '/data/ingest/2024-03-01.csv', 'status': 'ingested', 'resumed': True,
+                       'rows': 8000, 'written': 7990, 'rejected': 10, 'duplicates': 0, 'stale': 0, 'seconds': 0.8}],
+            'totals': {'rows': 8000, 'written': 7990, 'rejected': 10, 'duplicates': 0, 'stale': 0,
+                       'failed': 0, 'seconds': 0.8}
+        }
+        mock_response.raise_for_status = MagicMock()
+        mock_post.return_value = mock_response
+        
+        result = self.cli.ingest(['2024-03-01.csv'], workers=2)
+        
+        mock_post.assert_called_once_with(
+            "http://localhost:5000/api/admin/ingest",
+            json={'paths': ['2024-03-01.csv'], 'restart': False, 'workers': 2},
+            headers={'X-Admin-Token': 'secret'}
+        )
+        self.assertEqual(result['totals']['written'], 7990)
+        
+        # The header name follows the server's ADMIN_TOKEN_HEADER, or an explicit option
+        with patch.dict(os.environ, {'ADMIN_TOKEN_HEADER': 'X-Ops-Token'}):
+            self.cli.ingest(['2024-03-01.csv'])
+            self.assertEqual(mock_post.call_args.kwargs['headers'], {'X-Ops-Token': 'secret'})
+            self.cli.ingest(['2024-03-01.csv'], token_header='X-Proxy-Token')
+            self.assertEqual(mock_post.call_args.kwargs['headers'], {'X-Proxy-Token': 'secret'})
+    
     def test_configure(self):
         """Test configuring the CLI"""
         # Call method
@@ -0,0 +1,224 @@
+"""
+Test script for TinyTroupe concurrent turns and versioned writes
+"""
+import os
+import sys
+import json
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import text, update
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import app, db
+from src.database import ConcurrentUpdateError
+from src.extensions import cache, db_writer
+from src.models import Conversation, Message, Persona, PersonaState
+from src.routes.conversation import conversation_service
+from src.services.hedging import hedged_executor
+from src.services.response_reuse import response_reuse
+from src.services.turn_queue import turn_queue
+
+
+def slow_response(advisor_id, message, *args, **kwargs):
+    """Answer slowly enough for concurrent turns to overlap"""
+    time.sleep(0.05)
+    return f"{advisor_id} on {message}"
+
+
+class ConcurrencyTests(unittest.TestCase):
+    """Test cases for optimistic concurrency and serialized turns"""
+    
+    def setUp(self):
+        """Set up a conversation with two advisors"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        cache.clear()
+        conversation_service.usage.drain()
+        response_reuse.clear()
+        
+        with app.app_context():
+            db.create_all()
+            for advisor_id in ('warren_buffett', 'peter_lynch'):
+                db.session.add(Persona(id=advisor_id, name=advisor_id.replace('_', ' ').title(),
+                                       description='Investor.', personality={}, expertise=['investing']))
+            db.session.commit()
+        
+        response = self.client.post('/api/conversations', json={'title': 'Race', 'user_id': 'test_user',
+                                                                'settings': {'routing': {'mode': 'all'}}})
+        self.conversation_id = json.loads(response.data)['id']
+    
+    def tearDown(self):
+        """Clean up after tests"""
+        # The slow answers must not make later tests hedge their calls
+        hedged_executor.latencies.clear()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+    
+    def send_concurrently(self, count):
+        """Post ``count`` messages to the conversation at once, returning the status codes"""
+        statuses = []
+        
+        def send(number):
+            response = app.test_client().post(f'/api/conversations/{self.conversation_id}/messages',
+                                              json={'content': f'Question {number} about dividends?'})
+            statuses.append(response.status_code)
+        
+        with patch('src.services.tinytroupe_service.TinyTroupeService.get_response', side_effect=slow_response):
+            threads = [threading.Thread(target=send, args=(number,)) for number in range(count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return statuses
+    
+    def test_conflicting_write_is_retried_on_fresh_state(self):
+        """Test that a write losing the race re-reads the persona state instead of overwriting it"""
+        with app.app_context():
+            state_id = PersonaState.query.filter_by(conversation_id=self.conversation_id).first().id
+            attempts = []
+            
+            def write(session):
+                state = session.get(PersonaState, state_id, populate_existing=True)
+                notes = state.memory_state.get('notes', []) + ['mine']
+                if not attempts:
+                    # Another worker commits between our read and our write
+                    with db.engine.begin() as connection:
+                        connection.execute(update(PersonaState.__table__)
+                                           .where(PersonaState.__table__.c.id == state_id)
+                                           .values(memory_state={'notes': ['theirs']},
+                                                   version=PersonaState.__table__.c.version + 1))
+                attempts.append(state.version)
+                state.memory_state = dict(state.memory_state, notes=notes)
+                session.flush()
+            
+            db_writer.run_versioned(write)
+            db.session.remove()
+            state = db.session.get(PersonaState, state_id)
+            self.assertEqual(attempts, [1, 2])
+            self.assertEqual(state.memory_state['notes'], ['theirs', 'mine'])
+            self.assertEqual(state.version, 3)
+            
+            def always_conflicting(session):
+                attempts.append(session.get(PersonaState, state_id, populate_existing=True).version)
+                session.execute(update(PersonaState.__table__).where(PersonaState.__table__.c.id == state_id)
+                                .values(version=PersonaState.__table__.c.version + 1))
+                session.get(PersonaState, state_id).memory_state = {'notes': []}
+                session.flush()
+            
+            del attempts[:]
+            with self.assertRaises(ConcurrentUpdateError):
+                db_writer.run_versioned(always_conflicting, retries=2)
+            self.assertEqual(len(attempts), 3)
+    
+    def test_concurrent_turns_keep_every_memory(self):
+        """Test that overlapping turns each add their exchange to every persona's memory"""
+        self.assertEqual(self.send_concurrently(4), [201] * 4)
+        
+        with app.app_context():
+            for state in PersonaState.query.filter_by(conversation_id=self.conversation_id):
+                answers = Message.query.filter_by(conversation_id=self.conversation_id,
+                                                  advisor_id=state.persona_id).count()
+                self.assertEqual(answers, 4)
+                self.assertEqual(state.memory_state['memory_size'], 4)
+                self.assertEqual(state.version, 5)
+    
+    def test_messages_are_numbered_gaplessly(self):
+        """Test that concurrent turns get distinct, consecutive seqs, each turn's replies together"""
+        self.send_concurrently(3)
+        
+        messages = json.loads(self.client.get(f'/api/conversations/{self.conversation_id}/messages').data)
+        self.assertEqual([message['seq'] for message in messages], list(range(1, 10)))
+        replies = {}
+        for message in messages:
+            if message['role'] == 'advisor':
+                replies.setdefault(message['content'].split(' on ')[1], []).append(message['seq'])
+        for seqs in replies.values():
+            self.assertEqual(seqs, [seqs[0], seqs[0] + 1])
+        
+        with app.app_context():
+            self.assertEqual(db.session.get(Conversation, self.conversation_id).last_seq, 9)
+            plan = ' '.join(str(row[-1]) for row in db.session.execute(text(
+                'EXPLAIN QUERY PLAN SELECT * FROM messages WHERE conversation_id = :id AND seq > 0 ORDER BY seq'
+            ), {'id': self.conversation_id}))
+            self.assertIn('ix_messages_conversation_seq', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+    
+    def test_message_pages(self):
+        """Test paging through messages with a seq cursor"""
+        with app.app_context():
+            for number in range(5):
+                db.session.add(Message(conversation_id=self.conversation_id, role='user', content=f'm{number}'))
+            db.session.commit()
+        
+        url = f'/api/conversations/{self.conversation_id}/messages'
+        page = json.loads(self.client.get(f'{url}?limit=2').data)
+        self.assertEqual([message['content'] for message in page], ['m0', 'm1'])
+        page = json.loads(self.client.get(f"{url}?after={page[-1]['seq']}&limit=2").data)
+        self.assertEqual([message['content'] for message in page], ['m2', 'm3'])
+        page = json.loads(self.client.get(f"{url}?after={page[-1]['seq']}").data)
+        self.assertEqual([message['content'] for message in page], ['m4'])
+        
+        self.assertEqual(self.client.get(f'{url}?after=-1').status_code, 400)
+        self.assertEqual(self.client.get(f'{url}?limit=0').status_code, 400)
+    
+    def test_serialized_turns_run_one_at_a_time(self):
+        """Test that with serialized turns every message is answered before the next is stored"""
+        response = self.client.patch(f'/api/conversations/{self.conversation_id}',
+                                     json={'settings': {'turn_ordering': 'serialized'}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.send_concurrently(3), [201] * 3)
+        
+        messages = json.loads(self.client.get(f'/api/conversations/{self.conversation_id}/messages').data)
+        question = None
+        for message in messages:
+            if message['role'] == 'user':
+                question = message['content']
+            else:
+                self.assertTrue(message['content'].endswith(f'on {question}'))
+        self.assertEqual(len(messages), 9)
+        
+        with app.app_context():
+            self.assertIsNone(db.session.get(Conversation, self.conversation_id).turn_owner)
+    
+    def test_serialized_turn_waits_are_bounded(self):
+        """Test that a turn stuck behind another one gives up with a conflict"""
+        self.client.patch(f'/api/conversations/{self.conversation_id}',
+                          json={'settings': {'turn_ordering': 'serialized'}})
+        with app.app_context():
+            lease = turn_queue.acquire(self.conversation_id)
+            try:
+                with patch('src.config.Config.TURN_WAIT_SECONDS', 0.1):
+                    response = self.client.post(f'/api/conversations/{self.conversation_id}/messages',
+                                                json={'content': 'Anyone there?'})
+                self.assertEqual(response.status_code, 409)
+            finally:
+                turn_queue.release(self.conversation_id, lease)
+        
+        messages = json.loads(self.client.get(f'/api/conversations/{self.conversation_id}/messages').data)
+        self.assertEqual(messages, [])
+    
+    def test_update_with_stale_version_is_refused(self):
+        """Test compare-and-swap updates of a conversation through its version"""
+        conversation = json.loads(self.client.get(f'/api/conversations/{self.conversation_id}').data)
+        self.assertEqual(conversation['version'], 1)
+        
+        response = self.client.patch(f'/api/conversations/{self.conversation_id}',
+                                     json={'title': 'Renamed', 'version': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['version'], 2)
+        
+        response = self.client.patch(f'/api/conversations/{self.conversation_id}',
+                                     json={'title': 'Lost update', 'version': 1})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(self.client.get(f'/api/conversations/{self.conversation_id}').data)['title'],
+                         'Renamed')
+
+
+if __name__ == '__main__':
+    unittest.main()
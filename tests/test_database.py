@@ -0,0 +1,151 @@
+"""
+Test script for TinyTroupe Service SQLite production mode
+"""
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+import threading
+import time
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import text
+from src.config import Config
+from src.database import WriteQueue, sqlite_engine_options, enable_sqlite_pragmas
+from src.extensions import db
+from src.models import Conversation, Message
+
+
+class ProductionSQLiteConfig(Config):
+    """Configuration with SQLite production mode switched on"""
+    SQLITE_PRODUCTION_MODE = True
+    SQLITE_BUSY_TIMEOUT_MS = 2500
+    SQLITE_SYNCHRONOUS = 'NORMAL'
+
+
+class SQLiteProductionModeTests(unittest.TestCase):
+    """Test cases for WAL pragmas and the serialized write queue"""
+    
+    def setUp(self):
+        """Set up a file backed database with production mode enabled"""
+        self.test_dir = tempfile.mkdtemp()
+        ProductionSQLiteConfig.DATABASE_URI = f"sqlite:///{os.path.join(self.test_dir, 'test.db')}"
+        
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = ProductionSQLiteConfig.DATABASE_URI
+        self.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options(ProductionSQLiteConfig)
+        self.app.config['SQLITE_WRITE_QUEUE'] = True
+        self.app.config['SQLITE_WRITE_BATCH_WINDOW_MS'] = 20
+        db.init_app(self.app)
+        self.writer = WriteQueue(self.app)
+        
+        with self.app.app_context():
+            enable_sqlite_pragmas(db.engine, ProductionSQLiteConfig)
+            db.create_all()
+    
+    def tearDown(self):
+        """Clean up after tests"""
+        self.writer.shutdown()
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        shutil.rmtree(self.test_dir)
+    
+    def test_pragmas_applied(self):
+        """Test that new connections use WAL and the configured busy timeout"""
+        with self.app.app_context():
+            self.assertEqual(db.session.execute(text('PRAGMA journal_mode')).scalar(), 'wal')
+            self.assertEqual(db.session.execute(text('PRAGMA busy_timeout')).scalar(), 2500)
+            self.assertEqual(db.session.execute(text('PRAGMA synchronous')).scalar(), 1)  # NORMAL
+    
+    def test_concurrent_writes_are_group_committed(self):
+        """Test that concurrent writes all land and share commits"""
+        with self.app.app_context():
+            conversation_id = self.writer.run(
+                lambda session: self._add_conversation(session)
+            )
+        
+        errors = []
+        
+        def send(i):
+            try:
+                with self.app.app_context():
+                    self.writer.run(lambda session: session.add(Message(
+                        conversation_id=conversation_id, role='user', content=f'message {i}'
+                    )))
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+        
+        threads = [threading.Thread(target=send, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(errors, [])
+        with self.app.app_context():
+            self.assertEqual(Message.query.filter_by(conversation_id=conversation_id).count(), 20)
+        # 1 write for the conversation plus fewer commits than messages
+        self.assertLess(self.writer.batches_committed, 21)
+    
+    def test_failed_write_only_fails_its_caller(self):
+        """Test that a failing job in a batch does not roll back the others"""
+        with self.app.app_context():
+            conversation_id = self.writer.run(lambda session: self._add_conversation(session))
+        
+        # Hold the writer busy until every write below is queued, so they are committed as one batch
+        busy, release = threading.Event(), threading.Event()
+        
+        def block(session):
+            busy.set()
+            release.wait(5)
+        
+        blocker = threading.Thread(target=self.writer.run, args=(block,))
+        blocker.start()
+        self.assertTrue(busy.wait(5))
+        
+        outcomes = {}
+        
+        def send(i):
+            # Missing non-nullable content makes the third write fail
+            content = None if i == 2 else f'message {i}'
+            try:
+                with self.app.app_context():
+                    self.writer.run(lambda session: session.add(Message(
+                        conversation_id=conversation_id, role='user', content=content
+                    )))
+                outcomes[i] = None
+            except Exception as e:
+                outcomes[i] = e
+        
+        threads = [threading.Thread(target=send, args=(i,)) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while self.writer._queue.qsize() < len(threads) and time.monotonic() < deadline:
+            time.sleep(0.005)
+        with self.assertLogs('src.database', 'WARNING') as logs:
+            release.set()
+            for thread in threads + [blocker]:
+                thread.join()
+        
+        self.assertIn('Group commit of 5 writes failed', logs.output[0])
+        self.assertEqual([i for i, error in outcomes.items() if error is not None], [2])
+        with self.app.app_context():
+            contents = {message.content for message in Message.query.filter_by(conversation_id=conversation_id)}
+        self.assertEqual(contents, {'message 0', 'message 1', 'message 3', 'message 4'})
+    
+    @staticmethod
+    def _add_conversation(session):
+        conversation = Conversation(user_id='test_user', title='Write Queue')
+        session.add(conversation)
+        session.flush()
+        return conversation.id
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Test script for TinyTroupe deadlines and hedged model calls
+"""
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.cancellation import CancellationToken, OperationCancelled
+from src.deadline import Deadline, DeadlineExceeded
+from src.services.hedging import HedgedExecutor, LatencyTracker
+
+
+class HedgingTests(unittest.TestCase):
+    """Test cases for deadline-bounded, hedged execution"""
+    
+    def setUp(self):
+        """Set up an executor with a warmed-up latency history"""
+        self.executor = HedgedExecutor(max_workers=4)
+        for _ in range(20):
+            self.executor.latencies.observe('advisor', 0.01)
+    
+    def test_latency_percentile(self):
+        """Test that percentiles need enough samples"""
+        tracker = LatencyTracker()
+        self.assertIsNone(tracker.percentile('advisor', 95, min_samples=1))
+        for latency in range(1, 101):
+            tracker.observe('advisor', latency / 1000)
+        self.assertAlmostEqual(tracker.percentile('advisor', 95), 0.096)
+        self.assertIsNone(tracker.percentile('advisor', 95, min_samples=101))
+    
+    def test_slow_call_is_hedged(self):
+        """Test that a duplicate started after the p95 delay wins over a stuck primary"""
+        attempts = []
+        lock = threading.Lock()
+        
+        def call():
+            with lock:
+                attempts.append(1)
+                first = len(attempts) == 1
+            if first:
+                time.sleep(1)
+                return 'slow'
+            return 'fast'
+        
+        started = time.monotonic()
+        result = self.executor.call('advisor', call, Deadline(5))
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(result.result, 'fast')
+        self.assertEqual(result.metadata, {'hedged': True})
+        self.assertEqual(len(attempts), 2)
+    
+    @patch('src.config.Config.DEADLINE_RESERVE_MS', 50)
+    @patch('src.config.Config.LLM_HEDGING_ENABLED', False)
+    def test_deadline_returns_degraded_fallback(self):
+        """Test that calls still running near the deadline are answered by their fallback"""
+        started = time.monotonic()
+        result = self.executor.call('advisor', lambda: time.sleep(1) or 'late', Deadline(0.2),
+                                    fallback=lambda: 'template')
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(result.result, 'template')
+        self.assertEqual(result.metadata, {'degraded': True, 'reason': 'deadline'})
+        
+        result = self.executor.call('advisor', lambda: time.sleep(1), Deadline(0.1))
+        self.assertIsInstance(result.error, DeadlineExceeded)
+    
+    def test_cancellation_abandons_pending_calls(self):
+        """Test that cancelling resolves running calls at once and never starts new ones"""
+        token = CancellationToken()
+        ran = []
+        calls = [self.executor.submit('slow', lambda: time.sleep(1), cancel=token)]
+        threading.Timer(0.1, token.cancel, args=('client disconnected',)).start()
+        
+        started = time.monotonic()
+        self.executor.gather(calls, cancel=token)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertIsInstance(calls[0].error, OperationCancelled)
+        
+        late = self.executor.submit('advisor', lambda: ran.append(1), cancel=token)
+        self.assertIsInstance(late.error, OperationCancelled)
+        self.assertEqual(ran, [])
+    
+    def test_errors_are_reported(self):
+        """Test that a failing call resolves with its exception"""
+        def fail():
+            raise RuntimeError('model unavailable')
+        
+        result = self.executor.call('other', fail)
+        self.assertIsInstance(result.error, RuntimeError)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+"""
+Test script for TinyTroupe compact ids and the schema upgrade
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import uuid
+
+from sqlalchemy import create_engine, select
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import app, db
+from src.ids import new_id, uuid7
+from src.migrations import upgrade
+from src.models import Conversation, Message, Persona, PersonaMemory, PersonaState
+
+# Tables as created before ids were compact and messages had a seq
+OLD_SCHEMA = """
+CREATE TABLE conversations (id VARCHAR(36) NOT NULL PRIMARY KEY, user_id VARCHAR(36) NOT NULL,
+    title VARCHAR(255) NOT NULL, settings JSON NOT NULL, created_at DATETIME, updated_at DATETIME);
+CREATE TABLE messages (id VARCHAR(36) NOT NULL PRIMARY KEY,
+    conversation_id VARCHAR(36) NOT NULL REFERENCES conversations (id), role VARCHAR(20) NOT NULL,
+    advisor_id VARCHAR(36), content TEXT NOT NULL, timestamp DATETIME, metadata JSON);
+CREATE TABLE persona_states (id VARCHAR(36) NOT NULL PRIMARY KEY,
+    persona_id VARCHAR(36) NOT NULL REFERENCES personas (id),
+    conversation_id VARCHAR(36) NOT NULL REFERENCES conversations (id), memory_state JSON NOT NULL,
+    updated_at DATETIME);
+CREATE TABLE persona_memories (id INTEGER NOT NULL PRIMARY KEY,
+    persona_state_id VARCHAR(36) NOT NULL REFERENCES persona_states (id), position INTEGER NOT NULL,
+    content TEXT NOT NULL, vector BLOB NOT NULL, created_at DATETIME,
+    CONSTRAINT uq_persona_memories_position UNIQUE (persona_state_id, position));
+"""
+
+# Tables as created by the first release, before any of the columns added since
+BASELINE_SCHEMA = """
+CREATE TABLE conversations (id VARCHAR(36) NOT NULL PRIMARY KEY, user_id VARCHAR(36) NOT NULL,
+    title VARCHAR(255) NOT NULL, created_at DATETIME, updated_at DATETIME);
+CREATE TABLE personas (id VARCHAR(36) NOT NULL PRIMARY KEY, name VARCHAR(100) NOT NULL, description TEXT NOT NULL,
+    personality JSON NOT NULL, expertise JSON NOT NULL, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP));
+CREATE TABLE messages (id VARCHAR(36) NOT NULL PRIMARY KEY,
+    conversation_id VARCHAR(36) NOT NULL REFERENCES conversations (id), role VARCHAR(20) NOT NULL,
+    advisor_id VARCHAR(36), content TEXT NOT NULL, timestamp DATETIME);
+CREATE TABLE persona_states (id VARCHAR(36) NOT NULL PRIMARY KEY,
+    persona_id VARCHAR(36) NOT NULL REFERENCES personas (id),
+    conversation_id VARCHAR(36) NOT NULL REFERENCES conversations (id), memory_state JSON NOT NULL,
+    updated_at DATETIME);
+"""
+
+
+class CompactIdTests(unittest.TestCase):
+    """Test cases for time-ordered ids"""
+    
+    def test_ids_are_time_ordered_uuid7(self):
+        """Test that ids are valid UUIDv7 and sort in the order they were made"""
+        ids = [uuid7() for _ in range(20000)]
+        self.assertEqual(sorted(ids), ids)
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual({(value.version, value.variant) for value in ids}, {(7, uuid.RFC_4122)})
+        self.assertEqual(len(new_id()), 36)
+    
+    def test_ids_are_stored_in_16_bytes(self):
+        """Test that ids round-trip as strings but are stored as 16-byte blobs"""
+        app.config['TESTING'] = True
+        client = app.test_client()
+        with app.app_context():
+            db.create_all()
+        try:
+            response = client.post('/api/conversations', json={'title': 'Ids', 'user_id': 'test_user'})
+            conversation_id = response.get_json()['id']
+            self.assertEqual(str(uuid.UUID(conversation_id)), conversation_id)
+            self.assertEqual(client.get(f'/api/conversations/{conversation_id.upper()}').status_code, 200)
+            self.assertEqual(client.get('/api/conversations/not-an-id').status_code, 404)
+            with app.app_context():
+                stored = db.session.execute(select(Conversation.__table__.c.id.cast(db.LargeBinary))).scalar()
+                self.assertEqual(stored, uuid.UUID(conversation_id).bytes)
+        finally:
+            with app.app_context():
+                db.session.remove()
+                db.drop_all()
+
+
+class SchemaUpgradeTests(unittest.TestCase):
+    """Test cases for upgrading a database created with text ids"""
+    
+    def setUp(self):
+        """Create a database with the old schema"""
+        self.root = tempfile.mkdtemp()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.root, 'old.db')}")
+        Persona.__table__.create(self.engine)
+        with self.engine.begin() as connection:
+            for statement in OLD_SCHEMA.split(';'):
+                if statement.strip():
+                    connection.exec_driver_sql(statement)
+            connection.execute(Persona.__table__.insert(), [{'id': 'warren_buffett', 'name': 'Warren Buffett',
+                                                             'description': 'Investor.', 'personality': {},
+                                                             'expertise': []}])
+        self.conversation_id = str(uuid.uuid4())
+        self.state_id = str(uuid.uuid4())
+        self.message_ids = [str(uuid.uuid4()) for _ in range(3)]
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql(
+                "INSERT INTO conversations VALUES (?, 'ann', 'Old', '{}', '2024-01-01 00:00:00.000000', "
+                "'2024-01-01 00:00:00.000000')",
+                (self.conversation_id,))
+            connection.exec_driver_sql(
+                "INSERT INTO persona_states VALUES (?, 'warren_buffett', ?, '{}', '2024-01-01')",
+                (self.state_id, self.conversation_id))
+            connection.exec_driver_sql(
+                "INSERT INTO persona_memories VALUES (1, ?, 0, 'remembered', x'00', '2024-01-01')", (self.state_id,))
+            for message_id, content, stamp in zip(self.message_ids, ('first', 'second', 'third'),
+                                                  ('2024-01-01 09:00:00.000000', '2024-01-01 09:01:00.000000',
+                                                   '2024-01-01 09:01:00.000000')):
+                connection.exec_driver_sql(
+                    "INSERT INTO messages VALUES (?, ?, 'advisor', 'warren_buffett', ?, ?, NULL)",
+                    (message_id, self.conversation_id, content, stamp))
+    
+    def tearDown(self):
+        """Remove the database"""
+        self.engine.dispose()
+        shutil.rmtree(self.root)
+    
+    def test_upgrade_keeps_ids_and_numbers_messages(self):
+        """Test that text ids become 16-byte ids with the same string form, in one pass"""
+        copied = upgrade(self.engine, db.metadata)
+        self.assertEqual(copied, {'conversations': 1, 'messages': 3, 'persona_states': 1, 'persona_memories': 1})
+        self.assertEqual(upgrade(self.engine, db.metadata), {})
+        
+        with self.engine.connect() as connection:
+            self.assertEqual(connection.exec_driver_sql('SELECT typeof(id), length(id) FROM messages').fetchall(),
+                             [('blob', 16)] * 3)
+            conversation = connection.execute(select(Conversation.__table__)).one()
+            self.assertEqual((conversation.id, conversation.version, conversation.last_seq),
+                             (self.conversation_id, 1, 3))
+            messages = connection.execute(select(Message.__table__).order_by(Message.__table__.c.seq)).all()
+            ordered = sorted(self.message_ids[1:])
+            self.assertEqual([message.id for message in messages], [self.message_ids[0]] + ordered)
+            self.assertEqual({message.conversation_id for message in messages}, {self.conversation_id})
+            state = connection.execute(select(PersonaState.__table__)).one()
+            self.assertEqual((state.id, state.conversation_id), (self.state_id, self.conversation_id))
+            memory = connection.execute(select(PersonaMemory.__table__)).one()
+            self.assertEqual(memory.persona_state_id, self.state_id)
+            indexes = {row[0] for row in connection.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'messages'")}
+            self.assertIn('ix_messages_conversation_seq', indexes)
+            self.assertEqual(connection.exec_driver_sql(
+                "SELECT count(*) FROM sqlite_master WHERE name LIKE '_old_%'").scalar(), 0)
+    
+    
+    def test_upgrade_adds_columns_to_baseline_tables(self):
+        """Test that a database from the first release gets every column the models have, with their defaults"""
+        engine = create_engine(f"sqlite:///{os.path.join(self.root, 'baseline.db')}")
+        try:
+            with engine.begin() as connection:
+                for statement in BASELINE_SCHEMA.split(';'):
+                    if statement.strip():
+                        connection.exec_driver_sql(statement)
+                connection.exec_driver_sql(
+                    "INSERT INTO personas (id, name, description, personality, expertise) "
+                    "VALUES ('warren_buffett', 'Warren Buffett', 'Investor.', '{}', '[]')")
+                connection.exec_driver_sql(
+                    "INSERT INTO conversations VALUES (?, 'ann', 'Old', '2024-01-01 00:00:00.000000', "
+                    "'2024-01-01 00:00:00.000000')", (self.conversation_id,))
+                connection.exec_driver_sql(
+                    "INSERT INTO messages VALUES (?, ?, 'user', NULL, 'hello', '2024-01-01 09:00:00.000000')",
+                    (self.message_ids[0], self.conversation_id))
+            db.metadata.create_all(engine)
+            
+            copied = upgrade(engine, db.metadata)
+            self.assertEqual(copied, {'personas': 0, 'conversations': 1, 'messages': 1, 'persona_states': 0})
+            self.assertEqual(upgrade(engine, db.metadata), {})
+            
+            with engine.connect() as connection:
+                for table in db.metadata.sorted_tables:
+                    stored = {row[1] for row in connection.exec_driver_sql(f'PRAGMA table_info("{table.name}")')}
+                    self.assertEqual(stored, set(table.columns.keys()), table.name)
+                persona = connection.execute(select(Persona.__table__)).one()
+                self.assertIs(persona.response_reuse, True)
+                conversation = connection.execute(select(Conversation.__table__)).one()
+                self.assertEqual((conversation.settings, conversation.version, conversation.last_seq), ({}, 1, 1))
+                message = connection.execute(select(Message.__table__)).one()
+                self.assertEqual((message.id, message.seq), (self.message_ids[0], 1))
+        finally:
+            engine.dispose()
+
+
+if __name__ == '__main__':
+    unittest.main()
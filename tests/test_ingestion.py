@@ -0,0 +1,198 @@
+"""
+Test script for TinyTroupe bulk market data ingestion
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import app
+from src.services.fundamentals_index import FundamentalsIndex
+from src.services.market_data_ingest import MarketDataIngestor, resolve_input
+from src.services.price_history import PriceHistoryStore
+
+HEADER = 'Date,Ticker,Open,High,Low,Close,Volume,pe_ratio\n'
+
+
+def write_day(path, day, symbols, extra_lines=()):
+    """Write a full-market day dump with one row per symbol"""
+    with open(path, 'w') as handle:
+        handle.write(HEADER)
+        for number, symbol in enumerate(symbols):
+            price = 10 + number
+            handle.write(f'{day},{symbol},{price},{price + 1},{price - 1},{price + 0.5},{1000 * number},{number}\n')
+        handle.writelines(extra_lines)
+
+
+class MarketDataIngestorTests(unittest.TestCase):
+    """Test cases for the streaming ingestion pipeline"""
+    
+    def setUp(self):
+        """Set up an empty store, index and checkpoint directory"""
+        self.root = tempfile.mkdtemp()
+        self.store = PriceHistoryStore(os.path.join(self.root, 'prices'))
+        self.index = FundamentalsIndex()
+        self.ingestor = MarketDataIngestor(self.store, self.index, os.path.join(self.root, 'checkpoints'))
+    
+    def tearDown(self):
+        """Remove the store files"""
+        shutil.rmtree(self.root)
+    
+    def test_validates_and_deduplicates(self):
+        """Test that malformed rows are rejected and the last row of a repeated day wins"""
+        path = os.path.join(self.root, 'day.csv')
+        write_day(path, '2024-03-01', ['AAPL', 'msft'], [
+            '2024-03-01,AAPL,12,13,11,12.5,99,30\n',   # repeated day, replaces the first AAPL row
+            '2024-03-01,KO,-1,2,1,1,5,1\n',            # negative price
+            '2024-03-01,PEP,5,4,6,5,5,1\n',            # high below low
+            '2024-03-01,BAD SYMBOL,5,6,4,5,5,1\n',
+            'not-a-date,JNJ,5,6,4,5,5,1\n',
+            '2024-03-01,JNJ,5\n',                      # short line
+            '2024-02-29,MSFT,20,21,19,20,5,\n',        # earlier day, blank pe_ratio
+        ])
+        
+        result = self.ingestor.ingest_file(path)
+        
+        self.assertEqual(result['status'], 'ingested')
+        self.assertEqual((result['rows'], result['written'], result['rejected'], result['duplicates']), (9, 3, 4, 1))
+        self.assertEqual(self.store.symbols(), ['AAPL', 'MSFT'])
+        aapl = self.store.series('AAPL')
+        self.assertEqual((len(aapl), aapl['close'][0], aapl['volume'][0]), (1, 12.5, 99))
+        msft = self.store.series('MSFT')
+        self.assertEqual(np.datetime_as_string(msft['date']).tolist(), ['2024-02-29', '2024-03-01'])
+        total, page = self.index.screen([])
+        self.assertEqual({row['symbol']: row['pe_ratio'] for row in page}, {'AAPL': 30.0, 'MSFT': 1.0})
+    
+    def test_resumes_from_checkpoint(self):
+        """Test that an interrupted file resumes after its last completed chunk"""
+        path = os.path.join(self.root, 'day.csv')
+        symbols = [f'S{number:03d}' for number in range(25)]
+        write_day(path, '2024-03-01', symbols)
+        
+        write = self.ingestor._write
+        chunks = []
+        
+        def fail_on_third_chunk(columns, totals):
+            chunks.append(len(columns['symbol']))
+            if len(chunks) == 3:
+                raise OSError('disk full')
+            write(columns, totals)
+        
+        with patch.object(self.ingestor, '_write', side_effect=fail_on_third_chunk):
+            failed = self.ingestor.ingest_file(path, chunk_rows=10)
+        self.assertEqual((failed['status'], failed['error']), ('failed', 'disk full'))
+        self.assertEqual(len(self.store.symbols()), 20)
+        
+        resumed = self.ingestor.ingest_file(path, chunk_rows=10)
+        self.assertEqual((resumed['status'], resumed['resumed']), ('ingested', True))
+        self.assertEqual((resumed['rows'], resumed['written']), (25, 25))
+        self.assertEqual(self.store.symbols(), symbols)
+        
+        again = self.ingestor.ingest_file(path, chunk_rows=10)
+        self.assertEqual((again['status'], again['written']), ('complete', 25))
+        restarted = self.ingestor.ingest_file(path, restart=True)
+        self.assertEqual((restarted['status'], restarted['written'], restarted['stale']), ('ingested', 0, 25))
+        self.assertEqual(len(self.store.series('S000')), 1)
+    
+    def test_parallel_files(self):
+        """Test that several files are ingested at once and older days are merged afterwards"""
+        symbols = [f'T{number:04d}' for number in range(900)]
+        paths = []
+        for part in range(3):
+            paths.append(os.path.join(self.root, f'part{part}.csv'))
+            write_day(paths[-1], '2024-01-02', symbols[part * 300:(part + 1) * 300])
+        
+        result = self.ingestor.ingest(paths, workers=3)
+        
+        self.assertEqual(result['totals']['written'], 900)
+        self.assertEqual(result['totals']['failed'], 0)
+        self.assertEqual(self.store.symbols(), symbols)
+        
+        stale = os.path.join(self.root, 'late.csv')
+        write_day(stale, '2023-12-29', symbols[:10])
+        late = self.ingestor.ingest([stale])['files'][0]
+        self.assertEqual((late['written'], late['stale']), (10, 0))
+        self.assertEqual(np.datetime_as_string(self.store.series('T0000')['date']).tolist(),
+                         ['2023-12-29', '2024-01-02'])
+        again = self.ingestor.ingest([stale], restart=True)['files'][0]
+        self.assertEqual((again['written'], again['stale']), (0, 10))
+        
+        missing = os.path.join(self.root, 'missing.csv')
+        with open(missing, 'w') as handle:
+            handle.write('symbol,date,close\nAAPL,2024-01-01,1\n')
+        self.assertEqual(self.ingestor.ingest_file(missing)['error'], 'Missing column: open')
+    
+    
+    def test_parallel_daily_files_of_the_same_symbols(self):
+        """Test that daily files ingested concurrently in any order build complete, ordered series"""
+        symbols = [f'U{number:03d}' for number in range(200)]
+        days = [f'2024-01-{day:02d}' for day in range(2, 10)]
+        paths = []
+        for day in reversed(days):
+            paths.append(os.path.join(self.root, f'{day}.csv'))
+            write_day(paths[-1], day, symbols)
+        
+        result = self.ingestor.ingest(paths, workers=4, chunk_rows=25)
+        
+        self.assertEqual(result['totals']['failed'], 0)
+        self.assertEqual((result['totals']['written'], result['totals']['stale']), (len(symbols) * len(days), 0))
+        for symbol in (symbols[0], symbols[-1]):
+            self.assertEqual(np.datetime_as_string(self.store.series(symbol)['date']).tolist(), days)
+
+
+class IngestEndpointTests(unittest.TestCase):
+    """Test cases for the admin ingest endpoint"""
+    
+    def setUp(self):
+        """Set up an ingest directory with one dump"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.root = tempfile.mkdtemp()
+        self.patchers = [
+            patch('src.config.Config.PRICE_HISTORY_PATH', os.path.join(self.root, 'prices')),
+            patch('src.config.Config.INGEST_PATH', os.path.join(self.root, 'ingest')),
+            patch('src.config.Config.INGEST_CHECKPOINT_PATH', os.path.join(self.root, 'checkpoints')),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        os.makedirs(os.path.join(self.root, 'ingest'))
+        write_day(os.path.join(self.root, 'ingest', 'day.csv'), '2024-03-01', ['AAPL', 'MSFT'])
+    
+    def tearDown(self):
+        """Remove the ingest directory"""
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.root)
+    
+    def test_ingest_endpoint(self):
+        """Test token checks, path confinement and ingestion"""
+        body = {'paths': ['day.csv']}
+        with patch('src.config.Config.ADMIN_TOKEN', None):
+            self.assertEqual(self.client.post('/api/admin/ingest', json=body).status_code, 403)
+        
+        with patch('src.config.Config.ADMIN_TOKEN', 'secret'):
+            self.assertEqual(self.client.post('/api/admin/ingest', json=body).status_code, 401)
+            headers = {'X-Admin-Token': 'secret'}
+            for paths in (['../prices'], ['absent.csv'], [], 'day.csv'):
+                response = self.client.post('/api/admin/ingest', json={'paths': paths}, headers=headers)
+                self.assertEqual(response.status_code, 400)
+            
+            response = self.client.post('/api/admin/ingest', json=body, headers=headers)
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['totals']['written'], 2)
+        self.assertEqual(data['files'][0]['path'], resolve_input('day.csv'))
+        self.assertEqual(self.client.get('/api/financial-data/AAPL/history').status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
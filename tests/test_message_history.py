@@ -0,0 +1,184 @@
+"""
+Test script for the TinyTroupe read-only message history
+"""
+import os
+import sys
+import gzip
+import json
+import unittest
+from unittest.mock import patch
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import jsonify
+
+from src.main import app, db
+from src.models import Conversation, Message, TranscriptSnapshot
+from src.routes.conversation import conversation_service
+from src.services.message_history import message_history
+from src.services.transcripts import transcript_store
+
+
+class MessageHistoryTests(unittest.TestCase):
+    """Test cases for reading messages without the ORM"""
+    
+    def setUp(self):
+        """Set up a conversation with a few messages"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            conversation = Conversation(user_id='test_user', title='History')
+            db.session.add(conversation)
+            db.session.flush()
+            self.conversation_id = conversation.id
+            for number in range(7):
+                db.session.add(Message(conversation_id=self.conversation_id,
+                                       role='user' if number % 2 == 0 else 'advisor',
+                                       advisor_id=None if number % 2 == 0 else 'warren_buffett',
+                                       content=f'm{number}', meta={'cancelled': True} if number == 5 else None))
+                db.session.flush()
+            db.session.commit()
+    
+    def tearDown(self):
+        """Clean up after tests"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+    
+    def test_records_match_orm_messages(self):
+        """Test that records and their streamed JSON match the ORM messages, without loading any"""
+        with app.test_request_context():
+            expected = [message.to_dict() for message in
+                        Message.query.filter_by(conversation_id=self.conversation_id).order_by(Message.seq)]
+            expected_body = jsonify(expected).get_data()
+            db.session.expunge_all()
+            
+            records = list(message_history.records(self.conversation_id))
+            self.assertEqual([record.to_dict() for record in records], expected)
+            self.assertEqual([record.to_dict() for record in message_history.records(self.conversation_id, 2, 3)],
+                             expected[2:5])
+            self.assertEqual(len(db.session.identity_map), 0)
+            
+            with patch('src.services.message_history.BATCH_ROWS', 2):
+                chunks = list(message_history.json_chunks(message_history.records(self.conversation_id)))
+            self.assertGreater(len(chunks), 1)
+            self.assertEqual(b''.join(chunks), expected_body)
+            self.assertEqual(b''.join(message_history.json_chunks(iter([]))), b'[]\n')
+            
+            conversation = db.session.get(Conversation, self.conversation_id)
+            self.assertEqual(conversation.to_dict()['message_count'], 7)
+    
+    def test_recent_skips_cancelled_messages(self):
+        """Test that the prompt history is the last uncancelled messages, oldest first"""
+        with app.app_context():
+            recent = message_history.recent(self.conversation_id, 3)
+            self.assertEqual([message['content'] for message in recent], ['m3', 'm4', 'm6'])
+            self.assertEqual(len(message_history.recent(self.conversation_id, 20)), 6)
+            self.assertEqual(message_history.recent(self.conversation_id, 0), [])
+    
+    def test_streamed_history_is_compressed(self):
+        """Test that a streamed message list is gzip encoded as it is sent"""
+        url = f'/api/conversations/{self.conversation_id}/messages'
+        response = self.client.get(f'{url}?after=2', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+        messages = json.loads(gzip.decompress(response.data))
+        self.assertEqual([message['seq'] for message in messages], list(range(3, 8)))
+        response.close()
+        
+        response = self.client.get(f'{url}?limit=2')
+        self.assertIn('Content-Length', response.headers)
+        self.assertEqual(len(json.loads(response.data)), 2)
+
+
+class TranscriptSnapshotTests(unittest.TestCase):
+    """Test cases for incrementally maintained transcript snapshots"""
+    
+    def setUp(self):
+        """Set up an empty conversation"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            conversation = Conversation(user_id='test_user', title='Transcript')
+            db.session.add(conversation)
+            db.session.commit()
+            self.conversation_id = conversation.id
+        self.url = f'/api/conversations/{self.conversation_id}/messages'
+    
+    def tearDown(self):
+        """Clean up after tests"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+    
+    def snapshot(self):
+        with app.app_context():
+            snapshot = db.session.get(TranscriptSnapshot, self.conversation_id)
+            return snapshot and (snapshot.seq, snapshot.members, snapshot.size)
+    
+    def expected_body(self):
+        with app.test_request_context():
+            return jsonify([message.to_dict() for message in
+                            Message.query.filter_by(conversation_id=self.conversation_id).order_by(Message.seq)]
+                           ).get_data()
+    
+    def test_turns_append_to_the_snapshot(self):
+        """Test that each stored message is appended, and both encodings match the messages table"""
+        self.assertEqual(self.client.get(self.url).data, b'[]\n')
+        with app.app_context():
+            for number in range(3):
+                conversation_service.add_user_message(self.conversation_id, f'question {number}')
+        seq, members, size = self.snapshot()
+        self.assertEqual(seq, 3)
+        self.assertEqual(members, 4)  # the empty snapshot stored by the first read, then one per message
+        
+        expected = self.expected_body()
+        self.assertEqual(size, len(expected) - 3)
+        response = self.client.get(self.url)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, expected)
+        response = self.client.get(self.url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.data), expected)
+        self.assertEqual(self.snapshot()[:2], (3, 4))
+    
+    def test_stale_snapshot_is_caught_up_and_rebuilt(self):
+        """Test that messages missing from the snapshot are read from the table, then folded in"""
+        with app.app_context():
+            conversation_service.add_user_message(self.conversation_id, 'first')
+            for number in range(3):
+                db.session.add(Message(conversation_id=self.conversation_id, role='user', content=f'm{number}'))
+                db.session.flush()
+            db.session.commit()
+        self.assertEqual(self.snapshot()[:2], (1, 1))
+        
+        # The tail is within TRANSCRIPT_MAX_TAIL, so it is read from the table
+        rebuilds = transcript_store.rebuilds
+        self.assertEqual(self.client.get(self.url).data, self.expected_body())
+        self.assertEqual(transcript_store.rebuilds, rebuilds)
+        
+        with patch('src.config.Config.TRANSCRIPT_MAX_TAIL', 2):
+            self.assertEqual(self.client.get(self.url).data, self.expected_body())
+        self.assertEqual(transcript_store.rebuilds, rebuilds + 1)
+        self.assertEqual(self.snapshot()[:2], (4, 1))
+        
+        # Snapshots of an older format are rebuilt too
+        with patch('src.services.transcripts.FORMAT', 2):
+            self.assertEqual(self.client.get(self.url).data, self.expected_body())
+        self.assertEqual(transcript_store.rebuilds, rebuilds + 2)
+        
+        with app.app_context():
+            conversation_service.add_user_message(self.conversation_id, 'last')
+        self.assertEqual(self.snapshot()[:2], (4, 1))  # written in format 2, so not appended to
+        self.assertEqual(self.client.get(self.url).data, self.expected_body())
+        self.assertEqual(self.snapshot()[:2], (5, 1))
+        
+        self.assertEqual(self.client.delete(f'/api/conversations/{self.conversation_id}').status_code, 204)
+        self.assertIsNone(self.snapshot())
+
+
+if __name__ == '__main__':
+    unittest.main()
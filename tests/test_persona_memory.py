@@ -0,0 +1,125 @@
+"""
+Test script for TinyTroupe persona semantic memory
+"""
+import os
+import sys
+import time
+import unittest
+import json
+from unittest.mock import patch
+
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import app, db
+from src.models import Persona, PersonaMemory, PersonaState
+from src.services.persona_memory import HashingVectorizer, MemoryIndex, memory_store
+from src.services.response_reuse import response_reuse
+
+
+class PersonaMemoryIndexTests(unittest.TestCase):
+    """Test cases for the hashing vectorizer and memory index"""
+
+    def setUp(self):
+        """Set up a vectorizer"""
+        self.vectorizer = HashingVectorizer(256)
+
+    def test_vectorizer_is_stable_and_normalized(self):
+        """Test that embeddings are deterministic unit vectors that ignore stop words"""
+        first = self.vectorizer.transform('What about the Fed raising interest rates?')
+        second = self.vectorizer.transform('What about the Fed raising interest rates?')
+        np.testing.assert_array_equal(first, second)
+        self.assertAlmostEqual(float(np.linalg.norm(first)), 1.0, places=5)
+        self.assertFalse(self.vectorizer.transform('what is the').any())
+
+    def test_search_ranks_similar_snippets_first(self):
+        """Test that the most similar exchanges are returned and the limit is honoured"""
+        texts = [
+            'Apple has a strong brand moat and loyal customers',
+            'The Fed may raise interest rates to fight inflation',
+            'Bitcoin volatility makes it a speculative asset',
+            'Higher interest rates hurt bond prices',
+        ]
+        index = MemoryIndex(256, capacity=2)
+        index.extend(np.stack([self.vectorizer.transform(text) for text in texts]), texts)
+        self.assertEqual(index.size, 4)
+
+        hits = index.search(self.vectorizer.transform('how do interest rates affect things'), k=2)
+        self.assertEqual({position for position, _, _ in hits}, {1, 3})
+        self.assertGreaterEqual(hits[0][1], hits[1][1])
+
+        hits = index.search(self.vectorizer.transform('interest rates'), k=2, limit=2)
+        self.assertEqual(hits[0][0], 1)
+        self.assertTrue(all(position < 2 for position, _, _ in hits))
+
+    def test_search_latency_at_ten_thousand_turns(self):
+        """Test that top-k retrieval over 10k exchanges takes a few milliseconds"""
+        rng = np.random.default_rng(7)
+        vectors = rng.standard_normal((10000, 256)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        index = MemoryIndex(256)
+        index.extend(vectors, [f'exchange {i}' for i in range(10000)])
+        query = self.vectorizer.transform('valuation of banks after rate cuts')
+
+        timings = []
+        for _ in range(20):
+            started = time.perf_counter()
+            index.search(query, k=5)
+            timings.append(time.perf_counter() - started)
+        self.assertLess(sorted(timings)[len(timings) // 2], 0.01)
+
+
+class PersonaMemoryConversationTests(unittest.TestCase):
+    """Test cases for memory retrieval during conversations"""
+
+    def setUp(self):
+        """Set up test environment"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        memory_store.clear()
+        response_reuse.clear()
+
+        with app.app_context():
+            db.create_all()
+            db.session.add(Persona(
+                id='warren_buffett',
+                name='Warren Buffett',
+                description='The most successful investor of modern times.',
+                personality={'traits': ['patient']},
+                expertise=['value investing']
+            ))
+            db.session.commit()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    @patch('src.services.tinytroupe_service.TinyTroupeService.get_response')
+    def test_earlier_exchanges_are_recalled(self, mock_get_response):
+        """Test that exchanges outside the recent window are retrieved for related questions"""
+        mock_get_response.return_value = 'Noted.'
+        response = self.client.post('/api/conversations', json={'title': 'Memory Test', 'user_id': 'test_user'})
+        conversation_id = json.loads(response.data)['id']
+        url = f'/api/conversations/{conversation_id}/messages'
+
+        self.client.post(url, json={'content': 'My largest holding is Costco shares bought in 2009.'})
+        for i in range(10):
+            self.client.post(url, json={'content': f'Filler question number {i} about nothing much.'})
+
+        with app.app_context():
+            state = PersonaState.query.filter_by(conversation_id=conversation_id).one()
+            self.assertEqual(state.memory_state['memory_size'], 11)
+            self.assertEqual(PersonaMemory.query.filter_by(persona_state_id=state.id).count(), 11)
+
+        self.client.post(url, json={'content': 'Should I sell my Costco shares?'})
+        memories = mock_get_response.call_args.kwargs['memories']
+        self.assertTrue(memories)
+        self.assertIn('Costco shares bought in 2009', memories[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
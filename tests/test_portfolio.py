@@ -0,0 +1,138 @@
+"""
+Test script for TinyTroupe portfolio risk analysis
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import app, db
+from src.models import Persona
+from src.services.portfolio_service import parse_holdings, portfolio_metrics
+from src.services.price_history import BAR_DTYPE, PriceHistoryStore
+
+
+def make_bars(closes, start='2024-01-01'):
+    """Build daily bars around a list of closing prices"""
+    bars = np.zeros(len(closes), dtype=BAR_DTYPE)
+    bars['date'] = np.datetime64(start, 'D') + np.arange(len(closes))
+    for field in ('open', 'high', 'low', 'close'):
+        bars[field] = closes
+    return bars
+
+
+def random_walk(rng, days, market=None, beta=1.0):
+    """Build closes whose returns follow the market with a given beta plus noise"""
+    noise = rng.normal(0, 0.01, days - 1)
+    returns = noise if market is None else beta * market + noise
+    return 100 * np.concatenate([[1], np.cumprod(1 + returns)])
+
+
+class PortfolioMetricsTests(unittest.TestCase):
+    """Test cases for vectorized portfolio risk metrics"""
+    
+    def test_parse_holdings(self):
+        """Test that both holding formats are accepted and weights normalized"""
+        symbols, weights = parse_holdings({'aapl': 3, 'MSFT': 1})
+        self.assertEqual(symbols, ['AAPL', 'MSFT'])
+        np.testing.assert_allclose(weights, [0.75, 0.25])
+        symbols, _ = parse_holdings([{'symbol': 'KO', 'weight': 1}])
+        self.assertEqual(symbols, ['KO'])
+        for invalid in ({}, {'AAPL': -1}, [{'symbol': 'A', 'weight': 1}, {'symbol': 'a', 'weight': 1}], 'AAPL'):
+            with self.assertRaises(ValueError):
+                parse_holdings(invalid)
+    
+    def test_metrics_match_reference(self):
+        """Test volatility, beta and correlation against direct computations"""
+        rng = np.random.default_rng(11)
+        market = rng.normal(0, 0.01, 252)
+        first, second = random_walk(rng, 253, market, 1.5), random_walk(rng, 253, market, 0.5)
+        benchmark = 100 * np.concatenate([[1], np.cumprod(1 + market)])
+        weights = np.array([0.6, 0.4])
+        
+        result = portfolio_metrics(['A', 'B'], weights, [make_bars(first), make_bars(second)], make_bars(benchmark))
+        
+        returns = np.vstack([first[1:] / first[:-1] - 1, second[1:] / second[:-1] - 1])
+        daily = weights @ returns
+        self.assertEqual(result['period']['days'], 252)
+        self.assertAlmostEqual(result['portfolio']['volatility'], daily.std(ddof=1) * np.sqrt(252), places=5)
+        self.assertAlmostEqual(result['correlation']['matrix'][0][1], np.corrcoef(returns)[0, 1], places=5)
+        self.assertAlmostEqual(result['portfolio']['beta'],
+                               np.cov(daily, market)[0, 1] / market.var(ddof=1), places=5)
+        self.assertAlmostEqual(result['holdings'][0]['beta'], 1.5, delta=0.2)
+        self.assertAlmostEqual(sum(holding['risk_contribution'] for holding in result['holdings']), 1, places=5)
+        self.assertAlmostEqual(result['portfolio']['concentration']['hhi'], 0.52)
+    
+    def test_two_hundred_holdings_in_milliseconds(self):
+        """Test that a 200-holding portfolio is measured in milliseconds"""
+        rng = np.random.default_rng(13)
+        series = [make_bars(random_walk(rng, 400)) for _ in range(200)]
+        symbols = [f'S{number}' for number in range(200)]
+        weights = rng.uniform(1, 2, 200)
+        weights /= weights.sum()
+        
+        portfolio_metrics(symbols, weights, series)
+        started = time.perf_counter()
+        result = portfolio_metrics(symbols, weights, series)
+        self.assertLess(time.perf_counter() - started, 0.1)
+        self.assertEqual(len(result['correlation']['matrix']), 200)
+
+
+class PortfolioEndpointTests(unittest.TestCase):
+    """Test cases for the portfolio analysis endpoint"""
+    
+    def setUp(self):
+        """Set up advisors and a store with a few symbols"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.root = tempfile.mkdtemp()
+        self.patcher = patch('src.config.Config.PRICE_HISTORY_PATH', self.root)
+        self.patcher.start()
+        
+        rng = np.random.default_rng(17)
+        store = PriceHistoryStore(self.root)
+        for symbol in ('AAPL', 'KO', 'SPY'):
+            store.append(symbol, make_bars(random_walk(rng, 60)))
+        
+        with app.app_context():
+            db.create_all()
+            db.session.add(Persona(id='warren_buffett', name='Warren Buffett', description='Investor.',
+                                   personality={}, expertise=['value investing']))
+            db.session.commit()
+    
+    def tearDown(self):
+        """Clean up after tests"""
+        self.patcher.stop()
+        shutil.rmtree(self.root)
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+    
+    def test_portfolio_analysis(self):
+        """Test that risk metrics come with one advisor analysis of the whole portfolio"""
+        response = self.client.post('/api/portfolio/analysis', json={'holdings': {'AAPL': 70, 'KO': 30}})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['benchmark'], 'SPY')
+        self.assertEqual(data['period']['days'], 59)
+        self.assertEqual([holding['symbol'] for holding in data['holdings']], ['AAPL', 'KO'])
+        self.assertIsNotNone(data['portfolio']['beta'])
+        self.assertEqual(list(data['advisor_analysis']), ['warren_buffett'])
+        self.assertIn('2 holdings', data['advisor_analysis']['warren_buffett']['summary'])
+        
+        response = self.client.post('/api/portfolio/analysis', json={'holdings': {'AAPL': 1, 'TSLA': 1}})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('TSLA', json.loads(response.data)['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
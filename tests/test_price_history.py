@@ -0,0 +1,139 @@
+"""
+Test script for the TinyTroupe price history store and indicators
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import app
+from src.extensions import cache
+from src.services.price_history import BAR_DTYPE, PriceHistoryStore, compute_indicators
+
+
+def make_bars(closes, start='2024-01-01'):
+    """Build daily bars around a list of closing prices"""
+    closes = np.asarray(closes, dtype=float)
+    bars = np.zeros(len(closes), dtype=BAR_DTYPE)
+    bars['date'] = np.datetime64(start, 'D') + np.arange(len(closes))
+    bars['open'] = closes
+    bars['high'] = closes * 1.01
+    bars['low'] = closes * 0.99
+    bars['close'] = closes
+    bars['volume'] = 1000
+    return bars
+
+
+class PriceHistoryStoreTests(unittest.TestCase):
+    """Test cases for the memory-mapped price history store"""
+    
+    def setUp(self):
+        """Set up an empty store"""
+        self.root = tempfile.mkdtemp()
+        self.store = PriceHistoryStore(self.root)
+    
+    def tearDown(self):
+        """Remove the store files"""
+        shutil.rmtree(self.root)
+    
+    def test_append_only_updates(self):
+        """Test that days are appended in order and only the latest day can be revised"""
+        self.assertIsNone(self.store.series('AAPL'))
+        self.assertEqual(self.store.append('aapl', make_bars([10, 11, 12])), 3)
+        self.assertEqual(self.store.append('AAPL', [
+            {'date': '2024-01-03', 'open': 12, 'high': 13, 'low': 11, 'close': 12.5, 'volume': 10},
+            ('2024-01-04', 12.5, 13, 12, 13, 20),
+        ]), 2)
+        
+        bars = self.store.series('AAPL')
+        self.assertEqual(len(bars), 4)
+        self.assertEqual(bars['close'].tolist(), [10, 11, 12.5, 13])
+        self.assertEqual(self.store.symbols(), ['AAPL'])
+        
+        with self.assertRaises(ValueError):
+            self.store.append('AAPL', make_bars([9], start='2024-01-02'))
+        with self.assertRaises(ValueError):
+            self.store.series('../etc/passwd')
+    
+    def test_indicators_match_reference(self):
+        """Test vectorized indicators against straightforward computations"""
+        rng = np.random.default_rng(3)
+        closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 300)))
+        bars = make_bars(closes)
+        indicators, missing = compute_indicators([bars, None])
+        self.assertIsNone(missing)
+        
+        window = closes[-252:]
+        self.assertAlmostEqual(indicators['sma_20'], round(closes[-20:].mean(), 4))
+        self.assertAlmostEqual(indicators['high_52w'], round(window.max() * 1.01, 4))
+        self.assertAlmostEqual(indicators['low_52w'], round(window.min() * 0.99, 4))
+        self.assertAlmostEqual(indicators['max_drawdown'],
+                               round((window / np.maximum.accumulate(window) - 1).min(), 4))
+        
+        alpha = 2 / 13
+        weights = (1 - alpha) ** np.arange(252)[::-1]
+        self.assertAlmostEqual(indicators['ema_12'], round((window * weights).sum() / weights.sum(), 4))
+        self.assertTrue(0 <= indicators['rsi_14'] <= 100)
+        
+        short = compute_indicators([make_bars([10, 11, 12])])[0]
+        self.assertIsNone(short['sma_20'])
+        self.assertIsNone(short['rsi_14'])
+        self.assertEqual(short['close'], 12)
+    
+    def test_indicators_for_thousands_of_symbols(self):
+        """Test that indicators for a few thousand stored symbols take well under a second"""
+        rng = np.random.default_rng(5)
+        for number in range(2000):
+            self.store.append(f'S{number}', make_bars(100 * np.exp(np.cumsum(rng.normal(0, 0.01, 260)))))
+        
+        started = time.perf_counter()
+        results = compute_indicators([self.store.series(symbol) for symbol in self.store.symbols()])
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertEqual(len(results), 2000)
+        self.assertTrue(all(result['sma_200'] is not None for result in results))
+
+
+class PriceHistoryEndpointTests(unittest.TestCase):
+    """Test cases for the price history endpoint"""
+    
+    def setUp(self):
+        """Set up a store with one symbol"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.root = tempfile.mkdtemp()
+        self.patcher = patch('src.config.Config.PRICE_HISTORY_PATH', self.root)
+        self.patcher.start()
+        cache.clear()
+        PriceHistoryStore(self.root).append('MSFT', make_bars(np.linspace(100, 130, 30)))
+    
+    def tearDown(self):
+        """Remove the store files"""
+        self.patcher.stop()
+        shutil.rmtree(self.root)
+    
+    def test_history_endpoint(self):
+        """Test that bars are returned as columns with indicators, filtered by date and limit"""
+        response = self.client.get('/api/financial-data/msft/history?start=2024-01-11&limit=5')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['symbol'], 'MSFT')
+        self.assertEqual(data['bars'], 5)
+        self.assertEqual(data['series']['date'], ['2024-01-26', '2024-01-27', '2024-01-28', '2024-01-29', '2024-01-30'])
+        self.assertEqual(data['indicators']['close'], 130)
+        self.assertEqual(data['indicators']['as_of'], '2024-01-30')
+        
+        self.assertEqual(self.client.get('/api/financial-data/IBM/history').status_code, 404)
+        self.assertEqual(self.client.get('/api/financial-data/MSFT/history?start=soon').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Test script for TinyTroupe persona prompt compilation
+"""
+import os
+import sys
+import unittest
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.prompt_compiler import (PromptRegistry, route_expertise, DEFAULT_STRATEGY,
+                                          build_board_prompt, parse_board_reply)
+from src.services.tinytroupe_service import TinyTroupeService
+
+
+class PromptCompilerTests(unittest.TestCase):
+    """Test cases for compiled persona prompts"""
+    
+    def setUp(self):
+        """Set up a test advisor configuration"""
+        self.config = {
+            'id': 'john_keynes',
+            'name': 'John Maynard Keynes',
+            'description': 'Revolutionary economist.',
+            'personality': {'traits': ['contrarian'], 'communication_style': 'witty'},
+            'expertise': ['market psychology', 'macroeconomics', 'value investing']
+        }
+    
+    def test_routing_uses_strategy_priority(self):
+        """Test that value investing outranks macroeconomics regardless of list order"""
+        self.assertEqual(route_expertise(self.config['expertise']).key, 'value investing')
+        self.assertEqual(route_expertise(['thought experiments', 'pattern recognition']).key, 'pattern recognition')
+        self.assertIs(route_expertise(['astrology']), DEFAULT_STRATEGY)
+    
+    def test_compiled_once_per_version(self):
+        """Test that unchanged personas reuse their compiled prompts"""
+        registry = PromptRegistry()
+        first = registry.register(self.config)
+        self.assertIs(registry.register(dict(self.config)), first)
+        self.assertEqual(registry.compilations, 1)
+        
+        changed = dict(self.config, expertise=['macroeconomics'])
+        second = registry.register(changed)
+        self.assertIsNot(second, first)
+        self.assertNotEqual(second.version, first.version)
+        self.assertEqual(second.strategy.key, 'macroeconomics')
+        self.assertIs(registry.get('john_keynes'), second)
+    
+    def test_system_prompt_and_prompt_assembly(self):
+        """Test that the system prompt includes persona details"""
+        compiled = PromptRegistry().register(self.config)
+        self.assertIn('You are John Maynard Keynes.', compiled.system_prompt)
+        self.assertIn('Communication style: witty.', compiled.system_prompt)
+        
+        prompt = compiled.build_prompt('Should I buy bonds?', [
+            {'role': 'user', 'content': 'Hello'},
+            {'role': 'advisor', 'advisor_id': 'warren_buffett', 'content': 'Hi'}
+        ])
+        self.assertTrue(prompt.startswith(compiled.system_prompt))
+        self.assertIn('warren_buffett: Hi', prompt)
+        self.assertTrue(prompt.endswith('User: Should I buy bonds?\nJohn Maynard Keynes:'))
+    
+    def test_service_responses(self):
+        """Test that the service answers from the compiled templates"""
+        service = TinyTroupeService()
+        service.initialize_advisors([self.config])
+        
+        response = service.get_response('john_keynes', 'What about Tesla?', [])
+        self.assertTrue(response.startswith('As John Maynard Keynes, I would analyze this from a value investing'))
+        
+        analysis = service.analyze_stock('TSLA')
+        self.assertEqual(analysis['john_keynes']['name'], 'John Maynard Keynes')
+        self.assertIn('TSLA', analysis['john_keynes']['summary'])
+        
+        with self.assertRaises(ValueError):
+            service.get_response('unknown', 'Hi', [])
+    
+    def test_board_prompt_and_reply_parsing(self):
+        """Test that board prompts share one conversation prefix and replies are split per advisor"""
+        registry = PromptRegistry()
+        keynes = registry.register(self.config)
+        buffett = registry.register({'id': 'warren_buffett', 'name': 'Warren Buffett', 'expertise': ['value investing']})
+        history = [{'role': 'user', 'content': 'Hello'}]
+        
+        prompt = build_board_prompt([keynes, buffett], 'Should I buy bonds?', history)
+        self.assertEqual(prompt.count('User: Hello'), 1)
+        self.assertIn(keynes.system_prompt, prompt)
+        self.assertIn(buffett.system_prompt, prompt)
+        
+        reply = '```json\n{"replies": [{"advisor_id": "john_keynes", "content": "Rates first."},' \
+                ' {"advisor_id": "someone_else", "content": "Ignored."}]}\n```'
+        self.assertEqual(parse_board_reply(reply, ['john_keynes', 'warren_buffett']), {'john_keynes': 'Rates first.'})
+        
+        with self.assertRaises(ValueError):
+            parse_board_reply('Keynes: rates first. Buffett: moats.', ['john_keynes'])
+        with self.assertRaises(ValueError):
+            parse_board_reply('{"answers": {}}', ['john_keynes'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+"""
+Test script for TinyTroupe live quote streaming
+"""
+import os
+import sys
+import json
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import app
+from src.services.quote_stream import QuoteHub, SubscriberLimitExceeded, quote_hub
+
+
+class QuoteFeed:
+    """Stand-in provider whose price moves on every fetch"""
+    
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+    
+    def __call__(self, symbol, deadline=None):
+        with self.lock:
+            self.calls[symbol] = self.calls.get(symbol, 0) + 1
+            return {'symbol': symbol, 'price': 100.0 + self.calls[symbol], 'change_percent': 0.5}
+
+
+def wait_until(condition, timeout=2.0):
+    """Poll a condition until it holds or the timeout passes"""
+    started = time.monotonic()
+    while not condition() and time.monotonic() - started < timeout:
+        time.sleep(0.01)
+    return condition()
+
+
+class QuoteHubTests(unittest.TestCase):
+    """Test cases for shared quote polling and fan-out"""
+    
+    def setUp(self):
+        """Poll quickly from a fake provider"""
+        self.feed = QuoteFeed()
+        self.patchers = [
+            patch('src.config.Config.QUOTE_POLL_SECONDS', 0.02),
+            patch('src.services.financial_service.FinancialService._fetch_stock_data', side_effect=self.feed)
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        self.hub = QuoteHub(app)
+    
+    def tearDown(self):
+        """Stop the fake provider"""
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+    
+    def test_one_poller_per_symbol(self):
+        """Test that many subscribers share one poll loop, which stops with the last of them"""
+        subscriptions = [self.hub.subscribe('AAPL') for _ in range(5)] + [self.hub.subscribe('KO')]
+        for subscription in subscriptions:
+            event, quote = subscription.get(timeout=1)
+            self.assertEqual((event, quote['symbol']), ('quote', subscription.symbol))
+        self.assertEqual(self.hub.status()['AAPL']['subscribers'], 5)
+        
+        time.sleep(0.1)
+        polls = self.hub.status()['AAPL']['polls']
+        self.assertLessEqual(self.feed.calls['AAPL'], polls + 1)
+        
+        late = self.hub.subscribe('AAPL')
+        self.assertEqual(late.get(timeout=0)[0], 'quote')
+        
+        for subscription in subscriptions[:5] + [late]:
+            subscription.close()
+        late.close()
+        self.assertEqual(list(self.hub.status()), ['KO'])
+        time.sleep(0.05)
+        calls = self.feed.calls['AAPL']
+        time.sleep(0.1)
+        self.assertEqual(self.feed.calls['AAPL'], calls)
+        self.assertIsNone(late.get(timeout=0))
+        
+        subscriptions[-1].close()
+        self.assertEqual(self.hub.status(), {})
+    
+    def test_slow_subscriber_skips_to_latest_quote(self):
+        """Test that a subscriber that does not read holds only the newest update"""
+        slow = self.hub.subscribe('AAPL')
+        fast = self.hub.subscribe('AAPL')
+        prices = []
+        self.assertTrue(wait_until(lambda: prices.append(fast.get(timeout=1)[1]['price']) or len(prices) >= 5))
+        
+        self.assertGreaterEqual(slow.skipped, 4)
+        self.assertGreaterEqual(slow.get(timeout=0)[1]['price'], prices[-1])
+        fast.close()
+        slow.close()
+    
+    def test_subscriber_limit(self):
+        """Test that subscriptions beyond the limit are refused"""
+        with patch('src.config.Config.QUOTE_STREAM_MAX_SUBSCRIBERS', 1):
+            subscription = self.hub.subscribe('AAPL')
+            with self.assertRaises(SubscriberLimitExceeded):
+                self.hub.subscribe('KO')
+            subscription.close()
+
+
+class QuoteStreamEndpointTests(unittest.TestCase):
+    """Test cases for the live quote stream endpoint"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+    
+    def test_stream_quotes(self):
+        """Test that clients receive quote events and disconnecting stops the poller"""
+        with patch('src.config.Config.QUOTE_POLL_SECONDS', 0.02), \
+                patch('src.services.financial_service.FinancialService._fetch_stock_data', side_effect=QuoteFeed()):
+            responses = [self.client.get('/api/financial-data/aapl/stream', buffered=False) for _ in range(2)]
+            for response in responses:
+                self.assertEqual(response.mimetype, 'text/event-stream')
+                frame = next(frame for frame in response.response if frame.startswith(b'event:'))
+                event, data = frame.decode().strip().split('\n')
+                self.assertEqual(event, 'event: quote')
+                self.assertEqual(json.loads(data[len('data: '):])['symbol'], 'AAPL')
+            self.assertEqual(quote_hub.status()['AAPL']['subscribers'], 2)
+            
+            # Streams pushed their request contexts in this thread, so they are closed in reverse
+            for response in reversed(responses):
+                response.close()
+            self.assertEqual(quote_hub.status(), {})
+        
+        self.assertEqual(self.client.get('/api/financial-data/$$$/stream').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+"""
+Test script for the TinyTroupe stock screener
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import app
+from src.routes.financial import financial_service
+from src.services.fundamentals_index import FundamentalsIndex, fundamentals_index, parse_filters, parse_number
+from src.services.price_history import BAR_DTYPE, PriceHistoryStore
+
+
+def make_universe(size, seed=1):
+    """Build random quote records"""
+    rng = np.random.default_rng(seed)
+    lows = rng.uniform(10, 200, size)
+    return [{
+        'symbol': f'T{number:05d}',
+        'price': float(lows[number] * rng.uniform(1, 1.5)),
+        'pe_ratio': float(rng.uniform(5, 40)) if number % 10 else None,
+        'dividend_yield': float(rng.uniform(0, 6)),
+        'market_cap': f'{rng.uniform(1, 500):.2f}B',
+        '52_week_low': float(lows[number]),
+        '52_week_high': float(lows[number] * 1.5)
+    } for number in range(size)]
+
+
+class FundamentalsIndexTests(unittest.TestCase):
+    """Test cases for the columnar fundamentals index"""
+    
+    def test_parsing(self):
+        """Test quote number and filter parsing"""
+        self.assertEqual(parse_number('123.45B'), 123.45e9)
+        self.assertEqual(parse_number(2.5), 2.5)
+        self.assertTrue(np.isnan(parse_number(None)))
+        self.assertEqual(parse_filters({'pe_lt': '15', '52_week_low_gte': '10'}),
+                         [('pe_ratio', 'lt', 15.0), ('52_week_low', 'gte', 10.0)])
+        for invalid in ({'beta_lt': '1'}, {'pe_near': '1'}, {'pe_lt': 'cheap'}):
+            with self.assertRaises(ValueError):
+                parse_filters(invalid)
+    
+    def test_screen_matches_brute_force(self):
+        """Test filters, sorting and pagination against a plain Python screen over 5000 symbols"""
+        records = make_universe(5000)
+        index = FundamentalsIndex(capacity=16)
+        index.upsert(records[:100])
+        index.upsert(records[100:])
+        self.assertEqual(index.size, 5000)
+        
+        filters = parse_filters({'pe_lt': '15', 'dividend_yield_gt': '3'})
+        started = time.perf_counter()
+        total, page = index.screen(filters, sort='-dividend_yield', limit=20, offset=20)
+        self.assertLess(time.perf_counter() - started, 0.05)
+        
+        expected = sorted((record for record in records
+                           if record['pe_ratio'] is not None and record['pe_ratio'] < 15
+                           and record['dividend_yield'] > 3),
+                          key=lambda record: -record['dividend_yield'])
+        self.assertEqual(total, len(expected))
+        self.assertEqual([row['symbol'] for row in page], [record['symbol'] for record in expected[20:40]])
+        
+        # Unknown values never match a filter and sort last
+        total, page = index.screen([], sort='pe_ratio', limit=10, offset=4495)
+        self.assertEqual(total, 5000)
+        self.assertIsNotNone(page[4]['pe_ratio'])
+        self.assertIsNone(page[5]['pe_ratio'])
+    
+    def test_incremental_updates(self):
+        """Test that upserts update rows in place and keep derived columns current"""
+        index = FundamentalsIndex()
+        index.upsert([{'symbol': 'ko', 'price': 55, '52_week_low': 50, '52_week_high': 60, 'pe_ratio': 20}])
+        index.upsert([{'symbol': 'KO', 'price': 58}])
+        total, page = index.screen(parse_filters({'range_position_gt': '0.7'}))
+        self.assertEqual(total, 1)
+        self.assertEqual(page[0]['pe_ratio'], 20)
+        self.assertAlmostEqual(page[0]['range_position'], 0.8)
+
+
+class ScreenEndpointTests(unittest.TestCase):
+    """Test cases for the screen endpoint"""
+    
+    def setUp(self):
+        """Set up an index fed by a quote and by the price history"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.root = tempfile.mkdtemp()
+        self.patcher = patch('src.config.Config.PRICE_HISTORY_PATH', self.root)
+        self.patcher.start()
+        fundamentals_index.clear()
+        financial_service._synced_versions.clear()
+        
+        bars = np.zeros(3, dtype=BAR_DTYPE)
+        bars['date'] = np.datetime64('2024-01-01', 'D') + np.arange(3)
+        bars['close'] = bars['high'] = bars['low'] = [40, 50, 45]
+        PriceHistoryStore(self.root).append('JNJ', bars)
+        fundamentals_index.upsert([{'symbol': 'JNJ', 'pe_ratio': 14, 'dividend_yield': 3.2}])
+    
+    def tearDown(self):
+        """Remove the store files"""
+        self.patcher.stop()
+        shutil.rmtree(self.root)
+        fundamentals_index.clear()
+    
+    def test_screen_endpoint(self):
+        """Test that fundamentals and synced prices are screened together"""
+        with patch('src.config.Config.SCREENER_REFRESH_SECONDS', 0):
+            response = self.client.get('/api/financial-data/screen?pe_lt=15&price_gt=40&sort=-dividend_yield')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['total'], 1)
+        result = data['results'][0]
+        self.assertEqual((result['symbol'], result['price'], result['52_week_high']), ('JNJ', 45, 50))
+        self.assertAlmostEqual(result['change_percent'], -10)
+        
+        self.assertEqual(self.client.get('/api/financial-data/screen?beta_lt=1').status_code, 400)
+        self.assertEqual(self.client.get('/api/financial-data/screen?limit=0').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Test script for the TinyTroupe symbol master and lookup
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import app
+from src.services.symbol_master import SymbolMaster, UnknownSymbolError
+
+LISTING = (
+    'Symbol,Name,Exchange\n'
+    'AAPL,Apple Inc.,NASDAQ\n'
+    'APP,AppLovin Corporation,NASDAQ\n'
+    'AMAT,Applied Materials Inc.,NASDAQ\n'
+    'BAC,Bank of America Corporation,NYSE\n'
+    'BRK.B,Berkshire Hathaway Inc.,NYSE\n'
+    'bad symbol,Skipped,NYSE\n'
+)
+
+
+def write_listing(path, text=LISTING):
+    """Write a symbol master file"""
+    with open(path, 'w') as handle:
+        handle.write(text)
+
+
+class SymbolMasterTests(unittest.TestCase):
+    """Test cases for the symbol master prefix index"""
+    
+    def setUp(self):
+        """Set up a symbol master file"""
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'symbols.csv')
+        write_listing(self.path)
+        self.master = SymbolMaster(self.path)
+    
+    def tearDown(self):
+        """Remove the symbol master file"""
+        shutil.rmtree(self.root)
+    
+    def test_search(self):
+        """Test that ticker matches lead, followed by company name word matches"""
+        self.assertEqual(self.master.size, 5)
+        self.assertEqual([row['symbol'] for row in self.master.search('app')], ['APP', 'AAPL', 'AMAT'])
+        self.assertEqual([row['symbol'] for row in self.master.search('APP', limit=1)], ['APP'])
+        self.assertEqual(self.master.search('bank of')[0], {'symbol': 'BAC', 'name': 'Bank of America Corporation',
+                                                            'exchange': 'NYSE'})
+        self.assertEqual([row['symbol'] for row in self.master.search('brk.')], ['BRK.B'])
+        self.assertEqual(self.master.search(''), [])
+    
+    def test_validate_and_reload(self):
+        """Test validation against the list, and that file changes are picked up"""
+        self.assertEqual(self.master.validate(' aapl '), 'AAPL')
+        with self.assertRaises(UnknownSymbolError):
+            self.master.validate('APPL')
+        with self.assertRaises(ValueError):
+            self.master.validate('not a symbol')
+        
+        write_listing(self.path, LISTING + 'APPL,Typo Holdings,OTC\n')
+        os.utime(self.path, ns=(0, time.time_ns() + 10 ** 9))
+        self.assertEqual(self.master.validate('APPL'), 'APPL')
+        
+        os.remove(self.path)
+        self.assertEqual(self.master.validate('ANYTHING'), 'ANYTHING')
+    
+    def test_lookup_speed(self):
+        """Test that lookups over a large universe take well under a millisecond"""
+        self.master.load({'symbol': f'S{number:05d}', 'name': f'Company {number} Holdings'} for number in range(50000))
+        started = time.perf_counter()
+        for prefix in ('S1', 'S0001', 'comp', 'hold', 'zzz') * 200:
+            self.master.search(prefix, limit=10)
+        self.assertLess((time.perf_counter() - started) / 1000, 0.0005)
+
+
+class SymbolEndpointTests(unittest.TestCase):
+    """Test cases for symbol lookup and validation in the financial data endpoints"""
+    
+    def setUp(self):
+        """Set up a symbol master file"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.root = tempfile.mkdtemp()
+        path = os.path.join(self.root, 'symbols.csv')
+        write_listing(path)
+        self.patcher = patch('src.config.Config.SYMBOL_MASTER_PATH', path)
+        self.patcher.start()
+    
+    def tearDown(self):
+        """Remove the symbol master file"""
+        self.patcher.stop()
+        shutil.rmtree(self.root)
+    
+    def test_symbols_endpoint(self):
+        """Test prefix lookup"""
+        response = self.client.get('/api/financial-data/symbols?prefix=ban&limit=5')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual([row['symbol'] for row in data['results']], ['BAC'])
+        self.assertEqual(data['universe'], 5)
+        self.assertEqual(self.client.get('/api/financial-data/symbols?prefix=a&limit=0').status_code, 400)
+    
+    @patch('src.services.financial_service.FinancialService._fetch_stock_data')
+    def test_unknown_symbols_never_reach_the_provider(self, mock_fetch):
+        """Test that unknown and malformed symbols are rejected before any upstream call"""
+        self.assertEqual(self.client.get('/api/financial-data/APPL').status_code, 404)
+        self.assertEqual(self.client.get('/api/financial-data/APPL/analysis').status_code, 404)
+        self.assertEqual(self.client.get('/api/financial-data/$$$/analysis').status_code, 400)
+        mock_fetch.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+"""
+Test script for TinyTroupe watchlists and off-peak pre-warming
+"""
+import os
+import sys
+import json
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import app
+from src.config import Config
+from src.extensions import cache, db
+from src.rate_limit import TokenBucket
+from src.services.prewarm import PrewarmScheduler, in_window, prewarm_scheduler
+
+
+class SchedulingTests(unittest.TestCase):
+    """Test cases for the pre-warm window and rate limiting"""
+    
+    def test_window(self):
+        """Test off-peak windows, including ones past midnight, and one run per day"""
+        self.assertTrue(in_window(datetime(2024, 3, 1, 8, 30), '08:00-11:00'))
+        self.assertFalse(in_window(datetime(2024, 3, 1, 11, 0), '08:00-11:00'))
+        self.assertTrue(in_window(datetime(2024, 3, 1, 1, 0), '22:00-02:00'))
+        self.assertFalse(in_window(datetime(2024, 3, 1, 12, 0), '22:00-02:00'))
+        with self.assertRaises(ValueError):
+            in_window(datetime(2024, 3, 1), 'nightly')
+        
+        scheduler = PrewarmScheduler()
+        with patch('src.config.Config.PREWARM_WINDOW_UTC', '08:00-11:00'):
+            self.assertTrue(scheduler.due(datetime(2024, 3, 1, 9, 0)))
+            scheduler.last_run = datetime(2024, 3, 1, 8, 0)
+            self.assertFalse(scheduler.due(datetime(2024, 3, 1, 9, 0)))
+            self.assertTrue(scheduler.due(datetime(2024, 3, 2, 9, 0)))
+    
+    def test_token_bucket(self):
+        """Test that calls beyond the burst wait for the bucket to refill"""
+        bucket = TokenBucket(600)  # 10 per second
+        started = time.perf_counter()
+        self.assertTrue(bucket.acquire(10))
+        self.assertTrue(bucket.acquire(2))
+        self.assertGreaterEqual(time.perf_counter() - started, 0.15)
+        
+        stop = threading.Event()
+        stop.set()
+        self.assertFalse(bucket.acquire(5, stop))
+        self.assertTrue(TokenBucket(0).acquire(1000))
+
+
+class WatchlistTests(unittest.TestCase):
+    """Test cases for watchlist endpoints and pre-warming"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        cache.clear()
+        with app.app_context():
+            db.create_all()
+    
+    def tearDown(self):
+        """Clean up after tests"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+    
+    def test_watchlist_endpoints(self):
+        """Test adding, listing and removing watched symbols"""
+        response = self.client.post('/api/watchlist', json={'user_id': 'ann', 'symbols': ['msft', 'AAPL', 'MSFT']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['symbol'] for item in json.loads(response.data)], ['AAPL', 'MSFT'])
+        self.client.post('/api/watchlist', json={'user_id': 'bob', 'symbols': ['AAPL']})
+        
+        response = self.client.get('/api/watchlist?user_id=ann')
+        self.assertEqual([(item['symbol'], item['quote']) for item in json.loads(response.data)],
+                         [('AAPL', None), ('MSFT', None)])
+        
+        self.assertEqual(self.client.post('/api/watchlist', json={'symbols': ['$$$']}).status_code, 400)
+        self.assertEqual(self.client.post('/api/watchlist', json={'symbols': 'AAPL'}).status_code, 400)
+        with patch('src.config.Config.WATCHLIST_MAX_SYMBOLS', 2):
+            response = self.client.post('/api/watchlist', json={'user_id': 'ann', 'symbols': ['KO']})
+            self.assertEqual(response.status_code, 400)
+        
+        response = self.client.delete('/api/watchlist/msft?user_id=ann')
+        self.assertEqual([item['symbol'] for item in json.loads(response.data)], ['AAPL'])
+        self.assertEqual(self.client.delete('/api/watchlist/MSFT?user_id=ann').status_code, 404)
+    
+    def test_prewarm_makes_watched_views_cache_hits(self):
+        """Test that a pre-warm run fetches each watched symbol once and later views never go upstream"""
+        self.client.post('/api/watchlist', json={'user_id': 'ann', 'symbols': ['AAPL', 'KO']})
+        self.client.post('/api/watchlist', json={'user_id': 'bob', 'symbols': ['AAPL']})
+        
+        limits = {'PREWARM_QUOTES_PER_MINUTE': 0, 'PREWARM_LLM_CALLS_PER_MINUTE': 0, 'PREWARM_WORKERS': 2}
+        with patch.multiple('src.config.Config', **limits):
+            with patch('src.services.financial_service.FinancialService._fetch_stock_data',
+                       side_effect=lambda symbol, deadline=None: {'symbol': symbol, 'price': 10.0,
+                                                                  'change_percent': 1.5}) as fetch, \
+                    patch.object(cache.backend, 'set', wraps=cache.backend.set) as stored:
+                result = prewarm_scheduler.run()
+        self.assertEqual((result['symbols'], result['warmed'], result['errors']), (2, 2, {}))
+        self.assertEqual(sorted(call.args[0] for call in fetch.call_args_list), ['AAPL', 'KO'])
+        
+        # Only analyses are kept until the next run; quotes expire as usual
+        ttls = {call.args[0]: call.args[2] for call in stored.call_args_list}
+        self.assertEqual(ttls['analysis:KO'], Config.PREWARM_TTL_SECONDS)
+        self.assertNotEqual(ttls['quotes:KO'], Config.PREWARM_TTL_SECONDS)
+        self.assertEqual(ttls['quotes:KO'], cache.namespace('quotes').ttl)
+        
+        with patch('src.services.financial_service.FinancialService._fetch_stock_data') as fetch, \
+                patch('src.services.tinytroupe_service.TinyTroupeService.analyze_stock') as analyze:
+            response = self.client.get('/api/financial-data/KO/analysis')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.data)['stock_data']['price'], 10.0)
+            fetch.assert_not_called()
+            analyze.assert_not_called()
+        
+        watchlist = json.loads(self.client.get('/api/watchlist?user_id=ann').data)
+        self.assertEqual(watchlist[0]['quote']['price'], 10.0)
+        with patch('src.config.Config.ADMIN_TOKEN', 'secret'):
+            response = self.client.get('/api/admin/prewarm', headers={'X-Admin-Token': 'secret'})
+        self.assertEqual(json.loads(response.data)['last_run']['warmed'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,13 +5,21 @@ import os
 import sys
 import unittest
 import json
+import gzip
+import time
+import threading
 from unittest.mock import patch, MagicMock
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.main import app, db
-from src.models import Conversation, Message, Persona, PersonaState
+from src.extensions import cache
+from src.routes.conversation import conversation_service
+from src.services.hedging import hedged_executor
+from src.services.usage_service import UsageService
+from src.services.response_reuse import response_reuse
+from src.models import Conversation, IdempotencyKey, Message, Persona, PersonaState
 
 class TinyTroupeWebInterfaceTests(unittest.TestCase):
     """Test cases for TinyTroupe Service web interface"""
@@ -19,8 +27,10 @@ class TinyTroupeWebInterfaceTests(unittest.TestCase):
     def setUp(self):
         """Set up test environment"""
         app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
         self.client = app.test_client()
+        cache.clear()
+        conversation_service.usage.drain()
+        response_reuse.clear()
         
         with app.app_context():
             # Create tables
@@ -195,6 +205,415 @@ class TinyTroupeWebInterfaceTests(unittest.TestCase):
         self.assertEqual(len(data['advisor_analysis']), 2)
         self.assertEqual(data['advisor_analysis']['warren_buffett']['name'], 'Warren Buffett')
         self.assertEqual(data['advisor_analysis']['albert_einstein']['name'], 'Albert Einstein')
+    
+    def test_response_compression(self):
+        """Test that large JSON responses are gzip encoded when the client accepts it"""
+        conversation_response = self.client.post(
+            '/api/conversations',
+            json={'title': 'Compression Test', 'user_id': 'test_user'}
+        )
+        conversation_id = json.loads(conversation_response.data)['id']
+        
+        with app.app_context():
+            for i in range(50):
+                db.session.add(Message(
+                    conversation_id=conversation_id,
+                    role='user',
+                    content=f'Message number {i} about long term value investing.'
+                ))
+            db.session.commit()
+        
+        url = f'/api/conversations/{conversation_id}/messages'
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.data))), 50)
+        
+        # Without Accept-Encoding the body is sent as is
+        response = self.client.get(url)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(len(json.loads(response.data)), 50)
+        
+        # Responses below the size threshold are not compressed
+        response = self.client.get(f'/api/conversations/{conversation_id}', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+    
+    def test_json_provider_matches_stdlib(self):
+        """Test that the fast JSON provider encodes the same data as the stdlib, in the documented format"""
+        payload = {'b': [1, 2.5, None, True], 'a': {'nested': 'caf\u00e9'}, 1: 'int key'}
+        fast = app.json.dumps(payload)
+        self.assertEqual(json.loads(fast), json.loads(json.dumps(payload)))
+        self.assertEqual(app.json.loads(fast)['a']['nested'], 'caf\u00e9')
+        
+        # Same data, but orjson does not escape non-ASCII characters and formats some floats differently
+        if app.json.fast:
+            self.assertEqual(app.json.dumps_bytes({'a': 'caf\u00e9', 'f': 1e16}, separators=(',', ':')),
+                             '{"a":"caf\u00e9","f":1e16}'.encode('utf-8'))
+            self.assertEqual(json.dumps({'a': 'caf\u00e9', 'f': 1e16}, separators=(',', ':')),
+                             '{"a":"caf\\u00e9","f":1e+16}')
+    
+    def test_usage_ledger_and_budgets(self):
+        """Test that turns are recorded in the usage ledger and hard budgets reject turns"""
+        conversation_response = self.client.post(
+            '/api/conversations',
+            json={'title': 'Usage Test', 'user_id': 'test_user'}
+        )
+        conversation_id = json.loads(conversation_response.data)['id']
+        
+        response = self.client.post(
+            f'/api/conversations/{conversation_id}/messages',
+            json={'content': 'Is the market overvalued?'}
+        )
+        self.assertEqual(response.status_code, 201)
+        
+        response = self.client.get(f'/api/usage?group_by=advisor&conversation_id={conversation_id}')
+        self.assertEqual(response.status_code, 200)
+        rows = {row['advisor']: row for row in json.loads(response.data)}
+        self.assertEqual(set(rows), {'warren_buffett', 'albert_einstein'})
+        for row in rows.values():
+            self.assertEqual(row['calls'], 1)
+            self.assertGreater(row['prompt_tokens'], 0)
+            self.assertGreater(row['cost_usd'], 0)
+        
+        response = self.client.get('/api/usage?group_by=user&user_id=test_user')
+        used = json.loads(response.data)[0]['total_tokens']
+        
+        with patch('src.config.Config.USAGE_USER_HARD_DAILY_TOKENS', used):
+            response = self.client.post(
+                f'/api/conversations/{conversation_id}/messages',
+                json={'content': 'And now?'}
+            )
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(json.loads(response.data)['budget']['scope'], 'user')
+            
+            response = self.client.get('/api/usage/budget?user_id=test_user')
+            self.assertEqual(json.loads(response.data)['status'], 'rejected')
+        
+        with patch('src.config.Config.USAGE_USER_SOFT_DAILY_TOKENS', used):
+            self.client.post(
+                f'/api/conversations/{conversation_id}/messages',
+                json={'content': 'And now?'}
+            )
+            response = self.client.get(f'/api/usage?group_by=model&conversation_id={conversation_id}')
+            models = {row['model']: row['calls'] for row in json.loads(response.data)}
+            self.assertEqual(models, {'gpt-4o': 2, 'gpt-4o-mini': 2})
+        
+        self.assertEqual(self.client.get('/api/usage?group_by=planet').status_code, 400)
+    
+    def test_usage_is_collected_per_turn(self):
+        """Test that concurrent collections only see their own calls, including those run on the pool"""
+        usage = UsageService()
+        barrier = threading.Barrier(2)
+        drained = {}
+        
+        def turn(name):
+            with usage.collect() as batch:
+                usage.record(name, 'response', 'gpt-4o', 'prompt', 'completion', 1)
+                barrier.wait()
+                hedged_executor.call(name, lambda: usage.record(name, 'analysis', 'gpt-4o', 'p', 'c', 1))
+                barrier.wait()
+                drained[name] = batch.drain()
+        
+        threads = [threading.Thread(target=turn, args=(name,)) for name in ('first', 'second')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        for name, entries in drained.items():
+            self.assertEqual([(entry['advisor_id'], entry['operation']) for entry in entries],
+                             [(name, 'response'), (name, 'analysis')])
+        
+        # Calls recorded outside a collection wait in this instance's buffer only
+        usage.record('outside', 'response', 'gpt-4o', 'prompt', 'completion', 1)
+        self.assertEqual(conversation_service.usage.drain(), [])
+        self.assertEqual([entry['advisor_id'] for entry in usage.drain()], ['outside'])
+    
+    def test_advisor_routing(self):
+        """Test that top-k routing skips irrelevant advisors unless they are mentioned"""
+        response = self.client.post(
+            '/api/conversations',
+            json={'title': 'Routing Test', 'user_id': 'test_user',
+                  'settings': {'routing': {'mode': 'top_k', 'k': 1}}}
+        )
+        self.assertEqual(response.status_code, 201)
+        conversation_id = json.loads(response.data)['id']
+        
+        response = self.client.post(
+            f'/api/conversations/{conversation_id}/messages',
+            json={'content': 'Is this stock undervalued given its moat?'}
+        )
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data)
+        self.assertEqual(data['routing_mode'], 'top_k')
+        self.assertEqual([r['advisor_id'] for r in data['advisor_responses']], ['warren_buffett'])
+        self.assertEqual(data['skipped_advisors'][0]['advisor_id'], 'albert_einstein')
+        self.assertEqual(data['skipped_advisors'][0]['reason'], 'not in top 1')
+        
+        # An @-mention brings an advisor in regardless of relevance
+        response = self.client.post(
+            f'/api/conversations/{conversation_id}/messages',
+            json={'content': '@einstein is this stock undervalued?'}
+        )
+        data = json.loads(response.data)
+        self.assertEqual({r['advisor_id'] for r in data['advisor_responses']},
+                         {'warren_buffett', 'albert_einstein'})
+        self.assertEqual(data['skipped_advisors'], [])
+        
+        # Switching back to everyone answering
+        response = self.client.patch(
+            f'/api/conversations/{conversation_id}',
+            json={'settings': {'routing': {'mode': 'all'}}}
+        )
+        self.assertEqual(json.loads(response.data)['settings']['routing']['mode'], 'all')
+        
+        response = self.client.patch(
+            f'/api/conversations/{conversation_id}',
+            json={'settings': {'routing': {'mode': 'loudest'}}}
+        )
+        self.assertEqual(response.status_code, 400)
+    
+    @patch('src.services.tinytroupe_service.TinyTroupeService.get_response')
+    def test_near_duplicate_response_reuse(self, mock_get_response):
+        """Test that paraphrased questions reuse recent answers unless disabled for the advisor"""
+        mock_get_response.return_value = "Tesla trades far above intrinsic value."
+        
+        def ask(content):
+            response = self.client.post('/api/conversations', json={'title': 'Reuse Test', 'user_id': 'test_user'})
+            conversation_id = json.loads(response.data)['id']
+            response = self.client.post(f'/api/conversations/{conversation_id}/messages', json={'content': content})
+            return {r['advisor_id']: r for r in json.loads(response.data)['advisor_responses']}
+        
+        first = ask('Is Tesla overvalued?')
+        self.assertEqual(mock_get_response.call_count, 2)
+        self.assertEqual(first['warren_buffett']['metadata'], {})
+        
+        second = ask('tesla too expensive?')
+        self.assertEqual(mock_get_response.call_count, 2)
+        self.assertTrue(second['warren_buffett']['metadata']['reused'])
+        self.assertEqual(second['warren_buffett']['content'], "Tesla trades far above intrinsic value.")
+        
+        # Questions that refer back to the conversation are always answered afresh
+        ask('Is it too expensive?')
+        self.assertEqual(mock_get_response.call_count, 4)
+        
+        # So are negated questions, which embed like their opposite once stop words are dropped
+        for content in ('Is Tesla not overvalued?', "Tesla isn't too expensive?"):
+            negated = ask(content)
+            self.assertEqual(negated['warren_buffett']['metadata'], {})
+        self.assertEqual(mock_get_response.call_count, 8)
+        
+        with patch('src.config.Config.ADMIN_TOKEN', 'secret'):
+            response = self.client.patch('/api/advisors/warren_buffett', json={'response_reuse': False})
+            self.assertEqual(response.status_code, 401)
+            response = self.client.patch('/api/advisors/warren_buffett', json={'response_reuse': False},
+                                         headers={'X-Admin-Token': 'wrong'})
+            self.assertEqual(response.status_code, 401)
+            response = self.client.patch('/api/advisors/warren_buffett', json={'response_reuse': False},
+                                         headers={'X-Admin-Token': 'secret'})
+        self.assertFalse(json.loads(response.data)['response_reuse'])
+        third = ask('Is Tesla too pricey?')
+        self.assertEqual(mock_get_response.call_count, 9)
+        self.assertEqual(third['warren_buffett']['metadata'], {})
+        self.assertTrue(third['albert_einstein']['metadata']['reused'])
+        
+        # Reuse is persisted with the message
+        with app.app_context():
+            message = Message.query.filter_by(advisor_id='albert_einstein', content=third['albert_einstein']['content']
+                                              ).order_by(Message.timestamp.desc()).first()
+            self.assertTrue(message.to_dict()['metadata']['reused'])
+    
+    @patch('src.services.tinytroupe_service.TinyTroupeService.get_response')
+    def test_board_generation_mode(self, mock_get_response):
+        """Test that board mode answers every advisor with one call and falls back on bad output"""
+        mock_get_response.return_value = "Separate answer."
+        response = self.client.post(
+            '/api/conversations',
+            json={'title': 'Board Test', 'user_id': 'test_user', 'settings': {'generation_mode': 'board'}}
+        )
+        conversation_id = json.loads(response.data)['id']
+        
+        response = self.client.post(
+            f'/api/conversations/{conversation_id}/messages',
+            json={'content': 'What matters most in this market?'}
+        )
+        data = json.loads(response.data)
+        self.assertEqual(data['generation_mode'], 'board')
+        self.assertEqual(len(data['advisor_responses']), 2)
+        for advisor_response in data['advisor_responses']:
+            self.assertEqual(advisor_response['metadata'], {'generation': 'board'})
+        mock_get_response.assert_not_called()
+        
+        # The one call is charged to the advisors that took part, in even shares
+        response = self.client.get(f'/api/usage?group_by=advisor&conversation_id={conversation_id}')
+        rows = json.loads(response.data)
+        self.assertEqual({row['advisor'] for row in rows}, {'warren_buffett', 'albert_einstein'})
+        self.assertLessEqual(abs(rows[0]['total_tokens'] - rows[1]['total_tokens']), 2)
+        with patch('src.config.Config.USAGE_ADVISOR_HARD_DAILY_TOKENS', rows[0]['total_tokens'] - 2):
+            response = self.client.post(f'/api/conversations/{conversation_id}/messages', json={'content': 'And now?'})
+            self.assertEqual(json.loads(response.data)['advisor_responses'], [])
+        
+        with patch('src.services.tinytroupe_service.parse_board_reply', side_effect=ValueError('not JSON')):
+            response = self.client.post(
+                f'/api/conversations/{conversation_id}/messages',
+                json={'content': 'What matters most in this market?'}
+            )
+        data = json.loads(response.data)
+        self.assertEqual(mock_get_response.call_count, 2)
+        self.assertEqual({r['content'] for r in data['advisor_responses']}, {"Separate answer."})
+        
+        response = self.client.patch(
+            f'/api/conversations/{conversation_id}',
+            json={'settings': {'generation_mode': 'committee'}}
+        )
+        self.assertEqual(response.status_code, 400)
+    
+    def test_deadline_degrades_slow_advisors(self):
+        """Test that advisors still answering at the request deadline fall back to their template response"""
+        response = self.client.post('/api/conversations', json={'title': 'Deadline Test', 'user_id': 'test_user'})
+        conversation_id = json.loads(response.data)['id']
+        
+        def slow_response(*args, **kwargs):
+            time.sleep(1)
+            return "Too late."
+        
+        with patch('src.services.tinytroupe_service.TinyTroupeService.get_response', side_effect=slow_response), \
+                patch('src.config.Config.DEADLINE_RESERVE_MS', 50):
+            started = time.monotonic()
+            response = self.client.post(
+                f'/api/conversations/{conversation_id}/messages',
+                json={'content': 'What is the outlook for value stocks?'},
+                headers={'X-Request-Deadline-Ms': '300'}
+            )
+            self.assertLess(time.monotonic() - started, 0.9)
+        
+        self.assertEqual(response.status_code, 201)
+        for advisor_response in json.loads(response.data)['advisor_responses']:
+            self.assertEqual(advisor_response['metadata'], {'degraded': True, 'reason': 'deadline'})
+            self.assertTrue(advisor_response['content'].startswith('As '))
+        
+        response = self.client.get('/api/financial-data/AAPL', headers={'X-Request-Deadline-Ms': 'soon'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_stream_disconnect_cancels_pending_advisors(self):
+        """Test that closing a streamed turn cancels advisors still answering, and a retry replays it"""
+        response = self.client.post('/api/conversations', json={'title': 'Stream Test', 'user_id': 'test_user'})
+        conversation_id = json.loads(response.data)['id']
+        
+        def response_for(advisor_id, *args, **kwargs):
+            if advisor_id == 'albert_einstein':
+                time.sleep(2)
+            return f"Answer from {advisor_id}."
+        
+        with patch('src.services.tinytroupe_service.TinyTroupeService.get_response', side_effect=response_for):
+            response = self.client.post(
+                f'/api/conversations/{conversation_id}/messages/stream',
+                json={'content': 'What is the outlook for value stocks?'},
+                headers={'Idempotency-Key': 'stream-1'},
+                buffered=False
+            )
+            self.assertEqual(response.mimetype, 'text/event-stream')
+            chunks = iter(response.response)
+            self.assertIn(b'event: user_message', next(chunks))
+            frame = next(chunks)
+            self.assertIn(b'event: advisor_response', frame)
+            self.assertIn(b'Answer from warren_buffett.', frame)
+            started = time.monotonic()
+            response.close()
+            
+            stored, completed = {}, False
+            while time.monotonic() - started < 1.5 and (len(stored) < 2 or not completed):
+                time.sleep(0.05)
+                with app.app_context():
+                    stored = {message.advisor_id: message for message in
+                              Message.query.filter_by(conversation_id=conversation_id, role='advisor')}
+                    completed = IdempotencyKey.query.filter_by(key='stream-1', status_code=201).count() > 0
+            
+            # A retry with the same key, as the CLI sends after a dropped connection, replays the cancelled turn
+            retry = self.client.post(
+                f'/api/conversations/{conversation_id}/messages/stream',
+                json={'content': 'What is the outlook for value stocks?'},
+                headers={'Idempotency-Key': 'stream-1'}
+            )
+        
+        self.assertTrue(completed)
+        self.assertEqual(retry.headers.get('Idempotent-Replayed'), 'true')
+        self.assertIn(b'"cancelled":true', retry.data)
+        with app.app_context():
+            self.assertEqual(Message.query.filter_by(conversation_id=conversation_id, role='user').count(), 1)
+            self.assertEqual(Message.query.filter_by(conversation_id=conversation_id, role='advisor').count(), 2)
+        
+        self.assertEqual(stored['warren_buffett'].content, 'Answer from warren_buffett.')
+        self.assertEqual(stored['albert_einstein'].content, '')
+        self.assertEqual(stored['albert_einstein'].meta, {'cancelled': True})
+        
+        messages = json.loads(self.client.get(f'/api/conversations/{conversation_id}/messages').data)
+        self.assertIn({'cancelled': True}, [message['metadata'] for message in messages])
+    
+    def test_stream_closed_before_start_releases_turn_and_key(self):
+        """Test that a streamed turn the client never read frees the conversation and its idempotency key"""
+        response = self.client.post('/api/conversations', json={'title': 'Stream Test', 'user_id': 'test_user',
+                                                                'settings': {'turn_ordering': 'serialized'}})
+        conversation_id = json.loads(response.data)['id']
+        
+        # The test client reads the first event itself, so the view is dispatched directly
+        with app.test_request_context(f'/api/conversations/{conversation_id}/messages/stream', method='POST',
+                                      json={'content': 'Anyone there?'}, headers={'Idempotency-Key': 'gone-1'}):
+            response = app.full_dispatch_request()
+            self.assertEqual(response.status_code, 200)
+            with app.app_context():
+                self.assertIsNotNone(db.session.get(Conversation, conversation_id).turn_owner)
+            response.close()
+        
+        with app.app_context():
+            self.assertEqual(IdempotencyKey.query.filter_by(key='gone-1').count(), 0)
+            self.assertIsNone(db.session.get(Conversation, conversation_id).turn_owner)
+            self.assertEqual(Message.query.filter_by(conversation_id=conversation_id).count(), 0)
+    
+    def test_idempotency_key_replays_message_turns(self):
+        """Test that retried and concurrent duplicate messages produce a single turn"""
+        headers = {'Idempotency-Key': 'create-1'}
+        first = self.client.post('/api/conversations', json={'title': 'Retry Test', 'user_id': 'test_user'},
+                                 headers=headers)
+        retry = self.client.post('/api/conversations', json={'title': 'Retry Test', 'user_id': 'test_user'},
+                                 headers=headers)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.headers.get('Idempotent-Replayed'), 'true')
+        conversation_id = json.loads(first.data)['id']
+        self.assertEqual(json.loads(retry.data)['id'], conversation_id)
+        
+        calls = []
+        
+        def slow_response(advisor_id, *args, **kwargs):
+            calls.append(advisor_id)
+            time.sleep(0.3)
+            return f"Answer from {advisor_id}."
+        
+        url = f'/api/conversations/{conversation_id}/messages'
+        body = {'content': 'Is now a good time to buy index funds?'}
+        headers = {'Idempotency-Key': 'message-1'}
+        results = []
+        with patch('src.services.tinytroupe_service.TinyTroupeService.get_response', side_effect=slow_response):
+            duplicate = threading.Thread(target=lambda: results.append(app.test_client().post(url, json=body,
+                                                                                              headers=headers)))
+            duplicate.start()
+            time.sleep(0.1)
+            results.append(self.client.post(url, json=body, headers=headers))
+            duplicate.join()
+            results.append(self.client.post(url, json=body, headers=headers))
+        
+        self.assertEqual([response.status_code for response in results], [201, 201, 201])
+        turns = [json.loads(response.data) for response in results]
+        self.assertEqual(turns[0], turns[1])
+        self.assertEqual(turns[0], turns[2])
+        self.assertEqual(len(calls), 2)
+        with app.app_context():
+            self.assertEqual(Message.query.filter_by(conversation_id=conversation_id).count(), 3)
+        
+        response = self.client.post(url, json={'content': 'Something else'}, headers=headers)
+        self.assertEqual(response.status_code, 422)
 
 if __name__ == '__main__':
     unittest.main()